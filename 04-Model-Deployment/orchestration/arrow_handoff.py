@@ -0,0 +1,136 @@
+import os
+
+import numpy as np
+import pandas as pd
+import pyarrow as pa
+import pyarrow.ipc as ipc
+import scipy.sparse as sp
+
+# Files a preprocessed chunk consists of, in its own work directory
+FEATURES_FILE = "features.arrow"
+RIDES_FILE = "rides.arrow"
+PREDICTIONS_FILE = "predictions.arrow"
+
+# A row of features as (column index, value) pairs. The offsets of the list
+# array are the indptr of a CSR matrix, and the two struct fields its
+# indices and data, so it converts without copying
+FEATURE_TYPE = pa.list_(
+    pa.struct([pa.field("index", pa.int32()), pa.field("value", pa.float64())])
+)
+
+
+def write_table(table, path):
+    """
+    Write an Arrow IPC (Feather v2) file, uncompressed so that readers can
+    memory-map it. Written through a temp file, so a crash never leaves half
+    of one
+    """
+    temp_file = path + ".tmp"
+    with ipc.new_file(temp_file, table.schema) as writer:
+        writer.write_table(table)
+    os.replace(temp_file, path)
+    return path
+
+
+def read_table(path):
+    """Memory-map an Arrow IPC file; the columns point into the page cache"""
+    return ipc.open_file(pa.memory_map(path, "r")).read_all()
+
+
+def encode_features(df, dv):
+    """
+    What dv.transform(df.to_dict(orient="records")) gives, as a table with
+    one FEATURE_TYPE row per ride, built column by column: strings become
+    one-hot "<column>=<value>" features, numbers keep their value, and
+    values dv hasn't seen are left out
+    """
+    vocabulary = dv.vocabulary_
+    indices, values = [], []
+    for column in df.columns:
+        series = df[column]
+        if series.dtype == object or isinstance(series.dtype, pd.StringDtype):
+            names = column + dv.separator + series.astype(str)
+            index = names.map(vocabulary).fillna(-1).to_numpy(dtype=np.int64)
+            value = np.ones(len(df))
+        elif column in vocabulary:
+            index = np.full(len(df), vocabulary[column])
+            value = series.to_numpy(dtype=np.float64)
+        else:
+            continue
+        indices.append(index)
+        values.append(value)
+
+    if indices:
+        index = np.column_stack(indices)
+        value = np.column_stack(values)
+    else:
+        index = np.empty((len(df), 0), dtype=np.int64)
+        value = np.empty((len(df), 0))
+    known = index >= 0
+
+    offsets = np.zeros(len(df) + 1, dtype=np.int32)
+    np.cumsum(known.sum(axis=1), out=offsets[1:])
+    entries = pa.StructArray.from_arrays(
+        [pa.array(index[known].astype(np.int32)), pa.array(value[known])],
+        fields=list(FEATURE_TYPE.value_type),
+    )
+    features = pa.ListArray.from_arrays(pa.array(offsets), entries)
+    return pa.table(
+        {"features": features},
+        metadata={"num_features": str(len(dv.feature_names_))},
+    )
+
+
+def features_to_csr(table):
+    """CSR matrix over the buffers of an encoded (memory-mapped) table"""
+    column = table.column("features")
+    features = column.chunk(0) if column.num_chunks == 1 else column.combine_chunks()
+    entries = features.values
+    return sp.csr_matrix(
+        (
+            entries.field("value").to_numpy(zero_copy_only=True),
+            entries.field("index").to_numpy(zero_copy_only=True),
+            features.offsets.to_numpy(zero_copy_only=True),
+        ),
+        shape=(len(features), int(table.schema.metadata[b"num_features"])),
+    )
+
+
+def write_features(df, dv, path):
+    """
+    Features of the rides in df. Without a DictVectorizer the columns are
+    written as they are, for models that do their own encoding
+    """
+    if dv is None:
+        return write_table(pa.Table.from_pandas(df, preserve_index=False), path)
+    return write_table(encode_features(df, dv), path)
+
+
+def read_features(path):
+    """A CSR matrix, or the records of a file written without a DictVectorizer"""
+    table = read_table(path)
+    if table.schema.metadata and b"num_features" in table.schema.metadata:
+        return features_to_csr(table)
+    return table.to_pylist()
+
+
+def write_rides(df, path):
+    """The rides of df with their ride ids, the df.index"""
+    return write_table(
+        pa.Table.from_pandas(df.rename_axis("ride_id").reset_index()), path
+    )
+
+
+def read_rides(path):
+    return read_table(path).to_pandas().set_index("ride_id")
+
+
+def write_predictions(predictions, path):
+    return write_table(
+        pa.table({"predicted_duration": np.asarray(predictions, dtype=np.float64)}),
+        path,
+    )
+
+
+def read_predictions(path):
+    return read_table(path).column("predicted_duration").to_numpy()
@@ -1,130 +1,249 @@
 import os
+import shutil
+import argparse
+from contextlib import nullcontext
 import pandas as pd
-import pickle
+import numpy as np
+import pyarrow.parquet as pq
+from collections import deque
+from concurrent.futures import ThreadPoolExecutor
 from datetime import datetime
+from typing import Optional
 import boto3
 from prefect import flow, task
-from prefect.task_runners import SequentialTaskRunner
+from prefect.task_runners import ConcurrentTaskRunner, SequentialTaskRunner
+
+from arrow_handoff import (
+    FEATURES_FILE,
+    PREDICTIONS_FILE,
+    RIDES_FILE,
+    read_features,
+    read_predictions,
+    read_rides,
+    write_features,
+    write_predictions,
+    write_rides,
+)
+from downloader import download
+from model_cache import get_model_cache
+from month_runs import (
+    failed_summary,
+    month_output_file,
+    month_summary,
+    parse_month,
+    plan_chunks,
+    summarize,
+    task_slots,
+)
+from result_layout import write_query_optimized
+from run_manifest import run_fingerprint, up_to_date_manifest, write_manifest
+
+# What process_results needs of the preprocessed rides
+RIDE_COLUMNS = [
+    "duration",
+    "tpep_pickup_datetime",
+    "tpep_dropoff_datetime",
+    "PULocationID",
+    "DOLocationID",
+]
+
+
+def data_url(year, month):
+    """NYC TLC URL of a month of yellow taxi data"""
+    return f"https://d37ci6vzurychx.cloudfront.net/trip-data/yellow_tripdata_{year}-{month:02d}.parquet"
 
 
 @task
 def download_data(year, month):
-    """Download the dataset"""
+    """
+    Download the dataset, unless data/ already has this version of it.
+    Parallel range requests, resumed after an interruption, see downloader
+    """
     print(f"Downloading data for {year}-{month:02d}")
 
     # Use the NYC TLC data URL
-    url = f"https://d37ci6vzurychx.cloudfront.net/trip-data/yellow_tripdata_{year}-{month:02d}.parquet"
+    url = data_url(year, month)
 
-    os.makedirs("data", exist_ok=True)
     local_file = f"data/yellow_tripdata_{year}-{month:02d}.parquet"
+    return download(url, local_file)
 
-    # Download the file if it doesn't exist
-    if not os.path.exists(local_file):
-        os.system(f"wget {url} -O {local_file}")
 
-    return local_file
+def read_chunk(file_path, row_groups=None):
+    """
+    Read a file, or some of its row groups. The index is the row position in
+    the file either way, so ride ids don't depend on the chunking
+    """
+    if row_groups is None:
+        return pd.read_parquet(file_path)
+
+    parquet_file = pq.ParquetFile(file_path)
+    offset = sum(
+        parquet_file.metadata.row_group(i).num_rows for i in range(row_groups[0])
+    )
+    df = parquet_file.read_row_groups(row_groups).to_pandas()
+    df.index = pd.RangeIndex(offset, offset + len(df))
+    return df
+
+
+def limited(max_concurrency):
+    """Context of a task that runs with at most max_concurrency others, see task_slots"""
+    return task_slots(max_concurrency) if max_concurrency else nullcontext()
 
 
 @task
-def preprocess_data(file_path):
-    """Preprocess the dataset"""
-    print("Preprocessing data")
-
-    df = pd.read_parquet(file_path)
-
-    # Feature engineering
-    df["duration"] = (
-        df.tpep_dropoff_datetime - df.tpep_pickup_datetime
-    ).dt.total_seconds() / 60
-
-    # Filter outliers
-    df = df[(df.duration >= 1) & (df.duration <= 60)]
-
-    # Feature creation
-    categorical = ["PULocationID", "DOLocationID"]
-    df[categorical] = df[categorical].astype(str)
-
-    # Extract datetime features
-    df["pickup_hour"] = df.tpep_pickup_datetime.dt.hour
-    df["pickup_day"] = df.tpep_pickup_datetime.dt.day
-    df["pickup_month"] = df.tpep_pickup_datetime.dt.month
-    df["pickup_weekday"] = df.tpep_pickup_datetime.dt.weekday
-
-    # Convert to dictionaries for DictVectorizer
-    dicts = df[
-        categorical
-        + [
-            "pickup_hour",
-            "pickup_day",
-            "pickup_month",
-            "pickup_weekday",
-            "trip_distance",
+def preprocess_data(file_path, dv, work_dir, row_groups=None, max_concurrency=None):
+    """
+    Preprocess the dataset, or the chunk of it in row_groups, into Arrow
+    files in work_dir: the features encoded by dv as CSR arrays, and the
+    rides. Returns their paths; only paths are passed between tasks, which
+    memory-map the files
+    """
+    with limited(max_concurrency):
+        print("Preprocessing data")
+
+        df = read_chunk(file_path, row_groups)
+
+        # Feature engineering
+        df["duration"] = (
+            df.tpep_dropoff_datetime - df.tpep_pickup_datetime
+        ).dt.total_seconds() / 60
+
+        # Filter outliers
+        df = df[(df.duration >= 1) & (df.duration <= 60)]
+
+        # Feature creation
+        categorical = ["PULocationID", "DOLocationID"]
+        df[categorical] = df[categorical].astype(str)
+
+        # Extract datetime features
+        df["pickup_hour"] = df.tpep_pickup_datetime.dt.hour
+        df["pickup_day"] = df.tpep_pickup_datetime.dt.day
+        df["pickup_month"] = df.tpep_pickup_datetime.dt.month
+        df["pickup_weekday"] = df.tpep_pickup_datetime.dt.weekday
+
+        # Encode the columns the DictVectorizer gets
+        features = df[
+            categorical
+            + [
+                "pickup_hour",
+                "pickup_day",
+                "pickup_month",
+                "pickup_weekday",
+                "trip_distance",
+            ]
         ]
-    ].to_dict(orient="records")
 
-    return dicts, df
+        os.makedirs(work_dir, exist_ok=True)
+        return {
+            "features": write_features(
+                features, dv, os.path.join(work_dir, FEATURES_FILE)
+            ),
+            "rides": write_rides(df[RIDE_COLUMNS], os.path.join(work_dir, RIDES_FILE)),
+        }
 
 
 @task
-def load_model(model_path):
-    """Load the trained model and DictVectorizer"""
+def load_model(model_path, dv_path=None):
+    """
+    Load the trained model and DictVectorizer, from dv_path or, without it,
+    from a (dv, model) tuple in model_path. Served from the model cache of
+    this process when the files' content was loaded before
+    """
     print(f"Loading model from {model_path}")
 
-    with open(model_path, "rb") as f_in:
-        model = pickle.load(f_in)
-
-    # If separate DictVectorizer file exists
-    dv_path = "dv.pkl"
-    if os.path.exists(dv_path):
-        with open(dv_path, "rb") as f_in:
-            dv = pickle.load(f_in)
-    else:
-        # Assume model is a tuple of (model, dv)
-        dv = None
-        if isinstance(model, tuple) and len(model) == 2:
-            model, dv = model
-
+    cache = get_model_cache()
+    model, dv = cache.get(model_path, dv_path)
+    print(f"Model cache: {cache.stats()}")
     return model, dv
 
 
 @task
-def run_inference(model, dv, features):
-    """Run inference on the preprocessed data"""
+def run_inference(model, prepared, max_concurrency=None):
+    """
+    Run inference on the preprocessed data, and write the predictions next
+    to its features. Returns their path
+    """
     print("Running inference")
 
-    if dv is not None:
-        X = dv.transform(features)
-    else:
-        X = features  # Assume features are already transformed
+    with limited(max_concurrency):
+        X = read_features(prepared["features"])
+        y_pred = model.predict(X)
 
-    y_pred = model.predict(X)
+    predictions_file = os.path.join(
+        os.path.dirname(prepared["features"]), PREDICTIONS_FILE
+    )
+    return write_predictions(y_pred, predictions_file)
 
-    return y_pred
+
+@task
+def score_chunks(
+    file_path, model, dv, work_dir, chunk_row_groups, max_concurrency=None
+):
+    """
+    Split a downloaded file into chunks of chunk_row_groups row groups (see
+    plan_chunks), then preprocess and score them on threads, at most
+    max_concurrency at once. A task of its own, so the flow submits it with
+    the download's future instead of waiting for the file to plan chunks.
+    Returns the files of preprocess_data per chunk, with their predictions
+    """
+    chunks = plan_chunks(file_path, chunk_row_groups)
+
+    def score(i, row_groups):
+        prepared = preprocess_data.fn(
+            file_path,
+            dv,
+            os.path.join(work_dir, f"chunk-{i:05d}"),
+            row_groups,
+            max_concurrency,
+        )
+        return dict(
+            prepared, predictions=run_inference.fn(model, prepared, max_concurrency)
+        )
+
+    with ThreadPoolExecutor(max_workers=max_concurrency or len(chunks)) as pool:
+        return list(pool.map(score, range(len(chunks)), chunks))
 
 
 @task
-def process_results(df, predictions, output_file):
-    """Process and save the results"""
+def process_results(prepared, predictions, output_file, query_optimized=False):
+    """
+    Process and save the results. prepared and predictions are the files of
+    preprocess_data and run_inference, or lists of them with one entry per
+    chunk, which are combined in order; predictions is None for the chunks
+    of score_chunks, which carry their own. With query_optimized the file is
+    sorted by pickup time and has a page index and Bloom filters on the
+    locations, see result_layout
+    """
     print(f"Processing results and saving to {output_file}")
 
-    # Create results dataframe
+    if not isinstance(prepared, list):
+        prepared, predictions = [prepared], [predictions]
+    elif predictions is None:
+        predictions = [files["predictions"] for files in prepared]
+    df = pd.concat([read_rides(files["rides"]) for files in prepared])
+    predictions = np.concatenate([read_predictions(path) for path in predictions])
+
+    # Create results dataframe; by position, df is indexed by ride_id
     results_df = pd.DataFrame()
     results_df["ride_id"] = df.index
     results_df["predicted_duration"] = predictions
-    results_df["actual_duration"] = df["duration"]
-    results_df["pickup_datetime"] = df["tpep_pickup_datetime"]
-    results_df["dropoff_datetime"] = df["tpep_dropoff_datetime"]
-    results_df["PULocationID"] = df["PULocationID"]
-    results_df["DOLocationID"] = df["DOLocationID"]
+    results_df["actual_duration"] = df["duration"].to_numpy()
+    results_df["pickup_datetime"] = df["tpep_pickup_datetime"].to_numpy()
+    results_df["dropoff_datetime"] = df["tpep_dropoff_datetime"].to_numpy()
+    results_df["PULocationID"] = df["PULocationID"].to_numpy()
+    results_df["DOLocationID"] = df["DOLocationID"].to_numpy()
 
     # Calculate mean duration
     mean_duration = predictions.mean()
     print(f"Mean predicted duration: {mean_duration:.2f} minutes")
 
     # Save to parquet
-    results_df.to_parquet(output_file, engine="pyarrow")
+    if query_optimized:
+        write_query_optimized(results_df, output_file)
+    else:
+        results_df.to_parquet(output_file, engine="pyarrow")
 
-    return output_file, mean_duration
+    return output_file, mean_duration, len(results_df)
 
 
 @task
@@ -217,6 +336,40 @@ def upload_to_azure(file_path, container_name, blob_name=None):
         return False
 
 
+@task
+def check_manifest(manifest_file, fingerprint):
+    """Return the manifest of an earlier run that is still up to date, or None"""
+    manifest = up_to_date_manifest(manifest_file, fingerprint)
+    if manifest is not None:
+        print(
+            f"Input, model and code unchanged since {manifest['created']}, "
+            f"results are in {manifest['output_file']}"
+        )
+    return manifest
+
+
+@task
+def record_month(
+    manifest_file, fingerprint, year, month, processed, uploaded=None, work_dir=None
+):
+    """
+    Write the manifest of a finished month, remove its intermediate files
+    and return its summary
+    """
+    result_file, mean_duration, rows = processed
+    manifest = dict(
+        fingerprint,
+        output_file=result_file,
+        mean_duration=float(mean_duration),
+        rows=int(rows),
+        uploaded=bool(uploaded),
+    )
+    write_manifest(manifest_file, manifest)
+    if work_dir is not None:
+        shutil.rmtree(work_dir, ignore_errors=True)
+    return month_summary(year, month, manifest, success=uploaded is not False)
+
+
 @task
 def send_notification(mean_duration, success=True):
     """Send notification about job completion"""
@@ -231,47 +384,295 @@ def send_notification(mean_duration, success=True):
     return success
 
 
-@flow(task_runner=SequentialTaskRunner())
+def submit_month(
+    year,
+    month,
+    data_file,
+    model,
+    dv,
+    output_file,
+    manifest_file,
+    fingerprint,
+    work_dir,
+    chunk_row_groups=None,
+    max_concurrency=None,
+    query_optimized=False,
+    upload_to_cloud_storage=False,
+    cloud_provider="s3",
+    bucket_name=None,
+):
+    """
+    Submit the tasks of one month, whose download is the future data_file,
+    and return the future of its summary. Tasks only pass each other the
+    paths of their Arrow files in work_dir, so nothing is waited for here
+    and the month overlaps with the inference, writing and upload of the
+    month before it. With chunk_row_groups, the file is split and scored in
+    score_chunks. At most max_concurrency preprocessing and inference steps
+    run at once in a process, of all chunks and months
+    """
+    if chunk_row_groups:
+        prepared = score_chunks.submit(
+            data_file, model, dv, work_dir, chunk_row_groups, max_concurrency
+        )
+        predictions = None
+    else:
+        prepared = preprocess_data.submit(
+            data_file, dv, os.path.join(work_dir, "chunk-00000"), None, max_concurrency
+        )
+        predictions = run_inference.submit(model, prepared, max_concurrency)
+    processed = process_results.submit(
+        prepared, predictions, output_file, query_optimized
+    )
+
+    uploaded = None
+    if upload_to_cloud_storage:
+        uploaded = upload_to_cloud.submit(
+            output_file,
+            cloud_provider=cloud_provider,
+            bucket_name=bucket_name,
+            wait_for=[processed],
+        )
+
+    return record_month.submit(
+        manifest_file, fingerprint, year, month, processed, uploaded, work_dir
+    )
+
+
+def make_task_runner(kind="concurrent", max_workers=None):
+    """
+    Task runner by name: "sequential", "concurrent" (threads) or "dask"
+    (worker processes, needs prefect-dask)
+    """
+    if kind == "sequential":
+        return SequentialTaskRunner()
+    if kind == "concurrent":
+        return ConcurrentTaskRunner()
+    if kind == "dask":
+        try:
+            from prefect_dask import DaskTaskRunner
+        except ImportError:
+            raise ValueError(
+                "The dask task runner needs prefect-dask. Run: pip install prefect-dask"
+            )
+        return DaskTaskRunner(
+            cluster_kwargs={
+                "n_workers": max_workers,
+                "threads_per_worker": 1,
+                "processes": True,
+            }
+        )
+    raise ValueError(f"Unknown task runner: {kind}")
+
+
+@flow(task_runner=ConcurrentTaskRunner())
 def batch_inference(
     year: int = 2023,
     month: int = 4,
     model_path: str = "../models/model.bin",
-    output_file: str = None,
+    output_file: Optional[str] = None,
+    dv_path: Optional[str] = None,
     upload_to_cloud_storage: bool = False,
     cloud_provider: str = "s3",
     bucket_name: str = "taxi-duration-predictions",
+    force: bool = False,
+    months: Optional[list] = None,
+    max_concurrency: int = 2,
+    chunk_row_groups: Optional[int] = None,
+    prefetch_months: int = 1,
+    query_optimized: bool = False,
+    work_dir: Optional[str] = None,
 ):
-    """Main batch inference workflow"""
-    # Generate output filename with timestamp
-    if output_file is None:
-        timestamp = datetime.now().strftime("%Y%m%d_%H%M%S")
-        output_file = (
-            f"../output/result_yellow_tripdata_{year}-{month:02d}_{timestamp}.parquet"
+    """
+    Main batch inference workflow.
+    Scores year/month, or every month in months ("2023-04" or [2023, 4]).
+    Up to max_concurrency months are in flight at once, so the upload of a
+    month overlaps with processing the next one; chunk_row_groups also splits
+    each file into chunks of row groups that are preprocessed and scored
+    concurrently, up to max_concurrency chunks at once. With several months, output_file can use {year} and
+    {month} fields. The downloads of the next prefetch_months months start
+    ahead of their processing. Tasks hand over their data as Arrow files in
+    work_dir (by default .work next to the output), which are removed once
+    a month is done. Returns a summary with an entry per month and the mean
+    duration over all of them; a month whose tasks failed gets a failed
+    entry, and doesn't stop the others.
+    query_optimized writes result files sorted by pickup time, with a page
+    index and Bloom filters on the locations, for filtering readers.
+    A manifest per month in the output directory records the input, model and
+    code fingerprints of the last run. If none of them changed (and the upload
+    succeeded, when one is asked for), the month is skipped; force=True reruns.
+    """
+    if max_concurrency < 1:
+        raise ValueError("max_concurrency must be at least 1")
+    months = [parse_month(value) for value in months or [(year, month)]]
+    timestamp = datetime.now().strftime("%Y%m%d_%H%M%S")
+    output_files = [
+        month_output_file(output_file, year, month, timestamp) for year, month in months
+    ]
+    if len(set(output_files)) < len(output_files):
+        raise ValueError(
+            "Several months would write the same output file, "
+            "use {year} and {month} in output_file"
         )
 
-    # Create output directory if it doesn't exist
-    os.makedirs(os.path.dirname(output_file), exist_ok=True)
+    summaries = []
+    runs = []
+    for (year, month), month_file in zip(months, output_files):
+        # Create output directory if it doesn't exist
+        os.makedirs(os.path.dirname(month_file), exist_ok=True)
 
-    # Execute tasks in sequence
-    data_file = download_data(year, month)
-    features, df = preprocess_data(data_file)
-    model, dv = load_model(model_path)
-    predictions = run_inference(model, dv, features)
-    result_file, mean_duration = process_results(df, predictions, output_file)
-
-    # Upload to cloud (optional)
-    if upload_to_cloud_storage:
-        upload_success = upload_to_cloud(
-            result_file, cloud_provider=cloud_provider, bucket_name=bucket_name
+        manifest_file = os.path.join(
+            os.path.dirname(month_file),
+            f"manifest_yellow_tripdata_{year}-{month:02d}.json",
         )
-    else:
-        upload_success = True
+        fingerprint = dict(
+            run_fingerprint(data_url(year, month), model_path, dv_path),
+            query_optimized=query_optimized,
+        )
+        if not force:
+            previous = check_manifest(manifest_file, fingerprint)
+            if previous is not None and (
+                previous["uploaded"] or not upload_to_cloud_storage
+            ):
+                summaries.append(month_summary(year, month, previous, skipped=True))
+                continue
+
+        runs.append(
+            (len(summaries), year, month, month_file, manifest_file, fingerprint)
+        )
+        summaries.append(None)
+
+    if runs:
+        model, dv = load_model(model_path, dv_path)
+
+    downloads = {}
+    in_flight = deque()
+    for n, (position, year, month, month_file, manifest_file, fingerprint) in enumerate(
+        runs
+    ):
+        for ahead in runs[n : n + 1 + prefetch_months]:
+            if ahead[0] not in downloads:
+                downloads[ahead[0]] = download_data.submit(*ahead[1:3])
+
+        if len(in_flight) >= max_concurrency:
+            in_flight.popleft().wait()
+        summary = submit_month(
+            year,
+            month,
+            downloads[position],
+            model,
+            dv,
+            month_file,
+            manifest_file,
+            fingerprint,
+            os.path.join(
+                work_dir or os.path.join(os.path.dirname(month_file), ".work"),
+                f"{year}-{month:02d}",
+            ),
+            chunk_row_groups=chunk_row_groups,
+            max_concurrency=max_concurrency,
+            query_optimized=query_optimized,
+            upload_to_cloud_storage=upload_to_cloud_storage,
+            cloud_provider=cloud_provider,
+            bucket_name=bucket_name,
+        )
+        in_flight.append(summary)
+        summaries[position] = summary
+
+    # Results in the order of months, whether they ran, were skipped or failed
+    months_done = []
+    for position, (entry, (year, month), month_file) in enumerate(
+        zip(summaries, months, output_files)
+    ):
+        if not isinstance(entry, dict):
+            try:
+                entry = entry.result(raise_on_failure=False)
+            except Exception as e:
+                # record_month never ran, after a failed task before it;
+                # report the download's error if that was the one
+                entry = downloads[position].result(raise_on_failure=False)
+                if not isinstance(entry, BaseException):
+                    entry = e
+            if isinstance(entry, BaseException):
+                entry = failed_summary(year, month, month_file, entry)
+        months_done.append(entry)
+    summary = summarize(months_done)
+    summary["model_cache"] = get_model_cache().stats()
 
     # Send notification
-    send_notification(mean_duration, success=upload_success)
-
-    return mean_duration
+    send_notification(summary["mean_duration"], success=summary["success"])
+
+    return summary
+
+
+def parse_args(argv=None):
+    parser = argparse.ArgumentParser(description="Batch inference for taxi rides")
+    parser.add_argument(
+        "months", nargs="*", default=["2023-04"], help="Months to score, e.g. 2023-04"
+    )
+    parser.add_argument("--model-path", default="../models/model.bin")
+    parser.add_argument("--output-file", default=None)
+    parser.add_argument(
+        "--dv-path", default=None, help="DictVectorizer, if not in the model file"
+    )
+    parser.add_argument(
+        "--task-runner",
+        choices=["sequential", "concurrent", "dask"],
+        default="concurrent",
+    )
+    parser.add_argument(
+        "--max-concurrency",
+        type=int,
+        default=2,
+        help="Months in flight and chunk tasks running at once (and dask workers)",
+    )
+    parser.add_argument(
+        "--chunk-row-groups",
+        type=int,
+        default=None,
+        help="Score each file in chunks of this many row groups",
+    )
+    parser.add_argument(
+        "--prefetch-months",
+        type=int,
+        default=1,
+        help="Months downloaded ahead of the one being processed",
+    )
+    parser.add_argument(
+        "--work-dir",
+        default=None,
+        help="Directory of the Arrow files tasks hand over to each other",
+    )
+    parser.add_argument(
+        "--query-optimized",
+        action="store_true",
+        help="Sort results by pickup time, with page index and Bloom filters",
+    )
+    parser.add_argument("--upload", action="store_true")
+    parser.add_argument("--cloud-provider", default="s3")
+    parser.add_argument("--bucket-name", default="taxi-duration-predictions")
+    parser.add_argument("--force", action="store_true")
+    return parser.parse_args(argv)
+
+
+def main(argv=None):
+    args = parse_args(argv)
+    task_runner = make_task_runner(args.task_runner, args.max_concurrency)
+    return batch_inference.with_options(task_runner=task_runner)(
+        model_path=args.model_path,
+        output_file=args.output_file,
+        dv_path=args.dv_path,
+        upload_to_cloud_storage=args.upload,
+        cloud_provider=args.cloud_provider,
+        bucket_name=args.bucket_name,
+        force=args.force,
+        months=args.months,
+        max_concurrency=args.max_concurrency,
+        chunk_row_groups=args.chunk_row_groups,
+        prefetch_months=args.prefetch_months,
+        work_dir=args.work_dir,
+        query_optimized=args.query_optimized,
+    )
 
 
 if __name__ == "__main__":
-    batch_inference()
+    main()
@@ -0,0 +1,352 @@
+import os
+import json
+import time
+import hashlib
+import argparse
+import http.client
+import urllib.error
+import urllib.request
+from concurrent.futures import ThreadPoolExecutor, as_completed
+
+# Size of the byte ranges that are fetched in parallel
+PART_SIZE = 16 * 1024 * 1024
+
+MAX_WORKERS = 4
+RETRIES = 3
+TIMEOUT = 60
+
+# First retry waits this long, every next one twice as long
+BACKOFF_SECONDS = 1.0
+
+BUFFER_SIZE = 1024 * 1024
+
+
+def remote_info(url, timeout=TIMEOUT):
+    """
+    Size, ETag, Last-Modified and byte range support of a URL from a HEAD
+    request. Also what run_manifest fingerprints the input by, so skipping
+    a month and downloading it go by the same metadata
+    """
+    request = urllib.request.Request(url, method="HEAD")
+    with urllib.request.urlopen(request, timeout=timeout) as response:
+        headers = response.headers
+        size = headers.get("Content-Length")
+        return {
+            "size": int(size) if size is not None else None,
+            "etag": headers.get("ETag"),
+            "last_modified": headers.get("Last-Modified"),
+            "ranges": headers.get("Accept-Ranges", "").lower() == "bytes",
+        }
+
+
+def partial_path(local_file):
+    """File the parts are written into until the download is complete"""
+    return local_file + ".part"
+
+
+def state_path(local_file):
+    """Parts of a partial download that are complete"""
+    return local_file + ".part.json"
+
+
+def info_path(local_file):
+    """Size and ETag of a completed download"""
+    return local_file + ".download.json"
+
+
+def md5_etag(etag):
+    """The MD5 in an ETag of a single part S3/CloudFront upload, or None"""
+    value = (etag or "").strip('"')
+    if len(value) == 32 and all(c in "0123456789abcdef" for c in value.lower()):
+        return value.lower()
+    return None
+
+
+def file_md5(path):
+    digest = hashlib.md5()
+    with open(path, "rb") as f_in:
+        for chunk in iter(lambda: f_in.read(BUFFER_SIZE), b""):
+            digest.update(chunk)
+    return digest.hexdigest()
+
+
+def plan_parts(size, part_size=PART_SIZE):
+    """Inclusive (start, end) byte ranges of part_size bytes covering size bytes"""
+    return [
+        (start, min(start + part_size, size) - 1) for start in range(0, size, part_size)
+    ]
+
+
+def read_json(path):
+    try:
+        with open(path) as f_in:
+            return json.load(f_in)
+    except (FileNotFoundError, ValueError):
+        return None
+
+
+def write_json(path, content):
+    """Write through a temp file, so a crash never leaves half of one"""
+    temp_file = path + ".tmp"
+    with open(temp_file, "w") as f_out:
+        json.dump(content, f_out, indent=2)
+    os.replace(temp_file, path)
+
+
+def remove(*paths):
+    for path in paths:
+        if os.path.exists(path):
+            os.remove(path)
+
+
+def is_complete(local_file, info):
+    """
+    Whether local_file is a complete download of the remote file: the size
+    and ETag recorded when it was downloaded match, or, for files without
+    that record, at least the size does
+    """
+    if not os.path.exists(local_file):
+        return False
+
+    downloaded = read_json(info_path(local_file))
+    if downloaded is not None:
+        return downloaded.get("size") == info["size"] and (
+            downloaded.get("etag") == info["etag"]
+        )
+    return info["size"] is not None and os.path.getsize(local_file) == info["size"]
+
+
+def with_retries(fetch, retries=RETRIES, backoff=BACKOFF_SECONDS):
+    """
+    Call fetch(), retrying network errors and server errors with exponential
+    backoff. Client errors (4xx) and ValueError (a changed or corrupt file)
+    are raised right away
+    """
+    for attempt in range(retries + 1):
+        try:
+            return fetch()
+        except urllib.error.HTTPError as e:
+            if e.code < 500 or attempt == retries:
+                raise
+            error = e
+        except (OSError, http.client.HTTPException) as e:
+            # Also IncompleteRead, when a connection drops mid-body
+            if attempt == retries:
+                raise
+            error = e
+        print(f"Retrying after {error}")
+        time.sleep(backoff * 2**attempt)
+
+
+def check_etag(url, response, etag):
+    served = response.headers.get("ETag")
+    if etag is not None and served is not None and served != etag:
+        raise ValueError(f"{url} changed while downloading: ETag {served}, not {etag}")
+
+
+def fetch_part(url, path, start, end, etag=None, timeout=TIMEOUT):
+    """Download the bytes start..end of url into the same offset of path"""
+    headers = {"Range": f"bytes={start}-{end}"}
+    if etag is not None and not etag.startswith("W/"):
+        # A changed file is then sent whole (200) instead of the range
+        headers["If-Range"] = etag
+    request = urllib.request.Request(url, headers=headers)
+
+    with urllib.request.urlopen(request, timeout=timeout) as response:
+        check_etag(url, response, etag)
+        if response.status != 206:
+            raise ValueError(f"{url} didn't return the range {start}-{end}")
+
+        written = 0
+        with open(path, "r+b") as f_out:
+            f_out.seek(start)
+            for chunk in iter(lambda: response.read(BUFFER_SIZE), b""):
+                f_out.write(chunk)
+                written += len(chunk)
+
+    if written != end - start + 1:
+        raise ConnectionError(
+            f"Got {written} of {end - start + 1} bytes of {url} at {start}"
+        )
+    return written
+
+
+def fetch_whole(url, path, etag=None, timeout=TIMEOUT):
+    """Download url into path with a single request"""
+    with urllib.request.urlopen(url, timeout=timeout) as response:
+        check_etag(url, response, etag)
+        with open(path, "wb") as f_out:
+            for chunk in iter(lambda: response.read(BUFFER_SIZE), b""):
+                f_out.write(chunk)
+
+
+def download(
+    url,
+    local_file,
+    part_size=PART_SIZE,
+    max_workers=MAX_WORKERS,
+    retries=RETRIES,
+    timeout=TIMEOUT,
+    backoff=BACKOFF_SECONDS,
+):
+    """
+    Download url to local_file, unless it already holds that version.
+
+    - The file is fetched as byte ranges of part_size, max_workers at a
+      time, into local_file.part. Every finished part is recorded in
+      local_file.part.json, so an interrupted download resumes with the
+      missing parts, as long as the remote size and ETag didn't change
+    - Parts are retried with exponential backoff
+    - The result is checked against the remote size, and against the MD5
+      when the ETag is one, before it is renamed to local_file. A partial
+      download is never mistaken for a complete one
+    - Servers without range requests get a single (retried) request
+    - When the server can't be reached an existing local_file is used as is
+    """
+    try:
+        info = remote_info(url, timeout)
+    except OSError as e:
+        if os.path.exists(local_file):
+            print(f"Could not check {url} ({e}), using {local_file}")
+            return local_file
+        raise
+
+    if is_complete(local_file, info):
+        print(f"{local_file} is up to date")
+        return local_file
+
+    os.makedirs(os.path.dirname(os.path.abspath(local_file)), exist_ok=True)
+    part_file = partial_path(local_file)
+    state_file = state_path(local_file)
+    etag = info["etag"]
+
+    if not info["ranges"] or not info["size"]:
+        print(f"Downloading {url} in a single request")
+        remove(state_file)
+        with_retries(
+            lambda: fetch_whole(url, part_file, etag, timeout), retries, backoff
+        )
+    else:
+        state = read_json(state_file)
+        resumable = (
+            state is not None
+            and os.path.exists(part_file)
+            and os.path.getsize(part_file) == info["size"]
+            and etag is not None
+            and {key: state.get(key) for key in ["url", "size", "etag", "part_size"]}
+            == {"url": url, "size": info["size"], "etag": etag, "part_size": part_size}
+        )
+        if not resumable:
+            state = {
+                "url": url,
+                "size": info["size"],
+                "etag": etag,
+                "part_size": part_size,
+                "done": [],
+            }
+            with open(part_file, "wb") as f_out:
+                f_out.truncate(info["size"])
+
+        parts = plan_parts(info["size"], part_size)
+        done = set(state["done"])
+        todo = [index for index in range(len(parts)) if index not in done]
+        print(
+            f"Downloading {url}: {len(todo)} of {len(parts)} parts, "
+            f"{max_workers} at a time"
+        )
+
+        errors = []
+        with ThreadPoolExecutor(max_workers=max_workers) as pool:
+            futures = {
+                pool.submit(
+                    with_retries,
+                    lambda start=parts[index][0], end=parts[index][1]: fetch_part(
+                        url, part_file, start, end, etag, timeout
+                    ),
+                    retries,
+                    backoff,
+                ): index
+                for index in todo
+            }
+            for future in as_completed(futures):
+                try:
+                    future.result()
+                except Exception as e:
+                    errors.append(e)
+                    continue
+                done.add(futures[future])
+                write_json(state_file, dict(state, done=sorted(done)))
+
+        if errors:
+            if any(isinstance(e, ValueError) for e in errors):
+                # The remote file changed, the parts so far are of no use
+                remove(part_file, state_file)
+            else:
+                print(f"{len(done)} of {len(parts)} parts done, run again to resume")
+            raise errors[0]
+
+    size = os.path.getsize(part_file)
+    if info["size"] is not None and size != info["size"]:
+        remove(part_file, state_file)
+        raise ValueError(f"Downloaded {size} bytes of {url}, expected {info['size']}")
+    expected_md5 = md5_etag(etag)
+    if expected_md5 is not None and file_md5(part_file) != expected_md5:
+        remove(part_file, state_file)
+        raise ValueError(f"Download of {url} doesn't match its MD5 {expected_md5}")
+
+    os.replace(part_file, local_file)
+    write_json(info_path(local_file), {"url": url, "size": size, "etag": etag})
+    remove(state_file)
+    print(f"Downloaded {url} to {local_file} ({size} bytes)")
+    return local_file
+
+
+def download_many(items, max_files=2, **options):
+    """
+    Download several (url, local_file) pairs, max_files at a time, and
+    return the local files in the same order. Every download is finished
+    (or failed) before the first error is raised
+    """
+    with ThreadPoolExecutor(max_workers=max_files) as pool:
+        futures = [
+            pool.submit(download, url, local_file, **options)
+            for url, local_file in items
+        ]
+    errors = [future.exception() for future in futures if future.exception()]
+    if errors:
+        raise errors[0]
+    return [future.result() for future in futures]
+
+
+def parse_args(argv=None):
+    parser = argparse.ArgumentParser(
+        description="Download files with parallel, resumable range requests"
+    )
+    parser.add_argument("urls", nargs="+")
+    parser.add_argument("--output-dir", default="data")
+    parser.add_argument("--part-size", type=int, default=PART_SIZE)
+    parser.add_argument("--max-workers", type=int, default=MAX_WORKERS)
+    parser.add_argument(
+        "--max-files", type=int, default=2, help="Files downloaded at the same time"
+    )
+    parser.add_argument("--retries", type=int, default=RETRIES)
+    return parser.parse_args(argv)
+
+
+def main(argv=None):
+    args = parse_args(argv)
+    items = [
+        (url, os.path.join(args.output_dir, os.path.basename(url.split("?")[0])))
+        for url in args.urls
+    ]
+    return download_many(
+        items,
+        max_files=args.max_files,
+        part_size=args.part_size,
+        max_workers=args.max_workers,
+        retries=args.retries,
+    )
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,166 @@
+import os
+import time
+import pickle
+import hashlib
+import threading
+from collections import OrderedDict
+
+# Default budget of a process's cache, see get_model_cache
+MAX_BYTES = 512 * 1024 * 1024
+
+_hashes = {}
+_hashes_lock = threading.Lock()
+
+
+def file_sha256(path):
+    """
+    sha256 of a file, or None if it doesn't exist. Remembered per path until
+    the file's size or mtime changes, so repeated lookups only stat the file
+    """
+    try:
+        stat = os.stat(path)
+    except FileNotFoundError:
+        return None
+
+    key = os.path.abspath(path)
+    version = (stat.st_size, stat.st_mtime_ns)
+    with _hashes_lock:
+        known = _hashes.get(key)
+    if known is not None and known[0] == version:
+        return known[1]
+
+    digest = hashlib.sha256()
+    with open(path, "rb") as f_in:
+        for chunk in iter(lambda: f_in.read(1024 * 1024), b""):
+            digest.update(chunk)
+    with _hashes_lock:
+        _hashes[key] = (version, digest.hexdigest())
+    return digest.hexdigest()
+
+
+def is_vectorizer(obj):
+    return hasattr(obj, "transform") and hasattr(obj, "vocabulary_")
+
+
+def load_pickles(model_path, dv_path=None):
+    """
+    Unpickle (model, dv). Without dv_path, model_path can hold a (dv, model)
+    or (model, dv) tuple, or just a model that needs no DictVectorizer
+    """
+    with open(model_path, "rb") as f_in:
+        model = pickle.load(f_in)
+
+    if dv_path is not None:
+        with open(dv_path, "rb") as f_in:
+            return model, pickle.load(f_in)
+
+    if isinstance(model, tuple) and len(model) == 2:
+        first, second = model
+        return (second, first) if is_vectorizer(first) else (first, second)
+    return model, None
+
+
+class ModelCache:
+    """
+    Loaded (model, dv) pairs of a process, keyed by the sha256 of the model
+    file and of the DictVectorizer file:
+
+        model, dv = cache.get("models/model.bin", "models/dv.pkl")
+
+    - A changed file has another hash, so it's loaded again rather than
+      served stale; hashes are only recomputed when a file's size or mtime
+      changes
+    - The size of an entry is the size of its pickles, a stand-in for its
+      memory. When the entries exceed max_bytes, the least recently used
+      ones are dropped (the newest entry always stays)
+    - hits, misses, evictions and the time spent loading are counted for
+      stats()
+    """
+
+    def __init__(self, max_bytes=MAX_BYTES):
+        self.max_bytes = max_bytes
+        self.hits = 0
+        self.misses = 0
+        self.evictions = 0
+        self.load_seconds = 0.0
+        self._entries = OrderedDict()
+        self._lock = threading.Lock()
+
+    def key(self, model_path, dv_path=None):
+        model_hash = file_sha256(model_path)
+        if model_hash is None:
+            raise FileNotFoundError(f"Model file {model_path} doesn't exist")
+        dv_hash = None
+        if dv_path is not None:
+            dv_hash = file_sha256(dv_path)
+            if dv_hash is None:
+                raise FileNotFoundError(f"DictVectorizer file {dv_path} doesn't exist")
+        return model_hash, dv_hash
+
+    def get(self, model_path, dv_path=None):
+        """(model, dv) of the files, loaded once per content"""
+        key = self.key(model_path, dv_path)
+        with self._lock:
+            entry = self._entries.get(key)
+            if entry is not None:
+                self._entries.move_to_end(key)
+                self.hits += 1
+                return entry["model"], entry["dv"]
+
+        # Loaded outside the lock; two threads may load the same files once
+        start = time.perf_counter()
+        model, dv = load_pickles(model_path, dv_path)
+        seconds = time.perf_counter() - start
+        size = os.path.getsize(model_path)
+        if dv_path is not None:
+            size += os.path.getsize(dv_path)
+
+        with self._lock:
+            self.misses += 1
+            self.load_seconds += seconds
+            self._entries[key] = {"model": model, "dv": dv, "bytes": size}
+            self._entries.move_to_end(key)
+            self._evict()
+        print(f"Loaded {model_path} in {seconds * 1000:.1f} ms")
+        return model, dv
+
+    def _evict(self):
+        while len(self._entries) > 1 and self.bytes > self.max_bytes:
+            self._entries.popitem(last=False)
+            self.evictions += 1
+
+    @property
+    def bytes(self):
+        return sum(entry["bytes"] for entry in self._entries.values())
+
+    def clear(self):
+        with self._lock:
+            self._entries.clear()
+
+    def stats(self):
+        with self._lock:
+            return {
+                "hits": self.hits,
+                "misses": self.misses,
+                "evictions": self.evictions,
+                "load_seconds": self.load_seconds,
+                "entries": len(self._entries),
+                "bytes": self.bytes,
+            }
+
+
+_cache = None
+_cache_lock = threading.Lock()
+
+
+def get_model_cache():
+    """
+    The cache of this process, sized by MODEL_CACHE_MAX_BYTES. A worker that
+    runs many flows keeps its models between them
+    """
+    global _cache
+    with _cache_lock:
+        if _cache is None:
+            max_bytes = os.getenv("MODEL_CACHE_MAX_BYTES")
+            _cache = ModelCache(int(max_bytes) if max_bytes else MAX_BYTES)
+        return _cache
@@ -0,0 +1,118 @@
+import threading
+
+import numpy as np
+import pyarrow.parquet as pq
+
+_slots = {}
+_slots_lock = threading.Lock()
+
+
+def parse_month(value):
+    """(year, month) from "2023-04", (2023, 4) or [2023, 4]"""
+    if isinstance(value, str):
+        year, _, month = value.partition("-")
+    else:
+        year, month = value
+    year, month = int(year), int(month)
+    if not 1 <= month <= 12:
+        raise ValueError(f"Invalid month: {value}")
+    return year, month
+
+
+def month_output_file(output_file, year, month, timestamp):
+    """Output file of a month; output_file can use {year} and {month} fields"""
+    if output_file is None:
+        return (
+            f"../output/result_yellow_tripdata_{year}-{month:02d}_{timestamp}.parquet"
+        )
+    return output_file.format(year=year, month=month)
+
+
+def plan_chunks(file_path, row_groups_per_chunk):
+    """Split the row groups of a parquet file into consecutive chunks"""
+    num_row_groups = pq.read_metadata(file_path).num_row_groups
+    return [
+        list(range(start, min(start + row_groups_per_chunk, num_row_groups)))
+        for start in range(0, num_row_groups, row_groups_per_chunk)
+    ] or [None]
+
+
+def task_slots(limit):
+    """
+    Semaphore of this process that bounds the preprocessing and inference
+    tasks running at once to limit. ConcurrentTaskRunner runs every
+    submitted task right away in a thread of the flow's process, so without
+    it all chunks of the months in flight would run at once
+    """
+    with _slots_lock:
+        if limit not in _slots:
+            _slots[limit] = threading.BoundedSemaphore(limit)
+        return _slots[limit]
+
+
+def month_summary(year, month, manifest, success=True, skipped=False):
+    return {
+        "year": year,
+        "month": month,
+        "output_file": manifest["output_file"],
+        "mean_duration": manifest["mean_duration"],
+        "rows": manifest.get("rows"),
+        "uploaded": manifest["uploaded"],
+        "skipped": skipped,
+        "success": success,
+    }
+
+
+def failed_summary(year, month, output_file, error):
+    """Summary of a month whose tasks failed with error"""
+    return dict(
+        month_summary(
+            year,
+            month,
+            {"output_file": output_file, "mean_duration": None, "uploaded": False},
+            success=False,
+        ),
+        error=str(error),
+    )
+
+
+def summarize(months):
+    """
+    One summary of all months. The overall mean duration is weighted by the
+    rows of each month, or a plain mean when some row counts are unknown;
+    failed months have neither and are left out of it (None if all failed)
+    """
+    scored = [entry for entry in months if entry["mean_duration"] is not None]
+    rows = [entry["rows"] for entry in scored]
+    if all(count is not None for count in rows) and sum(rows):
+        mean_duration = sum(
+            entry["mean_duration"] * entry["rows"] for entry in scored
+        ) / sum(rows)
+    elif scored:
+        mean_duration = float(np.mean([entry["mean_duration"] for entry in scored]))
+    else:
+        mean_duration = None
+
+    for entry in months:
+        if entry["mean_duration"] is None:
+            print(
+                f"{entry['year']}-{entry['month']:02d}: failed, "
+                f"{entry.get('error')} -> {entry['output_file']}"
+            )
+            continue
+        status = (
+            "skipped" if entry["skipped"] else "ok" if entry["success"] else "failed"
+        )
+        print(
+            f"{entry['year']}-{entry['month']:02d}: {entry['mean_duration']:.2f} minutes, "
+            f"{entry['rows']} rides, {status} -> {entry['output_file']}"
+        )
+    if mean_duration is not None:
+        print(f"All months: {mean_duration:.2f} minutes")
+
+    return {
+        "months": months,
+        "rows": sum(count or 0 for count in rows),
+        "mean_duration": mean_duration,
+        "success": all(entry["success"] for entry in months),
+    }
@@ -0,0 +1,82 @@
+import inspect
+
+import pyarrow as pa
+import pyarrow.compute as pc
+import pyarrow.parquet as pq
+
+# Rows per row group: a month (~3M rides) gets ~25 row groups of about a
+# day each once sorted by pickup time, the unit readers skip by statistics
+ROW_GROUP_SIZE = 128 * 1024
+
+# Smaller pages than the 1 MiB default, so that page index aware readers can
+# also skip within a row group
+DATA_PAGE_SIZE = 64 * 1024
+
+SORT_COLUMN = "pickup_datetime"
+
+# Only the zones repeat enough for dictionary encoding to pay off; on the
+# durations and timestamps it falls back to plain encoding after wasting space
+DICTIONARY_COLUMNS = ["PULocationID", "DOLocationID"]
+
+BLOOM_FILTER_COLUMNS = ["PULocationID", "DOLocationID"]
+BLOOM_FILTER_FPP = 0.01
+
+SUPPORTS_BLOOM_FILTERS = (
+    "bloom_filter_options" in inspect.signature(pq.ParquetWriter.__init__).parameters
+)
+
+
+def bloom_filter_options(table, columns=BLOOM_FILTER_COLUMNS, fpp=BLOOM_FILTER_FPP):
+    """
+    Bloom filters for columns, sized for their number of distinct values in
+    table, which bounds the number in any row group
+    """
+    options = {}
+    for column in columns:
+        ndv = len(pc.unique(table.column(column)))
+        options[column] = {"ndv": max(ndv, 1), "fpp": fpp}
+    return options
+
+
+def write_query_optimized(
+    results_df,
+    output_file,
+    row_group_size=ROW_GROUP_SIZE,
+    data_page_size=DATA_PAGE_SIZE,
+    bloom_filter_columns=BLOOM_FILTER_COLUMNS,
+):
+    """
+    Write results_df for readers that filter on pickup time and location:
+
+    - rows sorted by pickup time, so every row group covers a short time
+      range and its min/max statistics exclude it from other time filters;
+      the order is recorded as the sorting columns of the row groups
+    - column statistics and a page index (column and offset indexes)
+    - dictionary encoding only for the location columns
+    - Bloom filters on the location columns, whose values are spread over
+      all row groups, so equality filters can skip the row groups without
+      the location (needs pyarrow 19 or newer, left out before that)
+    """
+    results_df = results_df.sort_values(SORT_COLUMN, kind="stable")
+    table = pa.Table.from_pandas(results_df, preserve_index=False)
+
+    options = {}
+    if bloom_filter_columns and SUPPORTS_BLOOM_FILTERS:
+        options["bloom_filter_options"] = bloom_filter_options(
+            table, bloom_filter_columns
+        )
+    elif bloom_filter_columns:
+        print(f"pyarrow {pa.__version__} can't write Bloom filters, skipping them")
+
+    pq.write_table(
+        table,
+        output_file,
+        row_group_size=row_group_size,
+        data_page_size=data_page_size,
+        use_dictionary=DICTIONARY_COLUMNS,
+        write_statistics=True,
+        write_page_index=True,
+        sorting_columns=[pq.SortingColumn(table.schema.get_field_index(SORT_COLUMN))],
+        **options,
+    )
+    return output_file
@@ -0,0 +1,453 @@
+import os
+import json
+import time
+import argparse
+import struct
+import numbers
+import operator
+import tempfile
+
+import numpy as np
+import pandas as pd
+import pyarrow.parquet as pq
+
+from result_layout import write_query_optimized
+
+OPERATORS = {
+    "==": operator.eq,
+    "<": operator.lt,
+    "<=": operator.le,
+    ">": operator.gt,
+    ">=": operator.ge,
+}
+
+NUM_LOCATIONS = 265
+
+# Zones with only a handful of pickups a month, like many outer borough ones
+QUIET_LOCATIONS = 20
+QUIET_RIDES = 5
+
+
+def make_results(n_rows, seed=0, year=2023, month=1):
+    """
+    Results of a month as process_results writes them: rides in input order
+    (not by time), and a skewed location distribution like the real one,
+    where a few zones have most rides and the last QUIET_LOCATIONS have
+    about QUIET_RIDES each
+    """
+    rng = np.random.default_rng(seed)
+    start = pd.Timestamp(year=year, month=month, day=1)
+    seconds = (start + pd.offsets.MonthBegin(1) - start).total_seconds()
+    pickup = start + pd.to_timedelta(rng.integers(0, seconds, n_rows), unit="s")
+    duration = rng.gamma(2.0, 7.0, n_rows).clip(1, 60)
+
+    weights = 1 / np.arange(1, NUM_LOCATIONS + 1) ** 1.5
+    weights[-QUIET_LOCATIONS:] = 0
+    weights *= (1 - QUIET_LOCATIONS * QUIET_RIDES / n_rows) / weights.sum()
+    weights[-QUIET_LOCATIONS:] = QUIET_RIDES / n_rows
+    locations = np.arange(1, NUM_LOCATIONS + 1).astype(str)
+
+    return pd.DataFrame(
+        {
+            "ride_id": np.arange(n_rows),
+            "predicted_duration": duration + rng.normal(0, 3, n_rows),
+            "actual_duration": duration,
+            "pickup_datetime": pickup,
+            "dropoff_datetime": pickup + pd.to_timedelta(duration, unit="m"),
+            "PULocationID": rng.choice(locations, n_rows, p=weights),
+            "DOLocationID": rng.choice(locations, n_rows, p=weights),
+        }
+    )
+
+
+def typical_filters(df):
+    """Filters analysts run: a day, an hour, a busy and a quiet zone, a day in a zone"""
+    day = df.pickup_datetime.min().normalize() + pd.Timedelta(days=14)
+    counts = df.PULocationID.value_counts()
+    busy, quiet = counts.index[0], counts.index[-1]
+    quiet_dropoff = df.DOLocationID.value_counts().index[-1]
+    one_day = [
+        ("pickup_datetime", ">=", day),
+        ("pickup_datetime", "<", day + pd.Timedelta(days=1)),
+    ]
+    return {
+        "one day": one_day,
+        "one hour": [
+            ("pickup_datetime", ">=", day + pd.Timedelta(hours=8)),
+            ("pickup_datetime", "<", day + pd.Timedelta(hours=9)),
+        ],
+        "busy pickup zone": [("PULocationID", "==", busy)],
+        "quiet pickup zone": [("PULocationID", "==", quiet)],
+        "quiet dropoff zone": [("DOLocationID", "==", quiet_dropoff)],
+        "one day, busy zone": one_day + [("PULocationID", "==", busy)],
+    }
+
+
+# Bloom filters as defined by the parquet format: split block filters of
+# 256 bit blocks over the xxHash64 of the plain encoded value
+
+_P1 = 11400714785074694791
+_P2 = 14029467366897019727
+_P3 = 1609587929392839161
+_P4 = 9650029242287828579
+_P5 = 2870177450012600261
+_MASK = 2**64 - 1
+
+SALT = [
+    0x47B6137B,
+    0x44974D91,
+    0x8824AD5B,
+    0xA2B7289D,
+    0x705495C7,
+    0x2DF1424B,
+    0x9EFC4947,
+    0x5C6BFB31,
+]
+
+
+def _rotl(x, r):
+    return ((x << r) | (x >> (64 - r))) & _MASK
+
+
+def _round(acc, lane):
+    acc = (acc + lane * _P2) & _MASK
+    return (_rotl(acc, 31) * _P1) & _MASK
+
+
+def _merge(acc, value):
+    acc ^= _round(0, value)
+    return (acc * _P1 + _P4) & _MASK
+
+
+def xxh64(data, seed=0):
+    """xxHash64 of bytes"""
+    n = len(data)
+    i = 0
+    if n >= 32:
+        v1 = (seed + _P1 + _P2) & _MASK
+        v2 = (seed + _P2) & _MASK
+        v3 = seed
+        v4 = (seed - _P1) & _MASK
+        while i + 32 <= n:
+            v1 = _round(v1, int.from_bytes(data[i : i + 8], "little"))
+            v2 = _round(v2, int.from_bytes(data[i + 8 : i + 16], "little"))
+            v3 = _round(v3, int.from_bytes(data[i + 16 : i + 24], "little"))
+            v4 = _round(v4, int.from_bytes(data[i + 24 : i + 32], "little"))
+            i += 32
+        h = (_rotl(v1, 1) + _rotl(v2, 7) + _rotl(v3, 12) + _rotl(v4, 18)) & _MASK
+        for v in (v1, v2, v3, v4):
+            h = _merge(h, v)
+    else:
+        h = (seed + _P5) & _MASK
+
+    h = (h + n) & _MASK
+    while i + 8 <= n:
+        h ^= _round(0, int.from_bytes(data[i : i + 8], "little"))
+        h = (_rotl(h, 27) * _P1 + _P4) & _MASK
+        i += 8
+    if i + 4 <= n:
+        h ^= (int.from_bytes(data[i : i + 4], "little") * _P1) & _MASK
+        h = (_rotl(h, 23) * _P2 + _P3) & _MASK
+        i += 4
+    while i < n:
+        h ^= (data[i] * _P5) & _MASK
+        h = (_rotl(h, 11) * _P1) & _MASK
+        i += 1
+
+    h ^= h >> 33
+    h = (h * _P2) & _MASK
+    h ^= h >> 29
+    h = (h * _P3) & _MASK
+    h ^= h >> 32
+    return h
+
+
+def _read_varint(data, pos):
+    result = shift = 0
+    while True:
+        byte = data[pos]
+        pos += 1
+        result |= (byte & 0x7F) << shift
+        shift += 7
+        if not byte & 0x80:
+            return result, pos
+
+
+def _read_header(data, pos=0):
+    """
+    Fields of a thrift compact struct with i32 and struct fields, which is
+    all a BloomFilterHeader has. Returns ({field id: value}, end position)
+    """
+    fields = {}
+    field_id = 0
+    while True:
+        byte = data[pos]
+        pos += 1
+        if byte == 0:
+            return fields, pos
+        field_type = byte & 0x0F
+        if byte >> 4:
+            field_id += byte >> 4
+        else:
+            value, pos = _read_varint(data, pos)
+            field_id = (value >> 1) ^ -(value & 1)
+        if field_type == 5:
+            value, pos = _read_varint(data, pos)
+            fields[field_id] = (value >> 1) ^ -(value & 1)
+        elif field_type == 12:
+            fields[field_id], pos = _read_header(data, pos)
+        else:
+            raise ValueError(f"Unexpected field type {field_type} in Bloom filter")
+
+
+# Little endian layout of the fixed width physical types in the plain encoding
+PLAIN_FORMATS = {"INT32": "<i", "INT64": "<q", "FLOAT": "<f", "DOUBLE": "<d"}
+
+
+def plain_encoded(value, physical_type):
+    """
+    Bytes a value is hashed as in a column of physical_type: the bytes
+    themselves (UTF-8 for strings) for BYTE_ARRAY, little endian values of
+    the type's width for numbers
+    """
+    if physical_type == "BYTE_ARRAY":
+        if isinstance(value, (str, bytes)):
+            return value.encode() if isinstance(value, str) else value
+    elif physical_type not in PLAIN_FORMATS:
+        raise ValueError(f"Bloom filters of {physical_type} columns aren't supported")
+    elif isinstance(
+        value, numbers.Integral if physical_type.startswith("INT") else numbers.Real
+    ) and not isinstance(value, bool):
+        try:
+            return struct.pack(PLAIN_FORMATS[physical_type], value)
+        except struct.error:
+            pass
+    raise ValueError(f"Can't look up {value!r} in a {physical_type} column")
+
+
+class BloomFilters:
+    """
+    Reads the Bloom filters of a parquet file, for readers that don't:
+
+        with BloomFilters(path) as filters:
+            filters.might_contain(row_group, "PULocationID", "132")
+
+    False means the row group doesn't have the value; True that it may
+    (or that the column has no Bloom filter)
+    """
+
+    def __init__(self, path):
+        self.metadata = pq.read_metadata(path)
+        self._file = open(path, "rb")
+        self._filters = {}
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *exc_info):
+        self.close()
+
+    def close(self):
+        self._file.close()
+
+    def _chunk(self, row_group, column):
+        index = self.metadata.schema.to_arrow_schema().get_field_index(column)
+        return self.metadata.row_group(row_group).column(index)
+
+    def _bitset(self, row_group, column):
+        key = (row_group, column)
+        if key not in self._filters:
+            chunk = self._chunk(row_group, column)
+            bitset = None
+            if chunk.bloom_filter_offset:
+                self._file.seek(chunk.bloom_filter_offset)
+                # The header is a few bytes; read generously if the length is unknown
+                data = self._file.read(chunk.bloom_filter_length or 64)
+                header, end = _read_header(data)
+                num_bytes = header[1]
+                bitset = data[end : end + num_bytes]
+                if len(bitset) < num_bytes:
+                    bitset += self._file.read(num_bytes - len(bitset))
+            self._filters[key] = bitset
+        return self._filters[key]
+
+    def has_filter(self, row_group, column):
+        return self._bitset(row_group, column) is not None
+
+    def might_contain(self, row_group, column, value):
+        bitset = self._bitset(row_group, column)
+        if bitset is None:
+            return True
+
+        physical_type = self._chunk(row_group, column).physical_type
+        h = xxh64(plain_encoded(value, physical_type))
+        num_blocks = len(bitset) // 32
+        block = ((h >> 32) * num_blocks) >> 32
+        key = h & 0xFFFFFFFF
+        for i, salt in enumerate(SALT):
+            word = int.from_bytes(
+                bitset[block * 32 + i * 4 : block * 32 + i * 4 + 4], "little"
+            )
+            if not (word >> (((key * salt) & 0xFFFFFFFF) >> 27)) & 1:
+                return False
+        return True
+
+
+def may_match(statistics, op, value):
+    """Whether a row group with these min/max statistics can have rows matching"""
+    if statistics is None or not statistics.has_min_max:
+        return True
+    low, high = statistics.min, statistics.max
+    if op == "==":
+        return low <= value <= high
+    if op in ("<", "<="):
+        return OPERATORS[op](low, value)
+    return OPERATORS[op](high, value)
+
+
+def row_groups_to_read(path, conditions, use_bloom_filters=True):
+    """
+    Row groups of path a reader has to read for the conjunction conditions:
+    those not excluded by min/max statistics and, for equality conditions,
+    by Bloom filters
+    """
+    with BloomFilters(path) as filters:
+        metadata = filters.metadata
+        schema = metadata.schema.to_arrow_schema()
+        needed = []
+        for i in range(metadata.num_row_groups):
+            row_group = metadata.row_group(i)
+            keep = True
+            for column, op, value in conditions:
+                chunk = row_group.column(schema.get_field_index(column))
+                if not may_match(chunk.statistics, op, value):
+                    keep = False
+                elif (
+                    use_bloom_filters
+                    and op == "=="
+                    and not filters.might_contain(i, column, value)
+                ):
+                    keep = False
+                if not keep:
+                    break
+            if keep:
+                needed.append(i)
+        return needed
+
+
+def best_time(run, repeat):
+    times = []
+    for _ in range(repeat):
+        start = time.perf_counter()
+        result = run()
+        times.append(time.perf_counter() - start)
+    return min(times), result
+
+
+def read_pruned(path, conditions):
+    """Read like a Bloom filter aware reader: only the row groups that may match"""
+    row_groups = row_groups_to_read(path, conditions)
+    table = pq.ParquetFile(path).read_row_groups(row_groups)
+    return table.filter(pq.filters_to_expression(conditions))
+
+
+def benchmark_file(path, filters, repeat=3):
+    """
+    Row groups kept per filter, and the read time with pyarrow's filters
+    (which prune by statistics only) and with Bloom filters as well
+    """
+    metadata = pq.read_metadata(path)
+    results = {}
+    for name, conditions in filters.items():
+        by_statistics = row_groups_to_read(path, conditions, use_bloom_filters=False)
+        by_bloom = row_groups_to_read(path, conditions)
+        seconds, table = best_time(
+            lambda: pq.read_table(path, filters=conditions), repeat
+        )
+        pruned_seconds, pruned = best_time(
+            lambda: read_pruned(path, conditions), repeat
+        )
+        assert pruned.num_rows == table.num_rows
+        results[name] = {
+            "row_groups": metadata.num_row_groups,
+            "kept_by_statistics": len(by_statistics),
+            "kept_by_statistics_and_bloom": len(by_bloom),
+            "bytes_to_read": sum(
+                metadata.row_group(i).total_byte_size for i in by_bloom
+            ),
+            "rows": table.num_rows,
+            "read_seconds": seconds,
+            "pruned_read_seconds": pruned_seconds,
+        }
+    return {"file_bytes": os.path.getsize(path), "filters": results}
+
+
+def run_results_benchmark(n_rows, data_dir, repeat=3, row_group_size=None):
+    """Compare the default result file with the query optimized one"""
+    df = make_results(n_rows)
+    filters = typical_filters(df)
+    default_file = os.path.join(data_dir, "results_default.parquet")
+    optimized_file = os.path.join(data_dir, "results_optimized.parquet")
+
+    df.to_parquet(default_file, engine="pyarrow")
+    options = {"row_group_size": row_group_size} if row_group_size else {}
+    start = time.perf_counter()
+    write_query_optimized(df, optimized_file, **options)
+    write_seconds = time.perf_counter() - start
+
+    report = {
+        "rows": n_rows,
+        "default": benchmark_file(default_file, filters, repeat),
+        "optimized": benchmark_file(optimized_file, filters, repeat),
+    }
+    report["optimized"]["write_seconds"] = write_seconds
+
+    print(
+        f"{n_rows} rows, file sizes: {report['default']['file_bytes']} bytes "
+        f"default, {report['optimized']['file_bytes']} bytes optimized"
+    )
+    for name in filters:
+        default = report["default"]["filters"][name]
+        optimized = report["optimized"]["filters"][name]
+        print(
+            f"{name:20} default: {default['kept_by_statistics_and_bloom']}/"
+            f"{default['row_groups']} row groups, {default['read_seconds'] * 1000:.1f} ms"
+            f" | optimized: {optimized['kept_by_statistics']}/"
+            f"{optimized['row_groups']} by statistics, "
+            f"{optimized['kept_by_statistics_and_bloom']} with Bloom filters, "
+            f"{optimized['read_seconds'] * 1000:.1f} ms "
+            f"({optimized['pruned_read_seconds'] * 1000:.1f} ms with Bloom filters)"
+        )
+    return report
+
+
+def parse_args(argv=None):
+    parser = argparse.ArgumentParser(
+        description="Row group pruning of default vs query optimized result files"
+    )
+    parser.add_argument("--rows", type=int, default=3_000_000)
+    parser.add_argument("--repeat", type=int, default=3)
+    parser.add_argument("--row-group-size", type=int, default=None)
+    parser.add_argument(
+        "--data-dir", default=None, help="Where the files go, a temp dir by default"
+    )
+    parser.add_argument("--output", default=None, help="Write the report as JSON")
+    return parser.parse_args(argv)
+
+
+def main(argv=None):
+    args = parse_args(argv)
+    with tempfile.TemporaryDirectory() as temp_dir:
+        data_dir = args.data_dir or temp_dir
+        os.makedirs(data_dir, exist_ok=True)
+        report = run_results_benchmark(
+            args.rows, data_dir, args.repeat, args.row_group_size
+        )
+    if args.output:
+        with open(args.output, "w") as f_out:
+            json.dump(report, f_out, indent=2)
+    return report
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,97 @@
+import os
+import json
+import hashlib
+import http.client
+from datetime import datetime
+
+from downloader import remote_info
+from model_cache import file_sha256
+
+CODE_DIR = os.path.dirname(os.path.abspath(__file__))
+
+# Flow code whose changes should trigger new runs
+FLOW_FILE = os.path.join(CODE_DIR, "batch_inference_flow.py")
+
+# The flow and the local modules it imports, which all decide what a run
+# writes
+FLOW_MODULES = [
+    "batch_inference_flow.py",
+    "arrow_handoff.py",
+    "downloader.py",
+    "model_cache.py",
+    "month_runs.py",
+    "result_layout.py",
+]
+
+
+def code_version():
+    """sha256 over the code of FLOW_MODULES"""
+    digest = hashlib.sha256()
+    for name in FLOW_MODULES:
+        digest.update(f"{name}:{file_sha256(os.path.join(CODE_DIR, name))}\n".encode())
+    return digest.hexdigest()
+
+
+def url_fingerprint(url):
+    """
+    Size, ETag and Last-Modified of a URL, from the HEAD request the
+    downloader makes (see downloader.remote_info), empty if it fails
+    """
+    try:
+        info = remote_info(url)
+    except (OSError, http.client.HTTPException) as e:
+        print(f"Could not fingerprint {url}: {e}")
+        return {}
+
+    return {
+        key: info[key]
+        for key in ["size", "etag", "last_modified"]
+        if info[key] is not None
+    }
+
+
+def run_fingerprint(url, model_path, dv_path=None):
+    """Everything that decides what a batch_inference run writes"""
+    return {
+        "input_url": url,
+        "input": url_fingerprint(url),
+        "model": file_sha256(model_path),
+        "dv": file_sha256(dv_path) if dv_path is not None else None,
+        "code_version": code_version(),
+    }
+
+
+def read_manifest(manifest_file):
+    try:
+        with open(manifest_file) as f_in:
+            return json.load(f_in)
+    except (FileNotFoundError, ValueError):
+        return None
+
+
+def up_to_date_manifest(manifest_file, fingerprint):
+    """
+    The manifest of the last run if it was made from the same input, model
+    and code and its output file still exists, otherwise None
+    """
+    if not fingerprint["input"]:
+        return None
+
+    manifest = read_manifest(manifest_file)
+    if manifest is None:
+        return None
+    if any(manifest.get(key) != value for key, value in fingerprint.items()):
+        return None
+    if not os.path.exists(manifest.get("output_file", "")):
+        return None
+    return manifest
+
+
+def write_manifest(manifest_file, manifest):
+    """Write the manifest through a temp file, so a crash never leaves half of one"""
+    manifest = dict(manifest, created=datetime.now().isoformat())
+    temp_file = manifest_file + ".tmp"
+    with open(temp_file, "w") as f_out:
+        json.dump(manifest, f_out, indent=2)
+    os.replace(temp_file, manifest_file)
+    return manifest_file
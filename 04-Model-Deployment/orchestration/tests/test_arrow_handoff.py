@@ -0,0 +1,79 @@
+import os
+import sys
+
+import numpy as np
+import pandas as pd
+import pytest
+from sklearn.feature_extraction import DictVectorizer
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+from arrow_handoff import (
+    read_features,
+    read_predictions,
+    read_rides,
+    write_features,
+    write_predictions,
+    write_rides,
+)
+
+
+@pytest.fixture
+def features():
+    rng = np.random.default_rng(42)
+    n = 500
+    df = pd.DataFrame(
+        {
+            "PULocationID": rng.integers(1, 60, n).astype(str),
+            "DOLocationID": rng.integers(1, 60, n).astype(str),
+            "pickup_hour": rng.integers(0, 24, n),
+            "trip_distance": rng.random(n) * 10,
+        }
+    )
+    df.loc[3, "trip_distance"] = np.nan
+    # Fitted without some locations and without pickup_hour
+    train = df[df.PULocationID != "7"].drop(columns="pickup_hour")
+    dv = DictVectorizer().fit(train.to_dict(orient="records"))
+    return df, dv
+
+
+def test_features_match_dict_vectorizer(tmp_path, features):
+    df, dv = features
+    path = write_features(df, dv, str(tmp_path / "features.arrow"))
+
+    X = read_features(path)
+    expected = dv.transform(df.to_dict(orient="records"))
+    assert X.shape == expected.shape
+    np.testing.assert_array_equal(X.toarray(), expected.toarray())
+
+    # The matrix reads the memory-mapped file, it isn't a copy
+    assert not X.data.flags.writeable
+    assert not X.indices.flags.writeable
+
+
+def test_features_without_rides(tmp_path, features):
+    df, dv = features
+    X = read_features(write_features(df.iloc[:0], dv, str(tmp_path / "f.arrow")))
+    assert X.shape == (0, len(dv.feature_names_))
+
+
+def test_features_without_dict_vectorizer(tmp_path, features):
+    df, _ = features
+    records = read_features(write_features(df, None, str(tmp_path / "f.arrow")))
+    assert records[:2] == df.iloc[:2].to_dict(orient="records")
+
+
+def test_rides_and_predictions(tmp_path, features):
+    df, _ = features
+    df = df[df.pickup_hour > 12]
+    pd.testing.assert_frame_equal(
+        read_rides(write_rides(df, str(tmp_path / "rides.arrow"))),
+        df.rename_axis("ride_id"),
+    )
+
+    predictions = np.linspace(1, 60, len(df))
+    np.testing.assert_array_equal(
+        read_predictions(
+            write_predictions(predictions, str(tmp_path / "predictions.arrow"))
+        ),
+        predictions,
+    )
@@ -0,0 +1,130 @@
+import os
+import sys
+import pickle
+
+import numpy as np
+import pandas as pd
+import pytest
+from sklearn.feature_extraction import DictVectorizer
+from sklearn.linear_model import LinearRegression
+
+pytest.importorskip("prefect")
+pytest.importorskip("boto3")
+from prefect import task
+from prefect.task_runners import SequentialTaskRunner
+from prefect.testing.utilities import prefect_test_harness
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+import batch_inference_flow
+
+
+@pytest.fixture(scope="module", autouse=True)
+def prefect_backend():
+    with prefect_test_harness():
+        yield
+
+
+def write_month(path, n_rows=1000, row_group_size=100):
+    """A month of rides with the columns the flow reads, over several row groups"""
+    rng = np.random.default_rng(42)
+    pickup = pd.Timestamp("2023-01-01") + pd.to_timedelta(
+        rng.integers(0, 28 * 24 * 3600, n_rows), unit="s"
+    )
+    df = pd.DataFrame(
+        {
+            "tpep_pickup_datetime": pickup,
+            "tpep_dropoff_datetime": pickup
+            + pd.to_timedelta(rng.integers(0, 90 * 60, n_rows), unit="s"),
+            "PULocationID": rng.integers(1, 60, n_rows),
+            "DOLocationID": rng.integers(1, 60, n_rows),
+            "trip_distance": rng.random(n_rows) * 10,
+        }
+    )
+    df.to_parquet(path, row_group_size=row_group_size)
+
+
+def write_model(path):
+    rng = np.random.default_rng(0)
+    records = [
+        {
+            "PULocationID": str(rng.integers(1, 60)),
+            "DOLocationID": str(rng.integers(1, 60)),
+            "pickup_hour": int(rng.integers(0, 24)),
+            "trip_distance": float(rng.random() * 10),
+        }
+        for _ in range(200)
+    ]
+    dv = DictVectorizer().fit(records)
+    model = LinearRegression().fit(dv.transform(records), rng.random(200) * 60)
+    with open(path, "wb") as f_out:
+        pickle.dump((dv, model), f_out)
+
+
+@pytest.fixture
+def flow_inputs(tmp_path, monkeypatch):
+    """Months in tmp_path instead of downloads: 2023-01 exists, 2023-02 doesn't"""
+    month_file = tmp_path / "2023-01.parquet"
+    write_month(month_file)
+    model_path = tmp_path / "model.bin"
+    write_model(model_path)
+
+    @task
+    def download_data(year, month):
+        if (year, month) != (2023, 1):
+            raise FileNotFoundError(f"No data for {year}-{month:02d}")
+        return str(month_file)
+
+    monkeypatch.setattr(batch_inference_flow, "download_data", download_data)
+    monkeypatch.setattr(
+        batch_inference_flow,
+        "run_fingerprint",
+        lambda url, model_path, dv_path=None: {"input_url": url},
+    )
+    return tmp_path, str(model_path)
+
+
+def run_flow(tmp_path, model_path, name, **kwargs):
+    return batch_inference_flow.batch_inference.with_options(
+        task_runner=SequentialTaskRunner()
+    )(
+        model_path=model_path,
+        output_file=str(tmp_path / name / "{year}-{month:02d}.parquet"),
+        force=True,
+        **kwargs,
+    )
+
+
+def test_chunked_run_matches_unchunked(flow_inputs):
+    """Chunks planned in score_chunks give the same results as the whole file"""
+    tmp_path, model_path = flow_inputs
+    whole = run_flow(tmp_path, model_path, "whole", months=["2023-01"])
+    chunked = run_flow(
+        tmp_path, model_path, "chunked", months=["2023-01"], chunk_row_groups=3
+    )
+
+    assert whole["success"] and chunked["success"]
+    assert chunked["rows"] == whole["rows"] > 0
+    pd.testing.assert_frame_equal(
+        pd.read_parquet(chunked["months"][0]["output_file"]),
+        pd.read_parquet(whole["months"][0]["output_file"]),
+    )
+    # The Arrow files of the chunks are removed with the month
+    assert not os.listdir(tmp_path / "chunked" / ".work")
+
+
+def test_failed_download_fails_only_its_month(flow_inputs):
+    tmp_path, model_path = flow_inputs
+    summary = run_flow(
+        tmp_path,
+        model_path,
+        "out",
+        months=["2023-02", "2023-01"],
+        chunk_row_groups=3,
+    )
+
+    failed, scored = summary["months"]
+    assert not summary["success"]
+    assert (failed["month"], failed["success"]) == (2, False)
+    assert "No data for 2023-02" in failed["error"]
+    assert (scored["month"], scored["success"]) == (1, True)
+    assert summary["rows"] == scored["rows"] > 0
@@ -0,0 +1,250 @@
+import os
+import re
+import sys
+import hashlib
+import threading
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+
+import pytest
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+from downloader import (
+    download,
+    download_many,
+    info_path,
+    partial_path,
+    plan_parts,
+    remote_info,
+    state_path,
+)
+from run_manifest import url_fingerprint
+
+RANGE_PATTERN = re.compile(r"bytes=(\d+)-(\d+)")
+
+PART_SIZE = 1000
+
+
+class FileHandler(BaseHTTPRequestHandler):
+    """
+    Serves server.files ({path: bytes}) with an MD5 ETag and, unless
+    server.ranges is off, byte ranges. A request for a range in
+    server.failures gets half of its body before the connection drops
+    """
+
+    protocol_version = "HTTP/1.1"
+
+    def log_message(self, format, *args):
+        pass
+
+    def _headers(self, status, body, extra=None):
+        content = self.server.files[self.path]
+        self.send_response(status)
+        self.send_header("Content-Length", str(len(body)))
+        self.send_header("ETag", self.server.etags.get(self.path) or etag_of(content))
+        if self.server.ranges:
+            self.send_header("Accept-Ranges", "bytes")
+        for key, value in (extra or {}).items():
+            self.send_header(key, value)
+        self.end_headers()
+
+    def do_HEAD(self):
+        if self.path not in self.server.files:
+            self.send_error(404)
+            return
+        self._headers(200, self.server.files[self.path])
+
+    def do_GET(self):
+        if self.path not in self.server.files:
+            self.send_error(404)
+            return
+        content = self.server.files[self.path]
+        match = RANGE_PATTERN.fullmatch(self.headers.get("Range", ""))
+        with self.server.lock:
+            self.server.requests.append(self.headers.get("Range"))
+        if not self.server.ranges or match is None:
+            self._headers(200, content)
+            self.wfile.write(content)
+            return
+
+        start, end = int(match[1]), int(match[2])
+        body = content[start : end + 1]
+        self._headers(
+            206, body, {"Content-Range": f"bytes {start}-{end}/{len(content)}"}
+        )
+        with self.server.lock:
+            fail = self.server.failures.get(start, 0)
+            if fail:
+                self.server.failures[start] = fail - 1
+        if fail:
+            self.wfile.write(body[: len(body) // 2])
+            self.close_connection = True
+            return
+        self.wfile.write(body)
+
+
+def etag_of(content):
+    return '"' + hashlib.md5(content).hexdigest() + '"'
+
+
+@pytest.fixture
+def http_server():
+    server = ThreadingHTTPServer(("127.0.0.1", 0), FileHandler)
+    server.files = {}
+    server.etags = {}
+    server.ranges = True
+    server.failures = {}
+    server.requests = []
+    server.lock = threading.Lock()
+    thread = threading.Thread(target=server.serve_forever, daemon=True)
+    thread.start()
+    yield server, f"http://127.0.0.1:{server.server_address[1]}"
+    server.shutdown()
+    server.server_close()
+
+
+def options(**kwargs):
+    return dict(dict(part_size=PART_SIZE, max_workers=4, backoff=0.01), **kwargs)
+
+
+def test_plan_parts():
+    assert plan_parts(2500, 1000) == [(0, 999), (1000, 1999), (2000, 2499)]
+    assert plan_parts(1000, 1000) == [(0, 999)]
+    assert plan_parts(0, 1000) == []
+
+
+def test_parallel_download(tmp_path, http_server):
+    server, base_url = http_server
+    server.files["/month.parquet"] = content = os.urandom(5500)
+    local_file = str(tmp_path / "data" / "month.parquet")
+
+    assert download(f"{base_url}/month.parquet", local_file, **options()) == local_file
+    with open(local_file, "rb") as f_in:
+        assert f_in.read() == content
+    assert sorted(server.requests) == sorted(
+        f"bytes={start}-{end}" for start, end in plan_parts(5500, PART_SIZE)
+    )
+    assert not os.path.exists(partial_path(local_file))
+    assert not os.path.exists(state_path(local_file))
+
+    # Unchanged, so nothing is downloaded again
+    server.requests.clear()
+    download(f"{base_url}/month.parquet", local_file, **options())
+    assert server.requests == []
+
+
+def test_failed_parts_are_retried(tmp_path, http_server):
+    server, base_url = http_server
+    server.files["/month.parquet"] = content = os.urandom(3000)
+    server.failures = {1000: 2}
+    local_file = str(tmp_path / "month.parquet")
+
+    download(f"{base_url}/month.parquet", local_file, **options(retries=2))
+    with open(local_file, "rb") as f_in:
+        assert f_in.read() == content
+    assert server.requests.count("bytes=1000-1999") == 3
+
+
+def test_resume_partial_download(tmp_path, http_server):
+    """An interrupted download leaves no local_file and fetches only the missing parts"""
+    server, base_url = http_server
+    server.files["/month.parquet"] = content = os.urandom(5000)
+    server.failures = {2000: 1, 4000: 1}
+    local_file = str(tmp_path / "month.parquet")
+
+    with pytest.raises(Exception):
+        download(f"{base_url}/month.parquet", local_file, **options(retries=0))
+    assert not os.path.exists(local_file)
+    assert os.path.exists(partial_path(local_file))
+
+    server.requests.clear()
+    download(f"{base_url}/month.parquet", local_file, **options(retries=0))
+    assert sorted(server.requests) == ["bytes=2000-2999", "bytes=4000-4999"]
+    with open(local_file, "rb") as f_in:
+        assert f_in.read() == content
+
+
+def test_changed_file_is_downloaded_again(tmp_path, http_server):
+    server, base_url = http_server
+    server.files["/month.parquet"] = os.urandom(3000)
+    server.failures = {0: 1}
+    local_file = str(tmp_path / "month.parquet")
+    with pytest.raises(Exception):
+        download(f"{base_url}/month.parquet", local_file, **options(retries=0))
+
+    # A new version: the parts of the old one are not reused
+    server.files["/month.parquet"] = content = os.urandom(3000)
+    server.requests.clear()
+    download(f"{base_url}/month.parquet", local_file, **options())
+    assert len(server.requests) == 3
+    with open(local_file, "rb") as f_in:
+        assert f_in.read() == content
+
+    # And a complete download of an older version is replaced
+    server.files["/month.parquet"] = content = os.urandom(2000)
+    download(f"{base_url}/month.parquet", local_file, **options())
+    with open(local_file, "rb") as f_in:
+        assert f_in.read() == content
+
+
+def test_corrupt_download_is_rejected(tmp_path, http_server):
+    """The MD5 in the ETag is checked before the file is renamed into place"""
+    server, base_url = http_server
+    server.files["/month.parquet"] = content = os.urandom(3000)
+    server.etags["/month.parquet"] = etag_of(content[::-1])
+    local_file = str(tmp_path / "month.parquet")
+
+    with pytest.raises(ValueError, match="MD5"):
+        download(f"{base_url}/month.parquet", local_file, **options())
+    assert not os.path.exists(local_file)
+    assert not os.path.exists(partial_path(local_file))
+
+
+def test_server_without_ranges(tmp_path, http_server):
+    server, base_url = http_server
+    server.ranges = False
+    server.files["/month.parquet"] = content = os.urandom(3000)
+    local_file = str(tmp_path / "month.parquet")
+
+    download(f"{base_url}/month.parquet", local_file, **options())
+    assert server.requests == [None]
+    with open(local_file, "rb") as f_in:
+        assert f_in.read() == content
+    assert os.path.exists(info_path(local_file))
+
+
+def test_download_many(tmp_path, http_server):
+    server, base_url = http_server
+    items = []
+    for month in range(1, 4):
+        server.files[f"/2023-{month:02d}.parquet"] = os.urandom(2500)
+        items.append(
+            (
+                f"{base_url}/2023-{month:02d}.parquet",
+                str(tmp_path / f"2023-{month:02d}.parquet"),
+            )
+        )
+
+    assert download_many(items, max_files=3, **options()) == [
+        local_file for _, local_file in items
+    ]
+    for url, local_file in items:
+        with open(local_file, "rb") as f_in:
+            assert f_in.read() == server.files[url[len(base_url) :]]
+
+    with pytest.raises(Exception):
+        download_many([(f"{base_url}/missing.parquet", str(tmp_path / "x"))])
+
+
+def test_fingerprint_is_what_the_download_checks(http_server):
+    """The manifest skips by the same HEAD metadata the download checks against"""
+    server, base_url = http_server
+    server.files["/month.parquet"] = content = os.urandom(1500)
+    url = f"{base_url}/month.parquet"
+
+    info = remote_info(url)
+    assert url_fingerprint(url) == {"size": 1500, "etag": etag_of(content)}
+    assert info["size"] == 1500 and info["etag"] == etag_of(content)
+
+    server.etags["/month.parquet"] = '"v2"'
+    assert url_fingerprint(url)["etag"] == '"v2"'
+    assert url_fingerprint(f"{base_url}/missing.parquet") == {}
@@ -0,0 +1,107 @@
+import os
+import sys
+import pickle
+
+import pytest
+from sklearn.feature_extraction import DictVectorizer
+from sklearn.linear_model import LinearRegression
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+from model_cache import ModelCache, file_sha256, load_pickles
+
+
+def write_model(path, intercept=0.0, tuple_order=None):
+    """A pickled LinearRegression, alone or in a tuple with a DictVectorizer"""
+    dv = DictVectorizer().fit([{"PULocationID": "1"}, {"PULocationID": "2"}])
+    lr = LinearRegression().fit(dv.transform([{"PULocationID": "1"}] * 2), [1, 1])
+    lr.intercept_ = intercept
+    if tuple_order == "dv_first":
+        content = (dv, lr)
+    elif tuple_order == "model_first":
+        content = (lr, dv)
+    else:
+        content = lr
+    with open(path, "wb") as f_out:
+        pickle.dump(content, f_out)
+    return str(path)
+
+
+def write_dv(path):
+    with open(path, "wb") as f_out:
+        pickle.dump(DictVectorizer().fit([{"a": "b"}]), f_out)
+    return str(path)
+
+
+@pytest.mark.parametrize("tuple_order", ["dv_first", "model_first"])
+def test_load_pickles(tmp_path, tuple_order):
+    model, dv = load_pickles(write_model(tmp_path / "model.bin", 1, tuple_order))
+    assert isinstance(model, LinearRegression)
+    assert isinstance(dv, DictVectorizer)
+
+    model, dv = load_pickles(
+        write_model(tmp_path / "lr.bin"), write_dv(tmp_path / "dv.pkl")
+    )
+    assert isinstance(model, LinearRegression)
+    assert dv.feature_names_ == ["a=b"]
+
+
+def test_hits_and_misses(tmp_path):
+    cache = ModelCache()
+    model_path = write_model(tmp_path / "model.bin", 1, "dv_first")
+
+    model, dv = cache.get(model_path)
+    assert cache.get(model_path) == (model, dv)
+    stats = cache.stats()
+    assert (stats["hits"], stats["misses"], stats["entries"]) == (1, 1, 1)
+    assert stats["load_seconds"] > 0
+    assert stats["bytes"] == os.path.getsize(model_path)
+
+    # Same content under another name is the same entry
+    copy_path = tmp_path / "copy.bin"
+    copy_path.write_bytes(open(model_path, "rb").read())
+    assert cache.get(str(copy_path))[0] is model
+
+    # New content is loaded again
+    write_model(model_path, 2, "dv_first")
+    os.utime(model_path, ns=(0, 0))
+    assert cache.get(model_path)[0].intercept_ == 2
+    assert cache.stats()["misses"] == 2
+
+
+def test_dv_path_is_part_of_the_key(tmp_path):
+    cache = ModelCache()
+    model_path = write_model(tmp_path / "model.bin")
+    _, dv = cache.get(model_path)
+    assert dv is None
+    _, dv = cache.get(model_path, write_dv(tmp_path / "dv.pkl"))
+    assert isinstance(dv, DictVectorizer)
+    assert cache.stats()["misses"] == 2
+
+    with pytest.raises(FileNotFoundError):
+        cache.get(model_path, str(tmp_path / "missing.pkl"))
+
+
+def test_lru_eviction(tmp_path):
+    paths = [write_model(tmp_path / f"{i}.bin", i) for i in range(3)]
+    cache = ModelCache(max_bytes=2 * os.path.getsize(paths[0]))
+
+    cache.get(paths[0])
+    cache.get(paths[1])
+    cache.get(paths[0])
+    cache.get(paths[2])
+    assert cache.stats()["evictions"] == 1
+
+    # 1 was the least recently used
+    cache.get(paths[0])
+    assert cache.stats()["hits"] == 2
+    cache.get(paths[1])
+    assert cache.stats()["misses"] == 4
+
+
+def test_file_sha256(tmp_path):
+    path = tmp_path / "file"
+    assert file_sha256(str(path)) is None
+    path.write_bytes(b"a")
+    first = file_sha256(str(path))
+    path.write_bytes(b"bb")
+    assert file_sha256(str(path)) != first
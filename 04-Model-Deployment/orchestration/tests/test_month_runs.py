@@ -0,0 +1,119 @@
+import os
+import sys
+import threading
+import time
+
+import pandas as pd
+import pytest
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+from month_runs import (
+    failed_summary,
+    month_output_file,
+    month_summary,
+    parse_month,
+    plan_chunks,
+    summarize,
+    task_slots,
+)
+
+
+def test_parse_month():
+    assert parse_month("2023-04") == (2023, 4)
+    assert parse_month((2023, 4)) == (2023, 4)
+    assert parse_month(["2023", "12"]) == (2023, 12)
+    for value in ["2023-13", "2023-00", (2023, 0)]:
+        with pytest.raises(ValueError):
+            parse_month(value)
+    with pytest.raises(ValueError):
+        parse_month("2023")
+
+
+def test_month_output_file():
+    assert (
+        month_output_file(None, 2023, 4, "20230501_120000")
+        == "../output/result_yellow_tripdata_2023-04_20230501_120000.parquet"
+    )
+    assert (
+        month_output_file("out/{year}-{month:02d}.parquet", 2023, 4, "ts")
+        == "out/2023-04.parquet"
+    )
+    assert month_output_file("out/results.parquet", 2023, 4, "ts") == (
+        "out/results.parquet"
+    )
+
+
+def summary(year, month, mean_duration, rows, **kwargs):
+    manifest = {
+        "output_file": f"{year}-{month:02d}.parquet",
+        "mean_duration": mean_duration,
+        "rows": rows,
+        "uploaded": False,
+    }
+    return month_summary(year, month, manifest, **kwargs)
+
+
+def test_summarize_weights_by_rows():
+    result = summarize([summary(2023, 1, 10.0, 100), summary(2023, 2, 20.0, 300)])
+    assert result["mean_duration"] == pytest.approx(17.5)
+    assert result["rows"] == 400
+    assert result["success"]
+
+    # Without the rows of a month, months count alike
+    result = summarize([summary(2023, 1, 10.0, 100), summary(2023, 2, 20.0, None)])
+    assert result["mean_duration"] == pytest.approx(15.0)
+
+
+def test_summarize_skipped_and_failed_months():
+    months = [
+        summary(2023, 1, 10.0, 100, skipped=True),
+        summary(2023, 2, 20.0, 100),
+        failed_summary(2023, 3, "2023-03.parquet", RuntimeError("download failed")),
+    ]
+    result = summarize(months)
+    assert result["months"] == months
+    assert result["mean_duration"] == pytest.approx(15.0)
+    assert result["rows"] == 200
+    assert not result["success"]
+    assert months[0]["skipped"] and months[0]["success"]
+    assert months[2]["error"] == "download failed"
+
+    result = summarize([months[2]])
+    assert result["mean_duration"] is None
+    assert not result["success"]
+
+
+def test_plan_chunks(tmp_path):
+    path = tmp_path / "rides.parquet"
+    pd.DataFrame({"ride": range(50)}).to_parquet(path, row_group_size=10)
+    assert plan_chunks(path, 2) == [[0, 1], [2, 3], [4]]
+    assert plan_chunks(path, 5) == [[0, 1, 2, 3, 4]]
+    assert plan_chunks(path, 10) == [[0, 1, 2, 3, 4]]
+
+    empty = tmp_path / "empty.parquet"
+    pd.DataFrame({"ride": []}).to_parquet(empty)
+    assert len(plan_chunks(empty, 2)) == 1
+
+
+def test_task_slots():
+    """No more than limit tasks hold a slot at once"""
+    assert task_slots(2) is task_slots(2)
+    running = []
+    most = []
+    lock = threading.Lock()
+
+    def task():
+        with task_slots(2):
+            with lock:
+                running.append(1)
+                most.append(len(running))
+            time.sleep(0.02)
+            with lock:
+                running.pop()
+
+    threads = [threading.Thread(target=task) for _ in range(8)]
+    for thread in threads:
+        thread.start()
+    for thread in threads:
+        thread.join()
+    assert max(most) == 2
@@ -0,0 +1,153 @@
+import os
+import sys
+
+import pandas as pd
+import pyarrow.parquet as pq
+import pytest
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+from result_layout import SUPPORTS_BLOOM_FILTERS, write_query_optimized
+from results_benchmark import (
+    BloomFilters,
+    make_results,
+    plain_encoded,
+    row_groups_to_read,
+    run_results_benchmark,
+    typical_filters,
+    xxh64,
+)
+
+needs_bloom_filters = pytest.mark.skipif(
+    not SUPPORTS_BLOOM_FILTERS, reason="pyarrow can't write Bloom filters"
+)
+
+
+@pytest.fixture
+def results():
+    return make_results(50_000, seed=1)
+
+
+def test_xxh64():
+    # Reference values of xxHash64, with seed 0 unless given
+    assert xxh64(b"") == 0xEF46DB3751D8E999
+    assert xxh64(b"a") == 0xD24EC4F1A98C6E5B
+    assert xxh64(b"abc") == 0x44BC2CF5AD770999
+    # Over 32 bytes, the four lane loop
+    assert xxh64(b"Nobody inspects the spammish repetition") == 0xFBCEA83C8A378BF1
+    assert xxh64(b"xxhash", seed=20) == 0x48B35AA98DC04F56
+
+
+def test_query_optimized_layout(tmp_path, results):
+    path = write_query_optimized(
+        results, str(tmp_path / "results.parquet"), row_group_size=5000
+    )
+    table = pq.read_table(path)
+    expected = results.sort_values("pickup_datetime", kind="stable")
+    pd.testing.assert_frame_equal(table.to_pandas(), expected.reset_index(drop=True))
+
+    metadata = pq.read_metadata(path)
+    assert metadata.num_row_groups == 10
+    row_group = metadata.row_group(0)
+    assert row_group.sorting_columns[0].column_index == table.schema.get_field_index(
+        "pickup_datetime"
+    )
+    for i in range(metadata.num_columns):
+        assert row_group.column(i).is_stats_set
+        assert row_group.column(i).has_column_index
+
+
+@needs_bloom_filters
+def test_bloom_filters(tmp_path, results):
+    path = write_query_optimized(
+        results, str(tmp_path / "results.parquet"), row_group_size=5000
+    )
+    parquet_file = pq.ParquetFile(path)
+    with BloomFilters(path) as filters:
+        assert filters.has_filter(0, "PULocationID")
+        assert not filters.has_filter(0, "ride_id")
+        for row_group in range(parquet_file.num_row_groups):
+            present = set(
+                parquet_file.read_row_group(row_group, columns=["PULocationID"])
+                .column(0)
+                .to_pylist()
+            )
+            assert all(
+                filters.might_contain(row_group, "PULocationID", value)
+                for value in present
+            )
+            absent = [str(value) for value in range(1000, 1200)]
+            false_positives = sum(
+                filters.might_contain(row_group, "PULocationID", value)
+                for value in absent
+            )
+            assert false_positives < 10
+
+
+@needs_bloom_filters
+@pytest.mark.parametrize("dtype", ["int32", "int64"])
+def test_bloom_filters_of_int_columns(tmp_path, results, dtype):
+    """Ints are hashed with the width of the column's physical type"""
+    results = results.astype({"PULocationID": dtype, "DOLocationID": dtype})
+    path = write_query_optimized(
+        results, str(tmp_path / "results.parquet"), row_group_size=5000
+    )
+    parquet_file = pq.ParquetFile(path)
+    with BloomFilters(path) as filters:
+        for row_group in range(parquet_file.num_row_groups):
+            present = parquet_file.read_row_group(row_group, columns=["PULocationID"])
+            assert all(
+                filters.might_contain(row_group, "PULocationID", value)
+                for value in set(present.column(0).to_pylist())
+            )
+        absent = range(1000, 1200)
+        assert sum(filters.might_contain(0, "PULocationID", v) for v in absent) < 10
+        with pytest.raises(ValueError):
+            filters.might_contain(0, "PULocationID", "3")
+
+
+def test_plain_encoded():
+    assert plain_encoded(3, "INT32") == b"\x03\x00\x00\x00"
+    assert plain_encoded(3, "INT64") == b"\x03" + b"\x00" * 7
+    assert plain_encoded("3", "BYTE_ARRAY") == b"3"
+    assert len(plain_encoded(1.5, "DOUBLE")) == 8
+    with pytest.raises(ValueError):
+        plain_encoded(2**31, "INT32")
+    with pytest.raises(ValueError):
+        plain_encoded(1.5, "INT64")
+    with pytest.raises(ValueError):
+        plain_encoded(3, "INT96")
+
+
+@needs_bloom_filters
+def test_pruning(tmp_path, results):
+    """Time filters prune by statistics, quiet zones by Bloom filters"""
+    path = write_query_optimized(
+        results, str(tmp_path / "results.parquet"), row_group_size=5000
+    )
+    filters = typical_filters(results)
+
+    assert len(row_groups_to_read(path, filters["one hour"])) == 1
+    quiet = filters["quiet pickup zone"]
+    assert len(row_groups_to_read(path, quiet, use_bloom_filters=False)) == 10
+    assert len(row_groups_to_read(path, quiet)) <= 5
+
+    # What's pruned never has matching rows
+    kept = row_groups_to_read(path, quiet)
+    matching = pq.read_table(path, filters=quiet).num_rows
+    assert matching > 0
+    assert (
+        pq.ParquetFile(path)
+        .read_row_groups(kept)
+        .filter(pq.filters_to_expression(quiet))
+        .num_rows
+        == matching
+    )
+
+
+def test_results_benchmark(tmp_path):
+    report = run_results_benchmark(20_000, str(tmp_path), repeat=1, row_group_size=2000)
+    default = report["default"]["filters"]["one day"]
+    optimized = report["optimized"]["filters"]["one day"]
+    assert default["kept_by_statistics"] == default["row_groups"]
+    assert optimized["kept_by_statistics"] < optimized["row_groups"] / 4
+    assert default["rows"] == optimized["rows"] > 0
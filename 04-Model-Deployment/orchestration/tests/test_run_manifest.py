@@ -0,0 +1,104 @@
+import os
+import ast
+import sys
+import shutil
+
+import pytest
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+import run_manifest
+from run_manifest import (
+    FLOW_MODULES,
+    run_fingerprint,
+    up_to_date_manifest,
+    write_manifest,
+)
+
+
+@pytest.fixture
+def code_dir(tmp_path, monkeypatch):
+    """A copy of the flow's code, fingerprinted instead of the real one"""
+    code_dir = tmp_path / "code"
+    code_dir.mkdir()
+    for name in FLOW_MODULES:
+        shutil.copy(os.path.join(run_manifest.CODE_DIR, name), code_dir / name)
+    monkeypatch.setattr(run_manifest, "CODE_DIR", str(code_dir))
+    monkeypatch.setattr(
+        run_manifest, "url_fingerprint", lambda url: {"size": 10, "etag": '"a"'}
+    )
+    return code_dir
+
+
+@pytest.fixture
+def model_file(tmp_path):
+    path = tmp_path / "model.bin"
+    path.write_bytes(b"model")
+    return str(path)
+
+
+def test_flow_modules_cover_local_imports():
+    """Every local module the flow imports is part of the code version"""
+    with open(run_manifest.FLOW_FILE) as f:
+        tree = ast.parse(f.read())
+    imported = {
+        node.module
+        for node in ast.walk(tree)
+        if isinstance(node, ast.ImportFrom) and node.module
+    } | {
+        alias.name
+        for node in ast.walk(tree)
+        if isinstance(node, ast.Import)
+        for alias in node.names
+    }
+    local = {
+        name + ".py"
+        for name in imported
+        if os.path.exists(os.path.join(run_manifest.CODE_DIR, name + ".py"))
+    }
+    assert local - {"run_manifest.py"} <= set(FLOW_MODULES)
+
+
+def test_up_to_date_manifest(tmp_path, code_dir, model_file):
+    output_file = tmp_path / "result.parquet"
+    output_file.write_bytes(b"result")
+    manifest_file = str(tmp_path / "manifest.json")
+    fingerprint = run_fingerprint("https://example.com/data.parquet", model_file)
+
+    assert up_to_date_manifest(manifest_file, fingerprint) is None
+    write_manifest(manifest_file, dict(fingerprint, output_file=str(output_file)))
+    assert up_to_date_manifest(manifest_file, fingerprint) is not None
+
+    # A changed model is a new run
+    with open(model_file, "ab") as f_out:
+        f_out.write(b" v2")
+    changed = run_fingerprint("https://example.com/data.parquet", model_file)
+    assert up_to_date_manifest(manifest_file, changed) is None
+
+    # So is a missing output
+    os.remove(output_file)
+    assert up_to_date_manifest(manifest_file, fingerprint) is None
+
+
+@pytest.mark.parametrize("module", ["arrow_handoff.py", "result_layout.py"])
+def test_editing_an_imported_module_invalidates(tmp_path, code_dir, model_file, module):
+    output_file = tmp_path / "result.parquet"
+    output_file.write_bytes(b"result")
+    manifest_file = str(tmp_path / "manifest.json")
+    fingerprint = run_fingerprint("https://example.com/data.parquet", model_file)
+    write_manifest(manifest_file, dict(fingerprint, output_file=str(output_file)))
+
+    with open(code_dir / module, "a") as f_out:
+        f_out.write("\n# changed\n")
+    edited = run_fingerprint("https://example.com/data.parquet", model_file)
+    assert edited["code_version"] != fingerprint["code_version"]
+    assert up_to_date_manifest(manifest_file, edited) is None
+
+
+def test_unknown_input_is_never_up_to_date(tmp_path, code_dir, model_file, monkeypatch):
+    monkeypatch.setattr(run_manifest, "url_fingerprint", lambda url: {})
+    output_file = tmp_path / "result.parquet"
+    output_file.write_bytes(b"result")
+    manifest_file = str(tmp_path / "manifest.json")
+    fingerprint = run_fingerprint("https://example.com/data.parquet", model_file)
+    write_manifest(manifest_file, dict(fingerprint, output_file=str(output_file)))
+    assert up_to_date_manifest(manifest_file, fingerprint) is None
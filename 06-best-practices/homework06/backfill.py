@@ -0,0 +1,220 @@
+import sys
+import os
+import time
+import argparse
+import logging
+from concurrent.futures import ProcessPoolExecutor, as_completed
+
+try:
+    from homework06.batch_refactoring import add_output_args, load_model, score_month
+    from homework06.partitioned_writer import DEFAULT_MAX_OPEN_FILES
+except ImportError:
+    from batch_refactoring import add_output_args, load_model, score_month
+    from partitioned_writer import DEFAULT_MAX_OPEN_FILES
+
+# Configure logging
+logging.basicConfig(
+    level=logging.INFO,
+    format="%(asctime)s - %(name)s - %(levelname)s - %(message)s",
+    datefmt="%Y-%m-%d %H:%M:%S",
+)
+logger = logging.getLogger(__name__)
+
+# Model loaded once per worker process by init_worker
+_model = None
+
+
+def parse_month(value):
+    """Parse a YYYY-MM string into a (year, month) tuple"""
+    try:
+        year, month = value.split("-")
+        year, month = int(year), int(month)
+    except ValueError:
+        raise ValueError(f"Expected a month as YYYY-MM, got {value!r}")
+
+    if not 1 <= month <= 12:
+        raise ValueError(f"Month must be between 1 and 12, got {value!r}")
+    return year, month
+
+
+def month_range(start, end):
+    """All (year, month) tuples from start to end, both included"""
+    year, month = parse_month(start)
+    end_year, end_month = parse_month(end)
+
+    months = []
+    while (year, month) <= (end_year, end_month):
+        months.append((year, month))
+        year, month = (year + 1, 1) if month == 12 else (year, month + 1)
+    return months
+
+
+def init_worker():
+    """Load the model once when the worker process starts"""
+    global _model
+    _model = load_model()
+
+
+def score_one(
+    year,
+    month,
+    batch_size=None,
+    compact=False,
+    compression=None,
+    force=False,
+    partitioned=False,
+    max_open_files=DEFAULT_MAX_OPEN_FILES,
+):
+    """Score a single month in a worker and report how it went"""
+    dv, lr = _model
+    start = time.perf_counter()
+
+    try:
+        output_file, rows = score_month(
+            year,
+            month,
+            dv,
+            lr,
+            batch_size=batch_size,
+            compact=compact,
+            compression=compression,
+            force=force,
+            partitioned=partitioned,
+            max_open_files=max_open_files,
+        )
+    except Exception as e:
+        return {
+            "year": year,
+            "month": month,
+            "status": "failed",
+            "error": f"{type(e).__name__}: {e}",
+            "seconds": time.perf_counter() - start,
+        }
+
+    seconds = time.perf_counter() - start
+    return {
+        "year": year,
+        "month": month,
+        "status": "ok",
+        "output_file": output_file,
+        "rows": rows,
+        "seconds": seconds,
+        "rows_per_sec": rows / seconds if seconds > 0 else 0.0,
+    }
+
+
+def backfill(
+    start,
+    end,
+    max_workers=None,
+    batch_size=None,
+    compact=False,
+    compression=None,
+    force=False,
+    partitioned=False,
+    max_open_files=DEFAULT_MAX_OPEN_FILES,
+):
+    """
+    Re-score every month from start to end (YYYY-MM, both included):
+    - Fan the months out over a process pool of at most max_workers processes
+    - Each worker loads the model once and reuses it for all its months;
+      it is loaded here first, so a bad MODEL_PATH fails with its own error
+      instead of a BrokenProcessPool from every worker's init_worker
+    - Input and output paths come from get_input_path/get_output_path,
+      so INPUT_FILE_PATTERN and OUTPUT_FILE_PATTERN are respected
+      (get_dataset_path and OUTPUT_DATASET_PATTERN with partitioned=True)
+    - Months whose output is up to date with the input, model and code are
+      skipped unless force=True (see score_month)
+    Returns one status record per month, in month order.
+    """
+    months = month_range(start, end)
+    if max_workers is None:
+        max_workers = os.cpu_count() or 1
+    max_workers = max(1, min(max_workers, len(months)))
+
+    logger.info(
+        f"Backfilling {len(months)} months from {start} to {end} "
+        f"with {max_workers} workers"
+    )
+
+    load_model()
+
+    started = time.perf_counter()
+    results = []
+    with ProcessPoolExecutor(max_workers=max_workers, initializer=init_worker) as pool:
+        futures = [
+            pool.submit(
+                score_one,
+                year,
+                month,
+                batch_size,
+                compact,
+                compression,
+                force,
+                partitioned,
+                max_open_files,
+            )
+            for year, month in months
+        ]
+        for future in as_completed(futures):
+            result = future.result()
+            results.append(result)
+
+            label = f"{result['year']:04d}-{result['month']:02d}"
+            if result["status"] == "ok":
+                logger.info(
+                    f"{label}: ok, {result['rows']} rows in {result['seconds']:.1f}s "
+                    f"({result['rows_per_sec']:.0f} rows/sec)"
+                )
+            else:
+                logger.error(f"{label}: failed, {result['error']}")
+
+    elapsed = time.perf_counter() - started
+    total_rows = sum(r.get("rows", 0) for r in results)
+    failed = [r for r in results if r["status"] != "ok"]
+    logger.info(
+        f"Backfill finished in {elapsed:.1f}s: {len(results) - len(failed)} ok, "
+        f"{len(failed)} failed, {total_rows} rows "
+        f"({total_rows / elapsed if elapsed > 0 else 0:.0f} rows/sec overall)"
+    )
+
+    return sorted(results, key=lambda r: (r["year"], r["month"]))
+
+
+def parse_args(argv):
+    parser = argparse.ArgumentParser(
+        description="Re-score a range of months in parallel"
+    )
+    parser.add_argument("start", help="First month to score, as YYYY-MM")
+    parser.add_argument("end", help="Last month to score, as YYYY-MM")
+    parser.add_argument(
+        "--workers",
+        type=int,
+        default=None,
+        help="Maximum number of months scored at the same time (default: CPU count)",
+    )
+    parser.add_argument(
+        "--batch-size",
+        type=int,
+        default=None,
+        help="Stream each input in batches of this many rows",
+    )
+    add_output_args(parser)
+    return parser.parse_args(argv)
+
+
+if __name__ == "__main__":
+    args = parse_args(sys.argv[1:])
+    results = backfill(
+        args.start,
+        args.end,
+        max_workers=args.workers,
+        batch_size=args.batch_size,
+        compact=args.compact,
+        compression=args.compression,
+        force=args.force,
+        partitioned=args.partitioned,
+        max_open_files=args.max_open_files,
+    )
+    if any(r["status"] != "ok" for r in results):
+        sys.exit(1)
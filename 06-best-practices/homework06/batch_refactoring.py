@@ -1,9 +1,82 @@
 import sys
 import os
+import json
 import pickle
+import tempfile
+import argparse
+import numpy as np
 import pandas as pd
+import pyarrow as pa
+import pyarrow.compute as pc
+import pyarrow.dataset as ds
+import pyarrow.parquet as pq
 import logging
 
+try:
+    from homework06.encoder import factorize_rows
+    from homework06.input_cache import get_input_cache
+    from homework06.checkpoint import Checkpoint, plan_parts, remove_checkpoint
+    from homework06.s3_writer import S3MultipartWriter, s3_storage_options
+    from homework06.partitioned_writer import (
+        DEFAULT_MAX_OPEN_FILES,
+        PartitionedWriter,
+        get_dataset_path,
+        is_dataset,
+        metadata_path,
+        pickup_days,
+        read_dataset,
+        read_outside_month,
+    )
+    from homework06.model_bundle import is_bundle, load_bundle
+    from homework06.profiling import NULL_PROFILER, StageProfiler
+    from homework06.sharding import (
+        check_shard,
+        read_input_metadata,
+        row_group_offset,
+        shard_path,
+        shard_spec,
+    )
+    from homework06.model_comparison import (
+        CHAMPION,
+        PredictionSummary,
+        check_model_name,
+        group_models,
+        result_column,
+    )
+    from homework06 import manifest
+except ImportError:
+    from encoder import factorize_rows
+    from input_cache import get_input_cache
+    from checkpoint import Checkpoint, plan_parts, remove_checkpoint
+    from s3_writer import S3MultipartWriter, s3_storage_options
+    from partitioned_writer import (
+        DEFAULT_MAX_OPEN_FILES,
+        PartitionedWriter,
+        get_dataset_path,
+        is_dataset,
+        metadata_path,
+        pickup_days,
+        read_dataset,
+        read_outside_month,
+    )
+    from model_bundle import is_bundle, load_bundle
+    from profiling import NULL_PROFILER, StageProfiler
+    from sharding import (
+        check_shard,
+        read_input_metadata,
+        row_group_offset,
+        shard_path,
+        shard_spec,
+    )
+    from model_comparison import (
+        CHAMPION,
+        PredictionSummary,
+        check_model_name,
+        group_models,
+        result_column,
+    )
+    import manifest
+
 # Configure logging
 logging.basicConfig(
     level=logging.INFO,
@@ -12,6 +85,15 @@ logging.basicConfig(
 )
 logger = logging.getLogger(__name__)
 
+DATETIME_COLUMNS = ["tpep_pickup_datetime", "tpep_dropoff_datetime"]
+
+# Column holding the row positions in the file while data stays in Arrow
+POSITION_COLUMN = "__row_position__"
+
+# Parquet codec for the legacy output (pandas' default) and the compact one
+DEFAULT_COMPRESSION = "snappy"
+COMPACT_COMPRESSION = "zstd"
+
 
 def prepare_data(df, categorical):
     """
@@ -26,35 +108,364 @@ def prepare_data(df, categorical):
 
     df = df[(df.duration >= 1) & (df.duration <= 60)].copy()
 
+    return prepare_features(df, categorical)
+
+
+def prepare_features(df, categorical):
+    """
+    Convert categorical columns to strings with -1 for missing values, in place.
+    This is the part of prepare_data that doesn't need the trip to be finished,
+    so the scoring service uses it on its own.
+    """
     df[categorical] = df[categorical].fillna(-1).astype("int").astype("str")
+    return df
 
+
+def prepare_arrow(table, categorical):
+    """
+    Arrow version of prepare_data for a pyarrow Table, using pyarrow.compute:
+    - Calculate trip duration in minutes, the same float values pandas gives
+    - Filter trips between 1 and 60 minutes
+    - Convert categorical columns to int32 with -1 for missing values
+    Location IDs stay integers instead of becoming Python strings;
+    ColumnarEncoder looks them up by their string form.
+    """
+    duration = pc.subtract(
+        table.column("tpep_dropoff_datetime"), table.column("tpep_pickup_datetime")
+    )
+    units_per_second = {"s": 1, "ms": 10**3, "us": 10**6, "ns": 10**9}[
+        duration.type.unit
+    ]
+    # Like pandas' total_seconds() / 60: integer units to seconds, then minutes
+    units = pc.cast(pc.cast(duration, pa.int64()), pa.float64())
+    seconds = pc.divide(units, float(units_per_second))
+    duration = pc.divide(seconds, 60.0)
+
+    table = table.append_column("duration", duration)
+    mask = pc.and_(
+        pc.greater_equal(table.column("duration"), 1.0),
+        pc.less_equal(table.column("duration"), 60.0),
+    )
+    table = table.filter(pc.fill_null(mask, False))
+
+    for column in categorical:
+        values = table.column(column)
+        if pa.types.is_floating(values.type):
+            # astype("int") truncates
+            values = pc.trunc(values)
+        values = pc.cast(pc.fill_null(values, -1), pa.int32())
+        table = table.set_column(table.schema.get_field_index(column), column, values)
+
+    return table
+
+
+def table_to_frame(table):
+    """Convert an Arrow table to pandas, with POSITION_COLUMN as the index"""
+    if POSITION_COLUMN not in table.column_names:
+        return table.to_pandas()
+
+    df = table.drop_columns([POSITION_COLUMN]).to_pandas()
+    df.index = pd.Index(table.column(POSITION_COLUMN).to_numpy())
     return df
 
 
-def read_data(filename, categorical):
+def get_storage_options(path):
+    """
+    Return the fsspec storage options for a path.
+    If S3_ENDPOINT_URL is set and the path is on S3, point the client at it (localstack)
+    S3_STORAGE_OPTIONS can add s3fs options as JSON, like
+    {"default_block_size": 16777216}; s3_benchmark.py measures their effect
+    """
+    if not path.startswith("s3://"):
+        return None
+    return s3_storage_options() or None
+
+
+def cached_input(filename):
+    """
+    Local copy of a remote input from the input cache when INPUT_CACHE_DIR is set,
+    otherwise the filename itself
+    """
+    if not filename.startswith(("s3://", "http://", "https://")):
+        return filename
+
+    cache = get_input_cache(get_storage_options(filename))
+    if cache is None:
+        return filename
+    return cache.fetch(filename)
+
+
+def get_read_columns(categorical, columns=None):
+    """Columns prepare_data needs, plus any passthrough columns, without duplicates"""
+    read_columns = list(categorical) + DATETIME_COLUMNS + list(columns or [])
+    return list(dict.fromkeys(read_columns))
+
+
+def filter_batch(batch, offset):
+    """
+    Apply the prepare_data duration filter (1 to 60 minutes) to an Arrow batch.
+    Durations are compared in whole units of the timestamp type, so exactly the
+    same rows are kept as in prepare_data.
+    Returns the filtered batch and the positions of the kept rows in the file,
+    given that the batch starts at row offset.
+    """
+    duration = pc.subtract(
+        batch.column("tpep_dropoff_datetime"), batch.column("tpep_pickup_datetime")
+    )
+    units_per_second = {"s": 1, "ms": 10**3, "us": 10**6, "ns": 10**9}[
+        duration.type.unit
+    ]
+    duration = pc.cast(duration, pa.int64())
+
+    mask = pc.and_(
+        pc.greater_equal(duration, 60 * units_per_second),
+        pc.less_equal(duration, 60 * 60 * units_per_second),
+    )
+    mask = pc.fill_null(mask, False)
+
+    positions = offset + np.flatnonzero(mask.to_numpy(zero_copy_only=False))
+    return batch.filter(mask), positions
+
+
+def decoded_size(metadata, columns=None, row_groups=None):
+    """
+    Uncompressed size in bytes of the given columns (all if None) in the
+    given row groups (all if None) from the parquet footer
+    """
+    total = 0
+    if row_groups is None:
+        row_groups = range(metadata.num_row_groups)
+    for i in row_groups:
+        row_group = metadata.row_group(i)
+        for j in range(row_group.num_columns):
+            column = row_group.column(j)
+            if columns is None or column.path_in_schema in columns:
+                total += column.total_uncompressed_size
+    return total
+
+
+def scan_table(filename, columns, row_groups=None):
+    """
+    Scan a local or S3 parquet file with pyarrow.dataset:
+    - Only the given columns are decoded
+    - Only the given consecutive row groups are read, if any (see sharding.py)
+    - The duration filter runs on every Arrow batch
+    Returns an Arrow table with the row positions in the file in POSITION_COLUMN.
+    """
+    options = get_storage_options(filename)
+    if filename.startswith("s3://"):
+        import fsspec
+
+        if options and "client_kwargs" in options:
+            logger.info(
+                f"Using S3 endpoint URL: {options['client_kwargs']['endpoint_url']}"
+            )
+        filesystem = fsspec.filesystem("s3", **(options or {}))
+        path = filename[len("s3://") :]
+    else:
+        filesystem, path = None, filename
+
+    dataset = ds.dataset(path, format="parquet", filesystem=filesystem)
+    fragments = list(dataset.get_fragments())
+
+    full_bytes = 0
+    projected_bytes = 0
+    for fragment in fragments:
+        full_bytes += decoded_size(fragment.metadata)
+        projected_bytes += decoded_size(fragment.metadata, columns, row_groups)
+    logger.info(
+        f"Decoding {projected_bytes / 1e6:.1f} MB of {full_bytes / 1e6:.1f} MB "
+        f"({len(columns)} of {len(dataset.schema.names)} columns)"
+    )
+
+    offset = 0
+    if row_groups is not None:
+        # A single file; its row groups before the first one read set the positions
+        [fragment] = fragments
+        offset = row_group_offset(fragment.metadata, row_groups)
+        fragments = [fragment.subset(row_group_ids=list(row_groups))]
+
+    batches = []
+    positions = []
+    read_rows = 0
+    for fragment in fragments:
+        for batch in fragment.to_batches(columns=columns, schema=dataset.schema):
+            filtered, kept = filter_batch(batch, offset + read_rows)
+            batches.append(filtered)
+            positions.append(kept)
+            read_rows += batch.num_rows
+
+    schema = pa.schema([dataset.schema.field(column) for column in columns])
+    table = pa.Table.from_batches(batches, schema=schema).append_column(
+        POSITION_COLUMN, pa.array(np.concatenate(positions or [[]]).astype("int64"))
+    )
+
+    logger.info(
+        f"Read {read_rows} records from {filename}, {table.num_rows} within 1-60 min"
+    )
+    return table
+
+
+def scan_data(filename, columns, row_groups=None):
+    """
+    scan_table converted to pandas. The index of the result holds the row
+    positions in the file, the same index pd.read_parquet followed by the
+    filter would give.
+    """
+    return table_to_frame(scan_table(filename, columns, row_groups))
+
+
+def read_http_table(filename, columns, row_groups=None):
+    """
+    Read the given columns (and consecutive row groups, if any) of a parquet
+    file over HTTP, which pyarrow datasets can't scan. Range requests fetch
+    only the footer and the column chunks read. Returns an Arrow table with
+    the row positions in the file in POSITION_COLUMN, unfiltered.
+    """
+    import fsspec
+
+    with fsspec.open(filename, "rb") as f_in:
+        parquet_file = pq.ParquetFile(f_in)
+        if row_groups is None:
+            table = parquet_file.read(columns=columns)
+            offset = 0
+        else:
+            table = parquet_file.read_row_groups(row_groups, columns=columns)
+            offset = row_group_offset(parquet_file.metadata, row_groups)
+
+    logger.info(f"Read {table.num_rows} records from {filename}")
+    return table.append_column(
+        POSITION_COLUMN,
+        pa.array(np.arange(offset, offset + table.num_rows, dtype="int64")),
+    )
+
+
+def read_data(
+    filename, categorical, columns=None, arrow=False, profiler=None, row_groups=None
+):
     """
     Read data from parquet file and prepare it using the prepare_data function
+    - Only the columns prepare_data needs plus the passthrough columns are read
+    - Only the given consecutive row groups are read, if any; the rows keep
+      their positions in the file as the index (see sharding.py)
+    - For local and S3 files the duration filter runs during the pyarrow scan
+    - Remote files are read through the input cache when INPUT_CACHE_DIR is set
+    - arrow=True prepares the data with prepare_arrow instead, and the
+      categorical columns come back as int32
     If S3_ENDPOINT_URL is set, use it for reading from localstack
+    The download, read and prepare stages are timed by profiler, if given.
     """
-    S3_ENDPOINT_URL = os.getenv("S3_ENDPOINT_URL")
-
     logger.info(f"Reading data from {filename}")
+    profiler = profiler or NULL_PROFILER
 
-    if S3_ENDPOINT_URL and filename.startswith("s3://"):
-        options = {"client_kwargs": {"endpoint_url": S3_ENDPOINT_URL}}
-        logger.info(f"Using S3 endpoint URL: {S3_ENDPOINT_URL}")
-        df = pd.read_parquet(filename, storage_options=options)
-    else:
-        df = pd.read_parquet(filename)
+    with profiler.stage("download"):
+        filename = cached_input(filename)
+    read_columns = get_read_columns(categorical, columns)
+
+    if arrow:
+        with profiler.stage("read") as stage:
+            if filename.startswith(("http://", "https://")):
+                table = read_http_table(filename, read_columns, row_groups)
+            else:
+                table = scan_table(filename, read_columns, row_groups)
+            stage.rows = table.num_rows
+
+        with profiler.stage("prepare") as stage:
+            prepared_df = table_to_frame(prepare_arrow(table, categorical))
+            stage.rows = len(prepared_df)
+        logger.info(f"After preparation: {len(prepared_df)} records remaining")
+        return prepared_df
 
-    logger.info(f"Read {len(df)} records from {filename}")
+    with profiler.stage("read") as stage:
+        if filename.startswith(("http://", "https://")) and row_groups is not None:
+            df = table_to_frame(read_http_table(filename, read_columns, row_groups))
+        elif filename.startswith(("http://", "https://")):
+            # pyarrow datasets can't scan over HTTP, let pandas download and project
+            df = pd.read_parquet(filename, columns=read_columns)
+            logger.info(f"Read {len(df)} records from {filename}")
+        else:
+            df = scan_data(filename, read_columns, row_groups)
+        stage.rows = len(df)
 
-    prepared_df = prepare_data(df, categorical)
+    with profiler.stage("prepare") as stage:
+        prepared_df = prepare_data(df, categorical)
+        stage.rows = len(prepared_df)
     logger.info(f"After preparation: {len(prepared_df)} records remaining")
 
     return prepared_df
 
 
+def iter_data(
+    filename,
+    categorical,
+    batch_size,
+    columns=None,
+    arrow=False,
+    profiler=None,
+    row_groups=None,
+):
+    """
+    Read the parquet file in batches of at most batch_size rows and prepare each one.
+    Only the needed columns (and the given consecutive row groups, if any) are
+    read and the duration filter runs on the Arrow batches. The index of every
+    batch holds the row positions in the file, so it matches the index
+    read_data would produce for the whole file.
+    With arrow=True the batches are prepared with prepare_arrow.
+    The download, read and prepare stages are timed by profiler, if given.
+    """
+    logger.info(f"Streaming data from {filename} in batches of {batch_size} rows")
+    profiler = profiler or NULL_PROFILER
+
+    with profiler.stage("download"):
+        filename = cached_input(filename)
+    options = get_storage_options(filename)
+    if filename.startswith(("s3://", "http://", "https://")):
+        import fsspec
+
+        source = fsspec.open(filename, "rb", **(options or {})).open()
+    else:
+        source = filename
+
+    read_columns = get_read_columns(categorical, columns)
+    parquet_file = pq.ParquetFile(source)
+    offset = 0
+    try:
+        if row_groups is not None:
+            offset = row_group_offset(parquet_file.metadata, row_groups)
+        start = offset
+        batches = parquet_file.iter_batches(
+            batch_size=batch_size, row_groups=row_groups, columns=read_columns
+        )
+        while True:
+            with profiler.stage("read") as stage:
+                batch = next(batches, None)
+                if batch is None:
+                    break
+                filtered, positions = filter_batch(batch, offset)
+                offset += batch.num_rows
+                stage.rows = batch.num_rows
+
+            with profiler.stage("prepare") as stage:
+                if arrow:
+                    table = pa.Table.from_batches([filtered]).append_column(
+                        POSITION_COLUMN, pa.array(positions)
+                    )
+                    df = table_to_frame(prepare_arrow(table, categorical))
+                else:
+                    df = filtered.to_pandas()
+                    df.index = pd.Index(positions)
+                    df = prepare_data(df, categorical)
+                stage.rows = len(df)
+
+            yield df
+    finally:
+        parquet_file.close()
+        if source is not filename:
+            source.close()
+
+    logger.info(f"Read {offset - start} records from {filename}")
+
+
 def get_input_path(year, month):
     default_input_pattern = "https://d37ci6vzurychx.cloudfront.net/trip-data/yellow_tripdata_{year:04d}-{month:02d}.parquet"
     input_pattern = os.getenv("INPUT_FILE_PATTERN", default_input_pattern)
@@ -69,20 +480,8 @@ def get_output_path(year, month):
     return output_pattern.format(year=year, month=month)
 
 
-def main(year, month):
-    logger.info(f"Starting prediction for year={year}, month={month}")
-
-    input_file = get_input_path(year, month)
-    output_file = get_output_path(year, month)
-
-    logger.info(f"Input file: {input_file}")
-    logger.info(f"Output file: {output_file}")
-
-    # Create the data directory if it doesn't exist and we're saving locally
-    if not output_file.startswith("s3://"):
-        os.makedirs(os.path.dirname(output_file), exist_ok=True)
-
-    logger.info("Loading model...")
+def find_model_path():
+    """Look for model.bin next to this script first, then in a few common locations"""
     # Get the directory where this script is located
     current_dir = os.path.dirname(os.path.abspath(__file__))
     model_path = os.path.join(current_dir, "model.bin")
@@ -103,6 +502,25 @@ def main(year, month):
                 logger.info(f"Found model at: {model_path}")
                 break
 
+    return model_path
+
+
+def load_model(model_path=None):
+    """
+    Load the (DictVectorizer, LinearRegression) tuple.
+    - model_path (or the MODEL_PATH env variable) can point to a pickled
+      model.bin or to a model bundle directory (see model_bundle.py), which
+      is memory-mapped instead of unpickled
+    - Without either, model.bin is searched for (see find_model_path)
+    """
+    logger.info("Loading model...")
+    model_path = model_path or os.getenv("MODEL_PATH") or find_model_path()
+
+    if is_bundle(model_path):
+        dv, lr = load_bundle(model_path)
+        logger.info(f"Model bundle loaded successfully from {model_path}")
+        return dv, lr
+
     try:
         with open(model_path, "rb") as f_in:
             dv, lr = pickle.load(f_in)
@@ -113,45 +531,889 @@ def main(year, month):
         logger.info("Directory contents: " + str(os.listdir(os.getcwd())))
         raise
 
-    categorical = ["PULocationID", "DOLocationID"]
+    return dv, lr
 
-    df = read_data(input_file, categorical)
-    df["ride_id"] = f"{year:04d}/{month:02d}_" + df.index.astype("str")
 
-    logger.info("Transforming features...")
-    dicts = df[categorical].to_dict(orient="records")
-    X_val = dv.transform(dicts)
+def predict(df, encoder, lr, unique=None, profiler=None):
+    """
+    Vectorize the categorical columns and run the model on them.
+    When the features are purely categorical (or unique=True), only the
+    distinct value tuples are transformed and predicted, and the predictions
+    are scattered back to the rows. unique=False forces the per-row path.
+    The vectorize and predict stages are timed by profiler, if given.
+    """
+    groups = [(encoder, {CHAMPION: lr})]
+    return predict_models(df, groups, unique=unique, profiler=profiler)[CHAMPION]
 
-    logger.info("Making predictions...")
-    y_pred = lr.predict(X_val)
 
-    logger.info(f"\nPredicted mean duration: {y_pred.mean():.2f}")
-    logger.info(f"\nPredicted sum duration: {y_pred.sum():.2f}\n")
+def predict_models(df, groups, unique=None, profiler=None):
+    """
+    Run several models over the same prepared data, see predict.
+    groups comes from model_comparison.group_models: the feature matrix is
+    built once per encoder and shared by all of its models, and the distinct
+    rows are found once for all of them.
+    Returns the predictions of every model by name.
+    """
+    profiler = profiler or NULL_PROFILER
+    if len(df) == 0:
+        # An empty shard or month; the models refuse to predict zero rows
+        return {
+            name: np.array([], dtype="float64")
+            for _, models in groups
+            for name in models
+        }
+    if unique is None:
+        unique = all(encoder.categorical_only for encoder, _ in groups)
+
+    rows, inverse = df, None
+    if unique:
+        with profiler.stage("vectorize"):
+            first, inverse = factorize_rows(df, groups[0][0].columns)
+            rows = df.iloc[first]
+        logger.debug(
+            f"Predicting {len(first)} distinct feature rows for {len(df)} rows"
+        )
+
+    predictions = {}
+    for encoder, models in groups:
+        with profiler.stage("vectorize") as stage:
+            X_val = encoder.transform(rows)
+            stage.rows = len(df)
+        for name, lr in models.items():
+            with profiler.stage("predict") as stage:
+                y_pred = lr.predict(X_val)
+                if inverse is not None:
+                    y_pred = y_pred[inverse]
+                stage.rows = len(df)
+            predictions[name] = y_pred
+
+    return predictions
+
+
+def make_result(df, y_pred, year, month, compact=False, challengers=None):
+    """
+    Build the output dataframe with a ride_id and the predicted duration.
+    With compact=True the ride_id is not built; the row position, year and
+    month are stored as integers and the predictions as float32 instead
+    (see read_results to get the ride_id back).
+    The predictions of challenger models ({name: y_pred}) are added as
+    predicted_duration_<name> columns.
+    """
+    if compact:
+        n_rows = len(df)
+        df_result = pd.DataFrame(
+            {
+                "row_id": df.index.to_numpy(dtype="int64"),
+                "year": np.full(n_rows, year, dtype="int16"),
+                "month": np.full(n_rows, month, dtype="int8"),
+                "predicted_duration": np.asarray(y_pred, dtype="float32"),
+            }
+        )
+    else:
+        df_result = pd.DataFrame()
+        df_result["ride_id"] = f"{year:04d}/{month:02d}_" + df.index.astype("str")
+        df_result["predicted_duration"] = y_pred
+
+    for name, y_challenger in (challengers or {}).items():
+        dtype = "float32" if compact else "float64"
+        df_result[result_column(name)] = np.asarray(y_challenger, dtype=dtype)
+    return df_result
+
 
-    df_result = pd.DataFrame()
-    df_result["ride_id"] = df["ride_id"]
-    df_result["predicted_duration"] = y_pred
+def get_write_options(compact=False, compression=None, challengers=()):
+    """
+    Keyword arguments for the pyarrow parquet writer of a results file.
+    The compact schema defaults to zstd, delta-encodes the increasing row ids
+    and dictionary-encodes the predictions (of the model and of the named
+    challengers), which only take one value per distinct pair of locations.
+    """
+    if compression is None:
+        compression = COMPACT_COMPRESSION if compact else DEFAULT_COMPRESSION
 
-    # Check if we need to use S3 endpoint URL for writing
-    S3_ENDPOINT_URL = os.getenv("S3_ENDPOINT_URL")
+    options = {"compression": compression}
+    if compact:
+        options["use_dictionary"] = ["year", "month", "predicted_duration"] + [
+            result_column(name) for name in challengers
+        ]
+        options["column_encoding"] = {"row_id": "DELTA_BINARY_PACKED"}
+    return options
+
+
+def save_results(df_result, output_file, write_options=None):
+    """Write the results to parquet, using the S3 endpoint URL if one is set"""
     logger.info(f"Saving results to {output_file}")
+    write_options = write_options or {}
 
-    if S3_ENDPOINT_URL and output_file.startswith("s3://"):
-        options = {"client_kwargs": {"endpoint_url": S3_ENDPOINT_URL}}
-        logger.info(f"Using S3 endpoint URL for saving: {S3_ENDPOINT_URL}")
+    options = get_storage_options(output_file)
+    if options:
+        if "client_kwargs" in options:
+            logger.info(
+                "Using S3 endpoint URL for saving: "
+                f"{options['client_kwargs']['endpoint_url']}"
+            )
         df_result.to_parquet(
-            output_file, engine="pyarrow", index=False, storage_options=options
+            output_file,
+            engine="pyarrow",
+            index=False,
+            storage_options=options,
+            **write_options,
         )
     else:
-        df_result.to_parquet(output_file, engine="pyarrow", index=False)
+        df_result.to_parquet(
+            output_file, engine="pyarrow", index=False, **write_options
+        )
+
+
+def save_partitioned(
+    df_result, days, path, write_options=None, max_open_files=DEFAULT_MAX_OPEN_FILES
+):
+    """
+    Write the results as a day-partitioned dataset (see PartitionedWriter).
+    Returns the number of rows written
+    """
+    logger.info(f"Saving results to the partitioned dataset {path}")
+    writer = PartitionedWriter(
+        path,
+        write_options,
+        max_open_files=max_open_files,
+        storage_options=get_storage_options(path),
+    )
+    try:
+        writer.write(df_result, days)
+    except BaseException:
+        writer.abort()
+        raise
+    writer.close()
+    return writer.rows
+
+
+def rebuild_ride_id(df):
+    """Legacy ride_id strings (YYYY/MM_row) from the columns of a compact result"""
+    year = df["year"].astype("str").str.zfill(4)
+    month = df["month"].astype("str").str.zfill(2)
+    return year + "/" + month + "_" + df["row_id"].astype("str")
+
+
+def read_results(filename):
+    """
+    Read a results file or partitioned dataset written with either schema
+    and return it in the legacy one: a ride_id string and a float64
+    predicted_duration, followed by the predicted_duration_<name> columns of
+    challenger models, if any. Datasets come back ordered by day.
+    """
+    options = get_storage_options(filename)
+    if is_dataset(filename, options):
+        df = read_dataset(filename, options)
+        if "ride_id" in df.columns:
+            columns = [c for c in df.columns if c.startswith("predicted_duration")]
+            return df[["ride_id"] + columns]
+    else:
+        df = pd.read_parquet(filename, storage_options=options)
+        if "ride_id" in df.columns:
+            return df
+
+    df_result = pd.DataFrame({"ride_id": rebuild_ride_id(df)})
+    for column in df.columns:
+        if column.startswith("predicted_duration"):
+            df_result[column] = df[column].astype("float64")
+    return df_result
+
+
+def score_in_batches(
+    input_file,
+    output_file,
+    year,
+    month,
+    dv,
+    lr,
+    categorical,
+    batch_size,
+    compact=False,
+    write_options=None,
+    arrow=False,
+    profiler=None,
+    challengers=None,
+    summary=None,
+    partitioned=False,
+    max_open_files=DEFAULT_MAX_OPEN_FILES,
+    row_groups=None,
+):
+    """
+    Streaming version of the scoring pipeline:
+    - Read the input batch by batch (see iter_data), only the given row
+      groups if any
+    - Prepare, transform and predict each batch
+    - Append every batch of results to a single parquet file, or with
+      partitioned=True to the day partitions of a dataset (see PartitionedWriter)
+    Memory stays bounded by batch_size instead of the size of the input file.
+    S3 outputs are uploaded part by part while scoring continues (see S3MultipartWriter),
+    local ones are written to a temporary file that replaces output_file when
+    complete, so a failure never leaves a truncated output_file.
+    challengers ({name: (dv, lr)}) are scored on the same batches, and the
+    predictions of all models are added to summary (a PredictionSummary).
+    """
+    if partitioned:
+        sink = PartitionedWriter(
+            output_file,
+            write_options,
+            max_open_files=max_open_files,
+            storage_options=get_storage_options(output_file),
+        )
+    elif output_file.startswith("s3://"):
+        sink = S3MultipartWriter(output_file)
+    else:
+        # Renamed over output_file once complete (see the finally block)
+        fd, sink = tempfile.mkstemp(
+            prefix=".tmp-", dir=os.path.dirname(os.path.abspath(output_file))
+        )
+        os.close(fd)
+
+    profiler = profiler or NULL_PROFILER
+    challengers = challengers or {}
+    groups = group_models({CHAMPION: (dv, lr), **challengers}, categorical)
+    writer = None
+    total_rows = 0
+    total_sum = 0.0
+    completed = False
+    try:
+        for df in iter_data(
+            input_file,
+            categorical,
+            batch_size,
+            arrow=arrow,
+            profiler=profiler,
+            row_groups=row_groups,
+        ):
+            if len(df) == 0:
+                continue
+
+            predictions = predict_models(df, groups, profiler=profiler)
+            y_pred = predictions.pop(CHAMPION)
+            total_rows += len(y_pred)
+            total_sum += y_pred.sum()
+            if summary is not None:
+                summary.update({CHAMPION: y_pred, **predictions})
+
+            with profiler.stage("write") as stage:
+                df_result = make_result(
+                    df, y_pred, year, month, compact=compact, challengers=predictions
+                )
+                stage.rows = len(y_pred)
+                if partitioned:
+                    sink.write(df_result, pickup_days(df, year, month))
+                    continue
+
+                table = pa.Table.from_pandas(df_result, preserve_index=False)
+                if writer is None:
+                    writer = pq.ParquetWriter(
+                        sink, table.schema, **(write_options or {})
+                    )
+                writer.write_table(table)
+
+        if total_rows == 0:
+            # No rows survived preparation, still write a file with the right schema
+            empty = make_result(
+                pd.DataFrame(index=pd.RangeIndex(0)),
+                np.array([], dtype="float64"),
+                year,
+                month,
+                compact=compact,
+                challengers={name: [] for name in challengers},
+            )
+            if partitioned:
+                sink.write(empty, np.array([], dtype="int8"))
+            else:
+                table = pa.Table.from_pandas(empty, preserve_index=False)
+                writer = pq.ParquetWriter(sink, table.schema, **(write_options or {}))
+                writer.write_table(table)
+        completed = True
+    finally:
+        if not completed and isinstance(sink, (S3MultipartWriter, PartitionedWriter)):
+            # Don't publish a truncated file on S3 or a _metadata for a partial dataset
+            sink.abort()
+        else:
+            if writer is not None:
+                writer.close()
+            if not isinstance(sink, str):
+                sink.close()
+            elif completed:
+                os.replace(sink, output_file)
+            else:
+                # A truncated local file is dropped too, output_file is left as it was
+                os.remove(sink)
+
+    if total_rows:
+        logger.info(f"\nPredicted mean duration: {total_sum / total_rows:.2f}")
+    logger.info(f"\nPredicted sum duration: {total_sum:.2f}\n")
+
+    return total_rows
+
+
+def score_rows(
+    input_file,
+    output_file,
+    year,
+    month,
+    dv,
+    lr,
+    categorical,
+    batch_size=None,
+    compact=False,
+    write_options=None,
+    arrow=False,
+    profiler=None,
+    challengers=None,
+    summary=None,
+    partitioned=False,
+    max_open_files=DEFAULT_MAX_OPEN_FILES,
+    row_groups=None,
+):
+    """
+    Score the input (only the given row groups, if any) into output_file,
+    in batches of batch_size rows if set (see score_in_batches) and all at
+    once otherwise. The predictions of all models are added to summary.
+    Returns the number of predictions written.
+    """
+    profiler = profiler or NULL_PROFILER
+    challengers = challengers or {}
+    if batch_size:
+        logger.info(f"Scoring in streaming mode with batch size {batch_size}")
+        return score_in_batches(
+            input_file,
+            output_file,
+            year,
+            month,
+            dv,
+            lr,
+            categorical,
+            batch_size,
+            compact=compact,
+            write_options=write_options,
+            arrow=arrow,
+            profiler=profiler,
+            challengers=challengers,
+            summary=summary,
+            partitioned=partitioned,
+            max_open_files=max_open_files,
+            row_groups=row_groups,
+        )
+
+    df = read_data(
+        input_file, categorical, arrow=arrow, profiler=profiler, row_groups=row_groups
+    )
+
+    logger.info("Transforming features and making predictions...")
+    groups = group_models({CHAMPION: (dv, lr), **challengers}, categorical)
+    predictions = predict_models(df, groups, profiler=profiler)
+    if summary is not None:
+        summary.update(predictions)
+    y_pred = predictions.pop(CHAMPION)
+
+    logger.info(f"\nPredicted mean duration: {y_pred.mean():.2f}")
+    logger.info(f"\nPredicted sum duration: {y_pred.sum():.2f}\n")
+
+    with profiler.stage("write") as stage:
+        df_result = make_result(
+            df, y_pred, year, month, compact=compact, challengers=predictions
+        )
+        rows = len(df_result)
+        if partitioned:
+            rows = save_partitioned(
+                df_result,
+                pickup_days(df, year, month),
+                output_file,
+                write_options=write_options,
+                max_open_files=max_open_files,
+            )
+        else:
+            save_results(df_result, output_file, write_options=write_options)
+        stage.rows = len(df_result)
+
+    return rows
+
+
+def score_checkpointed(
+    input_file,
+    output_file,
+    fingerprint,
+    row_group_range,
+    row_groups_per_part,
+    summary,
+    storage_options=None,
+    **score_options,
+):
+    """
+    score_rows with checkpoints: the row groups in row_group_range are
+    scored row_groups_per_part at a time, and every finished part is
+    committed to the checkpoint next to output_file (see checkpoint.py).
+    A run interrupted by a crash or a preemption resumes at the first part
+    that wasn't committed. Once all parts are done, they are published as
+    output_file in one step.
+    Returns the number of predictions written.
+    """
+    profiler = score_options.get("profiler") or NULL_PROFILER
+    parts = plan_parts(*row_group_range, row_groups_per_part)
+    checkpoint = Checkpoint(
+        output_file,
+        # The journal only applies to a run with the same parts
+        dict(
+            fingerprint,
+            checkpoint={
+                "row_groups": list(row_group_range),
+                "row_groups_per_part": row_groups_per_part,
+            },
+        ),
+        storage_options,
+    )
+
+    resumed = 0
+    for index, (start, stop) in enumerate(parts):
+        entry = checkpoint.completed(index)
+        if entry is not None:
+            if entry.get("summary"):
+                summary.merge(PredictionSummary.from_dict(entry["summary"]))
+            resumed += 1
+            continue
+
+        logger.info(
+            f"Scoring part {index + 1} of {len(parts)}: row groups {start}-{stop - 1}"
+        )
+        part_summary = PredictionSummary(summary.names)
+        rows = score_rows(
+            input_file,
+            checkpoint.part_path(index),
+            summary=part_summary,
+            row_groups=list(range(start, stop)),
+            **score_options,
+        )
+        summary.merge(part_summary)
+        checkpoint.commit(index, [start, stop], rows, part_summary.to_dict())
+
+    if resumed:
+        logger.info(f"Resumed {resumed} of {len(parts)} parts from the checkpoint")
+    profiler.metadata.update(resumed_parts=resumed, parts=len(parts))
+
+    with profiler.stage("publish") as stage:
+        checkpoint.publish(output_file, len(parts), score_options.get("write_options"))
+        stage.rows = checkpoint.rows
+    return checkpoint.rows
+
+
+def score_month(
+    year,
+    month,
+    dv,
+    lr,
+    batch_size=None,
+    compact=False,
+    compression=None,
+    arrow=False,
+    force=False,
+    profiler=None,
+    challengers=None,
+    partitioned=False,
+    max_open_files=DEFAULT_MAX_OPEN_FILES,
+    shard_index=None,
+    shard_count=None,
+    checkpoint_row_groups=None,
+):
+    """
+    Score one month with an already loaded model.
+    - arrow=True prepares the data with pyarrow.compute (see prepare_arrow)
+    - compact=True writes the compact result schema (see make_result)
+    - compression is the parquet codec, by default snappy for the legacy
+      schema and zstd for the compact one
+    - partitioned=True writes a Hive-partitioned dataset with one directory
+      per pickup day (see get_dataset_path and PartitionedWriter) instead of
+      a single file, keeping at most max_open_files files open. Its manifest
+      also records how many pickups fell outside the month (see pickup_days)
+    - A manifest next to the output records the input and model fingerprints,
+      the code version and the output options. When all of them still match,
+      the month is skipped unless force=True (see manifest.py)
+    - profiler (see profiling.StageProfiler) times every stage of the run
+    - challengers ({name: (dv, lr)}) are shadow models scored in the same
+      pass: their predictions are written as predicted_duration_<name>
+      columns, and the mean, sum and pairwise deltas of all models are
+      logged and stored in the manifest (see model_comparison.py)
+    - shard_index and shard_count score only one shard of the input's row
+      groups (see sharding.plan_shards) into its own file in the .shards
+      directory next to the output; merge_shards.py combines the shards
+      once all of them are written
+    - checkpoint_row_groups commits the results every that many row groups
+      (see score_checkpointed), so a failed run resumes where it stopped
+    Returns the output path and the number of predictions written.
+    """
+    profiler = profiler or NULL_PROFILER
+    challengers = challengers or {}
+    for name in challengers:
+        check_model_name(name)
+    sharded = shard_index is not None or shard_count is not None
+    if sharded:
+        check_shard(shard_index, shard_count)
+        if partitioned:
+            raise ValueError(
+                "Shards are written as single files, merge them into a dataset "
+                "with merge_shards.py --dataset instead"
+            )
+    if checkpoint_row_groups and partitioned:
+        raise ValueError("Checkpointed runs write single files, not datasets")
+    write_options = get_write_options(compact, compression, challengers)
+
+    input_file = get_input_path(year, month)
+    if partitioned:
+        output_file = get_dataset_path(year, month)
+        # _metadata is written last, so the dataset is complete when it exists
+        manifest_file = metadata_path(output_file)
+    elif sharded:
+        output_file = shard_path(get_output_path(year, month), shard_index, shard_count)
+        manifest_file = output_file
+    else:
+        output_file = get_output_path(year, month)
+        manifest_file = output_file
+
+    logger.info(f"Input file: {input_file}")
+    logger.info(f"Output file: {output_file}")
+    profiler.metadata.update(
+        year=year,
+        month=month,
+        input_file=input_file,
+        output_file=output_file,
+        batch_size=batch_size,
+    )
+
+    output_options = get_storage_options(output_file)
+    with profiler.stage("fingerprint"):
+        fingerprint = {
+            "input_file": input_file,
+            "input": manifest.input_fingerprint(
+                input_file, get_storage_options(input_file)
+            ),
+            "model": manifest.model_fingerprint(dv, lr),
+            "code_version": manifest.code_version(),
+            "options": {
+                "compact": compact,
+                "compression": write_options["compression"],
+            },
+        }
+        if partitioned:
+            fingerprint["options"]["partitioned"] = True
+        if challengers:
+            fingerprint["options"]["challengers"] = {
+                name: manifest.model_fingerprint(*model)
+                for name, model in challengers.items()
+            }
+        shard = None
+        metadata = None
+        if sharded or checkpoint_row_groups:
+            metadata = read_input_metadata(input_file, get_storage_options(input_file))
+        if sharded:
+            shard = shard_spec(metadata, shard_index, shard_count)
+            fingerprint["options"]["shard"] = {
+                "index": shard_index,
+                "count": shard_count,
+            }
+            logger.info(
+                f"Scoring shard {shard_index} of {shard_count}: row groups "
+                f"{shard['row_groups'][0]} to {shard['row_groups'][1] - 1}, "
+                f"{shard['input_rows']} rows from row {shard['first_row']}"
+            )
+    row_group_range = None
+    if shard:
+        row_group_range = tuple(shard["row_groups"])
+    elif metadata is not None:
+        row_group_range = (0, metadata.num_row_groups)
+    if not force:
+        previous = manifest.is_up_to_date(manifest_file, fingerprint, output_options)
+        if previous is not None:
+            logger.info(
+                f"Skipping {year:04d}-{month:02d}: {output_file} is up to date "
+                f"({previous['rows']} predictions, written {previous['created']})"
+            )
+            profiler.metadata.update(skipped=True, rows=previous["rows"])
+            return output_file, previous["rows"]
+    manifest.remove_manifest(manifest_file, output_options)
+
+    # Create the data directory if it doesn't exist and we're saving locally
+    if not output_file.startswith("s3://"):
+        os.makedirs(os.path.dirname(output_file), exist_ok=True)
+
+    categorical = ["PULocationID", "DOLocationID"]
+    summary = PredictionSummary([CHAMPION, *challengers])
+    score_options = dict(
+        year=year,
+        month=month,
+        dv=dv,
+        lr=lr,
+        categorical=categorical,
+        batch_size=batch_size,
+        compact=compact,
+        write_options=write_options,
+        arrow=arrow,
+        profiler=profiler,
+        challengers=challengers,
+        partitioned=partitioned,
+        max_open_files=max_open_files,
+    )
+
+    if checkpoint_row_groups:
+        total = score_checkpointed(
+            input_file,
+            output_file,
+            fingerprint,
+            row_group_range,
+            checkpoint_row_groups,
+            summary,
+            output_options,
+            **score_options,
+        )
+    else:
+        total = score_rows(
+            input_file,
+            output_file,
+            summary=summary,
+            row_groups=list(range(*row_group_range)) if shard else None,
+            **score_options,
+        )
 
     logger.info(f"Results saved successfully to {output_file}")
-    logger.info(f"Total predictions: {len(df_result)}")
+    logger.info(f"Total predictions: {total}")
+    profiler.metadata.update(rows=total)
+    entry = manifest_entry(fingerprint, total, summary, challengers, shard)
+    if partitioned:
+        entry["outside_month"] = read_outside_month(output_file, output_options)
+    manifest.write_manifest(manifest_file, entry, output_options)
+    if checkpoint_row_groups:
+        remove_checkpoint(output_file, output_options)
+
+    return output_file, total
+
+
+def manifest_entry(fingerprint, rows, summary, challengers, shard=None):
+    """
+    Manifest of a run; with challengers, the comparison of the models is
+    logged and added. A shard (see sharding.shard_spec) records which part of
+    the input it scored, for merge_shards.py.
+    """
+    entry = dict(fingerprint, rows=rows)
+    if shard is not None:
+        entry["shard"] = shard
+    if not challengers:
+        return entry
+
+    entry["summary"] = summary.to_dict()
+    for name, stats in entry["summary"]["models"].items():
+        logger.info(f"Model {name}: mean {stats['mean']:.2f}, sum {stats['sum']:.2f}")
+    for pair, stats in entry["summary"]["deltas"].items():
+        logger.info(
+            f"Delta {pair}: mean {stats['mean']:.3f}, mean abs "
+            f"{stats['mean_abs']:.3f}, rmse {stats['rmse']:.3f}, "
+            f"max abs {stats['max_abs']:.3f}"
+        )
+    return entry
+
+
+def main(
+    year,
+    month,
+    batch_size=None,
+    compact=False,
+    compression=None,
+    arrow=False,
+    force=False,
+    profile=False,
+    profile_output=None,
+    cprofile_output=None,
+    challengers=None,
+    partitioned=False,
+    max_open_files=DEFAULT_MAX_OPEN_FILES,
+    shard_index=None,
+    shard_count=None,
+    checkpoint_row_groups=None,
+):
+    """
+    Load the model and score one month, or one shard of it (see score_month).
+    challengers are "[name=]path" model specs scored next to it (see
+    load_challengers). With profile=True, or a
+    profile_output / cprofile_output path, the run is profiled per stage:
+    the record (see profiling.StageProfiler) is logged as one JSON line and
+    appended to profile_output, and cProfile stats of the slowest stage are
+    dumped to cprofile_output.
+    """
+    logger.info(f"Starting prediction for year={year}, month={month}")
+
+    profiler = StageProfiler(
+        enabled=bool(profile or profile_output or cprofile_output),
+        cprofile_path=cprofile_output,
+    )
+    profiler.start()
+
+    with profiler.stage("load_model"):
+        dv, lr = load_model()
+        challenger_models = load_challengers(challengers or [])
+    output_file, _ = score_month(
+        year,
+        month,
+        dv,
+        lr,
+        batch_size=batch_size,
+        compact=compact,
+        compression=compression,
+        arrow=arrow,
+        force=force,
+        profiler=profiler,
+        challengers=challenger_models,
+        partitioned=partitioned,
+        max_open_files=max_open_files,
+        shard_index=shard_index,
+        shard_count=shard_count,
+        checkpoint_row_groups=checkpoint_row_groups,
+    )
+
+    record = profiler.finish()
+    if record is not None:
+        line = json.dumps(record)
+        logger.info(f"Profile: {line}")
+        if profile_output:
+            with open(profile_output, "a") as f_out:
+                f_out.write(line + "\n")
 
     return output_file
 
 
+def load_challengers(specs):
+    """
+    Load challenger models from "[name=]path" specs, where path is a
+    model.bin or a model bundle. Without a name, the file or directory name
+    (without extension) is used. Returns {name: (dv, lr)}.
+    """
+    challengers = {}
+    for spec in specs:
+        name, separator, path = spec.partition("=")
+        if not separator:
+            path = spec
+            name = os.path.splitext(os.path.basename(os.path.normpath(path)))[0]
+        check_model_name(name)
+        if name in challengers:
+            raise ValueError(f"Duplicate challenger name {name!r}")
+        challengers[name] = load_model(path)
+    return challengers
+
+
+def add_output_args(parser):
+    """--compact, --compression, --partitioned and --force, shared with the backfill command"""
+    parser.add_argument(
+        "--compact",
+        action="store_true",
+        help="Write integer row ids, year/month and float32 predictions "
+        "instead of ride_id strings (see read_results)",
+    )
+    parser.add_argument(
+        "--compression",
+        choices=["none", "snappy", "gzip", "brotli", "lz4", "zstd"],
+        default=None,
+        help=f"Parquet codec (default: {DEFAULT_COMPRESSION}, "
+        f"{COMPACT_COMPRESSION} with --compact)",
+    )
+    parser.add_argument(
+        "--partitioned",
+        action="store_true",
+        help="Write a Hive-partitioned dataset (taxi_type=/year=/month=/day=) "
+        "with a _metadata file instead of one file per month",
+    )
+    parser.add_argument(
+        "--max-open-files",
+        type=int,
+        default=DEFAULT_MAX_OPEN_FILES,
+        help="Most partition files open at once with --partitioned "
+        f"(default: {DEFAULT_MAX_OPEN_FILES})",
+    )
+    parser.add_argument(
+        "--force",
+        action="store_true",
+        help="Score even if the manifest says the output is up to date",
+    )
+
+
+def parse_args(argv):
+    parser = argparse.ArgumentParser(description="Batch taxi duration prediction")
+    parser.add_argument("year", type=int)
+    parser.add_argument("month", type=int)
+    parser.add_argument(
+        "--batch-size",
+        type=int,
+        default=None,
+        help="Stream the input in batches of this many rows to bound memory usage",
+    )
+    parser.add_argument(
+        "--arrow",
+        action="store_true",
+        help="Prepare the data with pyarrow.compute, keeping location IDs as integers",
+    )
+    parser.add_argument(
+        "--challenger",
+        action="append",
+        default=[],
+        metavar="[NAME=]PATH",
+        help="Also score this model in the same pass and write its predictions "
+        "as predicted_duration_NAME (can be repeated)",
+    )
+    parser.add_argument(
+        "--profile",
+        action="store_true",
+        help="Log wall/CPU time, rows/sec and peak memory of every stage as JSON",
+    )
+    parser.add_argument(
+        "--profile-output",
+        default=None,
+        help="Append the profile record of the run to this JSON lines file",
+    )
+    parser.add_argument(
+        "--cprofile",
+        default=None,
+        help="Dump cProfile stats of the slowest stage to this file",
+    )
+    parser.add_argument(
+        "--shard-index",
+        type=int,
+        default=None,
+        help="Score only this shard (0-based) of the input's row groups "
+        "(requires --shard-count)",
+    )
+    parser.add_argument(
+        "--shard-count",
+        type=int,
+        default=None,
+        help="Number of shards the input is split into; combine the shard "
+        "outputs with merge_shards.py",
+    )
+    parser.add_argument(
+        "--checkpoint-row-groups",
+        type=int,
+        default=None,
+        help="Commit the results every this many input row groups, so a run "
+        "that fails resumes from the last commit instead of from scratch",
+    )
+    add_output_args(parser)
+    return parser.parse_args(argv)
+
+
 if __name__ == "__main__":
-    year = int(sys.argv[1])
-    month = int(sys.argv[2])
-    main(year, month)
\ No newline at end of file
+    args = parse_args(sys.argv[1:])
+    main(
+        args.year,
+        args.month,
+        batch_size=args.batch_size,
+        compact=args.compact,
+        compression=args.compression,
+        arrow=args.arrow,
+        force=args.force,
+        profile=args.profile,
+        profile_output=args.profile_output,
+        cprofile_output=args.cprofile,
+        challengers=args.challenger,
+        partitioned=args.partitioned,
+        max_open_files=args.max_open_files,
+        shard_index=args.shard_index,
+        shard_count=args.shard_count,
+        checkpoint_row_groups=args.checkpoint_row_groups,
+    )
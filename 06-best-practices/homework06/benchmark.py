@@ -0,0 +1,362 @@
+import sys
+import os
+import json
+import time
+import platform
+import argparse
+import logging
+import resource
+import tempfile
+import tracemalloc
+from datetime import datetime, timezone
+
+import numpy as np
+import pandas as pd
+import pyarrow as pa
+import pyarrow.parquet as pq
+
+try:
+    from homework06.encoder import ColumnarEncoder
+    from homework06.batch_refactoring import (
+        get_read_columns,
+        load_model,
+        make_result,
+        predict,
+        prepare_data,
+        prepare_arrow,
+        save_results,
+        scan_table,
+        table_to_frame,
+    )
+except ImportError:
+    from encoder import ColumnarEncoder
+    from batch_refactoring import (
+        get_read_columns,
+        load_model,
+        make_result,
+        predict,
+        prepare_data,
+        prepare_arrow,
+        save_results,
+        scan_table,
+        table_to_frame,
+    )
+
+logger = logging.getLogger(__name__)
+
+STAGES = ["read", "prepare", "prepare_arrow", "vectorize", "predict", "score", "write"]
+CATEGORICAL = ["PULocationID", "DOLocationID"]
+GENERATE_CHUNK_ROWS = 1_000_000
+
+# Arrow frees a buffer through the pool that allocated it, so the proxy pools
+# used for measuring must outlive every buffer they handed out
+_arrow_pools = []
+
+
+def parse_size(value):
+    """Parse a row count like 100000, 100k or 10M"""
+    value = value.strip()
+    multiplier = {"k": 10**3, "m": 10**6}.get(value[-1:].lower(), 1)
+    if multiplier != 1:
+        value = value[:-1]
+    try:
+        return int(float(value) * multiplier)
+    except ValueError:
+        raise ValueError(f"Expected a row count like 100k or 1M, got {value!r}")
+
+
+def make_trips(n_rows, seed=0, year=2023, month=1):
+    """Synthetic month of yellow taxi trips with the same 19 columns as the real files"""
+    rng = np.random.default_rng(seed)
+    pickup = pd.Timestamp(year=year, month=month, day=1) + pd.to_timedelta(
+        rng.integers(0, 28 * 24 * 3600, n_rows), unit="s"
+    )
+    # Most trips fall in the 1-60 minute window, some are filtered out
+    dropoff = pickup + pd.to_timedelta(rng.integers(0, 90 * 60, n_rows), unit="s")
+    pu = pd.array(rng.integers(1, 266, n_rows), dtype="Int64")
+    pu[rng.random(n_rows) < 0.01] = pd.NA
+    amount = rng.uniform(3, 100, n_rows)
+
+    return pd.DataFrame(
+        {
+            "VendorID": rng.integers(1, 3, n_rows, dtype="int32"),
+            "tpep_pickup_datetime": pickup,
+            "tpep_dropoff_datetime": dropoff,
+            "passenger_count": rng.integers(0, 6, n_rows).astype("float64"),
+            "trip_distance": rng.uniform(0, 20, n_rows),
+            "RatecodeID": rng.integers(1, 6, n_rows).astype("float64"),
+            "store_and_fwd_flag": rng.choice(["N", "Y"], n_rows),
+            "PULocationID": pu,
+            "DOLocationID": rng.integers(1, 266, n_rows),
+            "payment_type": rng.integers(1, 5, n_rows),
+            "fare_amount": amount,
+            "extra": rng.uniform(0, 5, n_rows),
+            "mta_tax": rng.choice([0.0, 0.5], n_rows),
+            "tip_amount": rng.uniform(0, 20, n_rows),
+            "tolls_amount": rng.uniform(0, 10, n_rows),
+            "improvement_surcharge": rng.choice([0.3, 1.0], n_rows),
+            "total_amount": amount * 1.2,
+            "congestion_surcharge": rng.choice([0.0, 2.5], n_rows),
+            "airport_fee": rng.choice([0.0, 1.75], n_rows),
+        }
+    )
+
+
+def write_trips(path, n_rows, seed=0):
+    """Write a synthetic month to parquet in chunks, so 10M rows fit in memory"""
+    writer = None
+    try:
+        for i, start in enumerate(range(0, n_rows, GENERATE_CHUNK_ROWS)):
+            chunk_rows = min(GENERATE_CHUNK_ROWS, n_rows - start)
+            table = pa.Table.from_pandas(
+                make_trips(chunk_rows, seed=seed + i), preserve_index=False
+            )
+            if writer is None:
+                writer = pq.ParquetWriter(path, table.schema)
+            writer.write_table(table)
+    finally:
+        if writer is not None:
+            writer.close()
+    return path
+
+
+def get_trips_file(data_dir, n_rows):
+    """Synthetic input with n_rows rows in data_dir, generated on first use"""
+    path = os.path.join(data_dir, f"synthetic_{n_rows}.parquet")
+    if not os.path.exists(path):
+        logger.info(f"Generating {n_rows} synthetic trips in {path}")
+        write_trips(path, n_rows)
+    return path
+
+
+def run_stages(input_file, output_file, dv, lr):
+    """
+    Run every stage once, in pipeline order, and yield (stage, rows, seconds):
+    - read: projected pyarrow scan with the duration filter (scan_table)
+    - prepare: prepare_data on the scanned frame
+    - prepare_arrow: prepare_arrow on the scanned Arrow table, to pandas
+    - vectorize: ColumnarEncoder.transform on every row
+    - predict: lr.predict on the full matrix
+    - score: predict() as the pipeline calls it, with distinct-row memoization
+    - write: make_result and save_results to a local parquet file
+    """
+    start = time.perf_counter()
+    table = scan_table(input_file, get_read_columns(CATEGORICAL))
+    df = table_to_frame(table)
+    yield "read", len(df), time.perf_counter() - start
+
+    start = time.perf_counter()
+    df = prepare_data(df, CATEGORICAL)
+    yield "prepare", len(df), time.perf_counter() - start
+
+    start = time.perf_counter()
+    table_to_frame(prepare_arrow(table, CATEGORICAL))
+    yield "prepare_arrow", len(df), time.perf_counter() - start
+    del table
+
+    encoder = ColumnarEncoder(dv, CATEGORICAL)
+    start = time.perf_counter()
+    X = encoder.transform(df)
+    yield "vectorize", len(df), time.perf_counter() - start
+
+    start = time.perf_counter()
+    lr.predict(X)
+    yield "predict", len(df), time.perf_counter() - start
+    del X
+
+    start = time.perf_counter()
+    y_pred = predict(df, encoder, lr)
+    yield "score", len(df), time.perf_counter() - start
+
+    start = time.perf_counter()
+    save_results(make_result(df, y_pred, 2023, 1), output_file)
+    yield "write", len(df), time.perf_counter() - start
+
+
+def measure_peaks(input_file, output_file, dv, lr):
+    """
+    Peak memory of every stage in bytes, in a separate run because tracemalloc
+    slows the timed runs down. Returns two dicts:
+    - Python and numpy allocations, traced with tracemalloc
+    - Arrow buffers, which tracemalloc doesn't see, from a fresh proxy of the
+      Arrow memory pool per stage
+    """
+    peaks = {}
+    arrow_peaks = {}
+    default_pool = pa.default_memory_pool()
+    tracemalloc.start()
+    try:
+        stages = run_stages(input_file, output_file, dv, lr)
+        while True:
+            pool = pa.proxy_memory_pool(default_pool)
+            _arrow_pools.append(pool)
+            pa.set_memory_pool(pool)
+            tracemalloc.reset_peak()
+            try:
+                stage, _, _ = next(stages)
+            except StopIteration:
+                break
+            peaks[stage] = tracemalloc.get_traced_memory()[1]
+            arrow_peaks[stage] = pool.max_memory()
+    finally:
+        tracemalloc.stop()
+        pa.set_memory_pool(default_pool)
+    return peaks, arrow_peaks
+
+
+def benchmark_size(n_rows, data_dir, dv, lr, repeat=3):
+    """Best-of-repeat time and peak memory of every stage for one input size"""
+    input_file = get_trips_file(data_dir, n_rows)
+    output_file = os.path.join(data_dir, f"predictions_{n_rows}.parquet")
+
+    best = {}
+    rows = {}
+    for _ in range(repeat):
+        for stage, stage_rows, seconds in run_stages(input_file, output_file, dv, lr):
+            best[stage] = min(seconds, best.get(stage, float("inf")))
+            rows[stage] = stage_rows
+    peaks, arrow_peaks = measure_peaks(input_file, output_file, dv, lr)
+
+    stages = {}
+    for stage in STAGES:
+        stages[stage] = {
+            "seconds": best[stage],
+            "rows": rows[stage],
+            "rows_per_sec": rows[stage] / best[stage] if best[stage] > 0 else 0.0,
+            "peak_bytes": peaks[stage],
+            "arrow_peak_bytes": arrow_peaks[stage],
+        }
+        logger.info(
+            f"{n_rows} rows, {stage}: {best[stage]:.3f}s "
+            f"({stages[stage]['rows_per_sec']:.0f} rows/sec), "
+            f"peak {peaks[stage] / 1e6:.1f} MB, "
+            f"Arrow peak {arrow_peaks[stage] / 1e6:.1f} MB"
+        )
+
+    return {
+        "rows": n_rows,
+        "input_bytes": os.path.getsize(input_file),
+        "stages": stages,
+    }
+
+
+def run_benchmark(sizes, data_dir, model_path=None, repeat=3):
+    """Benchmark all sizes and return the results as a JSON-serializable dict"""
+    dv, lr = load_model(model_path)
+
+    results = {}
+    for n_rows in sizes:
+        results[str(n_rows)] = benchmark_size(n_rows, data_dir, dv, lr, repeat=repeat)
+
+    return {
+        "meta": {
+            "created": datetime.now(timezone.utc).isoformat(),
+            "python": platform.python_version(),
+            "platform": platform.platform(),
+            "cpu_count": os.cpu_count(),
+            "numpy": np.__version__,
+            "pandas": pd.__version__,
+            "pyarrow": pa.__version__,
+            "repeat": repeat,
+            # ru_maxrss is in kilobytes on Linux
+            "max_rss_bytes": resource.getrusage(resource.RUSAGE_SELF).ru_maxrss * 1024,
+        },
+        "results": results,
+    }
+
+
+def compare(baseline, current, threshold=0.2, min_seconds=0.05):
+    """
+    Compare two benchmark results and return the regressions as messages.
+    A stage regressed when its time or peak memory grew by more than threshold
+    (0.2 = 20%) over the baseline. Stages faster than min_seconds in the baseline
+    are too noisy to time and are only checked for memory.
+    """
+    regressions = []
+    for size, result in current["results"].items():
+        baseline_result = baseline["results"].get(size)
+        if baseline_result is None:
+            continue
+
+        for stage, stats in result["stages"].items():
+            baseline_stats = baseline_result["stages"].get(stage)
+            if baseline_stats is None:
+                continue
+
+            for metric in ["seconds", "peak_bytes", "arrow_peak_bytes"]:
+                if metric not in baseline_stats or metric not in stats:
+                    continue
+                old, new = baseline_stats[metric], stats[metric]
+                if metric == "seconds" and old < min_seconds:
+                    continue
+                if old > 0 and new > old * (1 + threshold):
+                    regressions.append(
+                        f"{size} rows, {stage}: {metric} went from {old:.6g} "
+                        f"to {new:.6g} (+{(new / old - 1) * 100:.0f}%)"
+                    )
+    return regressions
+
+
+def parse_args(argv):
+    parser = argparse.ArgumentParser(
+        description="Benchmark the batch scoring stages on synthetic data"
+    )
+    parser.add_argument(
+        "--sizes",
+        default="100k,1M",
+        help="Comma separated row counts, like 100k,1M,10M (default: 100k,1M)",
+    )
+    parser.add_argument(
+        "--repeat", type=int, default=3, help="Timed runs per size, the best counts"
+    )
+    parser.add_argument(
+        "--data-dir",
+        default=None,
+        help="Keep the synthetic inputs here and reuse them (default: a temp dir)",
+    )
+    parser.add_argument("--model-path", default=None, help="model.bin or bundle")
+    parser.add_argument("--output", default=None, help="Write the results as JSON")
+    parser.add_argument(
+        "--baseline",
+        default=None,
+        help="Results JSON of an earlier run; exit with 1 on regressions",
+    )
+    parser.add_argument(
+        "--threshold",
+        type=float,
+        default=0.2,
+        help="Allowed slowdown or memory growth over the baseline (default: 0.2)",
+    )
+    return parser.parse_args(argv)
+
+
+if __name__ == "__main__":
+    logging.basicConfig(
+        level=logging.INFO,
+        format="%(asctime)s - %(name)s - %(levelname)s - %(message)s",
+        datefmt="%Y-%m-%d %H:%M:%S",
+    )
+    args = parse_args(sys.argv[1:])
+    sizes = [parse_size(size) for size in args.sizes.split(",")]
+
+    if args.data_dir:
+        os.makedirs(args.data_dir, exist_ok=True)
+        report = run_benchmark(sizes, args.data_dir, args.model_path, args.repeat)
+    else:
+        with tempfile.TemporaryDirectory() as data_dir:
+            report = run_benchmark(sizes, data_dir, args.model_path, args.repeat)
+
+    if args.output:
+        with open(args.output, "w") as f_out:
+            json.dump(report, f_out, indent=2)
+        logger.info(f"Wrote benchmark results to {args.output}")
+
+    if args.baseline:
+        with open(args.baseline) as f_in:
+            baseline = json.load(f_in)
+        regressions = compare(baseline, report, threshold=args.threshold)
+        for regression in regressions:
+            logger.error(f"Regression: {regression}")
+        if regressions:
+            sys.exit(1)
+        logger.info(f"No regressions over {args.baseline}")
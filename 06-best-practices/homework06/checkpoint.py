@@ -0,0 +1,158 @@
+import os
+import json
+import logging
+import tempfile
+import posixpath
+from datetime import datetime, timezone
+
+try:
+    from homework06.partitioned_writer import get_filesystem
+    from homework06.sharding import merge_files
+except ImportError:
+    from partitioned_writer import get_filesystem
+    from sharding import merge_files
+
+logger = logging.getLogger(__name__)
+
+# Directory next to the output that holds the committed parts of a run
+CHECKPOINT_SUFFIX = ".checkpoint"
+
+JOURNAL_FILE = "journal.json"
+
+
+def checkpoint_path(output_file):
+    """Directory of the checkpoint of output_file, e.g. 2023-01.checkpoint"""
+    root, _ = posixpath.splitext(output_file)
+    return root + CHECKPOINT_SUFFIX
+
+
+def plan_parts(start, stop, row_groups_per_part):
+    """
+    Split the row groups [start, stop) into consecutive [start, stop) ranges
+    of row_groups_per_part row groups, the units of work that are committed.
+    An empty range still gives one (empty) part, so the output gets written.
+    """
+    if row_groups_per_part < 1:
+        raise ValueError("row_groups_per_part must be at least 1")
+    bounds = list(range(start, stop, row_groups_per_part)) + [stop]
+    if len(bounds) == 1:
+        return [(start, stop)]
+    return list(zip(bounds[:-1], bounds[1:]))
+
+
+def remove_checkpoint(output_file, storage_options=None):
+    """Delete the checkpoint of output_file, once its output is published"""
+    fs, root = get_filesystem(checkpoint_path(output_file), storage_options)
+    if fs.exists(root):
+        fs.rm(root, recursive=True)
+
+
+class Checkpoint:
+    """
+    Committed parts of a run that writes output_file:
+
+        checkpoint = Checkpoint(output_file, fingerprint)
+        for index, row_groups in enumerate(parts):
+            if checkpoint.completed(index) is None:
+                ...score row_groups into checkpoint.part_path(index)...
+                checkpoint.commit(index, row_groups, rows)
+        checkpoint.publish(output_file, len(parts), write_options)
+
+    - A part is done once it is listed in the journal, which is rewritten
+      (renamed into place locally, a single PUT on S3) after its part file
+      is complete. A part file of an interrupted run that isn't in the
+      journal is simply written again
+    - The journal records the fingerprint of the run (input, model, code,
+      options and the part plan). A checkpoint of a different run is
+      deleted, so stale parts are never mixed into the output
+    """
+
+    def __init__(self, output_file, fingerprint, storage_options=None):
+        self.path = checkpoint_path(output_file)
+        self.fingerprint = fingerprint
+        self.storage_options = storage_options
+        self.fs, self._root = get_filesystem(self.path, storage_options)
+        self.parts = {}
+
+        journal = self._read_journal()
+        if journal is not None and fingerprint.get("input"):
+            if journal.get("fingerprint") == fingerprint:
+                self.parts = {entry["index"]: entry for entry in journal["parts"]}
+            else:
+                logger.info(f"Discarding the checkpoint of another run in {self.path}")
+        if not self.parts and self.fs.exists(self._root):
+            self.fs.rm(self._root, recursive=True)
+        self.fs.makedirs(self._root, exist_ok=True)
+
+        if self.parts:
+            logger.info(
+                f"Resuming from {len(self.parts)} committed parts in {self.path}"
+            )
+
+    def _read_journal(self):
+        try:
+            with self.fs.open(f"{self._root}/{JOURNAL_FILE}", "r") as f_in:
+                return json.load(f_in)
+        except FileNotFoundError:
+            return None
+        except ValueError as e:
+            logger.warning(f"Ignoring unreadable journal in {self.path}: {e}")
+            return None
+
+    def _write_journal(self):
+        content = json.dumps(
+            {
+                "fingerprint": self.fingerprint,
+                "parts": [self.parts[index] for index in sorted(self.parts)],
+            },
+            indent=2,
+        )
+        journal_file = f"{self._root}/{JOURNAL_FILE}"
+        if self.path.startswith("s3://"):
+            self.fs.pipe(journal_file, content.encode())
+            return
+
+        fd, temp_path = tempfile.mkstemp(prefix=".tmp-", dir=self._root)
+        try:
+            with os.fdopen(fd, "w") as f_out:
+                f_out.write(content)
+            os.replace(temp_path, journal_file)
+        except BaseException:
+            if os.path.exists(temp_path):
+                os.remove(temp_path)
+            raise
+
+    def part_path(self, index):
+        return posixpath.join(self.path, f"part-{index:05d}.parquet")
+
+    def completed(self, index):
+        """Journal entry of a committed part, or None if it still has to be scored"""
+        return self.parts.get(index)
+
+    def commit(self, index, row_groups, rows, summary=None):
+        """Record part index, whose file is complete, as done"""
+        self.parts[index] = {
+            "index": index,
+            "row_groups": list(row_groups),
+            "rows": rows,
+            "summary": summary,
+            "committed": datetime.now(timezone.utc).isoformat(),
+        }
+        self._write_journal()
+
+    @property
+    def rows(self):
+        return sum(entry["rows"] for entry in self.parts.values())
+
+    def publish(self, output_file, part_count, write_options=None):
+        """
+        Combine the part files into output_file, which appears all at once
+        (see merge_files)
+        """
+        missing = [index for index in range(part_count) if index not in self.parts]
+        if missing:
+            raise ValueError(
+                f"Can't publish {output_file}, parts {missing} are missing"
+            )
+        paths = [self.part_path(index) for index in range(part_count)]
+        return merge_files(paths, output_file, write_options, self.storage_options)
@@ -0,0 +1,147 @@
+import numpy as np
+import pandas as pd
+import scipy.sparse as sp
+
+
+def factorize_rows(df, columns):
+    """
+    Find the distinct value tuples of the given columns:
+    - first: position of the first row of every distinct tuple
+    - inverse: for every row, the number of its tuple in first
+    so that df.iloc[first] holds the distinct tuples and
+    values_per_tuple[inverse] broadcasts them back to all rows.
+    """
+    inverse = np.zeros(len(df), dtype=np.int64)
+    for column in columns:
+        codes, uniques = pd.factorize(df[column], use_na_sentinel=False)
+        # Re-factorize after each column so the combined key stays small
+        inverse, _ = pd.factorize(inverse * len(uniques) + codes)
+
+    _, first = np.unique(inverse, return_index=True)
+    return first, inverse
+
+
+class ColumnarEncoder:
+    """
+    Encode dataframe columns with the vocabulary of a fitted DictVectorizer.
+
+    transform(df) returns the same matrix as
+    dv.transform(df[columns].to_dict(orient="records")) but builds the CSR
+    arrays directly from the columns with vectorized lookups, so no per-row
+    dicts are created.
+
+    - Columns that were one-hot encoded by the DictVectorizer ("col=value"
+      features) are looked up by value; unknown values are dropped like
+      DictVectorizer does. Integer columns are looked up by their decimal
+      string form, which is what prepare_data produces.
+    - Columns that the DictVectorizer kept as numeric features are copied
+      as values.
+
+    categorical_only is True when none of the columns is numeric, so rows
+    with the same values in the columns always get the same feature row.
+    """
+
+    def __init__(self, dv, columns):
+        self.columns = list(columns)
+        self.n_features = len(dv.feature_names_)
+        self.dtype = dv.dtype
+        self.sparse = dv.sparse
+
+        self._numeric = {}
+        self._categorical = {}
+
+        for column in self.columns:
+            if column in dv.vocabulary_:
+                self._numeric[column] = dv.vocabulary_[column]
+                continue
+
+            prefix = f"{column}{dv.separator}"
+            values = []
+            positions = []
+            for name, position in dv.vocabulary_.items():
+                if name.startswith(prefix):
+                    values.append(name[len(prefix) :])
+                    positions.append(position)
+            positions = np.array(positions, dtype=np.intc)
+
+            # Integer view of the vocabulary, for columns that are not strings yet
+            int_values = []
+            int_positions = []
+            for value, position in zip(values, positions):
+                try:
+                    if str(int(value)) == value:
+                        int_values.append(int(value))
+                        int_positions.append(position)
+                except ValueError:
+                    pass
+
+            self._categorical[column] = (
+                pd.Index(values, dtype=object),
+                positions,
+                pd.Index(int_values, dtype="int64"),
+                np.array(int_positions, dtype=np.intc),
+            )
+
+        self.categorical_only = not self._numeric
+
+    def _encode_categorical(self, column, values):
+        """Return the feature index of every value, -1 for unknown values"""
+        str_index, str_positions, int_index, int_positions = self._categorical[column]
+
+        # Look up each distinct value once and broadcast back with the codes
+        codes, uniques = pd.factorize(values)
+        uniques = np.asarray(uniques)
+
+        if uniques.dtype.kind in "iu":
+            index, positions = int_index, int_positions
+            uniques = uniques.astype("int64", copy=False)
+        else:
+            index, positions = str_index, str_positions
+
+        found = (
+            index.get_indexer(uniques) if len(positions) else np.full(len(uniques), -1)
+        )
+        unique_idx = np.append(np.where(found >= 0, positions[found], -1), -1)
+
+        # Missing values get code -1, which picks the trailing -1
+        return unique_idx[codes].astype(np.intc, copy=False)
+
+    def transform(self, df):
+        """Build the feature matrix for the encoder columns of df"""
+        n_rows = len(df)
+        n_columns = len(self.columns)
+
+        feature_idx = np.empty((n_rows, n_columns), dtype=np.intc)
+        feature_val = np.ones((n_rows, n_columns), dtype=self.dtype)
+
+        for i, column in enumerate(self.columns):
+            values = df[column]
+            if not isinstance(values, pd.Series):
+                values = pd.Series(np.asarray(values))
+
+            if column in self._numeric:
+                feature_idx[:, i] = self._numeric[column]
+                feature_val[:, i] = values.to_numpy(dtype=self.dtype)
+            else:
+                feature_idx[:, i] = self._encode_categorical(column, values)
+
+        # DictVectorizer returns sorted column indices within each row,
+        # unknown values (-1) are pushed to the end and dropped
+        feature_idx[feature_idx < 0] = self.n_features
+        order = np.argsort(feature_idx, axis=1, kind="stable")
+        feature_idx = np.take_along_axis(feature_idx, order, axis=1)
+        feature_val = np.take_along_axis(feature_val, order, axis=1)
+
+        known = feature_idx < self.n_features
+        indptr = np.zeros(n_rows + 1, dtype=np.intc)
+        np.cumsum(known.sum(axis=1), out=indptr[1:])
+
+        X = sp.csr_matrix(
+            (feature_val[known], feature_idx[known], indptr),
+            shape=(n_rows, self.n_features),
+            dtype=self.dtype,
+        )
+
+        if not self.sparse:
+            return X.toarray()
+        return X
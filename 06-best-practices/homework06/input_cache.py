@@ -0,0 +1,201 @@
+import os
+import shutil
+import hashlib
+import logging
+import tempfile
+import urllib.request
+
+logger = logging.getLogger(__name__)
+
+TEMP_PREFIX = ".tmp-"
+
+
+def remote_info(url, storage_options=None):
+    """
+    Size and version markers of a remote file, without downloading it:
+    size, etag and version_id for s3:// (from the object metadata), size, etag
+    and last_modified for http(s):// (from a HEAD request). Markers the server
+    doesn't report are left out; an HTTP error gives an empty dict.
+    """
+    if url.startswith("s3://"):
+        import fsspec
+
+        fs = fsspec.filesystem("s3", **(storage_options or {}))
+        info = fs.info(url)
+        return {
+            key: value
+            for key, value in [
+                ("size", info.get("size")),
+                ("etag", info.get("ETag")),
+                ("version_id", info.get("VersionId")),
+            ]
+            if value is not None
+        }
+
+    request = urllib.request.Request(url, method="HEAD")
+    try:
+        with urllib.request.urlopen(request) as response:
+            headers = response.headers
+    except OSError as e:
+        logger.warning(f"Could not get the version of {url}: {e}")
+        return {}
+
+    info = {}
+    if headers.get("Content-Length"):
+        info["size"] = int(headers["Content-Length"])
+    if headers.get("ETag"):
+        info["etag"] = headers["ETag"]
+    if headers.get("Last-Modified"):
+        info["last_modified"] = headers["Last-Modified"]
+    return info
+
+
+class InputCache:
+    """
+    Read-through cache for remote input files (http(s):// and s3://).
+
+    - Entries are keyed by the URL plus the version the server reports
+      (ETag or Last-Modified for HTTP, VersionId or ETag for S3), so a
+      changed file is downloaded again instead of served stale
+    - Downloads go to a temp file in the cache directory and are renamed
+      into place, so readers never see a partial file
+    - When max_bytes is set, the least recently used entries are removed
+      until the cache fits
+    - Files whose server reports no version can't be validated, so they
+      aren't cached: fetch() returns the URL itself, to be read remotely
+    - hits, misses and uncached count how fetch() was served
+    """
+
+    def __init__(self, cache_dir, max_bytes=None, storage_options=None):
+        self.cache_dir = cache_dir
+        self.max_bytes = max_bytes
+        self.storage_options = storage_options
+        self.hits = 0
+        self.misses = 0
+        self.uncached = 0
+        os.makedirs(cache_dir, exist_ok=True)
+
+    def _version(self, url):
+        """Version marker of a remote file, None if the server doesn't tell"""
+        info = remote_info(url, self.storage_options)
+        if url.startswith("s3://"):
+            return info.get("version_id") or info.get("etag")
+        return info.get("etag") or info.get("last_modified")
+
+    def _download(self, url, target):
+        """Download url to a temp file next to target and rename it into place"""
+        fd, temp_path = tempfile.mkstemp(prefix=TEMP_PREFIX, dir=self.cache_dir)
+        try:
+            with os.fdopen(fd, "wb") as f_out:
+                if url.startswith("s3://"):
+                    import fsspec
+
+                    with fsspec.open(url, "rb", **(self.storage_options or {})) as f_in:
+                        shutil.copyfileobj(f_in, f_out, 1024 * 1024)
+                else:
+                    with urllib.request.urlopen(url) as f_in:
+                        shutil.copyfileobj(f_in, f_out, 1024 * 1024)
+            os.replace(temp_path, target)
+        except BaseException:
+            if os.path.exists(temp_path):
+                os.remove(temp_path)
+            raise
+
+    def path_for(self, url, version):
+        """Cache file for a URL at a given version"""
+        key = hashlib.sha256(f"{url}\n{version}".encode()).hexdigest()
+        extension = os.path.splitext(url.split("?")[0])[1]
+        return os.path.join(self.cache_dir, key + extension)
+
+    def fetch(self, url):
+        """
+        Return a local path with the content of url, downloading it if
+        needed, or url itself if its version is unknown
+        """
+        version = self._version(url)
+        if version is None:
+            self.uncached += 1
+            logger.warning(f"No version of {url} to validate a copy, not caching it")
+            return url
+
+        path = self.path_for(url, version)
+
+        if os.path.exists(path):
+            self.hits += 1
+            # Mark as recently used for the eviction order
+            os.utime(path)
+            logger.info(f"Input cache hit for {url}: {path}")
+            return path
+
+        self.misses += 1
+        logger.info(f"Input cache miss for {url}, downloading to {path}")
+        self._download(url, path)
+        self.evict(keep=path)
+        return path
+
+    def entries(self):
+        """Cached files as (path, size, last used) tuples, least recently used first"""
+        entries = []
+        for name in os.listdir(self.cache_dir):
+            if name.startswith(TEMP_PREFIX):
+                continue
+            path = os.path.join(self.cache_dir, name)
+            try:
+                stat = os.stat(path)
+            except FileNotFoundError:
+                continue
+            entries.append((path, stat.st_size, stat.st_mtime))
+        return sorted(entries, key=lambda entry: entry[2])
+
+    def evict(self, keep=None):
+        """Remove the least recently used entries until the cache fits max_bytes"""
+        if self.max_bytes is None:
+            return
+
+        entries = self.entries()
+        total = sum(size for _, size, _ in entries)
+        for path, size, _ in entries:
+            if total <= self.max_bytes:
+                break
+            if path == keep:
+                continue
+            logger.info(f"Evicting {path} from the input cache")
+            try:
+                os.remove(path)
+            except FileNotFoundError:
+                pass
+            total -= size
+
+    def stats(self):
+        entries = self.entries()
+        return {
+            "hits": self.hits,
+            "misses": self.misses,
+            "uncached": self.uncached,
+            "entries": len(entries),
+            "bytes": sum(size for _, size, _ in entries),
+        }
+
+
+_caches = {}
+
+
+def get_input_cache(storage_options=None):
+    """
+    Cache configured by INPUT_CACHE_DIR (and optionally INPUT_CACHE_MAX_BYTES),
+    or None if caching is not enabled. The same instance is returned for the
+    same directory, so counters add up over a process.
+    """
+    cache_dir = os.getenv("INPUT_CACHE_DIR")
+    if not cache_dir:
+        return None
+
+    max_bytes = os.getenv("INPUT_CACHE_MAX_BYTES")
+    max_bytes = int(max_bytes) if max_bytes else None
+
+    key = (cache_dir, max_bytes, repr(storage_options))
+    if key not in _caches:
+        _caches[key] = InputCache(
+            cache_dir, max_bytes=max_bytes, storage_options=storage_options
+        )
+    return _caches[key]
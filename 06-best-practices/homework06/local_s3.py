@@ -0,0 +1,461 @@
+import re
+import time
+import uuid
+import hashlib
+import logging
+import threading
+from collections import Counter
+from email.utils import formatdate
+from urllib.parse import parse_qs, quote, unquote, urlsplit
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+from xml.etree import ElementTree
+from xml.sax.saxutils import escape
+
+logger = logging.getLogger(__name__)
+
+S3_NAMESPACE = "http://s3.amazonaws.com/doc/2006-03-01/"
+
+RANGE_PATTERN = re.compile(r"bytes=(\d*)-(\d*)")
+
+
+class S3Object:
+    def __init__(self, body):
+        self.body = bytes(body)
+        self.etag = f'"{hashlib.md5(self.body).hexdigest()}"'
+        self.modified = time.time()
+
+
+class LocalS3:
+    """
+    In-memory S3 store: buckets of objects plus open multipart uploads.
+    Counts every request by operation and the body bytes in and out, so a
+    benchmark can report throughput and request counts.
+    """
+
+    def __init__(self):
+        self.buckets = {}
+        self.uploads = {}
+        self.requests = Counter()
+        self.bytes_in = 0
+        self.bytes_out = 0
+        self._lock = threading.Lock()
+
+    def count(self, operation, bytes_in=0, bytes_out=0):
+        with self._lock:
+            self.requests[operation] += 1
+            self.bytes_in += bytes_in
+            self.bytes_out += bytes_out
+
+    def reset_stats(self):
+        with self._lock:
+            self.requests = Counter()
+            self.bytes_in = 0
+            self.bytes_out = 0
+
+    def stats(self):
+        with self._lock:
+            return {
+                "requests": dict(self.requests),
+                "bytes_in": self.bytes_in,
+                "bytes_out": self.bytes_out,
+            }
+
+
+def error_xml(code, message):
+    return (
+        f'<?xml version="1.0" encoding="UTF-8"?>'
+        f"<Error><Code>{code}</Code><Message>{escape(message)}</Message></Error>"
+    ).encode()
+
+
+def http_date(timestamp):
+    return formatdate(timestamp, usegmt=True)
+
+
+def iso_date(timestamp):
+    return time.strftime("%Y-%m-%dT%H:%M:%S.000Z", time.gmtime(timestamp))
+
+
+class LocalS3Handler(BaseHTTPRequestHandler):
+    """
+    The subset of the S3 REST API (path-style addressing) that s3fs, pyarrow
+    and S3MultipartWriter use: buckets, objects with range reads, listings,
+    batch deletes and multipart uploads. Requests are not authenticated.
+    """
+
+    protocol_version = "HTTP/1.1"
+    store = None
+
+    # Request parsing
+
+    def _parse(self):
+        url = urlsplit(self.path)
+        bucket, _, key = url.path.lstrip("/").partition("/")
+        query = {
+            name: values[0]
+            for name, values in parse_qs(url.query, keep_blank_values=True).items()
+        }
+        return unquote(bucket), unquote(key), query
+
+    def _read_body(self):
+        if self.headers.get("Transfer-Encoding", "").lower() == "chunked":
+            body = self._read_chunks()
+        else:
+            body = self.rfile.read(int(self.headers.get("Content-Length", 0)))
+
+        if "aws-chunked" in self.headers.get("Content-Encoding", ""):
+            body = self._decode_aws_chunked(body)
+        return body
+
+    def _read_chunks(self):
+        chunks = []
+        while True:
+            size = int(self.rfile.readline().split(b";")[0].strip(), 16)
+            if size == 0:
+                # Trailers, up to the empty line
+                while self.rfile.readline().strip():
+                    pass
+                return b"".join(chunks)
+            chunks.append(self.rfile.read(size))
+            self.rfile.readline()
+
+    @staticmethod
+    def _decode_aws_chunked(body):
+        """Payload of an aws-chunked body (chunk sizes, signatures and trailers stripped)"""
+        chunks = []
+        position = 0
+        while True:
+            line_end = body.index(b"\r\n", position)
+            size = int(body[position:line_end].split(b";")[0], 16)
+            if size == 0:
+                return b"".join(chunks)
+            start = line_end + 2
+            chunks.append(body[start : start + size])
+            position = start + size + 2
+
+    # Responses
+
+    def _send(self, status, body=b"", headers=None, content_type="application/xml"):
+        self.send_response(status)
+        for name, value in (headers or {}).items():
+            self.send_header(name, value)
+        if body or status not in (204, 304):
+            self.send_header("Content-Type", content_type)
+        self.send_header("Content-Length", str(len(body)))
+        self.end_headers()
+        if body and self.command != "HEAD":
+            self.wfile.write(body)
+
+    def _xml(self, status, body):
+        payload = f'<?xml version="1.0" encoding="UTF-8"?>{body}'.encode()
+        self._send(status, payload)
+
+    def _error(self, status, code, message):
+        self._send(status, error_xml(code, message) if self.command != "HEAD" else b"")
+
+    def _object(self, bucket, key):
+        objects = self.store.buckets.get(bucket)
+        if objects is None:
+            self._error(404, "NoSuchBucket", f"Bucket {bucket} does not exist")
+            return None
+        obj = objects.get(key)
+        if obj is None:
+            self._error(404, "NoSuchKey", f"Key {key} does not exist")
+        return obj
+
+    def _object_headers(self, obj):
+        return {
+            "ETag": obj.etag,
+            "Last-Modified": http_date(obj.modified),
+            "Accept-Ranges": "bytes",
+        }
+
+    # Methods
+
+    def do_HEAD(self):
+        bucket, key, _ = self._parse()
+        if not key:
+            self.store.count("HeadBucket")
+            if bucket in self.store.buckets:
+                self._send(200)
+            else:
+                self._error(404, "NoSuchBucket", bucket)
+            return
+
+        self.store.count("HeadObject")
+        obj = self._object(bucket, key)
+        if obj is not None:
+            self.send_response(200)
+            for name, value in self._object_headers(obj).items():
+                self.send_header(name, value)
+            self.send_header("Content-Type", "binary/octet-stream")
+            self.send_header("Content-Length", str(len(obj.body)))
+            self.end_headers()
+
+    def do_GET(self):
+        bucket, key, query = self._parse()
+        if not key:
+            if "location" in query:
+                self.store.count("GetBucketLocation")
+                self._xml(200, f'<LocationConstraint xmlns="{S3_NAMESPACE}"/>')
+            else:
+                self._list_objects(bucket, query)
+            return
+
+        obj = self._object(bucket, key)
+        if obj is None:
+            self.store.count("GetObject")
+            return
+
+        body = obj.body
+        headers = self._object_headers(obj)
+        match = RANGE_PATTERN.fullmatch(self.headers.get("Range", ""))
+        if match is None:
+            self.store.count("GetObject", bytes_out=len(body))
+            self._send(200, body, headers, "binary/octet-stream")
+            return
+
+        first, last = match.groups()
+        if first:
+            start = int(first)
+            end = min(int(last), len(body) - 1) if last else len(body) - 1
+        else:
+            start, end = max(0, len(body) - int(last)), len(body) - 1
+        if start >= len(body):
+            self.store.count("GetObject")
+            self._error(416, "InvalidRange", self.headers["Range"])
+            return
+
+        part = body[start : end + 1]
+        headers["Content-Range"] = f"bytes {start}-{end}/{len(body)}"
+        self.store.count("GetObject", bytes_out=len(part))
+        self._send(206, part, headers, "binary/octet-stream")
+
+    def _list_objects(self, bucket, query):
+        self.store.count("ListObjectsV2")
+        objects = self.store.buckets.get(bucket)
+        if objects is None:
+            self._error(404, "NoSuchBucket", bucket)
+            return
+
+        prefix = query.get("prefix", "")
+        delimiter = query.get("delimiter", "")
+        max_keys = int(query.get("max-keys", 1000))
+        start_after = query.get("continuation-token") or query.get("start-after", "")
+
+        contents = []
+        prefixes = []
+        truncated = False
+        for key in sorted(objects):
+            if not key.startswith(prefix) or key <= start_after:
+                continue
+            if delimiter and delimiter in key[len(prefix) :]:
+                common = key[: key.index(delimiter, len(prefix)) + len(delimiter)]
+                if common not in prefixes and common > start_after:
+                    if len(contents) + len(prefixes) == max_keys:
+                        truncated = True
+                        break
+                    prefixes.append(common)
+                continue
+            if len(contents) + len(prefixes) == max_keys:
+                truncated = True
+                break
+            contents.append(key)
+
+        entries = "".join(
+            f"<Contents><Key>{escape(key)}</Key>"
+            f"<LastModified>{iso_date(objects[key].modified)}</LastModified>"
+            f"<ETag>{escape(objects[key].etag)}</ETag>"
+            f"<Size>{len(objects[key].body)}</Size>"
+            f"<StorageClass>STANDARD</StorageClass></Contents>"
+            for key in contents
+        )
+        entries += "".join(
+            f"<CommonPrefixes><Prefix>{escape(common)}</Prefix></CommonPrefixes>"
+            for common in prefixes
+        )
+        last = max(contents + prefixes) if truncated else ""
+        self._xml(
+            200,
+            f'<ListBucketResult xmlns="{S3_NAMESPACE}">'
+            f"<Name>{escape(bucket)}</Name><Prefix>{escape(prefix)}</Prefix>"
+            f"<KeyCount>{len(contents) + len(prefixes)}</KeyCount>"
+            f"<MaxKeys>{max_keys}</MaxKeys>"
+            f"<IsTruncated>{'true' if truncated else 'false'}</IsTruncated>"
+            + (
+                f"<NextContinuationToken>{escape(last)}</NextContinuationToken>"
+                if truncated
+                else ""
+            )
+            + f"{entries}</ListBucketResult>",
+        )
+
+    def do_PUT(self):
+        bucket, key, query = self._parse()
+        body = self._read_body()
+
+        if not key:
+            self.store.count("CreateBucket")
+            self.store.buckets.setdefault(bucket, {})
+            self._send(200, headers={"Location": f"/{bucket}"})
+            return
+
+        if "uploadId" in query:
+            self.store.count("UploadPart", bytes_in=len(body))
+            upload = self.store.uploads.get(query["uploadId"])
+            if upload is None:
+                self._error(404, "NoSuchUpload", query["uploadId"])
+                return
+            part = S3Object(body)
+            upload["parts"][int(query["partNumber"])] = part
+            self._send(200, headers={"ETag": part.etag})
+            return
+
+        self.store.count("PutObject", bytes_in=len(body))
+        objects = self.store.buckets.get(bucket)
+        if objects is None:
+            self._error(404, "NoSuchBucket", bucket)
+            return
+        obj = S3Object(body)
+        objects[key] = obj
+        self._send(200, headers={"ETag": obj.etag})
+
+    def do_POST(self):
+        bucket, key, query = self._parse()
+        body = self._read_body()
+
+        if "delete" in query:
+            self._delete_objects(bucket, body)
+        elif "uploads" in query:
+            self.store.count("CreateMultipartUpload")
+            if bucket not in self.store.buckets:
+                self._error(404, "NoSuchBucket", bucket)
+                return
+            upload_id = uuid.uuid4().hex
+            self.store.uploads[upload_id] = {"bucket": bucket, "key": key, "parts": {}}
+            self._xml(
+                200,
+                f'<InitiateMultipartUploadResult xmlns="{S3_NAMESPACE}">'
+                f"<Bucket>{escape(bucket)}</Bucket><Key>{escape(key)}</Key>"
+                f"<UploadId>{upload_id}</UploadId></InitiateMultipartUploadResult>",
+            )
+        elif "uploadId" in query:
+            self._complete_upload(bucket, key, query["uploadId"], body)
+        else:
+            self.store.count("UnsupportedPost")
+            self._error(501, "NotImplemented", self.path)
+
+    def _complete_upload(self, bucket, key, upload_id, body):
+        self.store.count("CompleteMultipartUpload")
+        upload = self.store.uploads.pop(upload_id, None)
+        if upload is None:
+            self._error(404, "NoSuchUpload", upload_id)
+            return
+
+        root = ElementTree.fromstring(body)
+        numbers = [
+            int(element.text)
+            for element in root.iter()
+            if element.tag.rsplit("}", 1)[-1] == "PartNumber"
+        ]
+        missing = [number for number in numbers if number not in upload["parts"]]
+        if missing:
+            self._error(400, "InvalidPart", f"Parts {missing} were not uploaded")
+            return
+
+        obj = S3Object(b"".join(upload["parts"][number].body for number in numbers))
+        obj.etag = f'"{hashlib.md5(obj.body).hexdigest()}-{len(numbers)}"'
+        self.store.buckets[bucket][key] = obj
+        self._xml(
+            200,
+            f'<CompleteMultipartUploadResult xmlns="{S3_NAMESPACE}">'
+            f"<Location>/{escape(quote(bucket))}/{escape(quote(key))}</Location>"
+            f"<Bucket>{escape(bucket)}</Bucket><Key>{escape(key)}</Key>"
+            f"<ETag>{escape(obj.etag)}</ETag></CompleteMultipartUploadResult>",
+        )
+
+    def _delete_objects(self, bucket, body):
+        self.store.count("DeleteObjects")
+        objects = self.store.buckets.get(bucket, {})
+        keys = [
+            element.text
+            for element in ElementTree.fromstring(body).iter()
+            if element.tag.rsplit("}", 1)[-1] == "Key"
+        ]
+        for key in keys:
+            objects.pop(key, None)
+        deleted = "".join(
+            f"<Deleted><Key>{escape(key)}</Key></Deleted>" for key in keys
+        )
+        self._xml(200, f'<DeleteResult xmlns="{S3_NAMESPACE}">{deleted}</DeleteResult>')
+
+    def do_DELETE(self):
+        bucket, key, query = self._parse()
+        if "uploadId" in query:
+            self.store.count("AbortMultipartUpload")
+            self.store.uploads.pop(query["uploadId"], None)
+        elif key:
+            self.store.count("DeleteObject")
+            self.store.buckets.get(bucket, {}).pop(key, None)
+        else:
+            self.store.count("DeleteBucket")
+            self.store.buckets.pop(bucket, None)
+        self._send(204)
+
+    def log_message(self, format, *args):
+        logger.debug(f"{self.address_string()} - {format % args}")
+
+
+class LocalS3Server(ThreadingHTTPServer):
+    """
+    S3-compatible server in a background thread of the current process,
+    a stand-in for LocalStack in benchmarks and tests:
+
+        with LocalS3Server() as server:
+            server.create_bucket("nyc-duration")
+            options = server.storage_options()  # for s3fs / fsspec
+            ...
+            server.store.stats()  # request counts and bytes in/out
+    """
+
+    daemon_threads = True
+    request_queue_size = 128
+
+    def __init__(self, host="127.0.0.1", port=0):
+        self.store = LocalS3()
+        handler = type("BoundLocalS3Handler", (LocalS3Handler,), {"store": self.store})
+        super().__init__((host, port), handler)
+        self._thread = None
+
+    @property
+    def endpoint_url(self):
+        host, port = self.server_address[:2]
+        return f"http://{host}:{port}"
+
+    def storage_options(self, **options):
+        """fsspec storage options for this server, plus any s3fs options"""
+        return {
+            "key": "local",
+            "secret": "local",
+            "client_kwargs": {"endpoint_url": self.endpoint_url},
+            **options,
+        }
+
+    def create_bucket(self, bucket):
+        self.store.buckets.setdefault(bucket, {})
+
+    def start(self):
+        self._thread = threading.Thread(target=self.serve_forever, daemon=True)
+        self._thread.start()
+        return self
+
+    def stop(self):
+        self.shutdown()
+        self.server_close()
+        self._thread.join()
+
+    def __enter__(self):
+        return self.start()
+
+    def __exit__(self, *exc_info):
+        self.stop()
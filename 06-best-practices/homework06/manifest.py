@@ -0,0 +1,176 @@
+import os
+import json
+import pickle
+import hashlib
+import logging
+import tempfile
+from datetime import datetime, timezone
+
+try:
+    from homework06.input_cache import remote_info
+except ImportError:
+    from input_cache import remote_info
+
+logger = logging.getLogger(__name__)
+
+MANIFEST_SUFFIX = ".manifest.json"
+
+# Modules whose code decides what ends up in a results file
+SCORING_MODULES = [
+    "batch_refactoring.py",
+    "checkpoint.py",
+    "encoder.py",
+    "model_bundle.py",
+    "model_comparison.py",
+    "partitioned_writer.py",
+    "sharding.py",
+]
+
+# Parts of the manifest that must match for a run to be skipped
+FINGERPRINT_KEYS = ["input", "model", "code_version", "options"]
+
+
+def footer_hash(f):
+    """sha256 of the parquet footer (schema, row groups and statistics) of an open file"""
+    f.seek(-8, os.SEEK_END)
+    tail = f.read(8)
+    if tail[4:] != b"PAR1":
+        raise ValueError("Not a parquet file")
+
+    footer_length = int.from_bytes(tail[:4], "little")
+    f.seek(-8 - footer_length, os.SEEK_END)
+    return hashlib.sha256(f.read(footer_length)).hexdigest()
+
+
+def input_fingerprint(filename, storage_options=None):
+    """
+    Identify the content of an input file without reading all of it:
+    - Local files: size and a hash of the parquet footer
+    - s3:// and http(s)://: size and the version markers the server reports
+      (ETag, VersionId, Last-Modified), see remote_info
+    An empty dict means the input can't be identified.
+    """
+    if filename.startswith(("s3://", "http://", "https://")):
+        return remote_info(filename, storage_options)
+
+    with open(filename, "rb") as f_in:
+        return {
+            "size": os.fstat(f_in.fileno()).st_size,
+            "footer_sha256": footer_hash(f_in),
+        }
+
+
+def model_fingerprint(dv, lr):
+    """sha256 of the pickled vectorizer and model"""
+    return hashlib.sha256(
+        pickle.dumps((dv, lr), protocol=pickle.HIGHEST_PROTOCOL)
+    ).hexdigest()
+
+
+_code_version = None
+
+
+def code_version():
+    """sha256 over the source of the scoring modules, computed once per process"""
+    global _code_version
+    if _code_version is None:
+        digest = hashlib.sha256()
+        directory = os.path.dirname(os.path.abspath(__file__))
+        for name in SCORING_MODULES:
+            with open(os.path.join(directory, name), "rb") as f_in:
+                digest.update(f_in.read())
+        _code_version = digest.hexdigest()
+    return _code_version
+
+
+def manifest_path(output_file):
+    return output_file + MANIFEST_SUFFIX
+
+
+def read_manifest(output_file, storage_options=None):
+    """Manifest written next to output_file, or None if there is none"""
+    path = manifest_path(output_file)
+    try:
+        if path.startswith("s3://"):
+            import fsspec
+
+            with fsspec.open(path, "r", **(storage_options or {})) as f_in:
+                return json.load(f_in)
+
+        with open(path) as f_in:
+            return json.load(f_in)
+    except FileNotFoundError:
+        return None
+    except ValueError as e:
+        logger.warning(f"Ignoring unreadable manifest {path}: {e}")
+        return None
+
+
+def write_manifest(output_file, manifest, storage_options=None):
+    """Write the manifest next to output_file, renamed into place for local files"""
+    path = manifest_path(output_file)
+    manifest = dict(manifest, created=datetime.now(timezone.utc).isoformat())
+    content = json.dumps(manifest, indent=2)
+
+    if path.startswith("s3://"):
+        import fsspec
+
+        with fsspec.open(path, "w", **(storage_options or {})) as f_out:
+            f_out.write(content)
+        return path
+
+    fd, temp_path = tempfile.mkstemp(
+        prefix=".tmp-", dir=os.path.dirname(os.path.abspath(path))
+    )
+    try:
+        with os.fdopen(fd, "w") as f_out:
+            f_out.write(content)
+        os.replace(temp_path, path)
+    except BaseException:
+        if os.path.exists(temp_path):
+            os.remove(temp_path)
+        raise
+    return path
+
+
+def remove_manifest(output_file, storage_options=None):
+    """
+    Drop the manifest before output_file is rewritten, so an interrupted run
+    can't leave a partial output behind a manifest that still matches
+    """
+    path = manifest_path(output_file)
+    if path.startswith("s3://"):
+        import fsspec
+
+        fs = fsspec.filesystem("s3", **(storage_options or {}))
+        if fs.exists(path):
+            fs.rm(path)
+    elif os.path.exists(path):
+        os.remove(path)
+
+
+def output_exists(output_file, storage_options=None):
+    if output_file.startswith("s3://"):
+        import fsspec
+
+        return fsspec.filesystem("s3", **(storage_options or {})).exists(output_file)
+    return os.path.exists(output_file)
+
+
+def is_up_to_date(output_file, fingerprint, storage_options=None):
+    """
+    Manifest of output_file if the output exists and was written from the same
+    input, model, code and options as fingerprint, otherwise None.
+    An input without a fingerprint is never up to date.
+    """
+    if not fingerprint.get("input"):
+        return None
+
+    manifest = read_manifest(output_file, storage_options)
+    if manifest is None:
+        return None
+    if any(manifest.get(key) != fingerprint[key] for key in FINGERPRINT_KEYS):
+        return None
+    if not output_exists(output_file, storage_options):
+        return None
+    return manifest
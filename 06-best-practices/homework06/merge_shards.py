@@ -0,0 +1,234 @@
+import sys
+import argparse
+import logging
+import posixpath
+
+import pyarrow.parquet as pq
+
+try:
+    from homework06.batch_refactoring import (
+        get_output_path,
+        get_storage_options,
+        get_write_options,
+        manifest_entry,
+    )
+    from homework06.model_comparison import PredictionSummary
+    from homework06.partitioned_writer import (
+        METADATA_FILE,
+        get_filesystem,
+        metadata_path,
+    )
+    from homework06.sharding import merge_files, open_shard, shard_path, shards_path
+    from homework06 import manifest
+except ImportError:
+    from batch_refactoring import (
+        get_output_path,
+        get_storage_options,
+        get_write_options,
+        manifest_entry,
+    )
+    from model_comparison import PredictionSummary
+    from partitioned_writer import METADATA_FILE, get_filesystem, metadata_path
+    from sharding import merge_files, open_shard, shard_path, shards_path
+    import manifest
+
+logger = logging.getLogger(__name__)
+
+
+def merged_fingerprint(entry):
+    """
+    Fingerprint of the merged output: the one of a shard without its shard
+    option, so a merged file is up to date for an unsharded run as well
+    """
+    fingerprint = {
+        key: entry.get(key) for key in ["input_file"] + manifest.FINGERPRINT_KEYS
+    }
+    fingerprint["options"] = {
+        key: value for key, value in entry["options"].items() if key != "shard"
+    }
+    return fingerprint
+
+
+def read_shard_manifests(output_file, shard_count, storage_options=None):
+    """
+    Manifests of all shard_count shards of output_file, in shard order.
+    Raises ValueError if a shard is missing (no output or no manifest, as
+    while it is still being written), if the shards weren't scored from the
+    same input, model, code and options, or if their row groups don't cover
+    the input exactly once.
+    """
+    manifests = []
+    missing = []
+    for index in range(shard_count):
+        path = shard_path(output_file, index, shard_count)
+        entry = manifest.read_manifest(path, storage_options)
+        if entry is None or not manifest.output_exists(path, storage_options):
+            missing.append(index)
+        else:
+            manifests.append(entry)
+    if missing:
+        raise ValueError(
+            f"{len(missing)} of {shard_count} shards of {output_file} are missing: "
+            f"{', '.join(str(index) for index in missing)}"
+        )
+
+    expected = merged_fingerprint(manifests[0])
+    next_row_group = 0
+    for index, entry in enumerate(manifests):
+        shard = entry.get("shard") or {}
+        if (shard.get("index"), shard.get("count")) != (index, shard_count):
+            raise ValueError(
+                f"The manifest of shard {index} of {shard_count} is for shard "
+                f"{shard.get('index')} of {shard.get('count')}"
+            )
+
+        fingerprint = merged_fingerprint(entry)
+        different = [key for key in expected if fingerprint[key] != expected[key]]
+        if different:
+            raise ValueError(
+                f"Shard {index} was scored with a different {', '.join(different)} "
+                "than shard 0, score it again"
+            )
+
+        start, stop = shard["row_groups"]
+        if start != next_row_group:
+            raise ValueError(
+                f"Shard {index} starts at row group {start} instead of {next_row_group}"
+            )
+        next_row_group = stop
+
+    if next_row_group != manifests[0]["shard"]["num_row_groups"]:
+        raise ValueError(
+            f"The shards cover {next_row_group} of "
+            f"{manifests[0]['shard']['num_row_groups']} row groups"
+        )
+    return manifests
+
+
+def read_footers(paths, manifests, storage_options=None):
+    """Footers of the shard files, checked against the row counts of their manifests"""
+    footers = []
+    for path, entry in zip(paths, manifests):
+        with open_shard(path, storage_options) as f_in:
+            footer = pq.read_metadata(f_in)
+        if footer.num_rows != entry["rows"]:
+            raise ValueError(
+                f"{path} has {footer.num_rows} rows, its manifest says {entry['rows']}"
+            )
+        footers.append(footer)
+    return footers
+
+
+def write_dataset_metadata(path, paths, footers, storage_options=None):
+    """
+    Write a _metadata file into the shards directory path that lists the
+    row groups of all shard files, so the directory can be read as one
+    dataset (see partitioned_writer.read_dataset) without copying anything
+    """
+    fs, root = get_filesystem(path, storage_options)
+    for shard_file, footer in zip(paths, footers):
+        footer.set_file_path(posixpath.basename(shard_file))
+
+    pq.write_metadata(
+        footers[0].schema.to_arrow_schema(),
+        f"{root}/{METADATA_FILE}",
+        metadata_collector=footers,
+        filesystem=fs,
+    )
+    logger.info(f"Wrote a dataset manifest of {len(paths)} shards to {path}")
+    return metadata_path(path)
+
+
+def merge_month(year, month, shard_count, dataset=False, force=False):
+    """
+    Combine the shard outputs of a month (see score_month) once all of them
+    are written:
+    - By default the shards are copied into the month's output file, which
+      then looks exactly like the output of an unsharded run, manifest
+      included
+    - With dataset=True only a _metadata file is written into the shards
+      directory, which then reads as one dataset
+    The inputs are never read again. The shard files are kept.
+    Returns the merged output path and the number of predictions.
+    """
+    output_file = get_output_path(year, month)
+    storage_options = get_storage_options(output_file)
+    manifests = read_shard_manifests(output_file, shard_count, storage_options)
+    paths = [
+        shard_path(output_file, index, shard_count) for index in range(shard_count)
+    ]
+
+    fingerprint = merged_fingerprint(manifests[0])
+    options = fingerprint["options"]
+    rows = sum(entry["rows"] for entry in manifests)
+
+    if dataset:
+        output_file = shards_path(output_file)
+        manifest_file = metadata_path(output_file)
+    else:
+        manifest_file = output_file
+
+    if not force:
+        previous = manifest.is_up_to_date(manifest_file, fingerprint, storage_options)
+        if previous is not None:
+            logger.info(f"Skipping the merge: {output_file} is up to date")
+            return output_file, rows
+    manifest.remove_manifest(manifest_file, storage_options)
+
+    footers = read_footers(paths, manifests, storage_options)
+    if dataset:
+        write_dataset_metadata(output_file, paths, footers, storage_options)
+    else:
+        write_options = get_write_options(
+            options["compact"], options["compression"], options.get("challengers", {})
+        )
+        merge_files(paths, output_file, write_options, storage_options)
+
+    summary = None
+    if "summary" in manifests[0]:
+        summary = PredictionSummary.from_dict(manifests[0]["summary"])
+        for entry in manifests[1:]:
+            summary.merge(PredictionSummary.from_dict(entry["summary"]))
+
+    entry = manifest_entry(fingerprint, rows, summary, options.get("challengers"))
+    entry["shards"] = shard_count
+    manifest.write_manifest(manifest_file, entry, storage_options)
+    logger.info(f"Merged {shard_count} shards, {rows} predictions, into {output_file}")
+    return output_file, rows
+
+
+def parse_args(argv):
+    parser = argparse.ArgumentParser(
+        description="Combine the shard outputs of a month scored with --shard-count"
+    )
+    parser.add_argument("year", type=int)
+    parser.add_argument("month", type=int)
+    parser.add_argument(
+        "--shard-count",
+        type=int,
+        required=True,
+        help="Number of shards the month was split into",
+    )
+    parser.add_argument(
+        "--dataset",
+        action="store_true",
+        help="Write a _metadata file over the shard files instead of copying "
+        "them into the output file",
+    )
+    parser.add_argument(
+        "--force",
+        action="store_true",
+        help="Merge even if the manifest says the merged output is up to date",
+    )
+    return parser.parse_args(argv)
+
+
+if __name__ == "__main__":
+    args = parse_args(sys.argv[1:])
+    merge_month(
+        args.year,
+        args.month,
+        args.shard_count,
+        dataset=args.dataset,
+        force=args.force,
+    )
@@ -0,0 +1,334 @@
+import os
+import sys
+import json
+import pickle
+import argparse
+import logging
+
+import numpy as np
+import scipy.sparse as sp
+
+logger = logging.getLogger(__name__)
+
+BUNDLE_FORMAT = "taxi-duration-model-bundle"
+BUNDLE_VERSION = 1
+MANIFEST_NAME = "bundle.json"
+
+
+class BundleVectorizer:
+    """
+    Read-only stand-in for a fitted DictVectorizer, loaded from a bundle.
+    Has the attributes ColumnarEncoder needs (feature_names_, vocabulary_,
+    separator, dtype, sparse) and a transform() for lists of dicts.
+    """
+
+    def __init__(self, feature_names, separator, dtype, sparse):
+        self.feature_names_ = [str(name) for name in feature_names]
+        self.vocabulary_ = {name: i for i, name in enumerate(self.feature_names_)}
+        self.separator = separator
+        self.dtype = dtype
+        self.sparse = sparse
+
+    def transform(self, dicts):
+        """Same result as DictVectorizer.transform for string and numeric values"""
+        indices = []
+        values = []
+        indptr = [0]
+        for row in dicts:
+            for column, value in row.items():
+                if isinstance(value, str):
+                    name = f"{column}{self.separator}{value}"
+                    value = 1
+                else:
+                    name = column
+                if name in self.vocabulary_:
+                    indices.append(self.vocabulary_[name])
+                    values.append(value)
+            indptr.append(len(indices))
+
+        X = sp.csr_matrix(
+            (
+                np.array(values, dtype=self.dtype),
+                np.array(indices, dtype=np.intc),
+                indptr,
+            ),
+            shape=(len(indptr) - 1, len(self.feature_names_)),
+            dtype=self.dtype,
+        )
+        X.sort_indices()
+        return X if self.sparse else X.toarray()
+
+
+class BundleLinearModel:
+    """Linear model from a bundle, predicts like sklearn's LinearRegression"""
+
+    def __init__(self, coef, intercept):
+        self.coef_ = coef
+        self.intercept_ = intercept
+
+    def predict(self, X):
+        y = X @ self.coef_.T
+        return np.asarray(y) + self.intercept_
+
+
+class BundleForestModel:
+    """
+    Tree ensemble from a bundle (RandomForestRegressor or DecisionTreeRegressor).
+    The node arrays of all trees are stored back to back; tree_offsets[i] is the
+    first node of tree i.
+    """
+
+    def __init__(
+        self, tree_offsets, children_left, children_right, feature, threshold, value
+    ):
+        self.tree_offsets = tree_offsets
+        self.children_left = children_left
+        self.children_right = children_right
+        self.feature = feature
+        self.threshold = threshold
+        self.value = value
+
+    def _predict_tree(self, X, root):
+        node = np.full(X.shape[0], root, dtype=np.int64)
+        rows = np.arange(X.shape[0])
+        active = self.children_left[node] != -1
+
+        while active.any():
+            active_rows = rows[active]
+            active_nodes = node[active]
+            go_left = (
+                X[active_rows, self.feature[active_nodes]]
+                <= self.threshold[active_nodes]
+            )
+            node[active] = np.where(
+                go_left,
+                root + self.children_left[active_nodes],
+                root + self.children_right[active_nodes],
+            )
+            active = self.children_left[node] != -1
+
+        return self.value[node]
+
+    def predict(self, X, chunk_size=10_000):
+        n_trees = len(self.tree_offsets) - 1
+        y = np.zeros(X.shape[0], dtype=np.float64)
+
+        for start in range(0, X.shape[0], chunk_size):
+            chunk = X[start : start + chunk_size]
+            # Trees compare float32 features, like sklearn does
+            chunk = chunk.toarray() if sp.issparse(chunk) else np.asarray(chunk)
+            chunk = chunk.astype(np.float32)
+
+            y_chunk = np.zeros(chunk.shape[0], dtype=np.float64)
+            for i in range(n_trees):
+                y_chunk += self._predict_tree(chunk, self.tree_offsets[i])
+            y[start : start + chunk_size] = y_chunk
+
+        return y / n_trees
+
+
+def _save_array(bundle_dir, name, array):
+    np.save(os.path.join(bundle_dir, f"{name}.npy"), np.ascontiguousarray(array))
+
+
+def _load_array(bundle_dir, name, mmap):
+    return np.load(
+        os.path.join(bundle_dir, f"{name}.npy"), mmap_mode="r" if mmap else None
+    )
+
+
+def export_bundle(dv, model, bundle_dir):
+    """
+    Write a DictVectorizer and a LinearRegression or tree model as a bundle:
+    a directory with bundle.json and one .npy file per array
+    """
+    os.makedirs(bundle_dir, exist_ok=True)
+
+    manifest = {
+        "format": BUNDLE_FORMAT,
+        "version": BUNDLE_VERSION,
+        "vectorizer": {
+            "separator": dv.separator,
+            "dtype": np.dtype(dv.dtype).name,
+            "sparse": bool(dv.sparse),
+        },
+        "model": {"class": type(model).__name__},
+    }
+    _save_array(bundle_dir, "feature_names", np.array(dv.feature_names_, dtype=str))
+
+    if hasattr(model, "coef_"):
+        manifest["model"]["kind"] = "linear"
+        _save_array(bundle_dir, "coef", np.asarray(model.coef_, dtype=np.float64))
+        _save_array(
+            bundle_dir, "intercept", np.asarray(model.intercept_, dtype=np.float64)
+        )
+    elif hasattr(model, "tree_") or hasattr(model, "estimators_"):
+        manifest["model"]["kind"] = "forest"
+        trees = (
+            [model.tree_]
+            if hasattr(model, "tree_")
+            else [estimator.tree_ for estimator in model.estimators_]
+        )
+        if any(tree.n_outputs != 1 for tree in trees):
+            raise ValueError("Only single-output tree models can be bundled")
+
+        offsets = np.cumsum([0] + [tree.node_count for tree in trees])
+        _save_array(bundle_dir, "tree_offsets", offsets.astype(np.int64))
+        for name in ["children_left", "children_right", "feature"]:
+            _save_array(
+                bundle_dir,
+                name,
+                np.concatenate([getattr(tree, name) for tree in trees]).astype(
+                    np.int64
+                ),
+            )
+        _save_array(
+            bundle_dir,
+            "threshold",
+            np.concatenate([tree.threshold for tree in trees]).astype(np.float64),
+        )
+        _save_array(
+            bundle_dir,
+            "value",
+            np.concatenate([tree.value[:, 0, 0] for tree in trees]).astype(np.float64),
+        )
+    else:
+        raise ValueError(f"Don't know how to bundle a {type(model).__name__}")
+
+    with open(os.path.join(bundle_dir, MANIFEST_NAME), "w") as f_out:
+        json.dump(manifest, f_out, indent=2)
+
+    logger.info(f"Exported {type(model).__name__} bundle to {bundle_dir}")
+    return bundle_dir
+
+
+def is_bundle(path):
+    return os.path.isfile(os.path.join(path, MANIFEST_NAME))
+
+
+def load_bundle(bundle_dir, mmap=True):
+    """
+    Load a bundle as (vectorizer, model). With mmap=True the arrays are
+    memory-mapped, so processes loading the same bundle share the pages.
+    """
+    with open(os.path.join(bundle_dir, MANIFEST_NAME)) as f_in:
+        manifest = json.load(f_in)
+
+    if manifest.get("format") != BUNDLE_FORMAT:
+        raise ValueError(f"{bundle_dir} is not a model bundle")
+    if manifest.get("version") != BUNDLE_VERSION:
+        raise ValueError(
+            f"Unsupported bundle version {manifest.get('version')} in {bundle_dir}, "
+            f"expected {BUNDLE_VERSION}"
+        )
+
+    vectorizer = manifest["vectorizer"]
+    dv = BundleVectorizer(
+        _load_array(bundle_dir, "feature_names", mmap),
+        separator=vectorizer["separator"],
+        dtype=np.dtype(vectorizer["dtype"]).type,
+        sparse=vectorizer["sparse"],
+    )
+
+    kind = manifest["model"]["kind"]
+    if kind == "linear":
+        model = BundleLinearModel(
+            _load_array(bundle_dir, "coef", mmap),
+            _load_array(bundle_dir, "intercept", mmap),
+        )
+    elif kind == "forest":
+        model = BundleForestModel(
+            *[
+                _load_array(bundle_dir, name, mmap)
+                for name in [
+                    "tree_offsets",
+                    "children_left",
+                    "children_right",
+                    "feature",
+                    "threshold",
+                    "value",
+                ]
+            ]
+        )
+    else:
+        raise ValueError(f"Unknown model kind {kind!r} in {bundle_dir}")
+
+    return dv, model
+
+
+def check_round_trip(dv, model, bundle_dir, n_rows=1000, seed=0):
+    """
+    Load the bundle back and compare it with the original objects:
+    same vocabulary, and predictions on random one-hot rows that match
+    exactly for linear models and to float precision for tree models.
+    Returns the largest absolute prediction difference.
+    """
+    bundle_dv, bundle_model = load_bundle(bundle_dir)
+    if bundle_dv.feature_names_ != list(dv.feature_names_):
+        raise AssertionError("Bundle vocabulary differs from the DictVectorizer")
+
+    n_features = len(dv.feature_names_)
+    rng = np.random.default_rng(seed)
+    X = sp.random(
+        n_rows,
+        n_features,
+        density=min(1.0, 2 / max(n_features, 1)),
+        format="csr",
+        random_state=rng,
+        data_rvs=lambda size: np.ones(size),
+    )
+
+    expected = model.predict(X)
+    actual = bundle_model.predict(X)
+
+    if isinstance(bundle_model, BundleLinearModel):
+        if not np.array_equal(expected, actual):
+            raise AssertionError("Bundle predictions differ from the original model")
+    elif not np.allclose(expected, actual, rtol=1e-12, atol=1e-12):
+        raise AssertionError("Bundle predictions differ from the original model")
+
+    return float(np.max(np.abs(expected - actual), initial=0.0))
+
+
+def load_pickled_model(model_path, dv_path=None):
+    """
+    Load (dv, model) from a model.bin tuple, or from a model.pkl plus a
+    separate dv.pkl as stored in the MLflow artifacts
+    """
+    with open(model_path, "rb") as f_in:
+        obj = pickle.load(f_in)
+
+    if isinstance(obj, tuple) and len(obj) == 2:
+        return obj
+
+    if dv_path is None:
+        raise ValueError(
+            f"{model_path} holds only a model, pass the matching dv.pkl with --dv"
+        )
+    with open(dv_path, "rb") as f_in:
+        dv = pickle.load(f_in)
+    return dv, obj
+
+
+def parse_args(argv):
+    parser = argparse.ArgumentParser(
+        description="Convert a pickled model to a memory-mappable model bundle"
+    )
+    parser.add_argument("model_path", help="model.bin tuple or model.pkl")
+    parser.add_argument("bundle_dir", help="Directory to write the bundle to")
+    parser.add_argument("--dv", default=None, help="dv.pkl for a model.pkl")
+    return parser.parse_args(argv)
+
+
+if __name__ == "__main__":
+    logging.basicConfig(
+        level=logging.INFO,
+        format="%(asctime)s - %(name)s - %(levelname)s - %(message)s",
+        datefmt="%Y-%m-%d %H:%M:%S",
+    )
+    args = parse_args(sys.argv[1:])
+
+    dv, model = load_pickled_model(args.model_path, args.dv)
+    export_bundle(dv, model, args.bundle_dir)
+    max_diff = check_round_trip(dv, model, args.bundle_dir)
+    logger.info(f"Round trip check passed, max prediction difference {max_diff}")
@@ -0,0 +1,146 @@
+import re
+import itertools
+
+import numpy as np
+
+try:
+    from homework06.encoder import ColumnarEncoder
+except ImportError:
+    from encoder import ColumnarEncoder
+
+# Name of the production model; its predictions keep the predicted_duration column
+CHAMPION = "champion"
+
+MODEL_NAME_PATTERN = re.compile(r"^[A-Za-z0-9_\-]+$")
+
+
+def result_column(name):
+    """Output column holding the predictions of a model"""
+    if name == CHAMPION:
+        return "predicted_duration"
+    return f"predicted_duration_{name}"
+
+
+def check_model_name(name):
+    if name == CHAMPION:
+        raise ValueError(f"{CHAMPION!r} is reserved for the production model")
+    if not MODEL_NAME_PATTERN.match(name):
+        raise ValueError(
+            f"Invalid model name {name!r}: use letters, digits, '_' and '-' only"
+        )
+
+
+def same_vectorizer(dv, other):
+    """True when two DictVectorizers build the same feature matrix"""
+    return dv is other or (
+        dv.vocabulary_ == other.vocabulary_
+        and dv.separator == other.separator
+        and dv.dtype == other.dtype
+        and dv.sparse == other.sparse
+    )
+
+
+def group_models(models, categorical):
+    """
+    Group models ({name: (dv, lr)}) by DictVectorizer and return a list of
+    (encoder, {name: lr}). Models whose vectorizers have the same vocabulary
+    share one encoder, so their feature matrix is built once per batch.
+    """
+    groups = []
+    for name, (dv, lr) in models.items():
+        for group_dv, _, members in groups:
+            if same_vectorizer(group_dv, dv):
+                members[name] = lr
+                break
+        else:
+            groups.append((dv, ColumnarEncoder(dv, categorical), {name: lr}))
+
+    return [(encoder, members) for _, encoder, members in groups]
+
+
+class PredictionSummary:
+    """
+    Running statistics of the predictions of several models, batch by batch:
+    - sum and mean of every model
+    - for every pair of models, the mean, mean absolute, root mean squared
+      and largest absolute difference of their predictions, reported as
+      "b-a" (the later model minus the earlier one, so challenger-champion)
+    """
+
+    def __init__(self, names):
+        self.names = list(names)
+        self.pairs = list(itertools.combinations(self.names, 2))
+        self.rows = 0
+        self.sums = dict.fromkeys(self.names, 0.0)
+        self.deltas = {
+            pair: {"sum": 0.0, "abs_sum": 0.0, "squared_sum": 0.0, "max_abs": 0.0}
+            for pair in self.pairs
+        }
+
+    def update(self, predictions):
+        """Add a batch of predictions ({name: array}, aligned by row)"""
+        if not self.names or len(predictions[self.names[0]]) == 0:
+            return
+
+        self.rows += len(predictions[self.names[0]])
+        for name in self.names:
+            self.sums[name] += float(np.sum(predictions[name], dtype="float64"))
+
+        for a, b in self.pairs:
+            delta = np.asarray(predictions[b], dtype="float64") - predictions[a]
+            abs_delta = np.abs(delta)
+            stats = self.deltas[(a, b)]
+            stats["sum"] += float(delta.sum())
+            stats["abs_sum"] += float(abs_delta.sum())
+            stats["squared_sum"] += float(np.dot(delta, delta))
+            stats["max_abs"] = max(stats["max_abs"], float(abs_delta.max()))
+
+    def merge(self, other):
+        """Add the statistics of another summary of the same models, e.g. of another shard"""
+        if other.names != self.names:
+            raise ValueError(
+                f"Can't merge summaries of {other.names} into {self.names}"
+            )
+
+        self.rows += other.rows
+        for name in self.names:
+            self.sums[name] += other.sums[name]
+        for pair, stats in self.deltas.items():
+            other_stats = other.deltas[pair]
+            for key in ("sum", "abs_sum", "squared_sum"):
+                stats[key] += other_stats[key]
+            stats["max_abs"] = max(stats["max_abs"], other_stats["max_abs"])
+
+    @classmethod
+    def from_dict(cls, summary):
+        """Rebuild a summary from the to_dict() stored in a manifest"""
+        result = cls(summary["models"])
+        result.rows = summary["rows"]
+        for name, stats in summary["models"].items():
+            result.sums[name] = stats["sum"]
+        for (a, b), stats in result.deltas.items():
+            delta = summary["deltas"][f"{b}-{a}"]
+            stats["sum"] = delta["mean"] * result.rows
+            stats["abs_sum"] = delta["mean_abs"] * result.rows
+            stats["squared_sum"] = delta["rmse"] ** 2 * result.rows
+            stats["max_abs"] = delta["max_abs"]
+        return result
+
+    def to_dict(self):
+        rows = self.rows or 1
+        return {
+            "rows": self.rows,
+            "models": {
+                name: {"sum": total, "mean": total / rows}
+                for name, total in self.sums.items()
+            },
+            "deltas": {
+                f"{b}-{a}": {
+                    "mean": stats["sum"] / rows,
+                    "mean_abs": stats["abs_sum"] / rows,
+                    "rmse": float(np.sqrt(stats["squared_sum"] / rows)),
+                    "max_abs": stats["max_abs"],
+                }
+                for (a, b), stats in self.deltas.items()
+            },
+        }
@@ -0,0 +1,288 @@
+import os
+import logging
+import posixpath
+from collections import OrderedDict
+from concurrent.futures import ThreadPoolExecutor
+
+import numpy as np
+import pandas as pd
+import pyarrow as pa
+import pyarrow.dataset as ds
+import pyarrow.parquet as pq
+
+logger = logging.getLogger(__name__)
+
+# Hive partition keys of the results dataset, in path order
+PARTITION_KEYS = ["taxi_type", "year", "month", "day"]
+
+# Summary of all files of a month, as written by pq.write_metadata
+METADATA_FILE = "_metadata"
+
+DEFAULT_MAX_OPEN_FILES = 64
+
+# Day partition of rows whose pickup is outside the month of the dataset:
+# day=00, which no day of the month has
+OUTSIDE_MONTH = 0
+
+# Key of the number of OUTSIDE_MONTH rows in the _metadata key-value metadata
+OUTSIDE_MONTH_KEY = b"outside_month_rows"
+
+
+def get_dataset_path(year, month):
+    """
+    Directory of the Hive-partitioned results of a month. The days are
+    written below it as day=DD/part-NNNNN.parquet.
+    """
+    default_dataset_pattern = (
+        "homework06/data/predictions/taxi_type=yellow/year={year:04d}/month={month:02d}"
+    )
+    dataset_pattern = os.getenv("OUTPUT_DATASET_PATTERN", default_dataset_pattern)
+    return dataset_pattern.format(year=year, month=month)
+
+
+def metadata_path(path):
+    return posixpath.join(path, METADATA_FILE)
+
+
+def get_filesystem(path, storage_options=None):
+    """
+    (fsspec filesystem, path without the protocol) for path, with the
+    storage options (e.g. the S3_ENDPOINT_URL endpoint) for s3:// paths.
+    pyarrow writes and reads through it on both local disk and S3.
+    """
+    import fsspec
+
+    if path.startswith("s3://"):
+        return fsspec.filesystem("s3", **(storage_options or {})), path[len("s3://") :]
+    return fsspec.filesystem("file"), os.path.abspath(path).replace(os.sep, "/")
+
+
+def is_dataset(path, storage_options=None):
+    """True if path is a directory, like the ones PartitionedWriter writes"""
+    fs, root = get_filesystem(path, storage_options)
+    return fs.isdir(root)
+
+
+def path_partitions(path):
+    """Hive keys and values in a path, e.g. {"year": "2023"} for .../year=2023/..."""
+    partitions = {}
+    for part in path.rstrip("/").split("/"):
+        key, separator, value = part.partition("=")
+        if separator and key in PARTITION_KEYS:
+            partitions[key] = value
+    return partitions
+
+
+def pickup_days(df, year, month):
+    """
+    Day of the month of every pickup, the day partition of every row.
+    TLC monthly files also have some pickups of other months (e.g. of
+    2022-12-31 in 2023-01); their day is OUTSIDE_MONTH, so that they are
+    kept with the month of the file without being filed under one of its days
+    """
+    pickup = df["tpep_pickup_datetime"]
+    days = pickup.dt.day.to_numpy(dtype="int8")
+    outside = (pickup.dt.year != year) | (pickup.dt.month != month)
+    days[outside.to_numpy()] = OUTSIDE_MONTH
+    return days
+
+
+class PartitionedWriter:
+    """
+    Writes results as a Hive-partitioned dataset below path, one day=DD
+    directory per day of the month:
+
+        writer = PartitionedWriter(path, write_options)
+        writer.write(df_result, days)  # once per batch
+        writer.close()                 # writes path/_metadata
+
+    - Every write() splits the batch by day and writes the days in parallel
+      on a pool of max_workers threads; each day has its own ParquetWriter,
+      so no file is written by two threads at once
+    - At most max_open_files files are open at the same time. When another
+      day needs a file, the least recently used one is closed and that day
+      continues in a new part file
+    - Partition key columns (year and month in the compact schema) are
+      dropped from the files; they are in the path
+    - Rows of day OUTSIDE_MONTH (see pickup_days) go to day=00 and are
+      counted in outside_month, so the dataset has every row of the input
+      file while queries on the days of the month don't see them
+    - close() writes a _metadata file with the footers of all files, so
+      readers can plan a query without opening every file, and the
+      outside_month count (see read_outside_month). A dataset without
+      one is incomplete, see abort()
+    Whatever was in path before is deleted when the writer is created.
+    """
+
+    def __init__(
+        self,
+        path,
+        write_options=None,
+        max_open_files=DEFAULT_MAX_OPEN_FILES,
+        max_workers=None,
+        storage_options=None,
+    ):
+        if max_open_files < 1:
+            raise ValueError("max_open_files must be at least 1")
+
+        self.path = path
+        self.write_options = dict(write_options or {})
+        self.max_open_files = max_open_files
+        self.fs, self._root = get_filesystem(path, storage_options)
+        self.schema = None
+        self.rows = 0
+        self.outside_month = 0
+
+        self._open = OrderedDict()
+        self._next_part = {}
+        self._files = []
+        self._pool = ThreadPoolExecutor(
+            max_workers=max_workers or min(32, (os.cpu_count() or 1) + 4)
+        )
+
+        if self.fs.exists(self._root):
+            logger.info(f"Removing previous dataset {path}")
+            self.fs.rm(self._root, recursive=True)
+
+    def _writer_for(self, day):
+        """Writer of a day, opening a new part file (and closing the LRU one) if needed"""
+        if day in self._open:
+            self._open.move_to_end(day)
+            return self._open[day]
+
+        if len(self._open) >= self.max_open_files:
+            _, writer = self._open.popitem(last=False)
+            writer.close()
+
+        part = self._next_part.get(day, 0)
+        self._next_part[day] = part + 1
+        relative_path = f"day={day:02d}/part-{part:05d}.parquet"
+        file_path = f"{self._root}/{relative_path}"
+        self.fs.makedirs(posixpath.dirname(file_path), exist_ok=True)
+
+        collector = []
+        writer = pq.ParquetWriter(
+            file_path,
+            self.schema,
+            filesystem=self.fs,
+            metadata_collector=collector,
+            **self.write_options,
+        )
+        self._files.append((relative_path, collector))
+        self._open[day] = writer
+        return writer
+
+    def write(self, df_result, days):
+        """Append a batch of results; days holds the day partition of every row"""
+        table = pa.Table.from_pandas(df_result, preserve_index=False)
+        table = table.drop_columns(
+            [name for name in table.column_names if name in PARTITION_KEYS]
+        )
+        if self.schema is None:
+            self.schema = table.schema
+
+        days = np.asarray(days)
+        self.outside_month += int((days == OUTSIDE_MONTH).sum())
+        if table.num_rows == 0:
+            return
+
+        # Sort the rows by day once, then hand out zero-copy slices per day
+        order = np.argsort(days, kind="stable")
+        table = table.take(pa.array(order))
+        unique_days, starts = np.unique(days[order], return_index=True)
+        ends = np.append(starts[1:], len(days))
+        slices = [
+            (int(day), table.slice(start, end - start))
+            for day, start, end in zip(unique_days, starts, ends)
+        ]
+
+        # Never more days at once than files may be open, so no writer is
+        # closed while one of its slices is still being written
+        for i in range(0, len(slices), self.max_open_files):
+            futures = [
+                self._pool.submit(self._writer_for(day).write_table, part)
+                for day, part in slices[i : i + self.max_open_files]
+            ]
+            for future in futures:
+                future.result()
+
+        self.rows += table.num_rows
+
+    def _close_files(self):
+        try:
+            for writer in self._open.values():
+                writer.close()
+        finally:
+            self._open.clear()
+            self._pool.shutdown()
+
+    def close(self):
+        """Close all files and write the _metadata summary; returns its path"""
+        self._close_files()
+        if self.schema is None:
+            raise ValueError("Nothing was written, the dataset has no schema")
+
+        # Listed by path, so readers of _metadata get the days in order
+        metadata = []
+        for relative_path, collector in sorted(self._files):
+            for file_metadata in collector:
+                file_metadata.set_file_path(relative_path)
+                metadata.append(file_metadata)
+
+        self.fs.makedirs(self._root, exist_ok=True)
+        pq.write_metadata(
+            self.schema.with_metadata(
+                {
+                    **(self.schema.metadata or {}),
+                    OUTSIDE_MONTH_KEY: str(self.outside_month).encode(),
+                }
+            ),
+            f"{self._root}/{METADATA_FILE}",
+            metadata_collector=metadata,
+            filesystem=self.fs,
+        )
+        logger.info(
+            f"Wrote {self.rows} rows in {len(self._files)} files to {self.path}"
+        )
+        if self.outside_month:
+            logger.warning(
+                f"{self.outside_month} rows with pickups outside the month "
+                f"are in day={OUTSIDE_MONTH:02d}"
+            )
+        return metadata_path(self.path)
+
+    def abort(self):
+        """Close the open files without writing _metadata, leaving the dataset incomplete"""
+        self._close_files()
+
+
+def read_outside_month(path, storage_options=None):
+    """Number of rows in the OUTSIDE_MONTH partition, from the _metadata of a dataset"""
+    fs, root = get_filesystem(path, storage_options)
+    with fs.open(metadata_path(root), "rb") as f_in:
+        metadata = pq.read_metadata(f_in).metadata or {}
+    return int(metadata.get(OUTSIDE_MONTH_KEY, 0))
+
+
+def read_dataset(path, storage_options=None):
+    """
+    Read a partitioned results dataset (or any directory above one) into
+    pandas, with the partition keys as columns, including the ones that are
+    only part of path itself. The files listed in a _metadata file are read
+    without listing the directory, all parquet files below it otherwise.
+    """
+    fs, root = get_filesystem(path, storage_options)
+    metadata_file = metadata_path(root)
+    if fs.exists(metadata_file):
+        dataset = ds.parquet_dataset(
+            metadata_file, filesystem=fs, partitioning=ds.HivePartitioning.discover()
+        )
+    else:
+        dataset = ds.dataset(root, filesystem=fs, format="parquet", partitioning="hive")
+    df = dataset.to_table().to_pandas()
+    for key, value in path_partitions(path).items():
+        if key not in df.columns:
+            df[key] = pd.Series(value, index=df.index).astype(
+                "int64" if value.isdigit() else "object"
+            )
+    return df
@@ -0,0 +1,159 @@
+import time
+import cProfile
+import logging
+import tracemalloc
+from datetime import datetime, timezone
+
+logger = logging.getLogger(__name__)
+
+
+class _NullStage:
+    """Stage of a disabled profiler: does nothing, so instrumented code stays cheap"""
+
+    rows = None
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *exc_info):
+        return False
+
+
+_NULL_STAGE = _NullStage()
+
+
+class _Stage:
+    def __init__(self, profiler, name):
+        self.profiler = profiler
+        self.name = name
+        self.rows = None
+
+    def __enter__(self):
+        if self.profiler.trace_memory:
+            tracemalloc.reset_peak()
+        self._profile = self.profiler._profile_for(self.name)
+        if self._profile is not None:
+            self._profile.enable()
+        self._wall = time.perf_counter()
+        self._cpu = time.process_time()
+        return self
+
+    def __exit__(self, *exc_info):
+        wall = time.perf_counter() - self._wall
+        cpu = time.process_time() - self._cpu
+        if self._profile is not None:
+            self._profile.disable()
+        peak = tracemalloc.get_traced_memory()[1] if self.profiler.trace_memory else 0
+        self.profiler._add(self.name, wall, cpu, self.rows, peak)
+        return False
+
+
+class StageProfiler:
+    """
+    Opt-in per-stage instrumentation of a scoring run:
+
+        profiler = StageProfiler()
+        profiler.start()
+        with profiler.stage("read") as stage:
+            df = ...
+            stage.rows = len(df)
+        record = profiler.finish()
+
+    - Every stage gets wall and CPU time, rows, rows/sec and the tracemalloc
+      peak while it ran. A stage entered several times (once per batch in
+      streaming mode) adds up its times and rows and keeps its highest peak
+    - finish() returns all of it as one JSON-serializable record
+    - With cprofile_path, every stage is run under its own cProfile and the
+      stats of the slowest one are dumped to that file; the profiler's own
+      overhead is then included in the timings
+    A disabled profiler hands out a shared no-op stage, see NULL_PROFILER.
+    """
+
+    def __init__(self, enabled=True, trace_memory=True, cprofile_path=None):
+        self.enabled = enabled
+        self.trace_memory = enabled and trace_memory
+        self.cprofile_path = cprofile_path if enabled else None
+        self.metadata = {}
+        self.stages = {}
+        self._profiles = {}
+        self._started_tracing = False
+
+    def start(self):
+        if not self.enabled:
+            return
+        if self.trace_memory and not tracemalloc.is_tracing():
+            tracemalloc.start()
+            self._started_tracing = True
+        self._started = datetime.now(timezone.utc)
+        self._wall = time.perf_counter()
+        self._cpu = time.process_time()
+
+    def stage(self, name):
+        if not self.enabled:
+            return _NULL_STAGE
+        return _Stage(self, name)
+
+    def _profile_for(self, name):
+        if self.cprofile_path is None:
+            return None
+        return self._profiles.setdefault(name, cProfile.Profile())
+
+    def _add(self, name, wall, cpu, rows, peak):
+        stats = self.stages.setdefault(
+            name,
+            {
+                "calls": 0,
+                "wall_seconds": 0.0,
+                "cpu_seconds": 0.0,
+                "rows": None,
+                "peak_bytes": 0,
+            },
+        )
+        stats["calls"] += 1
+        stats["wall_seconds"] += wall
+        stats["cpu_seconds"] += cpu
+        if rows is not None:
+            stats["rows"] = (stats["rows"] or 0) + rows
+        stats["peak_bytes"] = max(stats["peak_bytes"], peak)
+
+    def finish(self):
+        """Stop measuring and return the record of the run (None if disabled)"""
+        if not self.enabled:
+            return None
+
+        wall = time.perf_counter() - self._wall
+        cpu = time.process_time() - self._cpu
+        if self._started_tracing:
+            tracemalloc.stop()
+            self._started_tracing = False
+
+        stages = {}
+        for name, stats in self.stages.items():
+            seconds = stats["wall_seconds"]
+            rows_per_sec = (
+                stats["rows"] / seconds if stats["rows"] and seconds else None
+            )
+            stages[name] = dict(stats, rows_per_sec=rows_per_sec)
+        slowest = max(
+            stages, key=lambda name: stages[name]["wall_seconds"], default=None
+        )
+
+        record = {
+            **self.metadata,
+            "started": self._started.isoformat(),
+            "wall_seconds": wall,
+            "cpu_seconds": cpu,
+            "slowest_stage": slowest,
+            "stages": stages,
+        }
+
+        if self.cprofile_path and slowest is not None:
+            self._profiles[slowest].dump_stats(self.cprofile_path)
+            record["cprofile"] = self.cprofile_path
+            logger.info(f"Wrote cProfile stats of {slowest} to {self.cprofile_path}")
+
+        return record
+
+
+# Shared disabled profiler, the default wherever a profiler can be passed
+NULL_PROFILER = StageProfiler(enabled=False)
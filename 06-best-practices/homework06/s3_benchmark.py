@@ -0,0 +1,299 @@
+import sys
+import os
+import json
+import time
+import platform
+import argparse
+import logging
+import tempfile
+import contextlib
+from concurrent.futures import ThreadPoolExecutor
+from datetime import datetime, timezone
+
+import pyarrow as pa
+import pyarrow.parquet as pq
+
+try:
+    from homework06.benchmark import CATEGORICAL, get_trips_file, parse_size
+    from homework06.batch_refactoring import make_result, read_data, save_results
+    from homework06.local_s3 import LocalS3Server
+    from homework06.s3_writer import S3MultipartWriter
+except ImportError:
+    from benchmark import CATEGORICAL, get_trips_file, parse_size
+    from batch_refactoring import make_result, read_data, save_results
+    from local_s3 import LocalS3Server
+    from s3_writer import S3MultipartWriter
+
+logger = logging.getLogger(__name__)
+
+BUCKET = "s3-benchmark"
+
+# s3fs refuses write blocks and S3 refuses multipart parts under 5 MiB
+DEFAULT_BLOCK_SIZES = "5M,16M,64M"
+DEFAULT_CONCURRENCY = "1,4"
+
+WRITE_BATCH_ROWS = 100_000
+
+
+def parse_bytes(value):
+    """Parse a byte size like 5242880, 512K, 5M or 1G (powers of 1024)"""
+    value = value.strip()
+    multiplier = {"k": 2**10, "m": 2**20, "g": 2**30}.get(value[-1:].lower(), 1)
+    if multiplier != 1:
+        value = value[:-1]
+    return int(float(value) * multiplier)
+
+
+@contextlib.contextmanager
+def s3_environment(server, storage_options=None):
+    """
+    Point batch_refactoring (S3_ENDPOINT_URL, S3_STORAGE_OPTIONS) and
+    S3MultipartWriter at the stand-in for the duration of a run. The input
+    cache is switched off so every read goes to S3, and cached s3fs clients
+    are dropped so each run starts cold, like a new scoring process.
+    """
+    import s3fs
+
+    variables = {
+        "S3_ENDPOINT_URL": server.endpoint_url,
+        "S3_STORAGE_OPTIONS": json.dumps(storage_options or {}),
+        "AWS_ACCESS_KEY_ID": "local",
+        "AWS_SECRET_ACCESS_KEY": "local",
+        "AWS_DEFAULT_REGION": "us-east-1",
+        "INPUT_CACHE_DIR": None,
+    }
+    previous = {name: os.environ.get(name) for name in variables}
+    for name, value in variables.items():
+        if value is None:
+            os.environ.pop(name, None)
+        else:
+            os.environ[name] = value
+    s3fs.S3FileSystem.clear_instance_cache()
+
+    try:
+        yield
+    finally:
+        for name, value in previous.items():
+            if value is None:
+                os.environ.pop(name, None)
+            else:
+                os.environ[name] = value
+        s3fs.S3FileSystem.clear_instance_cache()
+
+
+def timed(server, run):
+    """Run run() with fresh request counters; seconds, requests and bytes moved"""
+    server.store.reset_stats()
+    start = time.perf_counter()
+    run()
+    seconds = time.perf_counter() - start
+    stats = server.store.stats()
+    return {
+        "seconds": seconds,
+        "requests": stats["requests"],
+        "request_count": sum(stats["requests"].values()),
+        "bytes_in": stats["bytes_in"],
+        "bytes_out": stats["bytes_out"],
+    }
+
+
+def upload(server, local_path, url):
+    import fsspec
+
+    fs = fsspec.filesystem("s3", skip_instance_cache=True, **server.storage_options())
+    fs.put_file(local_path, url[len("s3://") :])
+
+
+def read_run(url, concurrency):
+    """concurrency parallel read_data calls on the same object, like a backfill"""
+
+    def run():
+        with ThreadPoolExecutor(max_workers=concurrency) as pool:
+            for df in pool.map(
+                lambda _: read_data(url, CATEGORICAL), range(concurrency)
+            ):
+                assert len(df) > 0
+
+    return run
+
+
+def fsspec_write_run(df_result, url):
+    """save_results: one s3fs file, uploaded in default_block_size parts"""
+    return lambda: save_results(df_result, url)
+
+
+def multipart_write_run(table, url, part_size, concurrency):
+    """The streaming writer: parts of part_size uploaded by concurrency threads"""
+
+    def run():
+        sink = S3MultipartWriter(url, part_size=part_size, max_workers=concurrency)
+        with pq.ParquetWriter(sink, table.schema) as writer:
+            for batch in table.to_batches(max_chunksize=WRITE_BATCH_ROWS):
+                writer.write_batch(batch)
+        sink.close()
+
+    return run
+
+
+def best_run(server, run, repeat):
+    """Fastest of repeat timed runs"""
+    return min((timed(server, run) for _ in range(repeat)), key=lambda r: r["seconds"])
+
+
+def throughput(result, transferred):
+    seconds = result["seconds"]
+    result["mb_per_sec"] = transferred / 1e6 / seconds if seconds > 0 else None
+    return result
+
+
+def benchmark_size(server, n_rows, data_dir, block_sizes, concurrency, repeat=3):
+    """Read and write throughput of one synthetic month for every setting"""
+    local_path = get_trips_file(data_dir, n_rows)
+    input_url = f"s3://{BUCKET}/input/synthetic_{n_rows}.parquet"
+    upload(server, local_path, input_url)
+    file_bytes = os.path.getsize(local_path)
+
+    with s3_environment(server):
+        df = read_data(input_url, CATEGORICAL)
+    df_result = make_result(df, df["duration"].to_numpy(), 2023, 1)
+    table = pa.Table.from_pandas(df_result, preserve_index=False)
+
+    runs = []
+    for block_size in block_sizes:
+        options = {"default_block_size": block_size}
+        output_url = f"s3://{BUCKET}/output/{n_rows}_{block_size}.parquet"
+
+        for threads in concurrency:
+            with s3_environment(server, options):
+                result = best_run(server, read_run(input_url, threads), repeat)
+            runs.append(
+                dict(
+                    throughput(result, result["bytes_out"]),
+                    operation="read",
+                    block_size=block_size,
+                    concurrency=threads,
+                )
+            )
+
+            with s3_environment(server):
+                run = multipart_write_run(table, output_url, block_size, threads)
+                result = best_run(server, run, repeat)
+            runs.append(
+                dict(
+                    throughput(result, result["bytes_in"]),
+                    operation="write_multipart",
+                    block_size=block_size,
+                    concurrency=threads,
+                )
+            )
+
+        # s3fs uploads the parts of one file one after the other
+        with s3_environment(server, options):
+            result = best_run(server, fsspec_write_run(df_result, output_url), repeat)
+        runs.append(
+            dict(
+                throughput(result, result["bytes_in"]),
+                operation="write_fsspec",
+                block_size=block_size,
+                concurrency=1,
+            )
+        )
+
+    for run in runs:
+        logger.info(
+            f"{n_rows} rows, {run['operation']}, block {run['block_size'] // 2**20} MiB, "
+            f"concurrency {run['concurrency']}: {run['mb_per_sec']:.1f} MB/s, "
+            f"{run['request_count']} requests {run['requests']}"
+        )
+
+    return {
+        "file_bytes": file_bytes,
+        "rows": n_rows,
+        "result_rows": len(df_result),
+        "runs": runs,
+    }
+
+
+def run_s3_benchmark(sizes, data_dir, block_sizes, concurrency, repeat=3):
+    """Benchmark all sizes against a LocalS3Server and return a JSON-serializable dict"""
+    results = {}
+    with LocalS3Server() as server:
+        server.create_bucket(BUCKET)
+        for n_rows in sizes:
+            results[str(n_rows)] = benchmark_size(
+                server, n_rows, data_dir, block_sizes, concurrency, repeat=repeat
+            )
+
+    return {
+        "meta": {
+            "created": datetime.now(timezone.utc).isoformat(),
+            "python": platform.python_version(),
+            "platform": platform.platform(),
+            "cpu_count": os.cpu_count(),
+            "pyarrow": pa.__version__,
+            "repeat": repeat,
+            "server": "local_s3.LocalS3Server",
+        },
+        "results": results,
+    }
+
+
+def parse_args(argv):
+    parser = argparse.ArgumentParser(
+        description="Measure S3 read and write throughput against an in-process S3"
+    )
+    parser.add_argument(
+        "--sizes",
+        default="100k,1M",
+        help="Comma separated row counts, like 100k,1M,10M (default: 100k,1M)",
+    )
+    parser.add_argument(
+        "--block-sizes",
+        default=DEFAULT_BLOCK_SIZES,
+        help="s3fs default_block_size / multipart part sizes to try "
+        f"(default: {DEFAULT_BLOCK_SIZES})",
+    )
+    parser.add_argument(
+        "--concurrency",
+        default=DEFAULT_CONCURRENCY,
+        help="Parallel readers and upload threads to try "
+        f"(default: {DEFAULT_CONCURRENCY})",
+    )
+    parser.add_argument(
+        "--repeat", type=int, default=3, help="Timed runs per setting, the best counts"
+    )
+    parser.add_argument(
+        "--data-dir",
+        default=None,
+        help="Keep the synthetic inputs here and reuse them (default: a temp dir)",
+    )
+    parser.add_argument("--output", default=None, help="Write the results as JSON")
+    return parser.parse_args(argv)
+
+
+if __name__ == "__main__":
+    logging.basicConfig(
+        level=logging.INFO,
+        format="%(asctime)s - %(name)s - %(levelname)s - %(message)s",
+        datefmt="%Y-%m-%d %H:%M:%S",
+    )
+    args = parse_args(sys.argv[1:])
+    sizes = [parse_size(size) for size in args.sizes.split(",")]
+    block_sizes = [parse_bytes(size) for size in args.block_sizes.split(",")]
+    concurrency = [int(threads) for threads in args.concurrency.split(",")]
+
+    if args.data_dir:
+        os.makedirs(args.data_dir, exist_ok=True)
+        report = run_s3_benchmark(
+            sizes, args.data_dir, block_sizes, concurrency, args.repeat
+        )
+    else:
+        with tempfile.TemporaryDirectory() as data_dir:
+            report = run_s3_benchmark(
+                sizes, data_dir, block_sizes, concurrency, args.repeat
+            )
+
+    if args.output:
+        with open(args.output, "w") as f_out:
+            json.dump(report, f_out, indent=2)
+        logger.info(f"Wrote S3 benchmark results to {args.output}")
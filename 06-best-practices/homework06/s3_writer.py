@@ -0,0 +1,214 @@
+import io
+import os
+import json
+import logging
+import threading
+from concurrent.futures import ThreadPoolExecutor
+
+logger = logging.getLogger(__name__)
+
+# S3 rejects multipart parts smaller than 5 MiB, except for the last one
+MIN_PART_SIZE = 5 * 1024 * 1024
+
+
+class S3fsClient:
+    """
+    Minimal boto3-style S3 client on top of s3fs, which is already used for
+    reading and writing S3 through pandas. client.upload_part(**kwargs) calls
+    the S3 API method of the same name and is safe to use from several threads.
+    """
+
+    def __init__(self, storage_options=None):
+        import s3fs
+
+        self.fs = s3fs.S3FileSystem(**(storage_options or {}))
+
+    def __getattr__(self, method):
+        def call(**kwargs):
+            return self.fs.call_s3(method, **kwargs)
+
+        return call
+
+
+def s3_storage_options():
+    """
+    s3fs options of the environment: S3_STORAGE_OPTIONS as JSON, like
+    {"default_block_size": 16777216}, and the client pointed at
+    S3_ENDPOINT_URL (localstack) if it is set
+    """
+    options = json.loads(os.getenv("S3_STORAGE_OPTIONS") or "{}")
+    endpoint_url = os.getenv("S3_ENDPOINT_URL")
+    if endpoint_url:
+        options["client_kwargs"] = dict(
+            options.get("client_kwargs", {}), endpoint_url=endpoint_url
+        )
+    return options
+
+
+def make_s3_client():
+    """S3 client with the s3fs options of the environment, see s3_storage_options"""
+    return S3fsClient(s3_storage_options())
+
+
+def split_s3_url(url):
+    """Split s3://bucket/key into (bucket, key)"""
+    if not url.startswith("s3://"):
+        raise ValueError(f"Not an S3 URL: {url}")
+    bucket, _, key = url[len("s3://") :].partition("/")
+    return bucket, key
+
+
+class S3MultipartWriter(io.RawIOBase):
+    """
+    Writable file object that uploads to S3 while it is being written.
+
+    - Written bytes are cut into parts of part_size bytes, and each part is
+      uploaded as an S3 multipart part by a pool of max_workers threads
+    - At most max_in_flight parts are buffered or uploading at a time; write()
+      blocks until a slot frees up, so a slow upload slows down the producer
+      instead of growing memory
+    - close() uploads the last part and completes the upload. If a part
+      failed, the multipart upload is aborted and the error is raised from
+      the next write() or from close()
+    - Files smaller than one part are uploaded with a single put_object
+    - Used as a context manager, an exception in the with block aborts the
+      upload instead of publishing a truncated object
+
+    Memory use is bounded by about (max_in_flight + 1) * part_size.
+    """
+
+    def __init__(
+        self,
+        url,
+        part_size=8 * 1024 * 1024,
+        max_workers=4,
+        max_in_flight=None,
+        client=None,
+    ):
+        super().__init__()
+        self.url = url
+        self.bucket, self.key = split_s3_url(url)
+        self.part_size = max(part_size, MIN_PART_SIZE)
+        self.client = client or make_s3_client()
+
+        self._buffer = bytearray()
+        self._position = 0
+        self._upload_id = None
+        self._futures = []
+        self._slots = threading.BoundedSemaphore(max_in_flight or max_workers * 2)
+        self._executor = ThreadPoolExecutor(max_workers=max_workers)
+
+    def writable(self):
+        return True
+
+    def tell(self):
+        return self._position
+
+    def write(self, data):
+        if self.closed:
+            raise ValueError("write to closed file")
+
+        self._buffer += data
+        self._position += len(data)
+
+        try:
+            while len(self._buffer) >= self.part_size:
+                part = bytes(self._buffer[: self.part_size])
+                del self._buffer[: self.part_size]
+                self._submit(part)
+        except BaseException:
+            self.abort()
+            raise
+
+        return len(data)
+
+    def _check_failed(self):
+        """Raise the error of any part that already failed"""
+        for future in self._futures:
+            if future.done() and future.exception() is not None:
+                raise future.exception()
+
+    def _submit(self, body):
+        self._check_failed()
+
+        if self._upload_id is None:
+            response = self.client.create_multipart_upload(
+                Bucket=self.bucket, Key=self.key
+            )
+            self._upload_id = response["UploadId"]
+            logger.info(f"Started multipart upload to {self.url}")
+
+        # Backpressure: wait for a free slot before buffering one more part
+        self._slots.acquire()
+        part_number = len(self._futures) + 1
+        future = self._executor.submit(self._upload_part, part_number, body)
+        future.add_done_callback(lambda _: self._slots.release())
+        self._futures.append(future)
+
+    def _upload_part(self, part_number, body):
+        response = self.client.upload_part(
+            Bucket=self.bucket,
+            Key=self.key,
+            UploadId=self._upload_id,
+            PartNumber=part_number,
+            Body=body,
+        )
+        logger.debug(f"Uploaded part {part_number} ({len(body)} bytes) of {self.url}")
+        return {"PartNumber": part_number, "ETag": response["ETag"]}
+
+    def abort(self):
+        """Abort the multipart upload, dropping any uploaded parts"""
+        if self.closed:
+            return
+
+        try:
+            self._executor.shutdown(wait=True)
+            if self._upload_id is not None:
+                logger.warning(f"Aborting multipart upload to {self.url}")
+                self.client.abort_multipart_upload(
+                    Bucket=self.bucket, Key=self.key, UploadId=self._upload_id
+                )
+        finally:
+            super().close()
+
+    def __exit__(self, exc_type, exc_value, traceback):
+        if exc_type is not None:
+            self.abort()
+        else:
+            self.close()
+
+    def __del__(self):
+        # Never publish a half-written object from the garbage collector
+        if not self.closed:
+            try:
+                self.abort()
+            except Exception:
+                pass
+
+    def close(self):
+        if self.closed:
+            return
+
+        try:
+            if self._upload_id is None:
+                self.client.put_object(
+                    Bucket=self.bucket, Key=self.key, Body=bytes(self._buffer)
+                )
+            else:
+                if self._buffer:
+                    self._submit(bytes(self._buffer))
+                parts = [future.result() for future in self._futures]
+                self.client.complete_multipart_upload(
+                    Bucket=self.bucket,
+                    Key=self.key,
+                    UploadId=self._upload_id,
+                    MultipartUpload={"Parts": parts},
+                )
+                logger.info(f"Completed upload of {len(parts)} parts to {self.url}")
+        except BaseException:
+            self.abort()
+            raise
+
+        self._buffer = bytearray()
+        self._executor.shutdown(wait=True)
+        super().close()
@@ -0,0 +1,412 @@
+import sys
+import json
+import time
+import queue
+import bisect
+import argparse
+import logging
+import threading
+from concurrent.futures import Future, TimeoutError as FutureTimeoutError
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+
+import pandas as pd
+
+try:
+    from homework06.encoder import ColumnarEncoder
+    from homework06.batch_refactoring import load_model, predict, prepare_features
+except ImportError:
+    from encoder import ColumnarEncoder
+    from batch_refactoring import load_model, predict, prepare_features
+
+logger = logging.getLogger(__name__)
+
+CATEGORICAL = ["PULocationID", "DOLocationID"]
+
+LATENCY_BUCKETS_MS = (0.5, 1, 2, 5, 10, 20, 50, 100, 200, 500, 1000, 2000, 5000)
+BATCH_SIZE_BUCKETS = (1, 2, 4, 8, 16, 32, 64, 128, 256, 512, 1024, 4096)
+
+# Longest a request waits for its predictions before it gets a 503
+DEFAULT_TIMEOUT_S = 30.0
+
+
+class Histogram:
+    """
+    Thread-safe histogram with fixed bucket bounds, like a Prometheus histogram.
+    Percentiles are estimated as the upper bound of the bucket they fall in.
+    """
+
+    def __init__(self, bounds):
+        self.bounds = list(bounds)
+        self.counts = [0] * (len(self.bounds) + 1)
+        self.count = 0
+        self.total = 0.0
+        self.max = 0.0
+        self._lock = threading.Lock()
+
+    def observe(self, value):
+        with self._lock:
+            self.counts[bisect.bisect_left(self.bounds, value)] += 1
+            self.count += 1
+            self.total += value
+            self.max = max(self.max, value)
+
+    def percentile(self, q):
+        """Upper bound of the bucket holding the q-th percentile (0 < q <= 100)"""
+        with self._lock:
+            if self.count == 0:
+                return 0.0
+            rank = q / 100 * self.count
+            seen = 0
+            for bound, count in zip(self.bounds, self.counts):
+                seen += count
+                if seen >= rank:
+                    return min(bound, self.max)
+            return self.max
+
+    def snapshot(self):
+        buckets = {
+            f"le_{bound:g}": count for bound, count in zip(self.bounds, self.counts)
+        }
+        buckets["le_inf"] = self.counts[-1]
+        return {
+            "count": self.count,
+            "sum": self.total,
+            "mean": self.total / self.count if self.count else 0.0,
+            "max": self.max,
+            "p50": self.percentile(50),
+            "p90": self.percentile(90),
+            "p99": self.percentile(99),
+            "buckets": buckets,
+        }
+
+
+class MicroBatcher:
+    """
+    Coalesces concurrent scoring requests into micro-batches:
+    - submit() queues a prepared frame and returns a Future for its predictions
+    - A single worker thread takes the first waiting request and keeps adding
+      requests until the batch has max_batch_size rows or the first request
+      has waited max_wait_ms
+    - The whole batch is vectorized and predicted at once, and every request
+      gets its own slice of the predictions back
+    If scoring fails, every request in the batch gets the exception.
+    Requests cancelled while they wait (see ScoringService.predict) are
+    left out of their batch.
+    """
+
+    def __init__(self, score, max_batch_size=256, max_wait_ms=5.0):
+        self.score = score
+        self.max_batch_size = max_batch_size
+        self.max_wait = max_wait_ms / 1000
+        self.batch_sizes = Histogram(BATCH_SIZE_BUCKETS)
+        self.queue_wait_ms = Histogram(LATENCY_BUCKETS_MS)
+        self.score_ms = Histogram(LATENCY_BUCKETS_MS)
+
+        self._queue = queue.Queue()
+        # Held to check _closed and queue, so nothing is queued after close()
+        self._lock = threading.Lock()
+        self._closed = False
+        self._thread = threading.Thread(target=self._run, daemon=True)
+        self._thread.start()
+
+    def submit(self, df):
+        future = Future()
+        with self._lock:
+            if self._closed:
+                raise RuntimeError("MicroBatcher is closed")
+            self._queue.put((df, future, time.perf_counter()))
+        return future
+
+    def _run(self):
+        running = True
+        while running:
+            first = self._queue.get()
+            if first is None:
+                break
+
+            batch = [first]
+            rows = len(first[0])
+            deadline = first[2] + self.max_wait
+            while rows < self.max_batch_size:
+                timeout = deadline - time.perf_counter()
+                if timeout <= 0:
+                    break
+                try:
+                    item = self._queue.get(timeout=timeout)
+                except queue.Empty:
+                    break
+                if item is None:
+                    running = False
+                    break
+                batch.append(item)
+                rows += len(item[0])
+
+            self._score_batch(batch)
+
+    def _score_batch(self, batch):
+        batch = [item for item in batch if item[1].set_running_or_notify_cancel()]
+        if not batch:
+            return
+        started = time.perf_counter()
+        for _, _, submitted in batch:
+            self.queue_wait_ms.observe((started - submitted) * 1000)
+
+        try:
+            df = pd.concat([df for df, _, _ in batch], ignore_index=True)
+            y_pred = self.score(df)
+        except Exception as e:
+            logger.exception(f"Scoring a batch of {len(batch)} requests failed")
+            for _, future, _ in batch:
+                future.set_exception(e)
+            return
+
+        self.batch_sizes.observe(len(df))
+        self.score_ms.observe((time.perf_counter() - started) * 1000)
+
+        offset = 0
+        for request_df, future, _ in batch:
+            future.set_result(y_pred[offset : offset + len(request_df)])
+            offset += len(request_df)
+
+    def close(self):
+        """
+        Score what is already queued, then stop the worker thread. Requests
+        the worker didn't get to (if it died) fail with RuntimeError
+        """
+        with self._lock:
+            if self._closed:
+                return
+            self._closed = True
+            self._queue.put(None)
+        self._thread.join()
+
+        while True:
+            try:
+                item = self._queue.get_nowait()
+            except queue.Empty:
+                break
+            if item is not None and item[1].set_running_or_notify_cancel():
+                item[1].set_exception(RuntimeError("MicroBatcher is closed"))
+
+
+def records_to_frame(records, categorical=CATEGORICAL):
+    """
+    Prepared feature frame for a list of ride records (dicts). Missing
+    location IDs become -1, like in the batch job. Raises ValueError for
+    records the model can't score.
+    """
+    if not isinstance(records, list) or not all(isinstance(r, dict) for r in records):
+        raise ValueError("Expected a ride record or a list of ride records")
+
+    df = pd.DataFrame.from_records(records, columns=categorical)
+    try:
+        return prepare_features(df, categorical)
+    except (TypeError, ValueError, OverflowError) as e:
+        raise ValueError(f"Location IDs must be integers: {e}")
+
+
+class ScoringService:
+    """
+    Model held in memory behind a MicroBatcher, plus request metrics.
+    predict(records) is what the HTTP handler calls from its request thread.
+    """
+
+    def __init__(
+        self, dv, lr, max_batch_size=256, max_wait_ms=5.0, timeout=DEFAULT_TIMEOUT_S
+    ):
+        encoder = ColumnarEncoder(dv, CATEGORICAL)
+        self.batcher = MicroBatcher(
+            lambda df: predict(df, encoder, lr),
+            max_batch_size=max_batch_size,
+            max_wait_ms=max_wait_ms,
+        )
+        self.timeout = timeout
+        self.request_ms = Histogram(LATENCY_BUCKETS_MS)
+        self.requests = 0
+        self.errors = 0
+        self.rides = 0
+        self.started = time.time()
+        self._lock = threading.Lock()
+
+    def predict(self, records):
+        df = records_to_frame(records)
+        future = self.batcher.submit(df)
+        try:
+            y_pred = future.result(timeout=self.timeout)
+        except FutureTimeoutError:
+            # Not scored for nothing if it is still queued
+            future.cancel()
+            raise
+        with self._lock:
+            self.rides += len(df)
+        return y_pred.tolist()
+
+    def record_request(self, milliseconds, error=False):
+        self.request_ms.observe(milliseconds)
+        with self._lock:
+            self.requests += 1
+            self.errors += int(error)
+
+    def metrics(self):
+        return {
+            "uptime_seconds": time.time() - self.started,
+            "requests": self.requests,
+            "errors": self.errors,
+            "rides": self.rides,
+            "max_batch_size": self.batcher.max_batch_size,
+            "max_wait_ms": self.batcher.max_wait * 1000,
+            "request_latency_ms": self.request_ms.snapshot(),
+            "queue_wait_ms": self.batcher.queue_wait_ms.snapshot(),
+            "batch_score_ms": self.batcher.score_ms.snapshot(),
+            "batch_size": self.batcher.batch_sizes.snapshot(),
+        }
+
+    def close(self):
+        self.batcher.close()
+
+
+class ScoringHandler(BaseHTTPRequestHandler):
+    """
+    POST /predict with one ride record or a list of them, for example
+    {"PULocationID": 132, "DOLocationID": 236}, returns
+    {"predicted_duration": ...} with one prediction per record.
+    GET /metrics returns the latency histograms, GET /health returns ok.
+    """
+
+    # Keep-alive connections, so clients don't pay a TCP handshake per lookup
+    protocol_version = "HTTP/1.1"
+    service = None
+
+    def _send_json(self, status, body):
+        payload = json.dumps(body).encode()
+        self.send_response(status)
+        self.send_header("Content-Type", "application/json")
+        self.send_header("Content-Length", str(len(payload)))
+        self.end_headers()
+        self.wfile.write(payload)
+
+    def do_GET(self):
+        if self.path == "/health":
+            self._send_json(200, {"status": "ok"})
+        elif self.path == "/metrics":
+            self._send_json(200, self.service.metrics())
+        else:
+            self._send_json(404, {"error": f"Unknown path {self.path}"})
+
+    def _read_body(self):
+        """
+        The request body, or None if its Content-Length is invalid. Read for
+        every request, so that an unused body isn't taken for the next
+        request of a keep-alive connection
+        """
+        try:
+            length = int(self.headers.get("Content-Length", 0))
+        except ValueError:
+            length = -1
+        if length < 0:
+            # Where the body ends is unknown, so the connection can't be reused
+            self.close_connection = True
+            return None
+        return self.rfile.read(length)
+
+    def do_POST(self):
+        data = self._read_body()
+        if data is None:
+            self._send_json(400, {"error": "Invalid Content-Length"})
+            return
+        if self.path != "/predict":
+            self._send_json(404, {"error": f"Unknown path {self.path}"})
+            return
+
+        start = time.perf_counter()
+        status = 200
+        try:
+            body = json.loads(data or b"null")
+            single = isinstance(body, dict)
+            y_pred = self.service.predict([body] if single else body)
+            response = {"predicted_duration": y_pred[0] if single else y_pred}
+        except ValueError as e:
+            # Also covers invalid JSON (json.JSONDecodeError is a ValueError)
+            status, response = 400, {"error": str(e)}
+        except FutureTimeoutError:
+            status, response = 503, {"error": "Timed out waiting for predictions"}
+        except Exception as e:
+            logger.exception("Scoring request failed")
+            status, response = 500, {"error": f"{type(e).__name__}: {e}"}
+
+        self.service.record_request(
+            (time.perf_counter() - start) * 1000, error=status != 200
+        )
+        self._send_json(status, response)
+
+    def log_message(self, format, *args):
+        logger.debug(f"{self.address_string()} - {format % args}")
+
+
+class ScoringServer(ThreadingHTTPServer):
+    """HTTP server that answers every request from its own thread"""
+
+    daemon_threads = True
+    # The default listen backlog of 5 resets connections when many clients
+    # connect at once
+    request_queue_size = 128
+
+
+def make_server(service, host="0.0.0.0", port=9696):
+    handler = type("BoundScoringHandler", (ScoringHandler,), {"service": service})
+    return ScoringServer((host, port), handler)
+
+
+def parse_args(argv):
+    parser = argparse.ArgumentParser(
+        description="Serve taxi duration predictions over HTTP"
+    )
+    parser.add_argument("--host", default="0.0.0.0")
+    parser.add_argument("--port", type=int, default=9696)
+    parser.add_argument("--model-path", default=None, help="model.bin or bundle")
+    parser.add_argument(
+        "--max-batch-size",
+        type=int,
+        default=256,
+        help="Score a micro-batch as soon as it has this many rides (default: 256)",
+    )
+    parser.add_argument(
+        "--max-wait-ms",
+        type=float,
+        default=5.0,
+        help="Longest a request waits for others to join its batch (default: 5)",
+    )
+    parser.add_argument(
+        "--timeout",
+        type=float,
+        default=DEFAULT_TIMEOUT_S,
+        help="Longest a request waits for its predictions, in seconds (default: 30)",
+    )
+    return parser.parse_args(argv)
+
+
+if __name__ == "__main__":
+    logging.basicConfig(
+        level=logging.INFO,
+        format="%(asctime)s - %(name)s - %(levelname)s - %(message)s",
+        datefmt="%Y-%m-%d %H:%M:%S",
+    )
+    args = parse_args(sys.argv[1:])
+
+    dv, lr = load_model(args.model_path)
+    service = ScoringService(
+        dv,
+        lr,
+        max_batch_size=args.max_batch_size,
+        max_wait_ms=args.max_wait_ms,
+        timeout=args.timeout,
+    )
+    server = make_server(service, args.host, args.port)
+    logger.info(f"Serving predictions on http://{args.host}:{args.port}/predict")
+    try:
+        server.serve_forever()
+    except KeyboardInterrupt:
+        pass
+    finally:
+        server.server_close()
+        service.close()
@@ -0,0 +1,165 @@
+import os
+import logging
+import tempfile
+import posixpath
+
+import numpy as np
+import pyarrow.parquet as pq
+
+try:
+    from homework06.partitioned_writer import get_filesystem
+    from homework06.s3_writer import S3MultipartWriter
+except ImportError:
+    from partitioned_writer import get_filesystem
+    from s3_writer import S3MultipartWriter
+
+logger = logging.getLogger(__name__)
+
+# Directory next to the month's output file that holds the shard outputs
+SHARDS_SUFFIX = ".shards"
+
+
+def check_shard(shard_index, shard_count):
+    """Raise ValueError unless 0 <= shard_index < shard_count"""
+    if shard_count is None or shard_index is None:
+        raise ValueError("shard_index and shard_count must be given together")
+    if shard_count < 1:
+        raise ValueError("shard_count must be at least 1")
+    if not 0 <= shard_index < shard_count:
+        raise ValueError(
+            f"shard_index must be between 0 and {shard_count - 1}, got {shard_index}"
+        )
+
+
+def shards_path(output_file):
+    """Directory of the shard outputs of output_file, e.g. 2023-01.shards"""
+    root, _ = posixpath.splitext(output_file)
+    return root + SHARDS_SUFFIX
+
+
+def shard_path(output_file, shard_index, shard_count):
+    """Output file of one shard, e.g. 2023-01.shards/part-00001-of-00004.parquet"""
+    _, ext = posixpath.splitext(output_file)
+    return posixpath.join(
+        shards_path(output_file),
+        f"part-{shard_index:05d}-of-{shard_count:05d}{ext or '.parquet'}",
+    )
+
+
+def read_input_metadata(filename, storage_options=None):
+    """Parquet footer of a local, S3 or HTTP file; only the footer is downloaded"""
+    if filename.startswith(("s3://", "http://", "https://")):
+        import fsspec
+
+        with fsspec.open(filename, "rb", **(storage_options or {})) as f_in:
+            return pq.read_metadata(f_in)
+    return pq.read_metadata(filename)
+
+
+def plan_shards(metadata, shard_count):
+    """
+    Split the row groups of a parquet file into shard_count contiguous
+    [start, stop) ranges with about the same number of rows each. The plan
+    only depends on the footer, so every node computes the same one, and
+    concatenating the shards in order gives the rows in file order.
+    Shards beyond the number of row groups get an empty range.
+    """
+    rows = [metadata.row_group(i).num_rows for i in range(metadata.num_row_groups)]
+    cumulative = np.concatenate([[0], np.cumsum(rows, dtype="int64")])
+    total = cumulative[-1]
+
+    bounds = [0]
+    for k in range(1, shard_count):
+        target = total * k / shard_count
+        boundary = int(np.searchsorted(cumulative, target))
+        # The row group boundary closest to the target
+        if (
+            boundary > 0
+            and target - cumulative[boundary - 1] < cumulative[boundary] - target
+        ):
+            boundary -= 1
+        bounds.append(max(boundary, bounds[-1]))
+    bounds.append(len(rows))
+    return list(zip(bounds[:-1], bounds[1:]))
+
+
+def row_group_offset(metadata, row_groups):
+    """
+    Position in the file of the first row of row_groups, which must be
+    consecutive, so the rows read keep their positions (and ride_ids)
+    """
+    row_groups = list(row_groups)
+    if not row_groups:
+        return 0
+    if row_groups != list(range(row_groups[0], row_groups[0] + len(row_groups))):
+        raise ValueError(f"Row groups must be consecutive, got {row_groups}")
+    return sum(metadata.row_group(i).num_rows for i in range(row_groups[0]))
+
+
+def shard_spec(metadata, shard_index, shard_count):
+    """
+    The part of the input a shard scores, as recorded in its manifest:
+    its row group range, the position of its first row and its row count
+    """
+    check_shard(shard_index, shard_count)
+    start, stop = plan_shards(metadata, shard_count)[shard_index]
+    return {
+        "index": shard_index,
+        "count": shard_count,
+        "row_groups": [start, stop],
+        "num_row_groups": metadata.num_row_groups,
+        "first_row": sum(metadata.row_group(i).num_rows for i in range(start)),
+        "input_rows": sum(metadata.row_group(i).num_rows for i in range(start, stop)),
+    }
+
+
+def open_shard(path, storage_options=None):
+    """Open a local or S3 results file for reading"""
+    fs, shard_file = get_filesystem(path, storage_options)
+    return fs.open(shard_file, "rb")
+
+
+def merge_files(paths, output_file, write_options=None, storage_options=None):
+    """
+    Copy the results files in paths in order into output_file, one row group
+    at a time, so memory stays bounded by the largest row group. Only the
+    results are read, the inputs they were scored from are not. The output
+    only appears once complete: on S3 the multipart upload is aborted on
+    errors, locally a temporary file is renamed over output_file at the end.
+    """
+    if output_file.startswith("s3://"):
+        sink = S3MultipartWriter(output_file)
+    else:
+        fd, sink = tempfile.mkstemp(
+            prefix=".tmp-", dir=os.path.dirname(os.path.abspath(output_file))
+        )
+        os.close(fd)
+
+    writer = None
+    completed = False
+    try:
+        for path in paths:
+            with open_shard(path, storage_options) as f_in:
+                parquet_file = pq.ParquetFile(f_in)
+                if writer is None:
+                    writer = pq.ParquetWriter(
+                        sink, parquet_file.schema_arrow, **(write_options or {})
+                    )
+                for i in range(parquet_file.num_row_groups):
+                    writer.write_table(parquet_file.read_row_group(i))
+        completed = True
+    finally:
+        if not completed and isinstance(sink, S3MultipartWriter):
+            sink.abort()
+        else:
+            if writer is not None:
+                writer.close()
+            if not isinstance(sink, str):
+                sink.close()
+            elif completed:
+                os.replace(sink, output_file)
+            else:
+                os.remove(sink)
+
+    logger.info(f"Merged {len(paths)} files into {output_file}")
+    return output_file
@@ -0,0 +1,711 @@
+import os
+import sys
+import json
+import time
+import queue
+import argparse
+import logging
+import threading
+import socketserver
+from datetime import datetime, timezone
+
+import numpy as np
+import pandas as pd
+import pyarrow as pa
+import pyarrow.parquet as pq
+
+try:
+    from homework06.encoder import ColumnarEncoder
+    from homework06.batch_refactoring import (
+        DATETIME_COLUMNS,
+        load_model,
+        predict,
+        prepare_data,
+    )
+    from homework06.serve import (
+        BATCH_SIZE_BUCKETS,
+        CATEGORICAL,
+        LATENCY_BUCKETS_MS,
+        Histogram,
+    )
+except ImportError:
+    from encoder import ColumnarEncoder
+    from batch_refactoring import DATETIME_COLUMNS, load_model, predict, prepare_data
+    from serve import BATCH_SIZE_BUCKETS, CATEGORICAL, LATENCY_BUCKETS_MS, Histogram
+
+logger = logging.getLogger(__name__)
+
+# How far the dropoff of a scored ride lies in the past when it is written
+EVENT_LAG_BUCKETS_S = (1, 2, 5, 10, 30, 60, 120, 300, 900, 3600)
+
+# How often an idle consumer checks whether the sink is due to roll
+IDLE_POLL_SECONDS = 0.5
+
+
+class RollingSink:
+    """
+    Writes scored micro-batches into a directory of part files:
+    - A new file is started when the current one has max_rows rows or was
+      opened max_seconds ago, so downstream jobs get complete files at a
+      steady pace
+    - Files are written under a .tmp- name and renamed when they are rolled,
+      so readers listing the directory never see a partial file
+    Subclasses implement _open, _write and _close for a file format.
+    """
+
+    suffix = None
+
+    def __init__(self, directory, max_rows=100_000, max_seconds=60.0):
+        self.directory = directory
+        self.max_rows = max_rows
+        self.max_seconds = max_seconds
+        self.files = []
+        self.rows = 0
+        self._path = None
+        self._temp_path = None
+        self._file_rows = 0
+        self._opened = None
+        os.makedirs(directory, exist_ok=True)
+
+    def write(self, df):
+        if len(df) == 0:
+            return
+        if self._path is None:
+            name = (
+                f"part-{datetime.now(timezone.utc):%Y%m%dT%H%M%S}-"
+                f"{len(self.files):05d}{self.suffix}"
+            )
+            self._path = os.path.join(self.directory, name)
+            self._temp_path = os.path.join(self.directory, ".tmp-" + name)
+            self._opened = time.monotonic()
+            self._file_rows = 0
+            self._open(self._temp_path, df)
+
+        self._write(df)
+        self._file_rows += len(df)
+        self.rows += len(df)
+        self.roll_if_due()
+
+    def roll_if_due(self):
+        if self._path is None:
+            return
+        if (
+            self._file_rows >= self.max_rows
+            or time.monotonic() - self._opened >= self.max_seconds
+        ):
+            self.roll()
+
+    def roll(self):
+        """Finish the current file and move it into place"""
+        if self._path is None:
+            return
+        self._close()
+        os.replace(self._temp_path, self._path)
+        logger.info(f"Rolled {self._path} with {self._file_rows} rows")
+        self.files.append(self._path)
+        self._path = None
+
+    def close(self):
+        self.roll()
+
+
+class ParquetRollingSink(RollingSink):
+    """RollingSink of parquet files, one row group per micro-batch"""
+
+    suffix = ".parquet"
+
+    def __init__(self, directory, max_rows=100_000, max_seconds=60.0, **write_options):
+        super().__init__(directory, max_rows, max_seconds)
+        self.write_options = write_options
+        self._writer = None
+
+    def _open(self, path, df):
+        schema = pa.Schema.from_pandas(df, preserve_index=False)
+        self._writer = pq.ParquetWriter(path, schema, **self.write_options)
+
+    def _write(self, df):
+        self._writer.write_table(pa.Table.from_pandas(df, preserve_index=False))
+
+    def _close(self):
+        self._writer.close()
+        self._writer = None
+
+
+class JsonlRollingSink(RollingSink):
+    """RollingSink of newline-delimited JSON files"""
+
+    suffix = ".jsonl"
+
+    def _open(self, path, df):
+        self._file = open(path, "w")
+
+    def _write(self, df):
+        self._file.write(df.to_json(orient="records", lines=True, date_format="iso"))
+        self._file.flush()
+
+    def _close(self):
+        self._file.close()
+        self._file = None
+
+
+class JsonlStreamSink:
+    """Writes every micro-batch as JSON lines to a stream, like stdout"""
+
+    def __init__(self, stream):
+        self.stream = stream
+        self.rows = 0
+
+    def write(self, df):
+        if len(df) == 0:
+            return
+        self.stream.write(df.to_json(orient="records", lines=True, date_format="iso"))
+        self.stream.flush()
+        self.rows += len(df)
+
+    def roll_if_due(self):
+        pass
+
+    def close(self):
+        self.stream.flush()
+
+
+def parse_records(lines):
+    """
+    Ride records from JSON lines. Returns the records and the indexes of the
+    lines they came from; blank lines are skipped and lines that aren't JSON
+    objects are left out.
+    """
+    records = []
+    positions = []
+    for i, line in enumerate(lines):
+        line = line.strip()
+        if not line:
+            continue
+        try:
+            record = json.loads(line)
+        except ValueError:
+            continue
+        if isinstance(record, dict):
+            records.append(record)
+            positions.append(i)
+    return records, positions
+
+
+def records_to_rides(records, categorical=CATEGORICAL):
+    """
+    Frame of ride records with the columns prepare_data needs. Timestamps
+    are parsed as ISO 8601 and kept in UTC, naive ones are taken to be UTC
+    already (unparseable ones become NaT, which the duration filter drops).
+    Records with location IDs that aren't integers are dropped; missing ones
+    stay missing and become -1 like in the batch job.
+    Returns the frame and a mask of the records it kept.
+    """
+    df = pd.DataFrame.from_records(
+        records, columns=list(dict.fromkeys(categorical + DATETIME_COLUMNS))
+    )
+    for column in DATETIME_COLUMNS:
+        df[column] = pd.to_datetime(
+            df[column], errors="coerce", utc=True, format="ISO8601"
+        ).dt.tz_localize(None)
+
+    valid = np.ones(len(df), dtype=bool)
+    for column in categorical:
+        numbers = pd.to_numeric(df[column], errors="coerce")
+        valid &= ~(numbers.isna() & df[column].notna()).to_numpy()
+        valid &= (numbers.isna() | (numbers == numbers.round())).to_numpy()
+        df[column] = numbers
+    return df[valid], valid
+
+
+class StreamScorer:
+    """
+    Scores a stream of newline-delimited JSON ride records in micro-batches:
+
+        scorer = StreamScorer(dv, lr, sink)
+        # producer threads call scorer.put(line) for every line they read,
+        # and scorer.close_input() once the input ends
+        scorer.run()  # returns when the input is closed and everything is written
+
+    - A micro-batch is scored once it has max_batch_rows records or its first
+      record has waited max_latency_ms, whichever comes first
+    - Records go through prepare_data like in the batch job, so rides outside
+      1-60 minutes are filtered out, and missing location IDs become -1
+    - Lines wait in a queue of at most queue_size lines. When the sink (or
+      scoring) can't keep up, the queue fills and put() blocks, which stops
+      the producers from reading: stdin and sockets then push back on the
+      sender instead of growing memory
+    - Lines that aren't JSON objects, and records whose location IDs aren't
+      integers, are counted as invalid and skipped; blank lines are ignored
+    - If the sink fails, run() stops the input (put() returns False from
+      then on, so producers end) and raises the error
+    - On shutdown, drain() stops the input and writes the lines already
+      received, queued or not
+    The ride_id of a record is written with its prediction; records without
+    one get their position in the stream instead.
+    """
+
+    def __init__(
+        self,
+        dv,
+        lr,
+        sink,
+        max_batch_rows=1000,
+        max_latency_ms=1000.0,
+        queue_size=10_000,
+    ):
+        self.encoder = ColumnarEncoder(dv, CATEGORICAL)
+        self.lr = lr
+        self.sink = sink
+        self.max_batch_rows = max_batch_rows
+        self.max_latency = max_latency_ms / 1000
+        self.queue_size = queue_size
+
+        self.received = 0
+        self.scored = 0
+        self.filtered = 0
+        self.invalid = 0
+        self.batches = 0
+        self.errors = 0
+        self.backpressure_seconds = 0.0
+        self.batch_sizes = Histogram(BATCH_SIZE_BUCKETS)
+        self.score_ms = Histogram(LATENCY_BUCKETS_MS)
+        self.sink_ms = Histogram(LATENCY_BUCKETS_MS)
+        self.latency_ms = Histogram(LATENCY_BUCKETS_MS)
+        self.event_lag_s = Histogram(EVENT_LAG_BUCKETS_S)
+        self.started = time.time()
+
+        self._queue = queue.Queue(maxsize=queue_size)
+        self._stopped = threading.Event()
+        self._lock = threading.Lock()
+        self._pending = []
+        self._offset = 0
+
+    def put(self, line):
+        """
+        Queue one line, blocking while the queue is full (backpressure).
+        Returns False, without queueing it, once the scorer is stopped
+        """
+        if not self._put((line, time.perf_counter())):
+            return False
+        with self._lock:
+            self.received += 1
+        return True
+
+    def _put(self, item):
+        if self._stopped.is_set():
+            return False
+        try:
+            self._queue.put_nowait(item)
+            return True
+        except queue.Full:
+            pass
+        blocked = time.perf_counter()
+        try:
+            # Wakes up now and then, so a stopped scorer releases its producers
+            while not self._stopped.is_set():
+                try:
+                    self._queue.put(item, timeout=IDLE_POLL_SECONDS)
+                    return True
+                except queue.Full:
+                    continue
+            return False
+        finally:
+            with self._lock:
+                self.backpressure_seconds += time.perf_counter() - blocked
+
+    def close_input(self):
+        """No more lines will come; run() returns once the queued ones are written"""
+        self._put(None)
+
+    def stop(self):
+        """Stop taking lines: put() returns False, and blocked producers are released"""
+        self._stopped.set()
+
+    def run(self):
+        try:
+            return self._run()
+        except Exception:
+            # Most likely the sink (disk full, no permission): without a
+            # consumer the producers would block in put() forever
+            logger.exception("Stream scoring failed, stopping the input")
+            self.stop()
+            raise
+
+    def _run(self):
+        while True:
+            try:
+                first = self._queue.get(timeout=IDLE_POLL_SECONDS)
+            except queue.Empty:
+                self.sink.roll_if_due()
+                continue
+            if first is None:
+                break
+
+            self._pending = [first]
+            deadline = first[1] + self.max_latency
+            closed = False
+            while len(self._pending) < self.max_batch_rows:
+                timeout = deadline - time.perf_counter()
+                if timeout <= 0:
+                    break
+                try:
+                    item = self._queue.get(timeout=timeout)
+                except queue.Empty:
+                    break
+                if item is None:
+                    closed = True
+                    break
+                self._pending.append(item)
+
+            self.flush()
+            if closed:
+                break
+        return self.metrics()
+
+    def flush(self):
+        """Score and write the micro-batch being collected"""
+        batch, self._pending = self._pending, []
+        if batch:
+            self._score_batch(batch)
+
+    def drain(self):
+        """
+        Stop the input, then score and write what was received but not
+        written yet: the micro-batch being collected and the queued lines,
+        in micro-batches of at most max_batch_rows. For shutdown
+        """
+        self.stop()
+        batch, self._pending = self._pending, []
+        while True:
+            try:
+                item = self._queue.get_nowait()
+            except queue.Empty:
+                break
+            if item is None:
+                continue
+            batch.append(item)
+            if len(batch) >= self.max_batch_rows:
+                self._score_batch(batch)
+                batch = []
+        if batch:
+            self._score_batch(batch)
+
+    def _score_batch(self, batch):
+        started = time.perf_counter()
+        lines = [line for line, _ in batch]
+        received = np.array([submitted for _, submitted in batch])
+        first_offset = self._offset
+        self._offset += len(batch)
+        records_in = sum(1 for line in lines if line.strip())
+
+        records, positions = parse_records(lines)
+        try:
+            df, valid = records_to_rides(records)
+            positions = np.asarray(positions, dtype="int64")[valid]
+            df.index = pd.Index(first_offset + positions)
+            ride_ids = pd.Series(
+                [records[i].get("ride_id") for i in np.flatnonzero(valid)],
+                index=df.index,
+                dtype="object",
+            )
+
+            prepared = prepare_data(df, CATEGORICAL)
+            y_pred = predict(prepared, self.encoder, self.lr)
+        except Exception:
+            logger.exception(f"Scoring a micro-batch of {len(batch)} lines failed")
+            with self._lock:
+                self.errors += 1
+                self.invalid += records_in
+            return
+
+        ride_ids = ride_ids.loc[prepared.index]
+        missing = ride_ids.isna()
+        ride_ids[missing] = prepared.index[missing.to_numpy()].astype("str")
+        df_result = pd.DataFrame(
+            {
+                "ride_id": ride_ids.astype("str").to_numpy(),
+                "predicted_duration": y_pred,
+            }
+        )
+        scored = time.perf_counter()
+
+        self.sink.write(df_result)
+        written = time.perf_counter()
+
+        self.batch_sizes.observe(len(batch))
+        self.score_ms.observe((scored - started) * 1000)
+        self.sink_ms.observe((written - scored) * 1000)
+        kept = first_offset + np.arange(len(batch))
+        for latency in (written - received[np.isin(kept, prepared.index)]) * 1000:
+            self.latency_ms.observe(latency)
+        now = pd.Timestamp.now(tz="UTC").tz_localize(None)
+        for lag in (now - prepared["tpep_dropoff_datetime"]).dt.total_seconds():
+            self.event_lag_s.observe(lag)
+
+        with self._lock:
+            self.batches += 1
+            self.scored += len(df_result)
+            self.filtered += len(df) - len(prepared)
+            self.invalid += records_in - len(df)
+
+    def metrics(self):
+        """Counters, throughput and latency/lag histograms as a JSON-serializable dict"""
+        uptime = time.time() - self.started
+        with self._lock:
+            counters = {
+                "received": self.received,
+                "scored": self.scored,
+                "filtered": self.filtered,
+                "invalid": self.invalid,
+                "batches": self.batches,
+                "errors": self.errors,
+                "backpressure_seconds": self.backpressure_seconds,
+            }
+        return {
+            "uptime_seconds": uptime,
+            **counters,
+            "queue_depth": self._queue.qsize(),
+            "queue_size": self.queue_size,
+            "records_per_sec": counters["received"] / uptime if uptime > 0 else 0.0,
+            "scored_per_sec": counters["scored"] / uptime if uptime > 0 else 0.0,
+            "batch_size": self.batch_sizes.snapshot(),
+            "batch_score_ms": self.score_ms.snapshot(),
+            "sink_write_ms": self.sink_ms.snapshot(),
+            "latency_ms": self.latency_ms.snapshot(),
+            "event_lag_seconds": self.event_lag_s.snapshot(),
+        }
+
+
+def follow_lines(path, stop, poll_interval=0.2, from_start=True):
+    """
+    Lines of a file that keeps growing, like tail -F: at the end of the file,
+    wait for more until stop is set. Only complete lines are returned. A file
+    that is truncated or replaced (log rotation) is read again from the start.
+    """
+    f_in = open(path)
+    if not from_start:
+        f_in.seek(0, os.SEEK_END)
+    inode = os.fstat(f_in.fileno()).st_ino
+    partial = ""
+    try:
+        while not stop.is_set():
+            line = f_in.readline()
+            if line:
+                partial += line
+                if partial.endswith("\n"):
+                    yield partial
+                    partial = ""
+                continue
+
+            try:
+                stat = os.stat(path)
+            except FileNotFoundError:
+                stat = None
+            if stat is not None and (
+                stat.st_ino != inode or stat.st_size < f_in.tell()
+            ):
+                logger.info(f"{path} was truncated or replaced, reading it again")
+                f_in.close()
+                f_in = open(path)
+                inode = os.fstat(f_in.fileno()).st_ino
+                partial = ""
+                continue
+            stop.wait(poll_interval)
+    finally:
+        f_in.close()
+
+
+def pump(lines, scorer, close=True):
+    """
+    Feed lines to the scorer from a producer thread, until they end or the
+    scorer stops; close the input at the end
+    """
+    try:
+        for line in lines:
+            if not scorer.put(line):
+                break
+    finally:
+        if close:
+            scorer.close_input()
+
+
+class LineHandler(socketserver.StreamRequestHandler):
+    """Every line a client sends is a record; each connection has its own thread"""
+
+    scorer = None
+
+    def handle(self):
+        for line in self.rfile:
+            if not self.scorer.put(line.decode("utf-8", errors="replace")):
+                break
+
+
+class ThreadingUnixServer(socketserver.ThreadingMixIn, socketserver.UnixStreamServer):
+    daemon_threads = True
+
+
+class ThreadingTCPServer(socketserver.ThreadingTCPServer):
+    daemon_threads = True
+    allow_reuse_address = True
+
+
+def make_socket_server(address, scorer):
+    """
+    Line server for tcp://host:port or unix:///path that feeds every line it
+    receives to scorer. Clients are slowed down by TCP flow control while
+    the scorer's queue is full.
+    """
+    handler = type("BoundLineHandler", (LineHandler,), {"scorer": scorer})
+    if address.startswith("tcp://"):
+        host, _, port = address[len("tcp://") :].rpartition(":")
+        return ThreadingTCPServer((host or "127.0.0.1", int(port)), handler)
+    if address.startswith("unix://"):
+        path = address[len("unix://") :]
+        if os.path.exists(path):
+            os.remove(path)
+        return ThreadingUnixServer(path, handler)
+    raise ValueError(f"Expected tcp://host:port or unix:///path, got {address!r}")
+
+
+def report_metrics(scorer, stop, interval, metrics_output=None):
+    """Log the metrics (and append them to metrics_output) every interval seconds"""
+    while not stop.wait(interval):
+        line = json.dumps(scorer.metrics())
+        logger.info(f"Stream metrics: {line}")
+        if metrics_output:
+            with open(metrics_output, "a") as f_out:
+                f_out.write(line + "\n")
+
+
+def make_sink(output, output_format, roll_rows, roll_seconds):
+    if output == "-":
+        return JsonlStreamSink(sys.stdout)
+    if output_format == "jsonl":
+        return JsonlRollingSink(output, max_rows=roll_rows, max_seconds=roll_seconds)
+    return ParquetRollingSink(output, max_rows=roll_rows, max_seconds=roll_seconds)
+
+
+def parse_args(argv):
+    parser = argparse.ArgumentParser(
+        description="Score a stream of JSON lines ride records in micro-batches"
+    )
+    parser.add_argument(
+        "--input",
+        default="-",
+        help="- for stdin (default), a file, tcp://host:port or unix:///path",
+    )
+    parser.add_argument(
+        "--follow",
+        action="store_true",
+        help="Keep reading the input file as it grows, like tail -F",
+    )
+    parser.add_argument("--model-path", default=None, help="model.bin or bundle")
+    parser.add_argument(
+        "--output",
+        default="-",
+        help="Directory of rolling part files, or - for JSON lines on stdout",
+    )
+    parser.add_argument("--format", choices=["parquet", "jsonl"], default="parquet")
+    parser.add_argument(
+        "--max-batch-rows",
+        type=int,
+        default=1000,
+        help="Score a micro-batch once it has this many records (default: 1000)",
+    )
+    parser.add_argument(
+        "--max-latency-ms",
+        type=float,
+        default=1000.0,
+        help="Longest a record waits for its micro-batch to fill (default: 1000)",
+    )
+    parser.add_argument(
+        "--queue-size",
+        type=int,
+        default=10_000,
+        help="Lines buffered before the input is slowed down (default: 10000)",
+    )
+    parser.add_argument(
+        "--roll-rows",
+        type=int,
+        default=100_000,
+        help="Start a new output file after this many rows (default: 100000)",
+    )
+    parser.add_argument(
+        "--roll-seconds",
+        type=float,
+        default=60.0,
+        help="Start a new output file after this many seconds (default: 60)",
+    )
+    parser.add_argument(
+        "--metrics-interval",
+        type=float,
+        default=10.0,
+        help="Log throughput and lag metrics every this many seconds (default: 10)",
+    )
+    parser.add_argument(
+        "--metrics-output",
+        default=None,
+        help="Also append the metrics to this JSON lines file",
+    )
+    return parser.parse_args(argv)
+
+
+if __name__ == "__main__":
+    logging.basicConfig(
+        level=logging.INFO,
+        format="%(asctime)s - %(name)s - %(levelname)s - %(message)s",
+        datefmt="%Y-%m-%d %H:%M:%S",
+        stream=sys.stderr,
+    )
+    args = parse_args(sys.argv[1:])
+
+    dv, lr = load_model(args.model_path)
+    sink = make_sink(args.output, args.format, args.roll_rows, args.roll_seconds)
+    scorer = StreamScorer(
+        dv,
+        lr,
+        sink,
+        max_batch_rows=args.max_batch_rows,
+        max_latency_ms=args.max_latency_ms,
+        queue_size=args.queue_size,
+    )
+    stop = threading.Event()
+
+    server = None
+    if args.input.startswith(("tcp://", "unix://")):
+        server = make_socket_server(args.input, scorer)
+        producer = threading.Thread(target=server.serve_forever, daemon=True)
+        logger.info(f"Listening for JSON lines on {args.input}")
+    elif args.input == "-":
+        producer = threading.Thread(target=pump, args=(sys.stdin, scorer), daemon=True)
+    elif args.follow:
+        producer = threading.Thread(
+            target=pump, args=(follow_lines(args.input, stop), scorer), daemon=True
+        )
+    else:
+        producer = threading.Thread(
+            target=pump, args=(open(args.input), scorer), daemon=True
+        )
+    reporter = threading.Thread(
+        target=report_metrics,
+        args=(scorer, stop, args.metrics_interval, args.metrics_output),
+        daemon=True,
+    )
+    producer.start()
+    reporter.start()
+
+    try:
+        metrics = scorer.run()
+    except KeyboardInterrupt:
+        logger.info("Interrupted, writing the records already received")
+        stop.set()
+        scorer.drain()
+        metrics = scorer.metrics()
+    finally:
+        stop.set()
+        scorer.stop()
+        if server is not None:
+            server.shutdown()
+            server.server_close()
+        sink.close()
+    logger.info(f"Stream metrics: {json.dumps(metrics)}")
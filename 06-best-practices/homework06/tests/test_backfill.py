@@ -0,0 +1,81 @@
+# Fix Python import path issues when running from terminal
+try:
+    from fix_imports import *  # This adds parent directory to Python path
+except ImportError:
+    pass
+
+import pandas as pd
+import logging
+import sys
+import os
+
+import pytest
+
+# Dynamically adjust imports based on where the script is run from
+try:
+    from homework06.backfill import backfill, month_range
+except ImportError:
+    # Try relative import if running from tests directory
+    sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+    from backfill import backfill, month_range
+
+try:
+    from tests.test_batch_refactoring import create_month_file
+except ImportError:
+    from test_batch_refactoring import create_month_file
+
+# Configure logging for tests
+logging.basicConfig(
+    level=logging.INFO,
+    format="%(asctime)s - %(name)s - %(levelname)s - %(message)s",
+    datefmt="%Y-%m-%d %H:%M:%S",
+)
+logger = logging.getLogger(__name__)
+
+
+def test_month_range():
+    """Month ranges include both ends and roll over the year"""
+    assert month_range("2023-11", "2024-02") == [
+        (2023, 11),
+        (2023, 12),
+        (2024, 1),
+        (2024, 2),
+    ]
+    assert month_range("2024-03", "2024-03") == [(2024, 3)]
+    assert month_range("2024-03", "2024-02") == []
+
+    with pytest.raises(ValueError):
+        month_range("2024-13", "2024-12")
+
+
+def test_backfill(tmp_path, monkeypatch):
+    """Every month is scored, missing inputs are reported as failures"""
+    create_month_file(tmp_path / "2023-01.parquet", n_rows=300)
+    create_month_file(tmp_path / "2023-02.parquet", n_rows=200)
+
+    monkeypatch.setenv(
+        "INPUT_FILE_PATTERN", str(tmp_path / "{year:04d}-{month:02d}.parquet")
+    )
+    monkeypatch.setenv(
+        "OUTPUT_FILE_PATTERN", str(tmp_path / "out" / "{year:04d}-{month:02d}.parquet")
+    )
+
+    results = backfill("2023-01", "2023-03", max_workers=2)
+
+    assert [(r["year"], r["month"]) for r in results] == [
+        (2023, 1),
+        (2023, 2),
+        (2023, 3),
+    ]
+    assert [r["status"] for r in results] == ["ok", "ok", "failed"]
+
+    for result in results[:2]:
+        df = pd.read_parquet(result["output_file"])
+        assert len(df) == result["rows"] > 0
+
+
+def test_backfill_with_a_bad_model_path(tmp_path, monkeypatch):
+    """The model's own error, not a BrokenProcessPool from the workers"""
+    monkeypatch.setenv("MODEL_PATH", str(tmp_path / "missing.bin"))
+    with pytest.raises(FileNotFoundError, match="missing.bin"):
+        backfill("2023-01", "2023-02", max_workers=2)
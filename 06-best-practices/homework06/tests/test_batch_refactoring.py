@@ -4,6 +4,7 @@ try:
 except ImportError:
     pass
 
+import numpy as np
 import pandas as pd
 import logging
 from datetime import datetime
@@ -16,11 +17,25 @@ try:
         prepare_data,
         get_input_path,
         get_output_path,
+        main,
+        read_data,
+        decoded_size,
+        read_results,
+        prepare_arrow,
     )
 except ImportError:
     # Try relative import if running from tests directory
     sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
-    from batch_refactoring import prepare_data, get_input_path, get_output_path
+    from batch_refactoring import (
+        prepare_data,
+        get_input_path,
+        get_output_path,
+        main,
+        read_data,
+        decoded_size,
+        read_results,
+        prepare_arrow,
+    )
 
 # Configure logging for tests
 logging.basicConfig(
@@ -88,6 +103,34 @@ def test_prepare_data():
     logger.info("test_prepare_data completed successfully")
 
 
+def test_prepare_arrow():
+    """prepare_arrow keeps the same rows and durations, with integer location IDs"""
+    import pyarrow as pa
+
+    data = [
+        (None, None, dt(1, 1), dt(1, 10)),
+        (1, 1, dt(1, 2), dt(1, 10)),
+        (1, None, dt(1, 2, 0), dt(1, 2, 59)),
+        (3, 4, dt(1, 2, 0), dt(2, 2, 1)),
+    ]
+    columns = [
+        "PULocationID",
+        "DOLocationID",
+        "tpep_pickup_datetime",
+        "tpep_dropoff_datetime",
+    ]
+    categorical = ["PULocationID", "DOLocationID"]
+    df = pd.DataFrame(data, columns=columns)
+
+    result = prepare_arrow(pa.Table.from_pandas(df), categorical).to_pandas()
+
+    assert len(result) == 2
+    assert result["PULocationID"].dtype == "int32"
+    assert result["PULocationID"].astype("str").tolist() == ["-1", "1"]
+    assert result["DOLocationID"].astype("str").tolist() == ["-1", "1"]
+    assert result["duration"].tolist() == [9.0, 8.0]
+
+
 def test_path_functions():
     """Test the path handling functions"""
     logger.info("Starting test_path_functions")
@@ -150,3 +193,232 @@ def test_path_functions():
             del os.environ["OUTPUT_FILE_PATTERN"]
 
     logger.info("test_path_functions completed successfully")
+
+
+def create_month_file(path, n_rows=1000, row_group_size=128):
+    """Write a synthetic month with the yellow taxi schema over several row groups"""
+    import numpy as np
+    import pyarrow as pa
+    import pyarrow.parquet as pq
+
+    rng = np.random.default_rng(42)
+    pickup = pd.Timestamp("2023-01-01") + pd.to_timedelta(
+        rng.integers(0, 30 * 24 * 3600, n_rows), unit="s"
+    )
+    dropoff = pickup + pd.to_timedelta(rng.integers(0, 90 * 60, n_rows), unit="s")
+    pu = pd.array(rng.integers(1, 266, n_rows), dtype="Int64")
+    pu[::17] = pd.NA
+    amount = rng.uniform(0, 100, n_rows)
+    df = pd.DataFrame(
+        {
+            "VendorID": rng.integers(1, 3, n_rows, dtype="int32"),
+            "tpep_pickup_datetime": pickup,
+            "tpep_dropoff_datetime": dropoff,
+            "passenger_count": rng.integers(0, 6, n_rows).astype("float64"),
+            "trip_distance": rng.uniform(0, 20, n_rows),
+            "RatecodeID": rng.integers(1, 6, n_rows).astype("float64"),
+            "store_and_fwd_flag": rng.choice(["N", "Y"], n_rows),
+            "PULocationID": pu,
+            "DOLocationID": rng.integers(1, 266, n_rows),
+            "payment_type": rng.integers(1, 5, n_rows),
+            "fare_amount": amount,
+            "extra": rng.uniform(0, 5, n_rows),
+            "mta_tax": rng.choice([0.0, 0.5], n_rows),
+            "tip_amount": rng.uniform(0, 20, n_rows),
+            "tolls_amount": rng.uniform(0, 10, n_rows),
+            "improvement_surcharge": rng.choice([0.3, 1.0], n_rows),
+            "total_amount": amount * 1.2,
+            "congestion_surcharge": rng.choice([0.0, 2.5], n_rows),
+            "airport_fee": rng.choice([0.0, 1.75], n_rows),
+        }
+    )
+    pq.write_table(pa.Table.from_pandas(df), path, row_group_size=row_group_size)
+    return df
+
+
+def test_streaming_matches_full_read(tmp_path, monkeypatch):
+    """Streaming mode should produce exactly the same results as the full read"""
+    create_month_file(tmp_path / "2023-01.parquet")
+    monkeypatch.setenv(
+        "INPUT_FILE_PATTERN", str(tmp_path / "{year:04d}-{month:02d}.parquet")
+    )
+
+    monkeypatch.setenv(
+        "OUTPUT_FILE_PATTERN", str(tmp_path / "full" / "{year:04d}-{month:02d}.parquet")
+    )
+    df_full = pd.read_parquet(main(2023, 1))
+
+    monkeypatch.setenv(
+        "OUTPUT_FILE_PATTERN",
+        str(tmp_path / "stream" / "{year:04d}-{month:02d}.parquet"),
+    )
+    df_stream = pd.read_parquet(main(2023, 1, batch_size=100))
+
+    logger.info(f"Full read: {len(df_full)} rows, streaming: {len(df_stream)} rows")
+    assert len(df_full) > 0
+    pd.testing.assert_frame_equal(df_full, df_stream)
+    assert (
+        df_full["predicted_duration"].to_numpy().tobytes()
+        == df_stream["predicted_duration"].to_numpy().tobytes()
+    )
+
+
+def test_read_data_projection(tmp_path):
+    """read_data decodes fewer columns but returns the same rows as a full read"""
+    import pyarrow.parquet as pq
+
+    path = str(tmp_path / "2023-01.parquet")
+    create_month_file(path)
+    categorical = ["PULocationID", "DOLocationID"]
+
+    df = read_data(path, categorical, columns=["trip_distance"])
+    expected = prepare_data(pd.read_parquet(path), categorical)
+
+    assert list(df.columns) == categorical + [
+        "tpep_pickup_datetime",
+        "tpep_dropoff_datetime",
+        "trip_distance",
+        "duration",
+    ]
+    pd.testing.assert_frame_equal(df, expected[df.columns], check_index_type=False)
+
+    metadata = pq.ParquetFile(path).metadata
+    full_bytes = decoded_size(metadata)
+    projected_bytes = decoded_size(metadata, list(df.columns))
+    logger.info(f"Decoded bytes: {full_bytes} before, {projected_bytes} after")
+    assert projected_bytes < full_bytes / 2
+
+    full_memory = pq.read_table(path).nbytes
+    projected_memory = pq.read_table(path, columns=list(df.columns[:-1])).nbytes
+    logger.info(f"Arrow memory: {full_memory} before, {projected_memory} after")
+    assert projected_memory < full_memory / 3
+
+
+def test_compact_results(tmp_path, monkeypatch):
+    """Compact results are smaller and read_results rebuilds the legacy ride_id"""
+    import pyarrow.parquet as pq
+
+    create_month_file(tmp_path / "2023-01.parquet", n_rows=5000)
+    monkeypatch.setenv(
+        "INPUT_FILE_PATTERN", str(tmp_path / "{year:04d}-{month:02d}.parquet")
+    )
+
+    monkeypatch.setenv(
+        "OUTPUT_FILE_PATTERN",
+        str(tmp_path / "legacy" / "{year:04d}-{month:02d}.parquet"),
+    )
+    legacy_file = main(2023, 1)
+
+    monkeypatch.setenv(
+        "OUTPUT_FILE_PATTERN",
+        str(tmp_path / "compact" / "{year:04d}-{month:02d}.parquet"),
+    )
+    compact_file = main(2023, 1, compact=True)
+
+    monkeypatch.setenv(
+        "OUTPUT_FILE_PATTERN",
+        str(tmp_path / "stream" / "{year:04d}-{month:02d}.parquet"),
+    )
+    stream_file = main(2023, 1, batch_size=700, compact=True)
+
+    compact = pq.read_table(compact_file)
+    assert compact.schema.names == ["row_id", "year", "month", "predicted_duration"]
+    assert str(compact.schema.field("predicted_duration").type) == "float"
+    assert pq.ParquetFile(compact_file).metadata.row_group(0).column(0).compression == (
+        "ZSTD"
+    )
+
+    legacy_size = os.path.getsize(legacy_file)
+    compact_size = os.path.getsize(compact_file)
+    logger.info(f"Result file size: {legacy_size} legacy, {compact_size} compact")
+    assert compact_size < legacy_size / 2
+
+    df_legacy = read_results(legacy_file)
+    for path in [compact_file, stream_file]:
+        df = read_results(path)
+        assert list(df.columns) == ["ride_id", "predicted_duration"]
+        assert df["ride_id"].tolist() == df_legacy["ride_id"].tolist()
+        assert df["predicted_duration"].dtype == "float64"
+        np.testing.assert_allclose(
+            df["predicted_duration"], df_legacy["predicted_duration"], rtol=1e-6
+        )
+
+
+def test_arrow_prepare_matches_pandas(tmp_path, monkeypatch):
+    """Scoring with --arrow gives exactly the same results, streaming or not"""
+    create_month_file(tmp_path / "2023-01.parquet")
+    monkeypatch.setenv(
+        "INPUT_FILE_PATTERN", str(tmp_path / "{year:04d}-{month:02d}.parquet")
+    )
+
+    results = []
+    for name, kwargs in [
+        ("pandas", {}),
+        ("arrow", {"arrow": True}),
+        ("arrow_stream", {"arrow": True, "batch_size": 100}),
+    ]:
+        monkeypatch.setenv(
+            "OUTPUT_FILE_PATTERN",
+            str(tmp_path / name / "{year:04d}-{month:02d}.parquet"),
+        )
+        results.append(pd.read_parquet(main(2023, 1, **kwargs)))
+
+    expected = results[0]
+    assert len(expected) > 0
+    for df in results[1:]:
+        pd.testing.assert_frame_equal(df, expected)
+
+
+def test_read_data_arrow(tmp_path):
+    """read_data(arrow=True) has the same rows and durations as the pandas path"""
+    path = str(tmp_path / "2023-01.parquet")
+    create_month_file(path)
+    categorical = ["PULocationID", "DOLocationID"]
+
+    expected = read_data(path, categorical)
+    df = read_data(path, categorical, arrow=True)
+
+    assert list(df.columns) == list(expected.columns)
+    assert (df[categorical].dtypes == "int32").all()
+    pd.testing.assert_frame_equal(
+        df.astype({column: "str" for column in categorical}),
+        expected,
+        check_dtype=False,
+    )
+    assert df["duration"].to_numpy().tobytes() == (
+        expected["duration"].to_numpy().tobytes()
+    )
+
+
+def test_failed_streaming_run_keeps_the_previous_output(tmp_path, monkeypatch):
+    """A run failing halfway leaves neither a truncated output nor its temporary file"""
+    module = sys.modules[main.__module__]
+    create_month_file(tmp_path / "2023-01.parquet")
+    monkeypatch.setenv(
+        "INPUT_FILE_PATTERN", str(tmp_path / "{year:04d}-{month:02d}.parquet")
+    )
+    monkeypatch.setenv(
+        "OUTPUT_FILE_PATTERN", str(tmp_path / "out" / "{year:04d}-{month:02d}.parquet")
+    )
+    output_file = main(2023, 1, batch_size=100)
+    previous = pd.read_parquet(output_file)
+
+    predict_models = module.predict_models
+    calls = []
+
+    def failing_predict_models(*args, **kwargs):
+        calls.append(1)
+        if len(calls) == 3:
+            raise RuntimeError("scoring failed")
+        return predict_models(*args, **kwargs)
+
+    monkeypatch.setattr(module, "predict_models", failing_predict_models)
+    try:
+        main(2023, 1, batch_size=100, force=True)
+    except RuntimeError:
+        pass
+    else:
+        raise AssertionError("the run should have failed")
+
+    pd.testing.assert_frame_equal(pd.read_parquet(output_file), previous)
+    assert not [name for name in os.listdir(tmp_path / "out") if "tmp" in name]
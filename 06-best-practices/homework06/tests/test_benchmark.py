@@ -0,0 +1,96 @@
+# Fix Python import path issues when running from terminal
+try:
+    from fix_imports import *  # This adds parent directory to Python path
+except ImportError:
+    pass
+
+import json
+import logging
+import sys
+import os
+
+import pyarrow.parquet as pq
+
+# Dynamically adjust imports based on where the script is run from
+try:
+    from homework06.benchmark import (
+        STAGES,
+        compare,
+        parse_size,
+        run_benchmark,
+        write_trips,
+    )
+except ImportError:
+    # Try relative import if running from tests directory
+    sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+    from benchmark import STAGES, compare, parse_size, run_benchmark, write_trips
+
+# Configure logging for tests
+logging.basicConfig(
+    level=logging.INFO,
+    format="%(asctime)s - %(name)s - %(levelname)s - %(message)s",
+    datefmt="%Y-%m-%d %H:%M:%S",
+)
+logger = logging.getLogger(__name__)
+
+
+def test_parse_size():
+    assert parse_size("100k") == 100_000
+    assert parse_size("1M") == 1_000_000
+    assert parse_size("2500") == 2_500
+
+
+def test_write_trips_in_chunks(tmp_path, monkeypatch):
+    """Synthetic files are written chunk by chunk with the yellow taxi schema"""
+    monkeypatch.setattr(sys.modules[write_trips.__module__], "GENERATE_CHUNK_ROWS", 400)
+    path = write_trips(str(tmp_path / "trips.parquet"), 1_000)
+
+    metadata = pq.read_metadata(path)
+    assert metadata.num_rows == 1_000
+    assert metadata.num_columns == 19
+    assert metadata.num_row_groups == 3
+
+
+def test_run_benchmark(tmp_path):
+    """Every stage is timed and measured, and the report is valid JSON"""
+    report = run_benchmark([2_000], str(tmp_path), repeat=1)
+    result = report["results"]["2000"]
+
+    assert list(result["stages"]) == STAGES
+    assert result["stages"]["prepare"]["rows"] < 2_000
+    for stats in result["stages"].values():
+        assert stats["seconds"] > 0
+        assert stats["peak_bytes"] > 0
+
+    json.loads(json.dumps(report))
+    assert compare(report, report) == []
+
+
+def test_compare_reports_regressions():
+    """Slower or bigger stages beyond the threshold are reported"""
+    baseline = {
+        "results": {
+            "1000": {
+                "stages": {
+                    "read": {"seconds": 1.0, "peak_bytes": 1000},
+                    "predict": {"seconds": 0.01, "peak_bytes": 1000},
+                }
+            }
+        }
+    }
+    current = {
+        "results": {
+            "1000": {
+                "stages": {
+                    "read": {"seconds": 1.1, "peak_bytes": 2000},
+                    # Too fast to time reliably, only memory is compared
+                    "predict": {"seconds": 0.05, "peak_bytes": 1000},
+                }
+            }
+        }
+    }
+
+    regressions = compare(baseline, current, threshold=0.2)
+
+    assert len(regressions) == 1
+    assert "read: peak_bytes" in regressions[0]
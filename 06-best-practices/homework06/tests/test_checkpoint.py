@@ -0,0 +1,152 @@
+# Fix Python import path issues when running from terminal
+try:
+    from fix_imports import *  # This adds parent directory to Python path
+except ImportError:
+    pass
+
+import json
+import pickle
+import logging
+import sys
+import os
+
+import pandas as pd
+import pytest
+
+# Dynamically adjust imports based on where the script is run from
+try:
+    from homework06 import batch_refactoring
+    from homework06.batch_refactoring import read_results, score_month
+    from homework06.checkpoint import JOURNAL_FILE, checkpoint_path, plan_parts
+    from homework06.manifest import manifest_path
+except ImportError:
+    # Try relative import if running from tests directory
+    sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+    import batch_refactoring
+    from batch_refactoring import read_results, score_month
+    from checkpoint import JOURNAL_FILE, checkpoint_path, plan_parts
+    from manifest import manifest_path
+
+try:
+    from tests.test_batch_refactoring import create_month_file
+except ImportError:
+    from test_batch_refactoring import create_month_file
+
+# Configure logging for tests
+logging.basicConfig(
+    level=logging.INFO,
+    format="%(asctime)s - %(name)s - %(levelname)s - %(message)s",
+    datefmt="%Y-%m-%d %H:%M:%S",
+)
+logger = logging.getLogger(__name__)
+
+MODEL_PATH = os.path.join(
+    os.path.dirname(os.path.dirname(os.path.abspath(__file__))), "model.bin"
+)
+
+
+@pytest.fixture
+def month(tmp_path, monkeypatch):
+    """Synthetic January 2023 (8 row groups) and the path its results are written to"""
+    create_month_file(tmp_path / "2023-01.parquet")
+    monkeypatch.setenv(
+        "INPUT_FILE_PATTERN", str(tmp_path / "{year:04d}-{month:02d}.parquet")
+    )
+    monkeypatch.setenv(
+        "OUTPUT_FILE_PATTERN", str(tmp_path / "out" / "{year:04d}-{month:02d}.parquet")
+    )
+    with open(MODEL_PATH, "rb") as f_in:
+        dv, lr = pickle.load(f_in)
+    return str(tmp_path / "out" / "2023-01.parquet"), dv, lr
+
+
+SCORE_ROWS = batch_refactoring.score_rows
+
+
+class Preempted(Exception):
+    pass
+
+
+def fail_after(monkeypatch, parts):
+    """Make score_rows fail after scoring parts parts; returns the scored row groups"""
+    scored = []
+
+    def score_rows(*args, **kwargs):
+        if len(scored) == parts:
+            raise Preempted()
+        scored.append(kwargs["row_groups"])
+        return SCORE_ROWS(*args, **kwargs)
+
+    monkeypatch.setattr(batch_refactoring, "score_rows", score_rows)
+    return scored
+
+
+def test_plan_parts():
+    assert plan_parts(0, 8, 3) == [(0, 3), (3, 6), (6, 8)]
+    assert plan_parts(2, 4, 10) == [(2, 4)]
+    assert plan_parts(5, 5, 2) == [(5, 5)]
+    with pytest.raises(ValueError):
+        plan_parts(0, 8, 0)
+
+
+@pytest.mark.parametrize("batch_size", [None, 100])
+def test_checkpointed_run_matches_plain_run(month, batch_size):
+    output_file, dv, lr = month
+    _, rows = score_month(2023, 1, dv, lr, batch_size=batch_size)
+    expected = read_results(output_file)
+
+    assert score_month(
+        2023, 1, dv, lr, batch_size=batch_size, force=True, checkpoint_row_groups=3
+    ) == (output_file, rows)
+    pd.testing.assert_frame_equal(read_results(output_file), expected)
+    assert not os.path.exists(checkpoint_path(output_file))
+
+
+def test_resume_after_failure(month, monkeypatch):
+    """A restarted run only scores the parts that weren't committed"""
+    output_file, dv, lr = month
+    _, rows = score_month(2023, 1, dv, lr)
+    expected = read_results(output_file)
+    os.remove(output_file)
+    os.remove(manifest_path(output_file))
+
+    scored = fail_after(monkeypatch, 2)
+    with pytest.raises(Preempted):
+        score_month(2023, 1, dv, lr, checkpoint_row_groups=2)
+    assert scored == [[0, 1], [2, 3]]
+    # Nothing is published before all parts are done
+    assert not os.path.exists(output_file)
+    with open(os.path.join(checkpoint_path(output_file), JOURNAL_FILE)) as f_in:
+        journal = json.load(f_in)
+    assert [part["row_groups"] for part in journal["parts"]] == [[0, 2], [2, 4]]
+
+    scored = fail_after(monkeypatch, None)
+    assert score_month(2023, 1, dv, lr, checkpoint_row_groups=2) == (
+        output_file,
+        rows,
+    )
+    assert scored == [[4, 5], [6, 7]]
+    pd.testing.assert_frame_equal(read_results(output_file), expected)
+    assert not os.path.exists(checkpoint_path(output_file))
+
+
+def test_checkpoint_of_another_run_is_discarded(month, monkeypatch):
+    output_file, dv, lr = month
+    fail_after(monkeypatch, 2)
+    with pytest.raises(Preempted):
+        score_month(2023, 1, dv, lr, checkpoint_row_groups=2)
+
+    # Different parts, so the journal doesn't apply
+    scored = fail_after(monkeypatch, None)
+    score_month(2023, 1, dv, lr, checkpoint_row_groups=4)
+    assert scored == [[0, 1, 2, 3], [4, 5, 6, 7]]
+
+
+def test_checkpointed_shard(month):
+    """Shards checkpoint their own row groups"""
+    output_file, dv, lr = month
+    output, rows = score_month(
+        2023, 1, dv, lr, shard_index=1, shard_count=2, checkpoint_row_groups=1
+    )
+    assert rows == len(read_results(output))
+    assert not os.path.exists(checkpoint_path(output))
@@ -0,0 +1,184 @@
+# Fix Python import path issues when running from terminal
+try:
+    from fix_imports import *  # This adds parent directory to Python path
+except ImportError:
+    pass
+
+import numpy as np
+import pandas as pd
+import pickle
+import logging
+import time
+import sys
+import os
+
+# Dynamically adjust imports based on where the script is run from
+try:
+    from homework06.encoder import ColumnarEncoder, factorize_rows
+    from homework06.batch_refactoring import prepare_data, predict
+except ImportError:
+    # Try relative import if running from tests directory
+    sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+    from encoder import ColumnarEncoder, factorize_rows
+    from batch_refactoring import prepare_data, predict
+
+from sklearn.feature_extraction import DictVectorizer
+
+# Configure logging for tests
+logging.basicConfig(
+    level=logging.INFO,
+    format="%(asctime)s - %(name)s - %(levelname)s - %(message)s",
+    datefmt="%Y-%m-%d %H:%M:%S",
+)
+logger = logging.getLogger(__name__)
+
+categorical = ["PULocationID", "DOLocationID"]
+MODEL_PATH = os.path.join(
+    os.path.dirname(os.path.dirname(os.path.abspath(__file__))), "model.bin"
+)
+
+
+def load_model():
+    with open(MODEL_PATH, "rb") as f_in:
+        return pickle.load(f_in)
+
+
+def load_dv():
+    return load_model()[0]
+
+
+def synthetic_frame(n_rows, seed=1):
+    """Prepared frame with location IDs as strings, including unknown IDs"""
+    rng = np.random.default_rng(seed)
+    df = pd.DataFrame(
+        {
+            "PULocationID": rng.integers(-1, 300, n_rows),
+            "DOLocationID": rng.integers(-1, 300, n_rows),
+        }
+    )
+    df[categorical] = df[categorical].astype("str")
+    return df
+
+
+def assert_same_matrix(expected, actual):
+    assert expected.shape == actual.shape
+    assert (expected != actual).nnz == 0
+    np.testing.assert_array_equal(expected.indptr, actual.indptr)
+    np.testing.assert_array_equal(expected.indices, actual.indices)
+    np.testing.assert_array_equal(expected.data, actual.data)
+
+
+def test_encoder_matches_dict_vectorizer():
+    """The columnar encoder should build exactly the matrix dv.transform builds"""
+    dv = load_dv()
+    df = synthetic_frame(10_000)
+
+    expected = dv.transform(df[categorical].to_dict(orient="records"))
+    actual = ColumnarEncoder(dv, categorical).transform(df)
+
+    logger.info(f"Encoded {len(df)} rows into {actual.nnz} non-zero values")
+    assert_same_matrix(expected, actual)
+
+
+def test_encoder_on_prepare_data_output():
+    """Encoding the output of prepare_data, including the -1 for missing values"""
+    dv = load_dv()
+    df = pd.DataFrame(
+        {
+            "PULocationID": [None, 1, 132, 999],
+            "DOLocationID": [None, 1, 7, 4],
+            "tpep_pickup_datetime": pd.Timestamp("2023-01-01 01:00"),
+            "tpep_dropoff_datetime": pd.Timestamp("2023-01-01 01:10"),
+        }
+    )
+    df = prepare_data(df, categorical)
+
+    expected = dv.transform(df[categorical].to_dict(orient="records"))
+    actual = ColumnarEncoder(dv, categorical).transform(df)
+
+    assert_same_matrix(expected, actual)
+
+
+def test_encoder_integer_columns():
+    """Integer columns are looked up by their string form"""
+    dv = load_dv()
+    df = synthetic_frame(1_000)
+    df_int = df.astype({column: "int32" for column in categorical})
+
+    encoder = ColumnarEncoder(dv, categorical)
+    assert_same_matrix(encoder.transform(df), encoder.transform(df_int))
+
+
+def test_encoder_numeric_features():
+    """Numeric features are passed through as values, in any column order"""
+    records = [
+        {"trip_distance": 1.5, "PULocationID": "a"},
+        {"trip_distance": 0.0, "PULocationID": "b"},
+        {"trip_distance": 3.0, "PULocationID": "c"},
+    ]
+    dv = DictVectorizer().fit(records)
+    df = pd.DataFrame(records + [{"trip_distance": 2.0, "PULocationID": "z"}])
+    columns = ["trip_distance", "PULocationID"]
+
+    expected = dv.transform(df[columns].to_dict(orient="records"))
+    actual = ColumnarEncoder(dv, columns).transform(df)
+
+    assert_same_matrix(expected, actual)
+
+
+def test_encoder_speed():
+    """Compare the encoder with to_dict + dv.transform on a million rows"""
+    dv = load_dv()
+    df = synthetic_frame(1_000_000)
+
+    start = time.perf_counter()
+    expected = dv.transform(df[categorical].to_dict(orient="records"))
+    dict_seconds = time.perf_counter() - start
+
+    start = time.perf_counter()
+    actual = ColumnarEncoder(dv, categorical).transform(df)
+    columnar_seconds = time.perf_counter() - start
+
+    logger.info(
+        f"to_dict + dv.transform: {dict_seconds:.2f}s, "
+        f"ColumnarEncoder: {columnar_seconds:.2f}s "
+        f"({dict_seconds / columnar_seconds:.1f}x faster)"
+    )
+    assert_same_matrix(expected, actual)
+    assert columnar_seconds < dict_seconds
+
+
+def test_factorize_rows():
+    """Distinct tuples and the inverse index rebuild the original rows"""
+    df = pd.DataFrame(
+        {
+            "PULocationID": ["1", "2", "1", "1", "-1"],
+            "DOLocationID": ["5", "5", "5", "6", "-1"],
+        }
+    )
+    first, inverse = factorize_rows(df, categorical)
+
+    assert len(first) == 4
+    rebuilt = df.iloc[first].iloc[inverse].reset_index(drop=True)
+    pd.testing.assert_frame_equal(rebuilt, df)
+
+
+def test_unique_predictions_match_per_row():
+    """Predicting only the distinct location pairs gives the same predictions"""
+    dv, lr = load_model()
+    df = synthetic_frame(50_000)
+    encoder = ColumnarEncoder(dv, categorical)
+
+    assert encoder.categorical_only
+    y_rows = predict(df, encoder, lr, unique=False)
+    y_unique = predict(df, encoder, lr)
+
+    assert y_rows.tobytes() == y_unique.tobytes()
+
+
+def test_numeric_features_use_per_row_path():
+    """Memoization is only turned on automatically for categorical-only features"""
+    dv = DictVectorizer().fit([{"trip_distance": 1.5, "PULocationID": "a"}])
+    encoder = ColumnarEncoder(dv, ["trip_distance", "PULocationID"])
+
+    assert not encoder.categorical_only
@@ -0,0 +1,155 @@
+# Fix Python import path issues when running from terminal
+try:
+    from fix_imports import *  # This adds parent directory to Python path
+except ImportError:
+    pass
+
+import os
+import sys
+import logging
+import functools
+import threading
+from http.server import ThreadingHTTPServer, SimpleHTTPRequestHandler
+
+import pytest
+
+# Dynamically adjust imports based on where the script is run from
+try:
+    from homework06.input_cache import InputCache
+    from homework06.batch_refactoring import read_data
+except ImportError:
+    # Try relative import if running from tests directory
+    sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+    from input_cache import InputCache
+    from batch_refactoring import read_data
+
+try:
+    from tests.test_batch_refactoring import create_month_file
+except ImportError:
+    from test_batch_refactoring import create_month_file
+
+# Configure logging for tests
+logging.basicConfig(
+    level=logging.INFO,
+    format="%(asctime)s - %(name)s - %(levelname)s - %(message)s",
+    datefmt="%Y-%m-%d %H:%M:%S",
+)
+logger = logging.getLogger(__name__)
+
+
+class QuietHandler(SimpleHTTPRequestHandler):
+    def log_message(self, format, *args):
+        pass
+
+
+@pytest.fixture
+def http_server(tmp_path):
+    """Serve tmp_path/www over HTTP on a random local port"""
+    root = tmp_path / "www"
+    root.mkdir()
+    handler = functools.partial(QuietHandler, directory=str(root))
+    server = ThreadingHTTPServer(("127.0.0.1", 0), handler)
+    thread = threading.Thread(target=server.serve_forever, daemon=True)
+    thread.start()
+    yield root, f"http://127.0.0.1:{server.server_address[1]}"
+    server.shutdown()
+    server.server_close()
+
+
+class UnversionedHandler(QuietHandler):
+    """Sends neither ETag nor Last-Modified"""
+
+    def send_header(self, keyword, value):
+        if keyword.lower() not in ("etag", "last-modified"):
+            super().send_header(keyword, value)
+
+
+@pytest.fixture
+def unversioned_server(tmp_path):
+    root = tmp_path / "www"
+    root.mkdir()
+    handler = functools.partial(UnversionedHandler, directory=str(root))
+    server = ThreadingHTTPServer(("127.0.0.1", 0), handler)
+    thread = threading.Thread(target=server.serve_forever, daemon=True)
+    thread.start()
+    yield root, f"http://127.0.0.1:{server.server_address[1]}"
+    server.shutdown()
+    server.server_close()
+
+
+def test_cache_hits_and_misses(tmp_path, http_server):
+    """The second fetch is a hit, a changed file is a miss again"""
+    root, base_url = http_server
+    (root / "a.parquet").write_bytes(b"first version")
+    cache = InputCache(str(tmp_path / "cache"))
+
+    path = cache.fetch(f"{base_url}/a.parquet")
+    assert open(path, "rb").read() == b"first version"
+    assert cache.fetch(f"{base_url}/a.parquet") == path
+    assert (cache.hits, cache.misses) == (1, 1)
+
+    # A new Last-Modified means a new version of the file
+    (root / "a.parquet").write_bytes(b"second version")
+    os.utime(root / "a.parquet", (1_700_000_000, 1_700_000_000))
+    new_path = cache.fetch(f"{base_url}/a.parquet")
+    assert new_path != path
+    assert open(new_path, "rb").read() == b"second version"
+    assert (cache.hits, cache.misses) == (1, 2)
+
+    # No temp files are left behind
+    assert not [n for n in os.listdir(cache.cache_dir) if n.startswith(".tmp-")]
+
+
+def test_unversioned_files_are_not_cached(tmp_path, unversioned_server):
+    """A copy that can't be validated would be served forever, so there is none"""
+    root, base_url = unversioned_server
+    (root / "a.parquet").write_bytes(b"first version")
+    cache = InputCache(str(tmp_path / "cache"))
+
+    url = f"{base_url}/a.parquet"
+    assert cache.fetch(url) == url
+    assert cache.fetch(url) == url
+    assert cache.stats() == {
+        "hits": 0,
+        "misses": 0,
+        "uncached": 2,
+        "entries": 0,
+        "bytes": 0,
+    }
+
+
+def test_cache_lru_eviction(tmp_path, http_server):
+    """The least recently used files are evicted when the cache is over its size"""
+    root, base_url = http_server
+    for name in ["a", "b", "c"]:
+        (root / f"{name}.parquet").write_bytes(b"x" * 100)
+    cache = InputCache(str(tmp_path / "cache"), max_bytes=250)
+
+    path_a = cache.fetch(f"{base_url}/a.parquet")
+    path_b = cache.fetch(f"{base_url}/b.parquet")
+    os.utime(path_a, (1, 1))
+    os.utime(path_b, (2, 2))
+
+    # Using a makes b the least recently used entry
+    cache.fetch(f"{base_url}/a.parquet")
+    path_c = cache.fetch(f"{base_url}/c.parquet")
+
+    assert os.path.exists(path_a)
+    assert not os.path.exists(path_b)
+    assert os.path.exists(path_c)
+    assert cache.stats()["bytes"] <= 250
+
+
+def test_read_data_through_cache(tmp_path, http_server, monkeypatch):
+    """read_data downloads a remote input once and then reads the cached copy"""
+    root, base_url = http_server
+    create_month_file(root / "2023-01.parquet")
+    monkeypatch.setenv("INPUT_CACHE_DIR", str(tmp_path / "cache"))
+
+    categorical = ["PULocationID", "DOLocationID"]
+    df_first = read_data(f"{base_url}/2023-01.parquet", categorical)
+    df_second = read_data(f"{base_url}/2023-01.parquet", categorical)
+
+    assert df_first.equals(df_second)
+    cached = [n for n in os.listdir(tmp_path / "cache") if n.endswith(".parquet")]
+    assert len(cached) == 1
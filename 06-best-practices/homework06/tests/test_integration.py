@@ -53,6 +53,37 @@ def test_batch_prediction():
     return sum_pred
 
 
+def test_batch_prediction_streaming():
+    """Integration test for the streaming mode with a multipart S3 upload
+
+    Uses the same LocalStack setup as test_batch_prediction and checks that
+    the streamed output matches the output of the full read.
+    """
+    os.environ["INPUT_FILE_PATTERN"] = (
+        "s3://nyc-duration/in/{year:04d}-{month:02d}.parquet"
+    )
+    os.environ["OUTPUT_FILE_PATTERN"] = (
+        "s3://nyc-duration/out/streaming-{year:04d}-{month:02d}.parquet"
+    )
+    os.environ["S3_ENDPOINT_URL"] = "http://localhost:4566"
+
+    year, month = 2023, 1
+    options = {"client_kwargs": {"endpoint_url": os.environ["S3_ENDPOINT_URL"]}}
+
+    from homework06.batch_refactoring import main
+
+    output_file = main(year, month, batch_size=2)
+
+    df_stream = pd.read_parquet(output_file, storage_options=options)
+    df_full = pd.read_parquet(
+        "s3://nyc-duration/out/2023-01.parquet", storage_options=options
+    )
+    print(df_stream)
+
+    pd.testing.assert_frame_equal(df_stream, df_full)
+    return df_stream["predicted_duration"].sum()
+
+
 if __name__ == "__main__":
     sum_predicted = test_batch_prediction()
     print("\n" + "=" * 50)
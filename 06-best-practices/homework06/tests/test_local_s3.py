@@ -0,0 +1,213 @@
+# Fix Python import path issues when running from terminal
+try:
+    from fix_imports import *  # This adds parent directory to Python path
+except ImportError:
+    pass
+
+import pickle
+import logging
+import sys
+import os
+
+import fsspec
+import pandas as pd
+import pytest
+
+# Dynamically adjust imports based on where the script is run from
+try:
+    from homework06.batch_refactoring import read_data, read_results, score_month
+    from homework06.local_s3 import LocalS3Server
+    from homework06.merge_shards import merge_month
+    from homework06.s3_benchmark import s3_environment
+    from homework06.s3_writer import S3MultipartWriter, MIN_PART_SIZE
+except ImportError:
+    # Try relative import if running from tests directory
+    sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+    from batch_refactoring import read_data, read_results, score_month
+    from local_s3 import LocalS3Server
+    from merge_shards import merge_month
+    from s3_benchmark import s3_environment
+    from s3_writer import S3MultipartWriter, MIN_PART_SIZE
+
+try:
+    from tests.test_batch_refactoring import create_month_file
+except ImportError:
+    from test_batch_refactoring import create_month_file
+
+# Configure logging for tests
+logging.basicConfig(
+    level=logging.INFO,
+    format="%(asctime)s - %(name)s - %(levelname)s - %(message)s",
+    datefmt="%Y-%m-%d %H:%M:%S",
+)
+logger = logging.getLogger(__name__)
+
+MODEL_PATH = os.path.join(
+    os.path.dirname(os.path.dirname(os.path.abspath(__file__))), "model.bin"
+)
+
+
+@pytest.fixture
+def server():
+    with LocalS3Server() as server:
+        server.create_bucket("nyc-duration")
+        yield server
+
+
+@pytest.fixture
+def fs(server):
+    return fsspec.filesystem("s3", skip_instance_cache=True, **server.storage_options())
+
+
+def test_objects_and_listings(server, fs):
+    """s3fs can write, list, range-read and delete objects"""
+    fs.pipe("nyc-duration/a/one.txt", b"0123456789")
+    fs.pipe("nyc-duration/a/b/two.txt", b"two")
+
+    assert fs.cat("nyc-duration/a/one.txt", start=2, end=5) == b"234"
+    assert fs.info("nyc-duration/a/one.txt")["size"] == 10
+    assert sorted(fs.ls("nyc-duration/a", refresh=True)) == [
+        "nyc-duration/a/b",
+        "nyc-duration/a/one.txt",
+    ]
+    assert fs.find("nyc-duration") == [
+        "nyc-duration/a/b/two.txt",
+        "nyc-duration/a/one.txt",
+    ]
+
+    fs.rm("nyc-duration/a", recursive=True)
+    assert not fs.exists("nyc-duration/a/one.txt")
+
+    stats = server.store.stats()
+    assert stats["requests"]["PutObject"] == 2
+    assert stats["bytes_in"] == 13
+
+
+def test_multipart_upload(server):
+    """S3MultipartWriter's parts are assembled in order"""
+    with s3_environment(server):
+        sink = S3MultipartWriter(
+            "s3://nyc-duration/big.bin", part_size=MIN_PART_SIZE, max_workers=3
+        )
+        chunks = [bytes([i]) * (MIN_PART_SIZE // 2 + 1) for i in range(7)]
+        for chunk in chunks:
+            sink.write(chunk)
+        sink.close()
+
+    assert server.store.buckets["nyc-duration"]["big.bin"].body == b"".join(chunks)
+    requests = server.store.stats()["requests"]
+    assert requests["UploadPart"] == 4
+    assert requests["CompleteMultipartUpload"] == 1
+
+
+@pytest.mark.parametrize("arrow", [False, True])
+def test_read_data_from_s3(server, fs, tmp_path, arrow):
+    """read_data gives the same rows from S3 as from a local file"""
+    local_path = str(tmp_path / "2023-01.parquet")
+    create_month_file(local_path)
+    fs.put_file(local_path, "nyc-duration/in/2023-01.parquet")
+
+    expected = read_data(local_path, ["PULocationID", "DOLocationID"], arrow=arrow)
+    with s3_environment(server):
+        actual = read_data(
+            "s3://nyc-duration/in/2023-01.parquet",
+            ["PULocationID", "DOLocationID"],
+            arrow=arrow,
+        )
+    pd.testing.assert_frame_equal(actual, expected)
+    assert server.store.stats()["bytes_out"] > 0
+
+
+@pytest.mark.parametrize("partitioned", [False, True])
+@pytest.mark.parametrize("batch_size", [None, 100])
+def test_score_month_on_s3(server, fs, tmp_path, monkeypatch, batch_size, partitioned):
+    """Scoring from and to S3 writes the same results as local files"""
+    local_path = str(tmp_path / "2023-01.parquet")
+    create_month_file(local_path)
+    fs.put_file(local_path, "nyc-duration/in/2023-01.parquet")
+    monkeypatch.setenv("INPUT_FILE_PATTERN", local_path)
+    monkeypatch.setenv("OUTPUT_FILE_PATTERN", str(tmp_path / "local.parquet"))
+    with open(MODEL_PATH, "rb") as f_in:
+        dv, lr = pickle.load(f_in)
+    local_file, rows = score_month(2023, 1, dv, lr)
+
+    monkeypatch.setenv(
+        "INPUT_FILE_PATTERN", "s3://nyc-duration/in/{year:04d}-{month:02d}.parquet"
+    )
+    monkeypatch.setenv(
+        "OUTPUT_FILE_PATTERN", "s3://nyc-duration/out/{year:04d}-{month:02d}.parquet"
+    )
+    monkeypatch.setenv(
+        "OUTPUT_DATASET_PATTERN",
+        "s3://nyc-duration/out/taxi_type=yellow/year={year:04d}/month={month:02d}",
+    )
+    with s3_environment(server):
+        output, s3_rows = score_month(
+            2023, 1, dv, lr, batch_size=batch_size, partitioned=partitioned
+        )
+        df = read_results(output).sort_values("ride_id").reset_index(drop=True)
+        # The manifest was written, so a second run is skipped
+        server.store.reset_stats()
+        assert score_month(2023, 1, dv, lr, partitioned=partitioned) == (output, rows)
+        assert "PutObject" not in server.store.stats()["requests"]
+
+    assert s3_rows == rows
+    expected = read_results(local_file).sort_values("ride_id").reset_index(drop=True)
+    pd.testing.assert_frame_equal(df, expected)
+
+
+@pytest.mark.parametrize("dataset", [False, True])
+def test_shards_on_s3(server, fs, tmp_path, monkeypatch, dataset):
+    """Shards read their row groups from S3 and are merged there"""
+    local_path = str(tmp_path / "2023-01.parquet")
+    create_month_file(local_path)
+    fs.put_file(local_path, "nyc-duration/in/2023-01.parquet")
+    monkeypatch.setenv("INPUT_FILE_PATTERN", local_path)
+    monkeypatch.setenv("OUTPUT_FILE_PATTERN", str(tmp_path / "local.parquet"))
+    with open(MODEL_PATH, "rb") as f_in:
+        dv, lr = pickle.load(f_in)
+    local_file, rows = score_month(2023, 1, dv, lr)
+
+    monkeypatch.setenv(
+        "INPUT_FILE_PATTERN", "s3://nyc-duration/in/{year:04d}-{month:02d}.parquet"
+    )
+    monkeypatch.setenv(
+        "OUTPUT_FILE_PATTERN", "s3://nyc-duration/out/{year:04d}-{month:02d}.parquet"
+    )
+    with s3_environment(server):
+        for index in range(3):
+            score_month(2023, 1, dv, lr, shard_index=index, shard_count=3)
+        output, merged_rows = merge_month(2023, 1, 3, dataset=dataset)
+        df = read_results(output)
+
+    assert merged_rows == rows
+    pd.testing.assert_frame_equal(df, read_results(local_file))
+
+
+def test_checkpointed_run_on_s3(server, fs, tmp_path, monkeypatch):
+    """The journal and the parts live next to the S3 output until it is published"""
+    local_path = str(tmp_path / "2023-01.parquet")
+    create_month_file(local_path)
+    fs.put_file(local_path, "nyc-duration/in/2023-01.parquet")
+    monkeypatch.setenv("INPUT_FILE_PATTERN", local_path)
+    monkeypatch.setenv("OUTPUT_FILE_PATTERN", str(tmp_path / "local.parquet"))
+    with open(MODEL_PATH, "rb") as f_in:
+        dv, lr = pickle.load(f_in)
+    local_file, rows = score_month(2023, 1, dv, lr)
+
+    monkeypatch.setenv(
+        "INPUT_FILE_PATTERN", "s3://nyc-duration/in/{year:04d}-{month:02d}.parquet"
+    )
+    monkeypatch.setenv(
+        "OUTPUT_FILE_PATTERN", "s3://nyc-duration/out/{year:04d}-{month:02d}.parquet"
+    )
+    with s3_environment(server):
+        output, s3_rows = score_month(2023, 1, dv, lr, checkpoint_row_groups=3)
+        df = read_results(output)
+
+    assert s3_rows == rows
+    pd.testing.assert_frame_equal(df, read_results(local_file))
+    assert fs.find("nyc-duration/out") == [
+        "nyc-duration/out/2023-01.parquet",
+        "nyc-duration/out/2023-01.parquet.manifest.json",
+    ]
@@ -0,0 +1,118 @@
+# Fix Python import path issues when running from terminal
+try:
+    from fix_imports import *  # This adds parent directory to Python path
+except ImportError:
+    pass
+
+import copy
+import json
+import pickle
+import logging
+import sys
+import os
+
+import pytest
+
+# Dynamically adjust imports based on where the script is run from
+try:
+    from homework06.batch_refactoring import score_month
+    from homework06.manifest import input_fingerprint, manifest_path
+except ImportError:
+    # Try relative import if running from tests directory
+    sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+    from batch_refactoring import score_month
+    from manifest import input_fingerprint, manifest_path
+
+try:
+    from tests.test_batch_refactoring import create_month_file
+except ImportError:
+    from test_batch_refactoring import create_month_file
+
+# Configure logging for tests
+logging.basicConfig(
+    level=logging.INFO,
+    format="%(asctime)s - %(name)s - %(levelname)s - %(message)s",
+    datefmt="%Y-%m-%d %H:%M:%S",
+)
+logger = logging.getLogger(__name__)
+
+MODEL_PATH = os.path.join(
+    os.path.dirname(os.path.dirname(os.path.abspath(__file__))), "model.bin"
+)
+
+
+@pytest.fixture
+def month(tmp_path, monkeypatch):
+    """Synthetic January 2023 and the path its results are written to"""
+    create_month_file(tmp_path / "2023-01.parquet")
+    monkeypatch.setenv(
+        "INPUT_FILE_PATTERN", str(tmp_path / "{year:04d}-{month:02d}.parquet")
+    )
+    monkeypatch.setenv(
+        "OUTPUT_FILE_PATTERN", str(tmp_path / "out" / "{year:04d}-{month:02d}.parquet")
+    )
+    with open(MODEL_PATH, "rb") as f_in:
+        dv, lr = pickle.load(f_in)
+    return tmp_path, dv, lr
+
+
+def written_at(output_file):
+    with open(manifest_path(output_file)) as f_in:
+        return json.load(f_in)["created"]
+
+
+def test_unchanged_month_is_skipped(month):
+    """A second run with the same input, model and options doesn't rewrite the output"""
+    _, dv, lr = month
+
+    output_file, rows = score_month(2023, 1, dv, lr)
+    created = written_at(output_file)
+    mtime = os.stat(output_file).st_mtime_ns
+
+    assert score_month(2023, 1, dv, lr) == (output_file, rows)
+    assert score_month(2023, 1, dv, lr, batch_size=100) == (output_file, rows)
+    assert written_at(output_file) == created
+    assert os.stat(output_file).st_mtime_ns == mtime
+
+    score_month(2023, 1, dv, lr, force=True)
+    assert written_at(output_file) != created
+
+
+def test_changes_trigger_a_new_run(month):
+    """A different model, output option or input makes the month run again"""
+    tmp_path, dv, lr = month
+    output_file, _ = score_month(2023, 1, dv, lr)
+
+    created = written_at(output_file)
+    challenger = copy.deepcopy(lr)
+    challenger.intercept_ += 1.0
+    score_month(2023, 1, dv, challenger)
+    assert written_at(output_file) != created
+
+    created = written_at(output_file)
+    score_month(2023, 1, dv, challenger, compact=True)
+    assert written_at(output_file) != created
+
+    created = written_at(output_file)
+    create_month_file(tmp_path / "2023-01.parquet", n_rows=1200)
+    score_month(2023, 1, dv, challenger, compact=True)
+    assert written_at(output_file) != created
+
+    # A deleted output is written again even though its manifest still matches
+    created = written_at(output_file)
+    os.remove(output_file)
+    score_month(2023, 1, dv, challenger, compact=True)
+    assert os.path.exists(output_file)
+    assert written_at(output_file) != created
+
+
+def test_input_fingerprint_reads_only_the_footer(tmp_path):
+    path = str(tmp_path / "2023-01.parquet")
+    create_month_file(path)
+    fingerprint = input_fingerprint(path)
+
+    assert fingerprint["size"] == os.path.getsize(path)
+    assert input_fingerprint(path) == fingerprint
+
+    create_month_file(path, n_rows=999)
+    assert input_fingerprint(path)["footer_sha256"] != fingerprint["footer_sha256"]
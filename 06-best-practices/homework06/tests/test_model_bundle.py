@@ -0,0 +1,120 @@
+# Fix Python import path issues when running from terminal
+try:
+    from fix_imports import *  # This adds parent directory to Python path
+except ImportError:
+    pass
+
+import os
+import sys
+import json
+import pickle
+import logging
+
+import numpy as np
+import pandas as pd
+import pytest
+
+# Dynamically adjust imports based on where the script is run from
+try:
+    from homework06.model_bundle import export_bundle, load_bundle, check_round_trip
+    from homework06.batch_refactoring import load_model, predict
+    from homework06.encoder import ColumnarEncoder
+except ImportError:
+    # Try relative import if running from tests directory
+    sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+    from model_bundle import export_bundle, load_bundle, check_round_trip
+    from batch_refactoring import load_model, predict
+    from encoder import ColumnarEncoder
+
+from sklearn.ensemble import RandomForestRegressor
+from sklearn.feature_extraction import DictVectorizer
+
+# Configure logging for tests
+logging.basicConfig(
+    level=logging.INFO,
+    format="%(asctime)s - %(name)s - %(levelname)s - %(message)s",
+    datefmt="%Y-%m-%d %H:%M:%S",
+)
+logger = logging.getLogger(__name__)
+
+categorical = ["PULocationID", "DOLocationID"]
+MODEL_PATH = os.path.join(
+    os.path.dirname(os.path.dirname(os.path.abspath(__file__))), "model.bin"
+)
+
+
+def location_frame(n_rows, seed=0):
+    rng = np.random.default_rng(seed)
+    return pd.DataFrame(
+        {
+            "PULocationID": rng.integers(-1, 300, n_rows).astype(str),
+            "DOLocationID": rng.integers(-1, 300, n_rows).astype(str),
+        }
+    )
+
+
+def test_linear_bundle_round_trip(tmp_path):
+    """model.bin exported as a bundle predicts exactly the same values"""
+    with open(MODEL_PATH, "rb") as f_in:
+        dv, lr = pickle.load(f_in)
+
+    bundle_dir = export_bundle(dv, lr, str(tmp_path / "bundle"))
+    assert check_round_trip(dv, lr, bundle_dir) == 0.0
+
+    bundle_dv, bundle_lr = load_bundle(bundle_dir)
+    assert isinstance(bundle_lr.coef_, np.memmap)
+
+    df = location_frame(5_000)
+    expected = lr.predict(dv.transform(df[categorical].to_dict(orient="records")))
+    actual = predict(df, ColumnarEncoder(bundle_dv, categorical), bundle_lr)
+    assert expected.tobytes() == actual.tobytes()
+
+    # The plain transform() gives the same matrix as the DictVectorizer
+    dicts = df[categorical].to_dict(orient="records")
+    assert (bundle_dv.transform(dicts) != dv.transform(dicts)).nnz == 0
+
+
+def test_forest_bundle_round_trip(tmp_path):
+    """A random forest on the location features survives the round trip"""
+    df = location_frame(2_000, seed=1)
+    dicts = df[categorical].to_dict(orient="records")
+    dv = DictVectorizer().fit(dicts)
+    y = np.random.default_rng(2).uniform(1, 60, len(df))
+    rf = RandomForestRegressor(n_estimators=5, max_depth=8, random_state=0)
+    rf.fit(dv.transform(dicts), y)
+
+    bundle_dir = export_bundle(dv, rf, str(tmp_path / "forest"))
+    check_round_trip(dv, rf, bundle_dir)
+
+    bundle_dv, bundle_rf = load_bundle(bundle_dir)
+    X = dv.transform(dicts)
+    np.testing.assert_allclose(bundle_rf.predict(X), rf.predict(X), rtol=1e-12)
+
+
+def test_load_model_from_bundle(tmp_path, monkeypatch):
+    """load_model accepts a bundle directory through MODEL_PATH"""
+    with open(MODEL_PATH, "rb") as f_in:
+        dv, lr = pickle.load(f_in)
+    bundle_dir = export_bundle(dv, lr, str(tmp_path / "bundle"))
+
+    monkeypatch.setenv("MODEL_PATH", bundle_dir)
+    bundle_dv, bundle_lr = load_model()
+
+    assert bundle_dv.feature_names_ == list(dv.feature_names_)
+    np.testing.assert_array_equal(bundle_lr.coef_, lr.coef_)
+
+
+def test_unsupported_bundle_version(tmp_path):
+    with open(MODEL_PATH, "rb") as f_in:
+        dv, lr = pickle.load(f_in)
+    bundle_dir = export_bundle(dv, lr, str(tmp_path / "bundle"))
+
+    manifest_path = os.path.join(bundle_dir, "bundle.json")
+    with open(manifest_path) as f_in:
+        manifest = json.load(f_in)
+    manifest["version"] = 99
+    with open(manifest_path, "w") as f_out:
+        json.dump(manifest, f_out)
+
+    with pytest.raises(ValueError, match="Unsupported bundle version"):
+        load_bundle(bundle_dir)
@@ -0,0 +1,234 @@
+# Fix Python import path issues when running from terminal
+try:
+    from fix_imports import *  # This adds parent directory to Python path
+except ImportError:
+    pass
+
+import copy
+import json
+import pickle
+import logging
+import sys
+import os
+
+import numpy as np
+import pandas as pd
+import pytest
+from sklearn.feature_extraction import DictVectorizer
+from sklearn.linear_model import LinearRegression
+
+# Dynamically adjust imports based on where the script is run from
+try:
+    from homework06.batch_refactoring import (
+        load_challengers,
+        predict,
+        predict_models,
+        read_results,
+        score_month,
+    )
+    from homework06.encoder import ColumnarEncoder
+    from homework06.manifest import manifest_path
+    from homework06.model_comparison import (
+        CHAMPION,
+        PredictionSummary,
+        group_models,
+    )
+except ImportError:
+    # Try relative import if running from tests directory
+    sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+    from batch_refactoring import (
+        load_challengers,
+        predict,
+        predict_models,
+        read_results,
+        score_month,
+    )
+    from encoder import ColumnarEncoder
+    from manifest import manifest_path
+    from model_comparison import CHAMPION, PredictionSummary, group_models
+
+try:
+    from tests.test_batch_refactoring import create_month_file
+except ImportError:
+    from test_batch_refactoring import create_month_file
+
+# Configure logging for tests
+logging.basicConfig(
+    level=logging.INFO,
+    format="%(asctime)s - %(name)s - %(levelname)s - %(message)s",
+    datefmt="%Y-%m-%d %H:%M:%S",
+)
+logger = logging.getLogger(__name__)
+
+MODEL_PATH = os.path.join(
+    os.path.dirname(os.path.dirname(os.path.abspath(__file__))), "model.bin"
+)
+CATEGORICAL = ["PULocationID", "DOLocationID"]
+
+
+@pytest.fixture
+def month(tmp_path, monkeypatch):
+    """Synthetic January 2023, the production model and a shifted challenger"""
+    create_month_file(tmp_path / "2023-01.parquet")
+    monkeypatch.setenv(
+        "INPUT_FILE_PATTERN", str(tmp_path / "{year:04d}-{month:02d}.parquet")
+    )
+    monkeypatch.setenv(
+        "OUTPUT_FILE_PATTERN", str(tmp_path / "out" / "{year:04d}-{month:02d}.parquet")
+    )
+    with open(MODEL_PATH, "rb") as f_in:
+        dv, lr = pickle.load(f_in)
+
+    challenger = copy.deepcopy(lr)
+    challenger.intercept_ += 1.0
+    return dv, lr, challenger
+
+
+def small_model(locations):
+    """A model with its own DictVectorizer, fitted on a few location pairs"""
+    records = [
+        {"PULocationID": str(pu), "DOLocationID": str(do)}
+        for pu in locations
+        for do in locations
+    ]
+    dv = DictVectorizer().fit(records)
+    y = np.arange(len(records), dtype="float64")
+    return dv, LinearRegression().fit(dv.transform(records), y)
+
+
+@pytest.mark.parametrize("batch_size", [None, 100])
+def test_challenger_scored_in_the_same_pass(month, batch_size):
+    """Challenger predictions land next to the champion's, with a summary"""
+    dv, lr, challenger = month
+    output_file, rows = score_month(
+        2023,
+        1,
+        dv,
+        lr,
+        batch_size=batch_size,
+        challengers={"shifted": (copy.deepcopy(dv), challenger)},
+    )
+
+    df = pd.read_parquet(output_file)
+    assert list(df.columns) == [
+        "ride_id",
+        "predicted_duration",
+        "predicted_duration_shifted",
+    ]
+    assert len(df) == rows
+    np.testing.assert_allclose(
+        df["predicted_duration_shifted"], df["predicted_duration"] + 1.0
+    )
+
+    with open(manifest_path(output_file)) as f_in:
+        summary = json.load(f_in)["summary"]
+    assert summary["rows"] == rows
+    assert summary["models"][CHAMPION]["mean"] == pytest.approx(
+        df["predicted_duration"].mean()
+    )
+    delta = summary["deltas"][f"shifted-{CHAMPION}"]
+    assert delta["mean"] == pytest.approx(1.0)
+    assert delta["rmse"] == pytest.approx(1.0)
+    assert delta["max_abs"] == pytest.approx(1.0)
+
+
+def test_compact_challenger_results(month):
+    dv, lr, challenger = month
+    output_file, rows = score_month(
+        2023, 1, dv, lr, compact=True, challengers={"shifted": (dv, challenger)}
+    )
+
+    df = read_results(output_file)
+    assert list(df.columns) == [
+        "ride_id",
+        "predicted_duration",
+        "predicted_duration_shifted",
+    ]
+    assert df["predicted_duration_shifted"].dtype == "float64"
+    np.testing.assert_allclose(
+        df["predicted_duration_shifted"], df["predicted_duration"] + 1.0, rtol=1e-6
+    )
+
+
+def test_challengers_change_the_fingerprint(month):
+    """Adding a challenger reruns a month whose champion output is up to date"""
+    dv, lr, challenger = month
+    output_file, _ = score_month(2023, 1, dv, lr)
+    score_month(2023, 1, dv, lr, challengers={"shifted": (dv, challenger)})
+
+    assert "predicted_duration_shifted" in pd.read_parquet(output_file).columns
+
+
+def test_models_share_a_feature_matrix():
+    """Equal vectorizers share an encoder, and every model gets its own predictions"""
+    dv_a, lr_a = small_model([1, 2, 3])
+    dv_b, lr_b = small_model([2, 3, 4, 5])
+    models = {
+        CHAMPION: (dv_a, lr_a),
+        "copy": (copy.deepcopy(dv_a), copy.deepcopy(lr_a)),
+        "other": (dv_b, lr_b),
+    }
+    groups = group_models(models, CATEGORICAL)
+    assert [list(members) for _, members in groups] == [[CHAMPION, "copy"], ["other"]]
+
+    df = pd.DataFrame({"PULocationID": ["1", "2", "5", "2"], "DOLocationID": ["3"] * 4})
+    predictions = predict_models(df, groups)
+    for name, (dv, lr) in models.items():
+        expected = predict(df, ColumnarEncoder(dv, CATEGORICAL), lr, unique=False)
+        np.testing.assert_allclose(predictions[name], expected)
+
+
+def test_summary_over_batches():
+    summary = PredictionSummary(["a", "b"])
+    summary.update({"a": np.array([1.0, 2.0]), "b": np.array([1.0, 4.0])})
+    summary.update({"a": np.array([3.0]), "b": np.array([0.0])})
+
+    result = summary.to_dict()
+    assert result["rows"] == 3
+    assert result["models"]["a"] == {"sum": 6.0, "mean": 2.0}
+    assert result["deltas"]["b-a"]["mean"] == pytest.approx(-1 / 3)
+    assert result["deltas"]["b-a"]["mean_abs"] == pytest.approx(5 / 3)
+    assert result["deltas"]["b-a"]["rmse"] == pytest.approx(np.sqrt(13 / 3))
+    assert result["deltas"]["b-a"]["max_abs"] == 3.0
+
+
+def test_summaries_of_shards_merge():
+    """Summaries stored in the manifests of shards add up to the one of the whole"""
+    a = np.array([1.0, 2.0, 3.0, 5.0])
+    b = np.array([1.0, 4.0, 0.0, 5.5])
+    whole = PredictionSummary(["a", "b"])
+    whole.update({"a": a, "b": b})
+
+    merged = PredictionSummary(["a", "b"])
+    for part in (slice(0, 1), slice(1, 4)):
+        shard = PredictionSummary(["a", "b"])
+        shard.update({"a": a[part], "b": b[part]})
+        merged.merge(PredictionSummary.from_dict(shard.to_dict()))
+
+    expected = whole.to_dict()
+    actual = merged.to_dict()
+    assert actual["rows"] == expected["rows"]
+    for name in ("a", "b"):
+        assert actual["models"][name] == pytest.approx(expected["models"][name])
+    assert actual["deltas"]["b-a"] == pytest.approx(expected["deltas"]["b-a"])
+
+    with pytest.raises(ValueError):
+        merged.merge(PredictionSummary(["a", "c"]))
+
+
+def test_load_challengers(tmp_path):
+    with open(MODEL_PATH, "rb") as f_in:
+        model = f_in.read()
+    (tmp_path / "candidate.bin").write_bytes(model)
+
+    challengers = load_challengers(
+        [str(tmp_path / "candidate.bin"), f"retrained={MODEL_PATH}"]
+    )
+    assert list(challengers) == ["candidate", "retrained"]
+
+    with pytest.raises(ValueError):
+        load_challengers([f"{CHAMPION}={MODEL_PATH}"])
+    with pytest.raises(ValueError):
+        load_challengers([f"a={MODEL_PATH}", f"a={MODEL_PATH}"])
+    with pytest.raises(ValueError):
+        load_challengers([f"new model={MODEL_PATH}"])
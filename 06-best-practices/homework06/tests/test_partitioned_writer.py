@@ -0,0 +1,233 @@
+# Fix Python import path issues when running from terminal
+try:
+    from fix_imports import *  # This adds parent directory to Python path
+except ImportError:
+    pass
+
+import json
+import pickle
+import logging
+import sys
+import os
+
+import fsspec
+import numpy as np
+import pandas as pd
+import pyarrow.dataset as ds
+import pyarrow.parquet as pq
+import pytest
+
+# Dynamically adjust imports based on where the script is run from
+try:
+    from homework06.batch_refactoring import read_results, score_month
+    from homework06.manifest import manifest_path
+    from homework06 import partitioned_writer
+    from homework06.partitioned_writer import (
+        PartitionedWriter,
+        read_dataset,
+        read_outside_month,
+    )
+except ImportError:
+    # Try relative import if running from tests directory
+    sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+    from batch_refactoring import read_results, score_month
+    from manifest import manifest_path
+    import partitioned_writer
+    from partitioned_writer import PartitionedWriter, read_dataset, read_outside_month
+
+try:
+    from tests.test_batch_refactoring import create_month_file
+except ImportError:
+    from test_batch_refactoring import create_month_file
+
+# Configure logging for tests
+logging.basicConfig(
+    level=logging.INFO,
+    format="%(asctime)s - %(name)s - %(levelname)s - %(message)s",
+    datefmt="%Y-%m-%d %H:%M:%S",
+)
+logger = logging.getLogger(__name__)
+
+MODEL_PATH = os.path.join(
+    os.path.dirname(os.path.dirname(os.path.abspath(__file__))), "model.bin"
+)
+
+
+@pytest.fixture
+def month(tmp_path, monkeypatch):
+    """Synthetic January 2023, with single-file and partitioned outputs in tmp_path"""
+    create_month_file(tmp_path / "2023-01.parquet")
+    monkeypatch.setenv(
+        "INPUT_FILE_PATTERN", str(tmp_path / "{year:04d}-{month:02d}.parquet")
+    )
+    monkeypatch.setenv(
+        "OUTPUT_FILE_PATTERN", str(tmp_path / "out" / "{year:04d}-{month:02d}.parquet")
+    )
+    monkeypatch.setenv(
+        "OUTPUT_DATASET_PATTERN",
+        str(
+            tmp_path / "dataset" / "taxi_type=yellow/year={year:04d}/month={month:02d}"
+        ),
+    )
+    with open(MODEL_PATH, "rb") as f_in:
+        dv, lr = pickle.load(f_in)
+    return tmp_path, dv, lr
+
+
+def sort_by_ride(df):
+    return df.sort_values("ride_id").reset_index(drop=True)
+
+
+@pytest.mark.parametrize("compact", [False, True])
+@pytest.mark.parametrize("batch_size", [None, 100])
+def test_partitioned_matches_single_file(month, batch_size, compact):
+    """The dataset holds the same predictions as the single file, split by day"""
+    tmp_path, dv, lr = month
+    single_file, rows = score_month(2023, 1, dv, lr, compact=compact)
+    dataset, dataset_rows = score_month(
+        2023,
+        1,
+        dv,
+        lr,
+        batch_size=batch_size,
+        compact=compact,
+        partitioned=True,
+        max_open_files=8,
+    )
+
+    assert dataset_rows == rows
+    assert dataset.endswith("taxi_type=yellow/year=2023/month=01")
+    assert pq.read_metadata(os.path.join(dataset, "_metadata")).num_rows == rows
+
+    days = sorted(name for name in os.listdir(dataset) if name.startswith("day="))
+    assert days[0] == "day=01"
+    assert len(days) > 20
+
+    pd.testing.assert_frame_equal(
+        sort_by_ride(read_results(dataset)),
+        sort_by_ride(read_results(single_file)),
+        check_exact=False,
+    )
+
+    # A query on the whole dataset sees all partition keys
+    table = ds.dataset(str(tmp_path / "dataset"), partitioning="hive").to_table(
+        filter=ds.field("day") == 5
+    )
+    assert set(table.column("month").to_pylist()) == {1}
+    assert 0 < table.num_rows < rows
+
+
+def test_partitioned_month_is_skipped(month):
+    """The manifest sits next to _metadata, which is written last"""
+    _, dv, lr = month
+    dataset, rows = score_month(2023, 1, dv, lr, partitioned=True)
+    metadata_file = os.path.join(dataset, "_metadata")
+    mtime = os.stat(metadata_file).st_mtime_ns
+
+    assert score_month(2023, 1, dv, lr, partitioned=True) == (dataset, rows)
+    assert os.stat(metadata_file).st_mtime_ns == mtime
+
+    # Without _metadata the dataset is incomplete and gets written again
+    os.remove(metadata_file)
+    score_month(2023, 1, dv, lr, partitioned=True)
+    assert os.path.exists(metadata_file)
+
+
+@pytest.mark.parametrize("batch_size", [None, 100])
+def test_pickups_outside_the_month_are_kept_apart(month, batch_size):
+    """TLC files have a few pickups of other months; they go to day=00, and are counted"""
+    tmp_path, dv, lr = month
+    df = pd.read_parquet(tmp_path / "2023-01.parquet")
+    df.loc[:9, "tpep_pickup_datetime"] = pd.Timestamp("2022-12-31 23:50")
+    df.loc[:9, "tpep_dropoff_datetime"] = pd.Timestamp("2023-01-01 00:10")
+    df.loc[10:14, "tpep_pickup_datetime"] = pd.Timestamp("2023-02-01 00:05")
+    df.loc[10:14, "tpep_dropoff_datetime"] = pd.Timestamp("2023-02-01 00:20")
+    df.to_parquet(tmp_path / "2023-01.parquet", row_group_size=128)
+
+    single_file, rows = score_month(2023, 1, dv, lr)
+    dataset, dataset_rows = score_month(
+        2023, 1, dv, lr, batch_size=batch_size, partitioned=True
+    )
+    assert dataset_rows == rows
+    assert pq.read_metadata(os.path.join(dataset, "_metadata")).num_rows == rows
+    assert read_outside_month(dataset) == 15
+    with open(manifest_path(os.path.join(dataset, "_metadata"))) as f_in:
+        assert json.load(f_in)["outside_month"] == 15
+
+    # The synthetic month has no January 31st, only the December rows would
+    outside = read_results(single_file)["ride_id"].iloc[:15]
+    assert not os.path.exists(os.path.join(dataset, "day=31"))
+    days = read_dataset(dataset)
+    assert (days["day"] == 0).sum() == 15
+    assert set(read_results(dataset)["ride_id"].iloc[:15]) == set(outside)
+
+
+def results(start, n_rows):
+    rng = np.random.default_rng(start)
+    df = pd.DataFrame(
+        {
+            "row_id": np.arange(start, start + n_rows),
+            "year": np.full(n_rows, 2023, dtype="int16"),
+            "month": np.full(n_rows, 1, dtype="int8"),
+            "predicted_duration": rng.uniform(1, 60, n_rows).astype("float32"),
+        }
+    )
+    return df, rng.integers(1, 32, n_rows).astype("int8")
+
+
+def test_open_files_are_bounded(tmp_path):
+    """Days beyond max_open_files close the least recently used file"""
+    path = str(tmp_path / "taxi_type=yellow/year=2023/month=01")
+    writer = PartitionedWriter(path, max_open_files=4, max_workers=4)
+
+    expected = []
+    for start in range(0, 3000, 1000):
+        df, days = results(start, 1000)
+        writer.write(df, days)
+        assert len(writer._open) <= 4
+        expected.append(df)
+    writer.close()
+
+    files = pq.read_metadata(os.path.join(path, "_metadata"))
+    parts = {
+        files.row_group(i).column(0).file_path for i in range(files.num_row_groups)
+    }
+    assert len(parts) > 31
+    assert all(os.path.exists(os.path.join(path, part)) for part in parts)
+
+    df = read_dataset(path).sort_values("row_id").reset_index(drop=True)
+    expected = pd.concat(expected, ignore_index=True)
+    np.testing.assert_array_equal(df["row_id"], expected["row_id"])
+    np.testing.assert_array_equal(
+        df["predicted_duration"], expected["predicted_duration"]
+    )
+    assert (df["year"] == 2023).all()
+
+
+def test_writes_through_fsspec(monkeypatch):
+    """S3 datasets go through an fsspec filesystem; an in-memory one stands in for S3"""
+    memory = fsspec.filesystem("memory")
+    monkeypatch.setattr(
+        partitioned_writer,
+        "get_filesystem",
+        lambda path, storage_options=None: (memory, "/" + path[len("s3://") :]),
+    )
+    path = "s3://bucket/predictions/taxi_type=yellow/year=2023/month=01"
+
+    writer = PartitionedWriter(path)
+    df, days = results(0, 500)
+    writer.write(df, days)
+    writer.abort()
+    assert not memory.exists(
+        "/bucket/predictions/taxi_type=yellow/year=2023/month=01/_metadata"
+    )
+
+    # A new writer replaces the partial dataset
+    writer = PartitionedWriter(path)
+    writer.write(df, days)
+    assert writer.close() == path + "/_metadata"
+
+    assert memory.exists(
+        "/bucket/predictions/taxi_type=yellow/year=2023/month=01/_metadata"
+    )
+    assert len(read_dataset(path)) == 500
@@ -0,0 +1,116 @@
+# Fix Python import path issues when running from terminal
+try:
+    from fix_imports import *  # This adds parent directory to Python path
+except ImportError:
+    pass
+
+import json
+import pstats
+import logging
+import sys
+import os
+
+import pytest
+
+# Dynamically adjust imports based on where the script is run from
+try:
+    from homework06.batch_refactoring import main
+    from homework06.profiling import NULL_PROFILER, StageProfiler
+except ImportError:
+    # Try relative import if running from tests directory
+    sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+    from batch_refactoring import main
+    from profiling import NULL_PROFILER, StageProfiler
+
+try:
+    from tests.test_batch_refactoring import create_month_file
+except ImportError:
+    from test_batch_refactoring import create_month_file
+
+# Configure logging for tests
+logging.basicConfig(
+    level=logging.INFO,
+    format="%(asctime)s - %(name)s - %(levelname)s - %(message)s",
+    datefmt="%Y-%m-%d %H:%M:%S",
+)
+logger = logging.getLogger(__name__)
+
+
+@pytest.fixture
+def month(tmp_path, monkeypatch):
+    """Synthetic January 2023, scored into tmp_path/out"""
+    create_month_file(tmp_path / "2023-01.parquet")
+    monkeypatch.setenv(
+        "INPUT_FILE_PATTERN", str(tmp_path / "{year:04d}-{month:02d}.parquet")
+    )
+    monkeypatch.setenv(
+        "OUTPUT_FILE_PATTERN", str(tmp_path / "out" / "{year:04d}-{month:02d}.parquet")
+    )
+    return tmp_path
+
+
+def read_records(path):
+    with open(path) as f_in:
+        return [json.loads(line) for line in f_in]
+
+
+@pytest.mark.parametrize("batch_size", [None, 100])
+def test_profiled_run_writes_one_record(month, batch_size):
+    """Every stage of a run ends up in a single JSON record"""
+    profile_output = str(month / "profile.jsonl")
+    cprofile_output = str(month / "slowest.prof")
+
+    main(
+        2023,
+        1,
+        batch_size=batch_size,
+        force=True,
+        profile_output=profile_output,
+        cprofile_output=cprofile_output,
+    )
+
+    [record] = read_records(profile_output)
+    assert (record["year"], record["month"]) == (2023, 1)
+    assert record["batch_size"] == batch_size
+    assert record["rows"] > 0
+
+    stages = record["stages"]
+    for name in ["load_model", "read", "prepare", "vectorize", "predict", "write"]:
+        assert stages[name]["wall_seconds"] > 0
+        assert stages[name]["peak_bytes"] > 0
+    assert stages["predict"]["rows"] == record["rows"]
+    assert stages["write"]["rows"] == record["rows"]
+    assert stages["read"]["rows"] >= record["rows"]
+    assert stages["predict"]["rows_per_sec"] > 0
+    if batch_size:
+        assert stages["predict"]["calls"] > 1
+
+    assert record["slowest_stage"] in stages
+    assert record["cprofile"] == cprofile_output
+    pstats.Stats(cprofile_output)
+
+
+def test_stage_totals():
+    """Repeated stages add up their times and rows"""
+    profiler = StageProfiler(trace_memory=False)
+    profiler.start()
+    for rows in [10, 20]:
+        with profiler.stage("predict") as stage:
+            stage.rows = rows
+    with profiler.stage("write"):
+        pass
+    record = profiler.finish()
+
+    assert record["stages"]["predict"]["calls"] == 2
+    assert record["stages"]["predict"]["rows"] == 30
+    assert record["stages"]["write"]["rows"] is None
+    assert record["stages"]["write"]["rows_per_sec"] is None
+    assert record["wall_seconds"] >= record["stages"]["predict"]["wall_seconds"]
+
+
+def test_disabled_profiler_is_a_noop():
+    NULL_PROFILER.start()
+    with NULL_PROFILER.stage("read") as stage:
+        stage.rows = 10
+    assert NULL_PROFILER.stages == {}
+    assert NULL_PROFILER.finish() is None
@@ -0,0 +1,63 @@
+# Fix Python import path issues when running from terminal
+try:
+    from fix_imports import *  # This adds parent directory to Python path
+except ImportError:
+    pass
+
+import json
+import logging
+import sys
+import os
+
+# Dynamically adjust imports based on where the script is run from
+try:
+    from homework06.s3_benchmark import parse_bytes, run_s3_benchmark
+except ImportError:
+    # Try relative import if running from tests directory
+    sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+    from s3_benchmark import parse_bytes, run_s3_benchmark
+
+# Configure logging for tests
+logging.basicConfig(
+    level=logging.INFO,
+    format="%(asctime)s - %(name)s - %(levelname)s - %(message)s",
+    datefmt="%Y-%m-%d %H:%M:%S",
+)
+logger = logging.getLogger(__name__)
+
+
+def test_parse_bytes():
+    assert parse_bytes("5M") == 5 * 2**20
+    assert parse_bytes("512k") == 512 * 2**10
+    assert parse_bytes("1G") == 2**30
+    assert parse_bytes("1000") == 1000
+
+
+def test_run_s3_benchmark(tmp_path):
+    """Every setting reports throughput and the requests it took"""
+    block_size = 5 * 2**20
+    report = run_s3_benchmark(
+        [2_000], str(tmp_path), [block_size], concurrency=[1, 2], repeat=1
+    )
+    result = report["results"]["2000"]
+    assert result["file_bytes"] > 0
+
+    runs = {(run["operation"], run["concurrency"]): run for run in result["runs"]}
+    assert set(runs) == {
+        ("read", 1),
+        ("read", 2),
+        ("write_multipart", 1),
+        ("write_multipart", 2),
+        ("write_fsspec", 1),
+    }
+    for run in runs.values():
+        assert run["block_size"] == block_size
+        assert run["mb_per_sec"] > 0
+        assert run["request_count"] == sum(run["requests"].values())
+
+    # Two readers fetch the file twice
+    assert runs[("read", 2)]["bytes_out"] == 2 * runs[("read", 1)]["bytes_out"]
+    assert runs[("read", 1)]["requests"]["GetObject"] >= 1
+    assert runs[("write_fsspec", 1)]["bytes_in"] > 0
+
+    json.loads(json.dumps(report))
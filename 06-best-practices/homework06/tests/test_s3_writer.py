@@ -0,0 +1,189 @@
+# Fix Python import path issues when running from terminal
+try:
+    from fix_imports import *  # This adds parent directory to Python path
+except ImportError:
+    pass
+
+import io
+import os
+import sys
+import time
+import logging
+import threading
+
+import numpy as np
+import pyarrow as pa
+import pyarrow.parquet as pq
+import pytest
+
+# Dynamically adjust imports based on where the script is run from
+try:
+    from homework06 import s3_writer
+    from homework06.s3_writer import S3MultipartWriter, MIN_PART_SIZE
+except ImportError:
+    # Try relative import if running from tests directory
+    sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+    import s3_writer
+    from s3_writer import S3MultipartWriter, MIN_PART_SIZE
+
+# Configure logging for tests
+logging.basicConfig(
+    level=logging.INFO,
+    format="%(asctime)s - %(name)s - %(levelname)s - %(message)s",
+    datefmt="%Y-%m-%d %H:%M:%S",
+)
+logger = logging.getLogger(__name__)
+
+
+class RecordingClient:
+    """In-memory stand-in for the S3 multipart API calls used by the writer"""
+
+    def __init__(self, delay=0.0, fail_part=None):
+        self.delay = delay
+        self.fail_part = fail_part
+        self.objects = {}
+        self.parts = {}
+        self.aborted = []
+        self.in_flight = 0
+        self.max_in_flight = 0
+        self.lock = threading.Lock()
+
+    def create_multipart_upload(self, Bucket, Key):
+        return {"UploadId": "upload-1"}
+
+    def upload_part(self, Bucket, Key, UploadId, PartNumber, Body):
+        with self.lock:
+            self.in_flight += 1
+            self.max_in_flight = max(self.max_in_flight, self.in_flight)
+        time.sleep(self.delay)
+        with self.lock:
+            self.in_flight -= 1
+        if PartNumber == self.fail_part:
+            raise IOError(f"part {PartNumber} failed")
+        self.parts[PartNumber] = Body
+        return {"ETag": f'"etag-{PartNumber}"'}
+
+    def complete_multipart_upload(self, Bucket, Key, UploadId, MultipartUpload):
+        numbers = [part["PartNumber"] for part in MultipartUpload["Parts"]]
+        assert numbers == sorted(self.parts)
+        self.objects[(Bucket, Key)] = b"".join(self.parts[n] for n in numbers)
+
+    def abort_multipart_upload(self, Bucket, Key, UploadId):
+        self.aborted.append(Key)
+
+    def put_object(self, Bucket, Key, Body):
+        self.objects[(Bucket, Key)] = Body
+
+
+def write_parquet(sink, n_batches=8, rows_per_batch=200_000):
+    """Write random float batches as row groups and return the expected table"""
+    rng = np.random.default_rng(0)
+    tables = []
+    writer = None
+    for _ in range(n_batches):
+        table = pa.table({"predicted_duration": rng.random(rows_per_batch)})
+        if writer is None:
+            writer = pq.ParquetWriter(sink, table.schema, compression="none")
+        writer.write_table(table)
+        tables.append(table)
+    writer.close()
+    return pa.concat_tables(tables)
+
+
+def test_multipart_upload_of_parquet():
+    """Row groups are uploaded as parts and reassemble into the same parquet file"""
+    client = RecordingClient(delay=0.05)
+    sink = S3MultipartWriter(
+        "s3://nyc-duration/out/2023-01.parquet",
+        part_size=MIN_PART_SIZE,
+        max_workers=2,
+        client=client,
+    )
+    expected = write_parquet(sink)
+    sink.close()
+
+    body = client.objects[("nyc-duration", "out/2023-01.parquet")]
+    assert len(client.parts) > 1
+    last = max(client.parts)
+    assert all(len(client.parts[n]) == MIN_PART_SIZE for n in range(1, last))
+    assert pq.read_table(io.BytesIO(body)).equals(expected)
+    assert client.max_in_flight <= 2
+
+
+def test_small_file_uses_put_object():
+    client = RecordingClient()
+    with S3MultipartWriter("s3://bucket/small.parquet", client=client) as sink:
+        sink.write(b"tiny")
+
+    assert client.objects[("bucket", "small.parquet")] == b"tiny"
+    assert client.parts == {}
+
+
+def test_in_flight_parts_are_bounded():
+    """write() blocks when max_in_flight parts are pending"""
+    client = RecordingClient(delay=0.1)
+    sink = S3MultipartWriter(
+        "s3://bucket/key",
+        part_size=MIN_PART_SIZE,
+        max_workers=4,
+        max_in_flight=2,
+        client=client,
+    )
+    for _ in range(6):
+        sink.write(b"x" * MIN_PART_SIZE)
+    sink.close()
+
+    assert client.max_in_flight <= 2
+    assert len(client.parts) == 6
+
+
+def test_failed_part_aborts_upload():
+    client = RecordingClient(fail_part=2)
+    sink = S3MultipartWriter("s3://bucket/key", part_size=MIN_PART_SIZE, client=client)
+    with pytest.raises(IOError):
+        for _ in range(3):
+            sink.write(b"x" * MIN_PART_SIZE)
+        sink.close()
+
+    assert client.aborted == ["key"]
+    assert ("bucket", "key") not in client.objects
+
+
+def test_exception_in_with_block_aborts():
+    """A with block that fails doesn't publish what was written so far"""
+    client = RecordingClient()
+    with pytest.raises(RuntimeError):
+        with S3MultipartWriter(
+            "s3://bucket/key", part_size=MIN_PART_SIZE, client=client
+        ) as sink:
+            sink.write(b"x" * MIN_PART_SIZE)
+            sink.write(b"partial")
+            raise RuntimeError("scoring failed")
+
+    assert client.aborted == ["key"]
+    assert ("bucket", "key") not in client.objects
+
+    client = RecordingClient()
+    with pytest.raises(RuntimeError):
+        with S3MultipartWriter("s3://bucket/small", client=client) as sink:
+            sink.write(b"tiny")
+            raise RuntimeError("scoring failed")
+    assert client.objects == {}
+
+
+def test_client_uses_storage_options(monkeypatch):
+    """S3_STORAGE_OPTIONS and S3_ENDPOINT_URL both reach the s3fs client"""
+    monkeypatch.setenv(
+        "S3_STORAGE_OPTIONS",
+        '{"default_block_size": 16777216, "client_kwargs": {"region_name": "eu"}}',
+    )
+    monkeypatch.setenv("S3_ENDPOINT_URL", "http://localhost:4566")
+    assert s3_writer.s3_storage_options() == {
+        "default_block_size": 16777216,
+        "client_kwargs": {"region_name": "eu", "endpoint_url": "http://localhost:4566"},
+    }
+
+    created = []
+    monkeypatch.setattr(s3_writer, "S3fsClient", created.append)
+    s3_writer.make_s3_client()
+    assert created == [s3_writer.s3_storage_options()]
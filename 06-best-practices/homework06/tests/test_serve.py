@@ -0,0 +1,245 @@
+# Fix Python import path issues when running from terminal
+try:
+    from fix_imports import *  # This adds parent directory to Python path
+except ImportError:
+    pass
+
+import json
+import pickle
+import logging
+import threading
+import http.client
+import urllib.error
+import urllib.request
+import sys
+import os
+from concurrent.futures import ThreadPoolExecutor, TimeoutError as FutureTimeoutError
+
+import numpy as np
+import pandas as pd
+import pytest
+
+# Dynamically adjust imports based on where the script is run from
+try:
+    from homework06.serve import Histogram, MicroBatcher, ScoringService, make_server
+    from homework06.batch_refactoring import prepare_features
+except ImportError:
+    # Try relative import if running from tests directory
+    sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+    from serve import Histogram, MicroBatcher, ScoringService, make_server
+    from batch_refactoring import prepare_features
+
+# Configure logging for tests
+logging.basicConfig(
+    level=logging.INFO,
+    format="%(asctime)s - %(name)s - %(levelname)s - %(message)s",
+    datefmt="%Y-%m-%d %H:%M:%S",
+)
+logger = logging.getLogger(__name__)
+
+categorical = ["PULocationID", "DOLocationID"]
+MODEL_PATH = os.path.join(
+    os.path.dirname(os.path.dirname(os.path.abspath(__file__))), "model.bin"
+)
+
+
+@pytest.fixture
+def server():
+    """Scoring server on a free port, with a long max wait so requests coalesce"""
+    with open(MODEL_PATH, "rb") as f_in:
+        dv, lr = pickle.load(f_in)
+
+    service = ScoringService(dv, lr, max_batch_size=64, max_wait_ms=50)
+    httpd = make_server(service, "127.0.0.1", 0)
+    thread = threading.Thread(target=httpd.serve_forever, daemon=True)
+    thread.start()
+
+    yield f"http://127.0.0.1:{httpd.server_address[1]}", dv, lr
+
+    httpd.shutdown()
+    httpd.server_close()
+    service.close()
+
+
+def post(url, body):
+    request = urllib.request.Request(
+        url,
+        data=json.dumps(body).encode(),
+        headers={"Content-Type": "application/json"},
+        method="POST",
+    )
+    try:
+        with urllib.request.urlopen(request) as response:
+            return response.status, json.loads(response.read())
+    except urllib.error.HTTPError as e:
+        return e.code, json.loads(e.read())
+
+
+def test_concurrent_requests_match_batch_predictions(server):
+    """Concurrent requests are batched together and get their own predictions"""
+    url, dv, lr = server
+    rng = np.random.default_rng(0)
+    rides = [
+        {"PULocationID": int(pu), "DOLocationID": int(do)}
+        for pu, do in rng.integers(1, 266, (40, 2))
+    ]
+    rides[3]["PULocationID"] = None
+
+    with ThreadPoolExecutor(max_workers=20) as pool:
+        responses = list(pool.map(lambda ride: post(url + "/predict", ride), rides))
+
+    df = prepare_features(pd.DataFrame(rides), categorical)
+    expected = lr.predict(dv.transform(df[categorical].to_dict(orient="records")))
+    assert [status for status, _ in responses] == [200] * len(rides)
+    assert [body["predicted_duration"] for _, body in responses] == expected.tolist()
+
+    with urllib.request.urlopen(url + "/metrics") as response:
+        metrics = json.loads(response.read())
+    logger.info(f"Batch sizes: {metrics['batch_size']}")
+    assert metrics["requests"] == len(rides)
+    assert metrics["rides"] == len(rides)
+    assert metrics["batch_size"]["count"] < len(rides)
+    assert metrics["request_latency_ms"]["count"] == len(rides)
+
+
+def test_list_and_bad_requests(server):
+    url, _, _ = server
+
+    status, body = post(url + "/predict", [{"PULocationID": 1}, {"DOLocationID": 2}])
+    assert status == 200
+    assert len(body["predicted_duration"]) == 2
+
+    assert post(url + "/predict", [1, 2])[0] == 400
+    assert post(url + "/predict", {"PULocationID": "airport"})[0] == 400
+    assert post(url + "/predict", {"PULocationID": 10**30})[0] == 400
+    assert post(url + "/nothing", {})[0] == 404
+
+
+def test_unknown_path_keeps_the_connection_usable(server):
+    """The body of a POST to an unknown path isn't read as the next request"""
+    url, _, _ = server
+    connection = http.client.HTTPConnection(url[len("http://") :])
+    try:
+        connection.request("POST", "/nothing", body=b'{"PULocationID": 1}')
+        response = connection.getresponse()
+        response.read()
+        assert response.status == 404
+
+        connection.request(
+            "POST", "/predict", body=json.dumps({"PULocationID": 1}).encode()
+        )
+        response = connection.getresponse()
+        assert response.status == 200
+        assert "predicted_duration" in json.loads(response.read())
+    finally:
+        connection.close()
+
+
+def test_micro_batcher_respects_max_batch_size():
+    """Queued requests are split into batches of at most max_batch_size rows"""
+    batches = []
+
+    def score(df):
+        batches.append(len(df))
+        return np.arange(len(df), dtype="float64")
+
+    batcher = MicroBatcher(score, max_batch_size=4, max_wait_ms=200)
+    futures = [batcher.submit(pd.DataFrame({"x": [i]})) for i in range(10)]
+    results = [future.result(timeout=5) for future in futures]
+    batcher.close()
+
+    assert batches == [4, 4, 2]
+    assert [list(result) for result in results] == [
+        [0.0],
+        [1.0],
+        [2.0],
+        [3.0],
+        [0.0],
+        [1.0],
+        [2.0],
+        [3.0],
+        [0.0],
+        [1.0],
+    ]
+
+
+def test_micro_batcher_fails_the_whole_batch():
+    def score(df):
+        raise RuntimeError("model exploded")
+
+    batcher = MicroBatcher(score, max_wait_ms=50)
+    futures = [batcher.submit(pd.DataFrame({"x": [i]})) for i in range(3)]
+    for future in futures:
+        with pytest.raises(RuntimeError, match="model exploded"):
+            future.result(timeout=5)
+    batcher.close()
+
+
+def test_micro_batcher_close_races_submit():
+    """Every request submitted while closing is either refused or answered"""
+    batcher = MicroBatcher(lambda df: np.zeros(len(df)), max_wait_ms=1)
+    futures = []
+
+    def submit_all():
+        for i in range(200):
+            try:
+                futures.append(batcher.submit(pd.DataFrame({"x": [i]})))
+            except RuntimeError:
+                return
+
+    threads = [threading.Thread(target=submit_all) for _ in range(4)]
+    for thread in threads:
+        thread.start()
+    batcher.close()
+    for thread in threads:
+        thread.join()
+
+    assert all(len(future.result(timeout=5)) == 1 for future in futures)
+    with pytest.raises(RuntimeError, match="closed"):
+        batcher.submit(pd.DataFrame({"x": [0]}))
+
+
+def test_micro_batcher_close_fails_leftover_requests():
+    """Requests the worker never got to fail instead of waiting forever"""
+    batcher = MicroBatcher(lambda df: np.zeros(len(df)), max_wait_ms=1)
+    # Stop the worker behind the batcher's back, as if it had died
+    batcher._queue.put(None)
+    batcher._thread.join()
+
+    future = batcher.submit(pd.DataFrame({"x": [0]}))
+    batcher.close()
+    with pytest.raises(RuntimeError, match="closed"):
+        future.result(timeout=5)
+
+
+def test_prediction_timeout():
+    with open(MODEL_PATH, "rb") as f_in:
+        dv, lr = pickle.load(f_in)
+    service = ScoringService(dv, lr, max_wait_ms=1, timeout=0.1)
+    release = threading.Event()
+    score = service.batcher.score
+    service.batcher.score = lambda df: release.wait(5) and score(df)
+    try:
+        with pytest.raises(FutureTimeoutError):
+            service.predict([{"PULocationID": 1}])
+        # Queued behind the stuck batch, cancelled and never scored
+        with pytest.raises(FutureTimeoutError):
+            service.predict([{"PULocationID": 2}])
+    finally:
+        release.set()
+        service.close()
+    assert service.rides == 0
+
+
+def test_histogram_percentiles():
+    histogram = Histogram([1, 5, 10])
+    for value in [0.5] * 50 + [3] * 40 + [7] * 9 + [20]:
+        histogram.observe(value)
+
+    snapshot = histogram.snapshot()
+    assert snapshot["count"] == 100
+    assert snapshot["buckets"] == {"le_1": 50, "le_5": 40, "le_10": 9, "le_inf": 1}
+    assert histogram.percentile(50) == 1
+    assert histogram.percentile(90) == 5
+    assert histogram.percentile(99) == 10
+    assert histogram.percentile(100) == 20
@@ -0,0 +1,181 @@
+# Fix Python import path issues when running from terminal
+try:
+    from fix_imports import *  # This adds parent directory to Python path
+except ImportError:
+    pass
+
+import json
+import pickle
+import logging
+import sys
+import os
+
+import pandas as pd
+import pyarrow.parquet as pq
+import pytest
+
+# Dynamically adjust imports based on where the script is run from
+try:
+    from homework06.batch_refactoring import read_results, score_month
+    from homework06.manifest import manifest_path
+    from homework06.merge_shards import merge_month
+    from homework06.sharding import merge_files, plan_shards, shard_path, shards_path
+except ImportError:
+    # Try relative import if running from tests directory
+    sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+    from batch_refactoring import read_results, score_month
+    from manifest import manifest_path
+    from merge_shards import merge_month
+    from sharding import merge_files, plan_shards, shard_path, shards_path
+
+try:
+    from tests.test_batch_refactoring import create_month_file
+except ImportError:
+    from test_batch_refactoring import create_month_file
+
+# Configure logging for tests
+logging.basicConfig(
+    level=logging.INFO,
+    format="%(asctime)s - %(name)s - %(levelname)s - %(message)s",
+    datefmt="%Y-%m-%d %H:%M:%S",
+)
+logger = logging.getLogger(__name__)
+
+MODEL_PATH = os.path.join(
+    os.path.dirname(os.path.dirname(os.path.abspath(__file__))), "model.bin"
+)
+
+
+@pytest.fixture
+def month(tmp_path, monkeypatch):
+    """Synthetic January 2023 (8 row groups) and the path its results are written to"""
+    create_month_file(tmp_path / "2023-01.parquet")
+    monkeypatch.setenv(
+        "INPUT_FILE_PATTERN", str(tmp_path / "{year:04d}-{month:02d}.parquet")
+    )
+    monkeypatch.setenv(
+        "OUTPUT_FILE_PATTERN", str(tmp_path / "out" / "{year:04d}-{month:02d}.parquet")
+    )
+    with open(MODEL_PATH, "rb") as f_in:
+        dv, lr = pickle.load(f_in)
+    return tmp_path, dv, lr
+
+
+def test_plan_shards(tmp_path):
+    """Shards are contiguous, cover every row group once and have similar sizes"""
+    create_month_file(tmp_path / "month.parquet", n_rows=1000, row_group_size=100)
+    metadata = pq.read_metadata(tmp_path / "month.parquet")
+
+    assert plan_shards(metadata, 1) == [(0, 10)]
+    assert plan_shards(metadata, 3) == [(0, 3), (3, 7), (7, 10)]
+    assert plan_shards(metadata, 4) == plan_shards(metadata, 4)
+
+    # More shards than row groups: some shards get nothing
+    plan = plan_shards(metadata, 12)
+    assert sorted(stop - start for start, stop in plan) == [0] * 2 + [1] * 10
+    assert plan[0][0] == 0 and plan[-1][1] == 10
+    assert all(a[1] == b[0] for a, b in zip(plan, plan[1:]))
+
+
+@pytest.mark.parametrize("shard_count", [3, 10])
+@pytest.mark.parametrize("batch_size", [None, 100])
+def test_merged_shards_match_unsharded_run(month, batch_size, shard_count):
+    """Shards merged in order give the same file as scoring the whole month"""
+    tmp_path, dv, lr = month
+    total = 0
+    for index in range(shard_count):
+        output, rows = score_month(
+            2023,
+            1,
+            dv,
+            lr,
+            batch_size=batch_size,
+            shard_index=index,
+            shard_count=shard_count,
+        )
+        assert output == shard_path(
+            str(tmp_path / "out" / "2023-01.parquet"), index, shard_count
+        )
+        total += rows
+
+    output_file, merged_rows = merge_month(2023, 1, shard_count)
+    assert merged_rows == total
+    merged = read_results(output_file)
+
+    # The merged manifest matches the one of an unsharded run, which is skipped
+    mtime = os.stat(output_file).st_mtime_ns
+    assert score_month(2023, 1, dv, lr) == (output_file, total)
+    assert os.stat(output_file).st_mtime_ns == mtime
+
+    expected_file, expected_rows = score_month(2023, 1, dv, lr, force=True)
+    assert expected_rows == total
+    pd.testing.assert_frame_equal(merged, read_results(expected_file))
+
+
+def test_merge_as_dataset(month):
+    """With dataset=True the shards stay where they are, behind a _metadata file"""
+    tmp_path, dv, lr = month
+    for index in range(3):
+        score_month(2023, 1, dv, lr, compact=True, shard_index=index, shard_count=3)
+
+    path, rows = merge_month(2023, 1, 3, dataset=True)
+    assert path == shards_path(str(tmp_path / "out" / "2023-01.parquet"))
+    assert pq.read_metadata(os.path.join(path, "_metadata")).num_rows == rows
+    assert not os.path.exists(tmp_path / "out" / "2023-01.parquet")
+
+    expected_file, _ = score_month(2023, 1, dv, lr, compact=True)
+    pd.testing.assert_frame_equal(read_results(path), read_results(expected_file))
+
+
+def test_merge_checks_the_shards(month):
+    """Missing shards and shards of another run are refused"""
+    tmp_path, dv, lr = month
+    output_file = str(tmp_path / "out" / "2023-01.parquet")
+    score_month(2023, 1, dv, lr, shard_index=0, shard_count=3)
+    score_month(2023, 1, dv, lr, shard_index=2, shard_count=3)
+
+    with pytest.raises(ValueError, match="1 of 3 shards .* missing: 1"):
+        merge_month(2023, 1, 3)
+
+    score_month(2023, 1, dv, lr, compact=True, shard_index=1, shard_count=3)
+    with pytest.raises(ValueError, match="Shard 1 was scored with a different options"):
+        merge_month(2023, 1, 3)
+
+    # A manifest whose row count doesn't match its file
+    score_month(2023, 1, dv, lr, force=True, shard_index=1, shard_count=3)
+    path = manifest_path(shard_path(output_file, 1, 3))
+    with open(path) as f_in:
+        entry = json.load(f_in)
+    with open(path, "w") as f_out:
+        json.dump(dict(entry, rows=entry["rows"] + 1), f_out)
+    with pytest.raises(ValueError, match="its manifest says"):
+        merge_month(2023, 1, 3)
+    assert not os.path.exists(output_file)
+
+
+def test_failed_merge_keeps_the_previous_output(month):
+    """A merge that fails halfway leaves the output as it was, and no temporary file"""
+    tmp_path, dv, lr = month
+    paths = [
+        score_month(2023, 1, dv, lr, shard_index=i, shard_count=2)[0] for i in range(2)
+    ]
+    output_file = str(tmp_path / "out" / "2023-01.parquet")
+    merge_files(paths, output_file)
+    previous = read_results(output_file)
+
+    with open(paths[1], "wb") as f_out:
+        f_out.write(b"not parquet")
+    with pytest.raises(Exception):
+        merge_files(paths, output_file)
+    pd.testing.assert_frame_equal(read_results(output_file), previous)
+    assert not [name for name in os.listdir(tmp_path / "out") if "tmp" in name]
+
+
+def test_shard_arguments(month):
+    _, dv, lr = month
+    with pytest.raises(ValueError, match="between 0 and 2"):
+        score_month(2023, 1, dv, lr, shard_index=3, shard_count=3)
+    with pytest.raises(ValueError, match="together"):
+        score_month(2023, 1, dv, lr, shard_count=3)
+    with pytest.raises(ValueError, match="--dataset"):
+        score_month(2023, 1, dv, lr, shard_index=0, shard_count=3, partitioned=True)
@@ -0,0 +1,328 @@
+# Fix Python import path issues when running from terminal
+try:
+    from fix_imports import *  # This adds parent directory to Python path
+except ImportError:
+    pass
+
+import io
+import json
+import time
+import pickle
+import socket
+import logging
+import threading
+import sys
+import os
+
+import numpy as np
+import pandas as pd
+import pytest
+
+# Dynamically adjust imports based on where the script is run from
+try:
+    from homework06.batch_refactoring import predict, prepare_data
+    from homework06.encoder import ColumnarEncoder
+    from homework06.stream_scoring import (
+        JsonlRollingSink,
+        JsonlStreamSink,
+        ParquetRollingSink,
+        StreamScorer,
+        follow_lines,
+        make_socket_server,
+        pump,
+    )
+except ImportError:
+    # Try relative import if running from tests directory
+    sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+    from batch_refactoring import predict, prepare_data
+    from encoder import ColumnarEncoder
+    from stream_scoring import (
+        JsonlRollingSink,
+        JsonlStreamSink,
+        ParquetRollingSink,
+        StreamScorer,
+        follow_lines,
+        make_socket_server,
+        pump,
+    )
+
+try:
+    from tests.test_batch_refactoring import create_month_file
+except ImportError:
+    from test_batch_refactoring import create_month_file
+
+# Configure logging for tests
+logging.basicConfig(
+    level=logging.INFO,
+    format="%(asctime)s - %(name)s - %(levelname)s - %(message)s",
+    datefmt="%Y-%m-%d %H:%M:%S",
+)
+logger = logging.getLogger(__name__)
+
+categorical = ["PULocationID", "DOLocationID"]
+MODEL_PATH = os.path.join(
+    os.path.dirname(os.path.dirname(os.path.abspath(__file__))), "model.bin"
+)
+
+
+@pytest.fixture
+def model():
+    with open(MODEL_PATH, "rb") as f_in:
+        return pickle.load(f_in)
+
+
+@pytest.fixture
+def rides(tmp_path):
+    """Synthetic rides as JSON lines, and their batch predictions by line"""
+    df = create_month_file(tmp_path / "2023-01.parquet", n_rows=300)
+    lines = df[categorical + ["tpep_pickup_datetime", "tpep_dropoff_datetime"]].to_json(
+        orient="records", lines=True, date_format="iso"
+    )
+    return lines.splitlines(keepends=True), df
+
+
+def batch_predictions(df, dv, lr):
+    prepared = prepare_data(df, categorical)
+    y_pred = predict(prepared, ColumnarEncoder(dv, categorical), lr)
+    return pd.Series(y_pred, index=prepared.index.astype("str"))
+
+
+class ListSink:
+    """Keeps the micro-batches it gets; delay simulates a slow sink"""
+
+    def __init__(self, delay=0.0):
+        self.delay = delay
+        self.batches = []
+
+    def write(self, df):
+        time.sleep(self.delay)
+        self.batches.append(df)
+
+    def roll_if_due(self):
+        pass
+
+    def close(self):
+        pass
+
+
+def test_stream_matches_batch_predictions(model, rides):
+    """Micro-batches are prepared and scored like the batch job"""
+    dv, lr = model
+    lines, df = rides
+    sink = ListSink()
+    scorer = StreamScorer(dv, lr, sink, max_batch_rows=64)
+    pump(lines, scorer)
+    metrics = scorer.run()
+
+    result = pd.concat(sink.batches, ignore_index=True)
+    expected = batch_predictions(df, dv, lr)
+    assert list(result["ride_id"]) == list(expected.index)
+    np.testing.assert_allclose(result["predicted_duration"], expected.to_numpy())
+
+    assert all(len(batch) > 0 for batch in sink.batches)
+    assert metrics["received"] == len(lines)
+    assert metrics["scored"] == len(expected)
+    assert metrics["filtered"] == len(lines) - len(expected)
+    assert metrics["batch_size"]["max"] == 64
+    assert metrics["latency_ms"]["count"] == len(expected)
+
+
+def test_invalid_records_are_skipped(model):
+    dv, lr = model
+    sink = ListSink()
+    scorer = StreamScorer(dv, lr, sink)
+    ride = {
+        "tpep_pickup_datetime": "2023-01-01T10:00:00",
+        "tpep_dropoff_datetime": "2023-01-01T10:12:00Z",
+        "PULocationID": 132,
+        "DOLocationID": 236,
+    }
+    lines = [
+        json.dumps(dict(ride, ride_id="a")),
+        "not json",
+        "",
+        json.dumps([1, 2]),
+        json.dumps(dict(ride, ride_id="b", PULocationID="JFK")),
+        json.dumps(dict(ride, ride_id="c", PULocationID=None)),
+        json.dumps(dict(ride, ride_id="d", tpep_dropoff_datetime="2023-01-01T12:00")),
+    ]
+    pump(lines, scorer)
+    metrics = scorer.run()
+
+    result = pd.concat(sink.batches)
+    assert list(result["ride_id"]) == ["a", "c"]
+    assert metrics["invalid"] == 3
+    assert metrics["filtered"] == 1
+    assert metrics["errors"] == 0
+
+
+def test_latency_bound(model, rides):
+    """A partial micro-batch is scored once its first record waited max_latency_ms"""
+    dv, lr = model
+    lines, _ = rides
+    sink = ListSink()
+    scorer = StreamScorer(dv, lr, sink, max_batch_rows=1000, max_latency_ms=50)
+    thread = threading.Thread(target=scorer.run)
+    thread.start()
+
+    for line in lines[:10]:
+        scorer.put(line)
+    deadline = time.time() + 5
+    while not sink.batches and time.time() < deadline:
+        time.sleep(0.01)
+    # Scored while the input is still open
+    assert len(sink.batches) == 1
+
+    scorer.close_input()
+    thread.join()
+
+
+def test_backpressure(model, rides):
+    """A slow sink fills the queue, and then put() blocks the producer"""
+    dv, lr = model
+    lines, _ = rides
+    sink = ListSink(delay=0.05)
+    scorer = StreamScorer(
+        dv, lr, sink, max_batch_rows=10, max_latency_ms=1000, queue_size=20
+    )
+    depths = []
+
+    def produce():
+        for line in lines[:150]:
+            scorer.put(line)
+            depths.append(scorer._queue.qsize())
+        scorer.close_input()
+
+    producer = threading.Thread(target=produce)
+    producer.start()
+    metrics = scorer.run()
+    producer.join()
+
+    assert max(depths) <= 20
+    assert metrics["backpressure_seconds"] > 0.1
+    assert metrics["received"] == 150
+
+
+def test_drain_writes_queued_lines(model, rides):
+    """On shutdown, the lines still queued are scored too, then the input stops"""
+    dv, lr = model
+    lines, df = rides
+    sink = ListSink()
+    scorer = StreamScorer(dv, lr, sink, max_batch_rows=64)
+    for line in lines:
+        scorer.put(line)
+    scorer.drain()
+
+    result = pd.concat(sink.batches, ignore_index=True)
+    assert list(result["ride_id"]) == list(batch_predictions(df, dv, lr).index)
+    assert max(len(batch) for batch in sink.batches) <= 64
+    assert scorer.metrics()["queue_depth"] == 0
+    assert not scorer.put(lines[0])
+
+
+class FailingSink(ListSink):
+    def write(self, df):
+        raise OSError("No space left on device")
+
+
+def test_sink_error_stops_producers(model, rides):
+    """A failing sink makes run() raise, and producers blocked in put() return"""
+    dv, lr = model
+    lines, _ = rides
+    scorer = StreamScorer(
+        dv, lr, FailingSink(), max_batch_rows=10, max_latency_ms=10, queue_size=5
+    )
+    producer = threading.Thread(target=pump, args=(lines, scorer))
+    producer.start()
+
+    with pytest.raises(OSError):
+        scorer.run()
+    producer.join(timeout=5)
+    assert not producer.is_alive()
+    assert scorer.metrics()["received"] < len(lines)
+
+
+@pytest.mark.parametrize("sink_class", [ParquetRollingSink, JsonlRollingSink])
+def test_rolling_sinks(tmp_path, sink_class):
+    """Files roll by rows and by age, and only complete files are visible"""
+    sink = sink_class(str(tmp_path / "out"), max_rows=25, max_seconds=0.2)
+    for start in range(0, 50, 10):
+        sink.write(
+            pd.DataFrame({"ride_id": [str(i) for i in range(start, start + 10)]})
+        )
+    assert len(sink.files) == 1
+
+    time.sleep(0.25)
+    sink.roll_if_due()
+    sink.close()
+    assert len(sink.files) == 2
+    assert sorted(os.listdir(tmp_path / "out")) == sorted(
+        os.path.basename(path) for path in sink.files
+    )
+
+    if sink_class is ParquetRollingSink:
+        frames = [pd.read_parquet(path) for path in sink.files]
+    else:
+        frames = [pd.read_json(path, lines=True, dtype=False) for path in sink.files]
+    df = pd.concat(frames, ignore_index=True)
+    assert list(df["ride_id"].astype("str")) == [str(i) for i in range(50)]
+
+
+def test_stdout_sink():
+    stream = io.StringIO()
+    sink = JsonlStreamSink(stream)
+    sink.write(pd.DataFrame({"ride_id": ["a", "b"], "predicted_duration": [1.0, 2.0]}))
+    assert stream.getvalue().splitlines() == [
+        '{"ride_id":"a","predicted_duration":1.0}',
+        '{"ride_id":"b","predicted_duration":2.0}',
+    ]
+
+
+def test_follow_lines(tmp_path):
+    """Complete lines are read as they are appended, also after truncation"""
+    path = tmp_path / "feed.jsonl"
+    path.write_text("1\n2")
+    stop = threading.Event()
+    lines = follow_lines(str(path), stop, poll_interval=0.01)
+
+    assert next(lines) == "1\n"
+    with open(path, "a") as f_out:
+        f_out.write("2\n3\n")
+    assert next(lines) == "22\n"
+    assert next(lines) == "3\n"
+
+    path.write_text("4\n")
+    assert next(lines) == "4\n"
+    stop.set()
+    assert list(lines) == []
+
+
+def test_socket_source(model, rides):
+    """Lines sent over TCP are scored like the ones read from stdin"""
+    dv, lr = model
+    lines, df = rides
+    sink = ListSink()
+    scorer = StreamScorer(dv, lr, sink, max_batch_rows=50, max_latency_ms=20)
+    server = make_socket_server("tcp://127.0.0.1:0", scorer)
+    threading.Thread(target=server.serve_forever, daemon=True).start()
+    consumer = threading.Thread(target=scorer.run)
+    consumer.start()
+
+    try:
+        with socket.create_connection(server.server_address) as client:
+            client.sendall("".join(lines).encode())
+        deadline = time.time() + 10
+        while scorer.metrics()["received"] < len(lines) and time.time() < deadline:
+            time.sleep(0.01)
+    finally:
+        scorer.close_input()
+        consumer.join()
+        server.shutdown()
+        server.server_close()
+
+    result = pd.concat(sink.batches, ignore_index=True)
+    expected = batch_predictions(df, dv, lr)
+    np.testing.assert_allclose(
+        result.set_index("ride_id")["predicted_duration"].loc[expected.index],
+        expected.to_numpy(),
+    )